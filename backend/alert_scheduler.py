@@ -0,0 +1,382 @@
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from app_logging import get_logger
+from conditional import INVENTORY_VERSIONS, InventoryVersions
+from metrics import (ALERT_QUEUE_DEPTH, ALERT_ROWS_WRITTEN, ALERT_RUN_DURATION, ALERT_RUNS,
+                     ALERT_SCHEDULER_LAG)
+
+logger = get_logger("alert_scheduler")
+
+# --- Alert Scheduler ---
+# Stock alerts (low_stock, expiry_warning, reorder_suggestion) are computed in
+# the background and stored in stock_alerts; the alerts and dashboard
+# endpoints only read those rows. A user is recomputed when their inventory
+# version (see conditional.py) has moved since their last run, after a short
+# debounce so a burst of writes costs one run, and otherwise once per
+# refresh interval as forecasts age. Expiry sweeps (expiry.py) mark users
+# whose products enter the expiry window. Due times carry
+# random jitter, so tenants that changed together, or were all seeded at
+# startup, do not run in lockstep. Failed runs retry with backoff.
+#
+# Run the loop in one worker only (ALERT_SCHEDULER=1 there); the others read
+# the shared rows. A process without the loop recomputes a user's alerts on
+# read whenever their inventory version has moved, so they stay live even
+# when no worker runs it. Writes made on other workers still reach it through the
+# change bus. Responses that embed alerts add the run generation to their
+# ETag, since a run changes them without bumping the inventory version. A
+# generation is a millisecond timestamp of the run, and each run announces
+# it on the change bus, so every worker builds the same ETag however many
+# runs it has made itself.
+#
+# ALERT_SCHEDULER           run the background loop in this process (default 0)
+# ALERT_DEBOUNCE_S          wait after a change before recomputing (default 2)
+# ALERT_JITTER_S            random spread added to due times (default 5)
+# ALERT_REFRESH_S           recompute unchanged users this often (default 3600)
+# ALERT_TICK_S              how often the loop checks for due users (default 1)
+# ALERT_CONCURRENCY         users recomputed at once (default 4)
+# ALERT_EXPIRY_DAYS         warn about products expiring within this many days (default 3)
+# ALERT_REORDER_DAYS        suggest reordering when stock runs out within this many days (default 7)
+# ALERT_REORDER_COVER_DAYS  days of demand a suggested reorder covers (default 14)
+
+ALERT_SCHEDULER = os.getenv('ALERT_SCHEDULER', '0') == '1'
+ALERT_DEBOUNCE_S = float(os.getenv('ALERT_DEBOUNCE_S', '2'))
+ALERT_JITTER_S = float(os.getenv('ALERT_JITTER_S', '5'))
+ALERT_REFRESH_S = float(os.getenv('ALERT_REFRESH_S', '3600'))
+ALERT_TICK_S = float(os.getenv('ALERT_TICK_S', '1'))
+ALERT_CONCURRENCY = int(os.getenv('ALERT_CONCURRENCY', '4'))
+ALERT_EXPIRY_DAYS = int(os.getenv('ALERT_EXPIRY_DAYS', '3'))
+ALERT_REORDER_DAYS = float(os.getenv('ALERT_REORDER_DAYS', '7'))
+ALERT_REORDER_COVER_DAYS = float(os.getenv('ALERT_REORDER_COVER_DAYS', '14'))
+
+ALERT_TYPES = ('low_stock', 'expiry_warning', 'reorder_suggestion')
+DEFAULT_MINIMUM_STOCK = 1.0
+
+
+def _as_date(value) -> Optional[date]:
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _recommendation(forecast: Optional[dict], today: date, days_ahead: float,
+                    cover_days: float) -> Optional[dict]:
+    """predict_stock_depletion-style recommendation from a forecasting.forecast_products row."""
+    if not forecast or forecast.get("days_until_depletion") is None:
+        return None
+    days = forecast["days_until_depletion"]
+    rate = forecast.get("consumption_rate_per_day") or 0.0
+    if days > days_ahead:
+        return {"urgency": "LOW", "message": f"Stock sufficient for {days:.1f} days",
+                "suggested_reorder_quantity": 0, "suggested_reorder_date": None}
+    return {
+        "urgency": "HIGH" if days <= 3 else "MEDIUM",
+        "message": f"Stock will be low in {days:.1f} days",
+        "suggested_reorder_quantity": round(rate * cover_days, 3),
+        "suggested_reorder_date": (today + timedelta(days=max(0.0, days - 2))).isoformat(),
+    }
+
+
+def build_alerts(products: List[dict], forecasts: Iterable[dict], now: Optional[datetime] = None,
+                 expiry_days: int = ALERT_EXPIRY_DAYS, reorder_days: float = ALERT_REORDER_DAYS,
+                 cover_days: float = ALERT_REORDER_COVER_DAYS) -> List[dict]:
+    """stock_alerts rows (without user_id) for a user's products and their depletion forecasts."""
+    today = (now or datetime.now(timezone.utc)).date()
+    by_name = {f["product_name"].lower(): f for f in forecasts}
+    alerts = []
+    for product in products:
+        name = product['name']
+        forecast = by_name.get(name.lower())
+        quantity = float(product.get('quantity') or 0)
+        minimum = product.get('minimum_stock')
+        minimum = DEFAULT_MINIMUM_STOCK if minimum is None else float(minimum)
+        recommendation = _recommendation(forecast, today, reorder_days, cover_days)
+
+        if quantity <= minimum:
+            prediction = {"product_name": name, "current_stock": quantity, "minimum_stock": minimum,
+                          **({"consumption_rate_per_day": forecast.get("consumption_rate_per_day"),
+                              "days_until_depletion": forecast.get("days_until_depletion")} if forecast else {}),
+                          "recommendation": recommendation}
+            alerts.append({"product_name": name, "alert_type": "low_stock",
+                           "alert_message": f"Stock for {name} is running low ({quantity:g} kg remaining)",
+                           "details": {"product": dict(product), "prediction": prediction}})
+        elif recommendation and recommendation["urgency"] != "LOW":
+            alerts.append({"product_name": name, "alert_type": "reorder_suggestion",
+                           "alert_message": f"Reorder {recommendation['suggested_reorder_quantity']:g} kg of {name}: "
+                                            f"{recommendation['message'].lower()}",
+                           "details": {"forecast": forecast, "recommendation": recommendation}})
+
+        expiry = _as_date(product.get('expiry_date'))
+        if expiry is not None and quantity > 0 and (expiry - today).days <= expiry_days:
+            days_left = (expiry - today).days
+            message = (f"{name} expired on {expiry.isoformat()}" if days_left < 0 else
+                       f"{name} expires {'today' if days_left == 0 else f'in {days_left} days'} "
+                       f"({quantity:g} kg in stock)")
+            alerts.append({"product_name": name, "alert_type": "expiry_warning", "alert_message": message,
+                           "details": {"expiry_date": expiry.isoformat(), "days_left": days_left,
+                                       "quantity": quantity}})
+    return alerts
+
+
+def alerts_payload(rows: List[dict]) -> dict:
+    """The /analytics/alerts body: low-stock details as before, plus every stored row.
+
+    Rows the check_low_stock trigger inserted before a run filled in their
+    details count too, with just the product name and message.
+    """
+    low_stock = [row.get('details') or {"product": {"name": row['product_name']}, "prediction": None,
+                                        "message": row.get('alert_message')}
+                 for row in rows if row['alert_type'] == 'low_stock']
+    stamps = [row['updated_at'] for row in rows if row.get('updated_at')]
+    return {"alerts": low_stock, "count": len(low_stock), "stock_alerts": rows,
+            "computed_at": max(stamps) if stamps else None}
+
+
+class MemoryAlertStore:
+    """stock_alerts kept in process memory (in-memory server and tests)."""
+
+    def __init__(self):
+        self._rows: Dict[str, Dict[tuple, dict]] = {}
+
+    def replace(self, user_id: str, alerts: List[dict], computed_at: str) -> int:
+        current = self._rows.get(user_id, {})
+        rows = {}
+        for alert in alerts:
+            key = (alert['product_name'], alert['alert_type'])
+            previous = current.get(key)
+            rows[key] = {**alert, "user_id": user_id, "updated_at": computed_at,
+                         "is_read": previous['is_read'] if previous else False,
+                         "created_at": previous['created_at'] if previous else computed_at}
+        self._rows[user_id] = rows
+        return len(rows)
+
+    def list(self, user_id: str) -> List[dict]:
+        return sorted(self._rows.get(user_id, {}).values(), key=lambda r: (r['alert_type'], r['product_name']))
+
+
+class SupabaseAlertStore:
+    """stock_alerts rows in Supabase, replaced per user with an upsert and a stale-row delete."""
+
+    def __init__(self, client_factory: Callable[[], object], page_size: int = 1000):
+        self.client_factory = client_factory
+        self.page_size = page_size
+
+    def replace(self, user_id: str, alerts: List[dict], computed_at: str) -> int:
+        client = self.client_factory()
+        rows = [{**alert, "user_id": user_id, "updated_at": computed_at} for alert in alerts]
+        for start in range(0, len(rows), self.page_size):
+            # is_read and created_at are left out, so alerts that persist keep them
+            client.table('stock_alerts').upsert(rows[start:start + self.page_size],
+                                                on_conflict='user_id,product_name,alert_type').execute()
+        client.table('stock_alerts').delete().eq('user_id', user_id).lt('updated_at', computed_at).execute()
+        return len(rows)
+
+    def list(self, user_id: str) -> List[dict]:
+        client = self.client_factory()
+        rows, offset = [], 0
+        while True:
+            page = (client.table('stock_alerts').select('*').eq('user_id', user_id)
+                    .order('alert_type').order('product_name')
+                    .range(offset, offset + self.page_size - 1).execute().data)
+            rows.extend(page)
+            if len(page) < self.page_size:
+                return rows
+            offset += self.page_size
+
+
+class AlertScheduler:
+    """Recomputes users' alerts in the background when their inventory changes."""
+
+    def __init__(self, compute: Callable[[str], Awaitable[List[dict]]], store,
+                 users: Optional[Callable[[], List[str]]] = None,
+                 announce: Optional[Callable[[str, int], Awaitable[None]]] = None,
+                 versions: InventoryVersions = INVENTORY_VERSIONS,
+                 debounce: float = ALERT_DEBOUNCE_S, jitter: float = ALERT_JITTER_S,
+                 refresh: float = ALERT_REFRESH_S, tick: float = ALERT_TICK_S,
+                 concurrency: int = ALERT_CONCURRENCY,
+                 clock: Callable[[], float] = time.monotonic, rng: Optional[random.Random] = None):
+        self.compute = compute
+        self.store = store
+        self.users = users
+        self.announce = announce
+        self.versions = versions
+        self.debounce = debounce
+        self.jitter = jitter
+        self.refresh = refresh
+        self.tick_interval = tick
+        self.concurrency = concurrency
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self._queue: List[tuple] = []          # (due, seq, user); stale entries are skipped
+        self._due: Dict[str, float] = {}
+        self._seq = itertools.count()
+        self._seen: Dict[str, int] = {}        # version last noticed by poll_versions
+        self._computed: Dict[str, int] = {}    # version the stored alerts reflect
+        self._failures: Dict[str, int] = {}
+        self._generations: Dict[str, int] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._due)
+
+    def due(self, user_id: str) -> Optional[float]:
+        return self._due.get(user_id)
+
+    def generation(self, user_id: str) -> int:
+        """Latest run for a user, here or announced by another worker; part of ETags that cover alerts."""
+        return self._generations.get(user_id, 0)
+
+    def apply_change(self, user_id: str, change: dict):
+        """ChangeHub listener: adopts the generation announced after another worker's run."""
+        if change.get("entity") != "alerts" or not change.get("data"):
+            return
+        generation = int(change["data"]["generation"])
+        if generation > self._generations.get(user_id, 0):
+            self._generations[user_id] = generation
+            if self._task is None:
+                # Counts as a run at the version seen now, so ensure() need not repeat it
+                self._computed[user_id] = self.versions.get(user_id)
+
+    def _set_due(self, user_id: str, due: float):
+        self._due[user_id] = due
+        heapq.heappush(self._queue, (due, next(self._seq), user_id))
+
+    def schedule(self, user_id: str, due: float):
+        """Runs a user at `due` unless they are already due earlier."""
+        current = self._due.get(user_id)
+        if current is None or due < current:
+            self._set_due(user_id, due)
+
+    def mark_dirty(self, user_id: str, now: Optional[float] = None):
+        now = self.clock() if now is None else now
+        self.schedule(user_id, now + self.debounce + self.rng.uniform(0, self.jitter))
+
+    def seed(self, user_ids: Iterable[str], now: Optional[float] = None):
+        """Spreads a first refresh of every user over one refresh interval."""
+        now = self.clock() if now is None else now
+        for user_id in user_ids:
+            self.schedule(user_id, now + self.rng.uniform(0, self.refresh))
+
+    def poll_versions(self, now: Optional[float] = None) -> int:
+        """Marks users whose inventory version moved since the last poll; returns how many."""
+        changed = 0
+        for user_id, version in self.versions.snapshot().items():
+            if self._seen.get(user_id) == version:
+                continue
+            self._seen[user_id] = version
+            if self._computed.get(user_id) != version:
+                self.mark_dirty(user_id, now)
+                changed += 1
+        return changed
+
+    async def run_user(self, user_id: str, due: Optional[float] = None) -> bool:
+        """Recomputes and stores one user's alerts; returns whether it succeeded."""
+        started = self.clock()
+        if due is not None:
+            ALERT_SCHEDULER_LAG.observe(max(0.0, started - due))
+        version = self.versions.get(user_id)
+        computed_at = datetime.now(timezone.utc).isoformat()
+        try:
+            alerts = await self.compute(user_id)
+            written = await asyncio.to_thread(self.store.replace, user_id, alerts, computed_at)
+        except Exception as e:
+            failures = self._failures.get(user_id, 0) + 1
+            self._failures[user_id] = failures
+            ALERT_RUNS.inc("error")
+            logger.warning("Alert run for %s failed (attempt %d): %s", user_id, failures, e)
+            backoff = min(self.refresh, max(self.debounce, 1.0) * 2 ** failures)
+            self.schedule(user_id, self.clock() + backoff + self.rng.uniform(0, self.jitter))
+            return False
+        finally:
+            ALERT_RUN_DURATION.observe(self.clock() - started)
+
+        self._failures.pop(user_id, None)
+        self._computed[user_id] = version
+        generation = max(self._generations.get(user_id, 0) + 1, time.time_ns() // 1_000_000)
+        self._generations[user_id] = generation
+        if self.announce is not None:
+            await self.announce(user_id, generation)
+        ALERT_RUNS.inc("ok")
+        ALERT_ROWS_WRITTEN.inc(amount=written)
+        if self.versions.get(user_id) != version:
+            self.mark_dirty(user_id)  # written to while computing
+        else:
+            self._set_due(user_id, self.clock() + self.refresh + self.rng.uniform(-self.jitter, self.jitter))
+        return True
+
+    def _start_run(self, user_id: str, due: Optional[float] = None) -> asyncio.Task:
+        task = self._inflight.get(user_id)
+        if task is None:
+            task = asyncio.ensure_future(self.run_user(user_id, due))
+            self._inflight[user_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(user_id, None))
+        return task
+
+    async def ensure(self, user_id: str):
+        """Computes a user's alerts now if they may be out of date.
+
+        With the loop running here, that is only before the first run (here or
+        announced). Without it nothing else refreshes them, so they are also
+        recomputed whenever the inventory version moved since the last run.
+        """
+        if self._task is None:
+            if self._computed.get(user_id) != self.versions.get(user_id):
+                await self._start_run(user_id)
+        elif user_id not in self._computed and user_id not in self._generations:
+            await self._start_run(user_id)
+
+    async def tick(self, now: Optional[float] = None) -> int:
+        """Runs the users that are due, up to the concurrency limit; returns how many ran."""
+        self.poll_versions(now)
+        now = self.clock() if now is None else now
+        runs = []
+        while self._queue and len(runs) < self.concurrency and self._queue[0][0] <= now:
+            due, _, user_id = heapq.heappop(self._queue)
+            if self._due.get(user_id) != due:
+                continue
+            del self._due[user_id]
+            runs.append(self._start_run(user_id, due))
+        ALERT_QUEUE_DEPTH.set(len(self._due))
+        if runs:
+            await asyncio.gather(*runs)
+        return len(runs)
+
+    async def _loop(self):
+        if self.users is not None:
+            try:
+                self.seed(await asyncio.to_thread(self.users))
+            except Exception as e:
+                logger.warning("Could not list users for the alert scheduler: %s", e)
+        while True:
+            try:
+                ran = await self.tick()
+            except Exception as e:
+                logger.warning("Alert scheduler tick failed: %s", e)
+                ran = 0
+            if ran < self.concurrency:
+                await asyncio.sleep(self.tick_interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,161 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+
+# --- Structured, Non-Blocking Logging ---
+# Request handlers only put records on a bounded in-memory queue; a
+# QueueListener thread formats them and does the (possibly blocking) write to
+# stdout. If the collector falls behind and the queue fills up, records are
+# dropped and counted instead of stalling the event loop.
+#
+# LOG_LEVEL          DEBUG/INFO/WARNING/... (default INFO)
+# LOG_FORMAT         json or text (default json)
+# LOG_QUEUE_SIZE     max buffered records before dropping (default 10000)
+# LOG_SAMPLE_RATE    share of hot-path debug records kept (default 0.01)
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '0.01'))
+
+ROOT_LOGGER = 'vocal_verse'
+
+request_id_var: contextvars.ContextVar = contextvars.ContextVar('request_id', default='-')
+
+_listener = None
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps every record with the current request's correlation ID."""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    _RESERVED = set(vars(logging.makeLogRecord({}))) | {'request_id', 'message', 'asctime'}
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, 'request_id', '-'),
+        }
+        for key, value in vars(record).items():
+            if key not in self._RESERVED:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: a full queue drops the record."""
+
+    dropped = 0
+
+    def prepare(self, record):
+        # The stdlib version folds the traceback into msg; keep it in exc_text so JSON output has "exc"
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, stream=None,
+                      queue_size: int = LOG_QUEUE_SIZE) -> logging.Logger:
+    """Routes the vocal_verse logger through a bounded queue drained by a background thread."""
+    global _listener
+    logger = logging.getLogger(ROOT_LOGGER)
+    if _listener is not None:
+        _listener.stop()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == 'json' else logging.Formatter(
+        '%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s'))
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(RequestIdFilter())
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+    _listener.start()
+    return logger
+
+
+def shutdown_logging():
+    """Flushes queued records and stops the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def hot_debug(logger: logging.Logger, msg: str, *args, rate: float = None):
+    """Debug log for per-call hot paths, kept for only a sampled share of calls."""
+    if logger.isEnabledFor(logging.DEBUG) and random.random() < (LOG_SAMPLE_RATE if rate is None else rate):
+        logger.debug(msg, *args, extra={"sampled": True}, stacklevel=2)
+
+
+class CorrelationIdMiddleware:
+    """Pure ASGI middleware: reuses an incoming X-Request-ID or mints one, and echoes it back."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request_id = None
+        for name, value in scope.get("headers", ()):
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Columnar archive of old inventory_transactions.
+
+Moves transactions older than ARCHIVE_AFTER_DAYS out of the database into
+one file per user and month under ARCHIVE_DIR:
+  python archive.py run [--user USER_ID] [--older-than-days 365]
+
+Rows are written (and fsynced) before they are deleted from the database,
+and month files are merged by transaction id, so an interrupted run can
+simply be repeated.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional
+
+from export import EXPORT_PAGE_SIZE, EXPORT_RESOURCES, keyset_pages, supabase_page_fetcher
+from rollups import as_utc
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+    ARCHIVE_AVAILABLE = True
+except ImportError:
+    ARCHIVE_AVAILABLE = False
+
+# --- Transaction Archive ---
+# Analytics that read raw transactions scan the whole history every time.
+# Rows past the horizon are frozen, so they are kept as columnar files
+# instead: Arrow IPC files are memory-mapped and read without copying or
+# parsing, Parquet files are smaller but decoded on read. Reads combine the
+# hot database rows with the archive (see supabase_server.py). Deleting
+# archived rows does not touch daily_product_rollups.
+#
+# ARCHIVE_DIR          where month files are kept (default ./archive)
+# ARCHIVE_AFTER_DAYS   archive transactions older than this (default 365)
+# ARCHIVE_FORMAT       arrow or parquet (default arrow)
+
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archive')
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '365'))
+ARCHIVE_FORMAT = os.getenv('ARCHIVE_FORMAT', 'arrow')
+
+ARCHIVE_COLUMNS = EXPORT_RESOURCES["transactions"][1]
+SUMMARY_KEY = b"vocal_verse.summary"
+EXTENSIONS = {"arrow": ".arrow", "parquet": ".parquet"}
+
+_SAFE_USER_ID = re.compile(r'^[A-Za-z0-9_-]+$')
+
+if ARCHIVE_AVAILABLE:
+    SCHEMA = pa.schema([
+        ("id", pa.string()),
+        ("product_name", pa.string()),
+        ("transaction_type", pa.string()),
+        ("quantity_change", pa.float64()),
+        ("price_per_kg", pa.float64()),
+        ("notes", pa.string()),
+        ("created_at", pa.timestamp("us", tz="UTC")),
+    ])
+
+
+def _to_table(rows: List[dict]) -> "pa.Table":
+    columns = {name: [row.get(name) for row in rows] for name in ARCHIVE_COLUMNS}
+    columns["created_at"] = [as_utc(value) for value in columns["created_at"]]
+    for name in ("quantity_change", "price_per_kg"):
+        columns[name] = [None if value is None else float(value) for value in columns[name]]
+    return pa.table(columns, schema=SCHEMA)
+
+
+def summarize_table(table: "pa.Table") -> Dict[str, dict]:
+    """Rollup-style bucket per lowercased product name over a table of transactions."""
+    kind, quantity = table.column("transaction_type"), table.column("quantity_change")
+    grouped = pa.table({
+        "product": table.column("product_name"),
+        "added": pc.if_else(pc.equal(kind, "add"), quantity, 0.0),
+        "removed": pc.if_else(pc.equal(kind, "remove"), quantity, 0.0),
+        "price": table.column("price_per_kg"),
+        "created_at": table.column("created_at"),
+    }).group_by("product").aggregate([
+        ("added", "sum"), ("removed", "sum"), ("price", "sum"), ("price", "count"),
+        ("created_at", "count"), ("created_at", "min"), ("created_at", "max"),
+    ])
+    summary: Dict[str, dict] = {}
+    for row in grouped.to_pylist():
+        product = row["product"].lower()
+        part = {"product_name": product, "added": row["added_sum"], "removed": row["removed_sum"],
+                "price_sum": row["price_sum"] or 0.0, "price_count": row["price_count"],
+                "transaction_count": row["created_at_count"],
+                "first_at": row["created_at_min"].isoformat(), "last_at": row["created_at_max"].isoformat()}
+        bucket = summary.get(product)
+        if bucket is None:
+            summary[product] = part
+            continue
+        for field in ("added", "removed", "price_sum", "price_count", "transaction_count"):
+            bucket[field] += part[field]
+        bucket["first_at"] = min(bucket["first_at"], part["first_at"])
+        bucket["last_at"] = max(bucket["last_at"], part["last_at"])
+    return summary
+
+
+class TransactionArchive:
+    """Per-user, per-month columnar files of archived transactions."""
+
+    def __init__(self, root: str = ARCHIVE_DIR, fmt: str = ARCHIVE_FORMAT, cache_files: int = 256):
+        if fmt not in EXTENSIONS:
+            raise ValueError(f"Unknown archive format: {fmt}")
+        self.root = root
+        self.fmt = fmt
+        self.cache_files = cache_files
+        self._summaries: "OrderedDict[tuple, Dict[str, dict]]" = OrderedDict()
+
+    def _user_dir(self, user_id: str) -> str:
+        if not _SAFE_USER_ID.match(str(user_id)):
+            raise ValueError(f"Invalid user id: {user_id!r}")
+        return os.path.join(self.root, str(user_id))
+
+    def files(self, user_id: str) -> List[tuple]:
+        """(month, path) of every archive file of a user, oldest first."""
+        directory = self._user_dir(user_id)
+        if not os.path.isdir(directory):
+            return []
+        found = []
+        for name in os.listdir(directory):
+            month, extension = os.path.splitext(name)
+            if extension in EXTENSIONS.values():
+                found.append((month, os.path.join(directory, name)))
+        return sorted(found)
+
+    def _read(self, path: str) -> "pa.Table":
+        if path.endswith(EXTENSIONS["parquet"]):
+            return pq.read_table(path, memory_map=True)
+        with pa.memory_map(path, 'r') as source:
+            return pa.ipc.open_file(source).read_all()  # the table's buffers keep the mapping alive
+
+    def write_month(self, user_id: str, month: str, rows: List[dict]) -> int:
+        """Merges rows into a month file (skipping ids already archived); returns rows added."""
+        directory = self._user_dir(user_id)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, month + EXTENSIONS[self.fmt])
+        table = _to_table(rows)
+        if os.path.exists(path):
+            existing = self._read(path)
+            known = pa.array(set(existing.column("id").to_pylist()), pa.string())
+            table = table.filter(pc.invert(pc.is_in(table.column("id"), value_set=known)))
+            added = table.num_rows
+            table = pa.concat_tables([existing.replace_schema_metadata(None), table])
+        else:
+            added = table.num_rows
+        table = table.sort_by([("created_at", "ascending"), ("id", "ascending")])
+        # The per-product summary rides in the schema metadata, so analytics
+        # read a few hundred bytes per month instead of scanning its columns.
+        table = table.replace_schema_metadata({SUMMARY_KEY: json.dumps(summarize_table(table))})
+
+        tmp = path + ".tmp"
+        if self.fmt == "parquet":
+            pq.write_table(table, tmp)
+        else:
+            with pa.OSFile(tmp, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        with open(tmp, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        return added
+
+    def _month_summary(self, path: str) -> Dict[str, dict]:
+        """Per-product buckets of one month file, cached until the file changes."""
+        key = (path, os.stat(path).st_mtime_ns)
+        summary = self._summaries.get(key)
+        if summary is not None:
+            self._summaries.move_to_end(key)
+            return summary
+
+        if path.endswith(EXTENSIONS["parquet"]):
+            schema = pq.read_schema(path, memory_map=True)
+        else:
+            with pa.memory_map(path, 'r') as source:
+                schema = pa.ipc.open_file(source).schema
+        stored = (schema.metadata or {}).get(SUMMARY_KEY)
+        summary = json.loads(stored) if stored else summarize_table(self._read(path))
+        self._summaries[key] = summary
+        while len(self._summaries) > self.cache_files:
+            self._summaries.popitem(last=False)
+        return summary
+
+    def product_buckets(self, user_id: str, product_name: str) -> List[dict]:
+        """One rollup-style bucket per archived month that has the product (see rollups.summarize)."""
+        product = product_name.lower()
+        buckets = []
+        for _, path in self.files(user_id):
+            bucket = self._month_summary(path).get(product)
+            if bucket is not None:
+                buckets.append(bucket)
+        return buckets
+
+    def pages(self, user_id: str, since: Optional[datetime] = None,
+              page_size: int = EXPORT_PAGE_SIZE) -> Iterator[List[dict]]:
+        """Archived rows as ISO-timestamped dicts, oldest first, one page at a time."""
+        since = as_utc(since) if since is not None else None
+        for month, path in self.files(user_id):
+            if since is not None and month < since.strftime('%Y-%m'):
+                continue
+            table = self._read(path)
+            if since is not None:
+                cutoff = pa.scalar(since, SCHEMA.field("created_at").type)
+                table = table.filter(pc.greater_equal(table.column("created_at"), cutoff))
+            for batch in table.to_batches(max_chunksize=page_size):
+                rows = batch.to_pylist()
+                for row in rows:
+                    row["created_at"] = row["created_at"].isoformat()
+                if rows:
+                    yield rows
+
+    def read_rows(self, user_id: str, since: Optional[datetime] = None) -> List[dict]:
+        return [row for page in self.pages(user_id, since) for row in page]
+
+
+def archive_user(client, archive: TransactionArchive, user_id: str, before: datetime,
+                 page_size: int = EXPORT_PAGE_SIZE, delete_batch: int = 200) -> int:
+    """Moves a user's transactions created before `before` into the archive; returns rows moved."""
+    fetch_page = supabase_page_fetcher(client, 'inventory_transactions', user_id, ARCHIVE_COLUMNS,
+                                       until=before.isoformat())
+    moved, month, pending = 0, None, []
+
+    def flush():
+        archive.write_month(user_id, month, pending)
+        ids = [row['id'] for row in pending]
+        for start in range(0, len(ids), delete_batch):
+            client.table('inventory_transactions').delete().in_('id', ids[start:start + delete_batch]).execute()
+        return len(ids)
+
+    # Pages arrive in created_at order, so only the current month is held in memory.
+    for page in keyset_pages(fetch_page, page_size):
+        for row in page:
+            row_month = as_utc(row['created_at']).strftime('%Y-%m')
+            if row_month != month and pending:
+                moved += flush()
+                pending = []
+            month = row_month
+            pending.append(row)
+    if pending:
+        moved += flush()
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["run"])
+    parser.add_argument("--user", help="only archive this user's transactions")
+    parser.add_argument("--older-than-days", type=int, default=ARCHIVE_AFTER_DAYS)
+    args = parser.parse_args()
+    if not ARCHIVE_AVAILABLE:
+        sys.exit("pyarrow is required for the archive (pip install pyarrow)")
+
+    from dotenv import load_dotenv
+    from supabase import create_client
+
+    load_dotenv()
+    url, key = os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+    if not url or not key:
+        sys.exit("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set")
+    client = create_client(url, key)
+    archive = TransactionArchive()
+    before = datetime.now(timezone.utc) - timedelta(days=args.older_than_days)
+    users = [args.user] if args.user else [row['id'] for row in client.table('users').select('id').execute().data]
+    for uid in users:
+        print(f"{uid}: archived {archive_user(client, archive, uid, before)} transactions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Product analytics latency before and after archiving old transactions.
+
+Generates one shop's history (default 2M transactions over 3 years across
+200 products) and times the raw-transaction analytics for one product:
+  before          every transaction of the product comes back from the
+                  database (JSON decode of the rows, as PostgREST returns
+                  them) and is aggregated with pandas, like the original
+                  get_product_analytics
+  after_cold      only the last --hot-days stay in the database and are
+                  folded into day buckets; older months add the per-product
+                  summaries stored in their archive files' metadata
+  after_warm      same with those summaries already cached in the process
+Also reports the archive's size on disk and the time taken to write it.
+
+Usage: python benchmarks/bench_archive.py [--transactions 2000000] [--products 200]
+                                          [--years 3] [--hot-days 365] [--format arrow|parquet]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+import archive
+import rollups
+from fast_json import dumps
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    import json
+    loads = json.loads
+
+USER = "bench-user"
+
+
+def make_rows(n, n_products, years, seed=11):
+    rng = np.random.default_rng(seed)
+    now = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    start = now - timedelta(days=365 * years)
+    offsets = np.sort(rng.uniform(0, (now - start).total_seconds(), n))
+    products = rng.integers(0, n_products, n)
+    adds = rng.random(n) < 0.2
+    quantities = np.round(rng.gamma(2.0, 1.5, n), 3)
+    prices = np.round(rng.uniform(20, 80, n), 2)
+    rows = []
+    for i in range(n):
+        rows.append({
+            "id": f"{i:012d}", "user_id": USER, "product_name": f"Product {products[i]}",
+            "transaction_type": "add" if adds[i] else "remove", "quantity_change": float(quantities[i]),
+            "price_per_kg": float(prices[i]) if adds[i] else None, "notes": "",
+            "created_at": (start + timedelta(seconds=float(offsets[i]))).isoformat(),
+        })
+    return now, rows
+
+
+def legacy_analytics(transactions, product_name):
+    """The get_product_analytics pandas path before rollups and the archive."""
+    df = pd.DataFrame(transactions)
+    df['created_at'] = pd.to_datetime(df['created_at'])
+    total_added = df[df['transaction_type'] == 'add']['quantity_change'].sum()
+    total_removed = df[df['transaction_type'] == 'remove']['quantity_change'].sum()
+    days_span = (df['created_at'].max() - df['created_at'].min()).days
+    price_data = df[df['price_per_kg'].notna()]
+    return {"product_name": product_name, "current_stock": total_added - total_removed,
+            "consumption_rate_per_day": total_removed / days_span if days_span > 0 else 0,
+            "average_price": price_data['price_per_kg'].mean() if not price_data.empty else 0,
+            "transaction_count": len(df)}
+
+
+def timed(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transactions", type=int, default=2_000_000)
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--hot-days", type=int, default=365)
+    parser.add_argument("--format", default="arrow", choices=["arrow", "parquet"])
+    args = parser.parse_args()
+    if not archive.ARCHIVE_AVAILABLE:
+        sys.exit("pyarrow is required (pip install pyarrow)")
+
+    now, rows = make_rows(args.transactions, args.products, args.years)
+    cutoff = (now - timedelta(days=args.hot_days)).isoformat()
+    product = "Product 7"
+    product_rows = [r for r in rows if r["product_name"] == product]
+    all_payload = dumps(product_rows)  # what PostgREST sends for the full history
+    hot_payload = dumps([r for r in product_rows if r["created_at"] >= cutoff])
+
+    with tempfile.TemporaryDirectory() as root:
+        store = archive.TransactionArchive(root, args.format)
+        started = time.perf_counter()
+        month, pending = None, []
+        for row in rows:
+            if row["created_at"] >= cutoff:
+                break
+            row_month = row["created_at"][:7]
+            if row_month != month and pending:
+                store.write_month(USER, month, pending)
+                pending = []
+            month = row_month
+            pending.append(row)
+        if pending:
+            store.write_month(USER, month, pending)
+        archive_s = time.perf_counter() - started
+        size = sum(os.path.getsize(path) for _, path in store.files(USER))
+
+        def after(cold):
+            reader = archive.TransactionArchive(root, args.format) if cold else store
+            buckets = rollups.fold(loads(hot_payload)) + reader.product_buckets(USER, product)
+            return rollups.summarize(buckets, product)
+
+        before_ms, before = timed(lambda: legacy_analytics(loads(all_payload), product))
+        cold_ms, cold = timed(lambda: after(cold=True))
+        after(cold=False)
+        warm_ms, warm = timed(lambda: after(cold=False))
+
+    assert before["transaction_count"] == cold["transaction_count"] == warm["transaction_count"]
+    assert abs(before["current_stock"] - warm["current_stock"]) < 1e-6
+
+    archived = sum(1 for r in rows if r["created_at"] < cutoff)
+    print(f"=== ARCHIVE ({len(rows)} transactions, {archived} archived as {args.format}, "
+          f"{size / 2**20:.1f} MiB in {archive_s:.1f} s) ===")
+    print(f"product rows: {len(product_rows)} total, {len(loads(hot_payload))} hot")
+    print(f"{'mode':<14}{'ms':>10}{'speedup':>10}")
+    for name, ms in (("before", before_ms), ("after_cold", cold_ms), ("after_warm", warm_ms)):
+        print(f"{name:<14}{ms:>10.2f}{before_ms / ms:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Expiry index versus scanning products.
+
+Generates --products products (default 1M) with expiry dates spread over
+--horizon-days, split across --users shops, and loads them into an
+ExpiryIndex. It then compares three operations with the scans they replace:
+  query    "what expires in the next 1 / 7 days" for the largest shop; the
+           scan filters that shop's products (timestamps already parsed)
+           and builds the same result rows
+  sweep    find every product that entered the warning window in the last
+           minute, across all shops; the scan checks every product
+  upsert   a product write (new expiry date) keeping the index current
+
+Usage: python benchmarks/bench_expiry.py [--products 1000000] [--users 1000] [--horizon-days 365]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import expiry
+
+NOW = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def make_rows(n, users, horizon_days, seed=9):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        # a few shops hold most of the catalogue
+        user = f"shop-{min(int(rng.paretovariate(1.2)) - 1, users - 1)}"
+        rows.append({"id": f"{i:08d}", "user_id": user, "name": f"Product {i}", "quantity": 1 + rng.random() * 20,
+                     "expiry_date": NOW + timedelta(days=rng.uniform(-2, horizon_days))})
+    return rows
+
+
+def timed(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--horizon-days", type=float, default=365)
+    args = parser.parse_args()
+
+    rows = make_rows(args.products, args.users, args.horizon_days)
+    now = NOW.timestamp()
+    index = expiry.ExpiryIndex(warn_days=3)
+    started = time.perf_counter()
+    index.load_all(rows, now=now)
+    load_s = time.perf_counter() - started
+
+    by_user = {}
+    for row in rows:
+        row["expires_at"] = row["expiry_date"].timestamp()
+        by_user.setdefault(row["user_id"], []).append(row)
+    shop, shop_rows = max(by_user.items(), key=lambda item: len(item[1]))
+
+    def scan_query(days):
+        horizon = now + days * expiry.DAY_S
+        hits = sorted((r["expires_at"], r["id"], r) for r in shop_rows if r["expires_at"] <= horizon)
+        return [{"id": pid, "name": r["name"], "quantity": r["quantity"], "expiry_date": r["expiry_date"].isoformat(),
+                 "days_left": round((t - now) / expiry.DAY_S, 2), "expired": t <= now} for t, pid, r in hits]
+
+    queries = []
+    for days in (1, 7):
+        scan_ms, expected = timed(lambda: scan_query(days))
+        index.expiring(shop, days, now=now)  # formats expiry dates on first read
+        query_ms, got = timed(lambda: index.expiring(shop, days, now=now))
+        assert [item["id"] for item in got] == [item["id"] for item in expected]
+        queries.append((days, query_ms, scan_ms, len(got)))
+
+    # Sweeps run every minute: compare finding one minute's worth of due events
+    later = now + 30 * expiry.DAY_S
+    warn = 3 * expiry.DAY_S
+    index.sweep(now=later - 60)
+
+    def scan_sweep():
+        return sum(1 for r in rows if later - 60 < r["expires_at"] - warn <= later or later - 60 < r["expires_at"] <= later)
+
+    sweep_scan_ms, due = timed(scan_sweep, repeat=3)
+    started = time.perf_counter()
+    fired = index.sweep(now=later)
+    sweep_ms = (time.perf_counter() - started) * 1000
+    assert sum(len(names) for names in fired.values()) == due
+
+    rng = random.Random(2)
+    sample = rng.sample(shop_rows, min(10_000, len(shop_rows)))
+    started = time.perf_counter()
+    for row in sample:
+        index.upsert(shop, {**row, "expiry_date": row["expiry_date"] + timedelta(days=rng.uniform(1, 30))}, now=later)
+    upsert_us = (time.perf_counter() - started) / len(sample) * 1e6
+
+    print(f"=== EXPIRY ({args.products} products, {len(by_user)} shops, largest {len(shop_rows)}) ===")
+    print(f"load            {load_s:>9.2f} s")
+    for days, query_ms, scan_ms, hits in queries:
+        print(f"query {days} day(s)  index {query_ms:>8.3f} ms   scan {scan_ms:>8.2f} ms   "
+              f"({hits} hits, {scan_ms / query_ms:.0f}x)")
+    print(f"sweep 1 minute  index {sweep_ms:>8.3f} ms   scan {sweep_scan_ms:>8.2f} ms   "
+          f"({due} due, {sweep_scan_ms / max(sweep_ms, 1e-3):.0f}x)")
+    print(f"upsert          {upsert_us:>9.1f} us per write")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Peak memory and throughput of the streaming transaction export.
+
+Exports a synthetic inventory_transactions table (default 5M rows) through
+export.keyset_pages and the StreamingResponse body iterator, the same path
+GET /export/transactions takes, and records the process's peak RSS. The
+page reader seeks by cursor like the (user_id, created_at, id) index does.
+For comparison, `materialize` builds the whole result list and encodes it
+in one go the way GET /products does; it runs on --materialize-rows rows
+because the full set would not fit in memory on small hosts.
+
+Each mode runs in its own process so peak RSS is not shared between them.
+
+Usage: python benchmarks/bench_export.py [--rows 5000000] [--page-size 1000]
+                                         [--materialize-rows 500000] [--mode all|ndjson|csv|materialize]
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import export
+import fast_json
+
+START = datetime(2020, 1, 1)
+PRODUCTS = ["rice", "onion", "tomato", "potato", "wheat", "sugar", "dal", "salt"]
+
+
+def make_row(i):
+    return {
+        "id": f"{i:012d}",
+        "product_name": PRODUCTS[i % len(PRODUCTS)],
+        "transaction_type": "remove" if i % 3 else "add",
+        "quantity_change": round(0.25 + (i * 7919 % 1000) / 100, 3),
+        "price_per_kg": 40.0 + i % 17 if i % 3 == 0 else None,
+        "notes": "",
+        "created_at": (START + timedelta(seconds=30 * i)).isoformat(),
+    }
+
+
+def table_fetcher(total_rows):
+    def fetch(after, limit):
+        start = int(after[1]) + 1 if after else 0
+        return [make_row(i) for i in range(start, min(start + limit, total_rows))]
+    return fetch
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def drain(response):
+    size = 0
+    async for chunk in response.body_iterator:
+        size += len(chunk)
+    return size
+
+
+def run_mode(mode, rows, page_size):
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    if mode == "materialize":
+        everything = [row for page in export.keyset_pages(table_fetcher(rows), page_size) for row in page]
+        size = len(fast_json.dumps(everything))
+    else:
+        _, columns = export.EXPORT_RESOURCES["transactions"]
+        response = export.export_response(export.keyset_pages(table_fetcher(rows), page_size),
+                                          mode, columns, "transactions")
+        size = asyncio.run(drain(response))
+    elapsed = time.perf_counter() - started
+    print(f"{mode}\t{rows}\t{elapsed:.2f}\t{size / 2**20:.1f}\t{baseline:.1f}\t{peak_rss_mb():.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--page-size", type=int, default=export.EXPORT_PAGE_SIZE)
+    parser.add_argument("--materialize-rows", type=int, default=500_000)
+    parser.add_argument("--mode", default="all", choices=["all", "ndjson", "csv", "materialize"])
+    args = parser.parse_args()
+
+    if args.mode != "all":
+        rows = min(args.rows, args.materialize_rows) if args.mode == "materialize" else args.rows
+        run_mode(args.mode, rows, args.page_size)
+        return
+
+    print(f"=== EXPORT (page size {args.page_size}) ===")
+    print(f"{'mode':<14}{'rows':>10}{'seconds':>10}{'rows/s':>12}{'MiB out':>10}{'base RSS':>10}{'peak RSS':>10}")
+    for mode in ("ndjson", "csv", "materialize"):
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--mode", mode, "--rows", str(args.rows),
+                              "--page-size", str(args.page_size), "--materialize-rows", str(args.materialize_rows)],
+                             capture_output=True, text=True, check=True).stdout.strip().split("\t")
+        name, rows, seconds, mib, base, peak = out[0], int(out[1]), float(out[2]), out[3], out[4], out[5]
+        print(f"{name:<14}{rows:>10}{seconds:>10.2f}{rows / seconds:>12.0f}{mib:>10}{base:>10}{peak:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Per-product pandas depletion estimate vs. the vectorized forecasting engine.
+
+Generates a synthetic history (default 1000 products x 730 days, ~0.7
+removals per product per day plus weekly restocks) and times:
+  legacy        the get_product_analytics approach, one DataFrame filter per
+                product (timed on --legacy-sample products, extrapolated)
+  engine_ses    forecast_rates + depletion_days on prebuilt arrays
+  engine_window same with the moving-window rate
+  engine_rows   forecast_products end to end from row dicts (includes parsing)
+
+Usage: python benchmarks/bench_forecast.py [--products 1000] [--days 730] [--legacy-sample 50]
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+import forecasting
+
+
+def make_history(n_products, n_days, seed=7):
+    rng = np.random.default_rng(seed)
+    now = datetime(2024, 12, 31, 18)
+    base_rate = rng.gamma(2.0, 1.0, n_products)
+    product_idx, day_idx, qty, kinds = [], [], [], []
+    for day in range(n_days):
+        active = rng.random(n_products) < 0.7
+        idx = np.nonzero(active)[0]
+        product_idx.append(idx)
+        day_idx.append(np.full(len(idx), day))
+        qty.append(rng.poisson(base_rate[idx]) + 0.5)
+        kinds.append(np.full(len(idx), "remove"))
+        if day % 7 == 0:
+            product_idx.append(np.arange(n_products))
+            day_idx.append(np.full(n_products, day))
+            qty.append(base_rate * 7)
+            kinds.append(np.full(n_products, "add"))
+    product_idx, day_idx = np.concatenate(product_idx), np.concatenate(day_idx)
+    qty, kinds = np.concatenate(qty), np.concatenate(kinds)
+
+    start = now - timedelta(days=n_days - 1)
+    stamps = pd.Timestamp(start) + pd.to_timedelta(day_idx, unit="D")
+    names = [f"product {i}" for i in range(n_products)]
+    rows = pd.DataFrame({
+        "product_name": np.array(names)[product_idx],
+        "transaction_type": kinds,
+        "quantity_change": qty,
+        "created_at": stamps.strftime("%Y-%m-%dT%H:%M:%S"),
+    }).to_dict("records")
+    products = [{"name": name, "quantity": float(rate * 10), "minimum_stock": 1.0}
+                for name, rate in zip(names, base_rate)]
+    return now, products, rows, (product_idx, day_idx, np.where(kinds == "remove", qty, 0.0))
+
+
+def legacy(products, rows):
+    df = pd.DataFrame(rows)
+    df["created_at"] = pd.to_datetime(df["created_at"])
+    out = []
+    for product in products:
+        pdf = df[df["product_name"] == product["name"]]
+        total_removed = pdf[pdf["transaction_type"] == "remove"]["quantity_change"].sum()
+        days_span = (pdf["created_at"].max() - pdf["created_at"].min()).days
+        rate = total_removed / days_span if days_span > 0 else 0
+        out.append((product["quantity"] - product["minimum_stock"]) / rate if rate > 0 else None)
+    return out
+
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--legacy-sample", type=int, default=50)
+    args = parser.parse_args()
+
+    now, products, rows, (product_idx, day_idx, removed) = make_history(args.products, args.days)
+    n = len(products)
+    first_day = np.zeros(n, dtype=np.int64)
+    stock = np.array([p["quantity"] - p["minimum_stock"] for p in products])
+
+    def engine(method):
+        demand = forecasting.daily_matrix(product_idx, day_idx, removed, n, args.days)
+        rate, sigma = forecasting.forecast_rates(demand, first_day, method=method)
+        return forecasting.depletion_days(stock, rate, sigma)
+
+    sample = products[:args.legacy_sample]
+    legacy_ms = timed(lambda: legacy(sample, rows), repeat=1) * n / len(sample)
+
+    results = [
+        ("legacy (extrapolated)", legacy_ms),
+        ("engine_ses", timed(lambda: engine("ses"))),
+        ("engine_window", timed(lambda: engine("window"))),
+        ("engine_rows", timed(lambda: forecasting.forecast_products(products, rows, now=now,
+                                                                     history_days=args.days))),
+    ]
+
+    print(f"=== FORECASTING ({n} products x {args.days} days, {len(rows)} transactions) ===")
+    print(f"{'mode':<24}{'ms':>12}{'speedup':>10}")
+    for name, ms in results:
+        print(f"{name:<24}{ms:>12.1f}{legacy_ms / ms:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
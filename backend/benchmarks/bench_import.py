@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Bulk product import throughput.
+
+Streams a generated CSV (default 50k rows, 20% of them repeats of an earlier
+SKU, a few invalid) to POST /products/import of the in-memory server in 64
+KiB chunks and reports wall time and rows/s. It then runs parse_upload alone
+to separate parsing and validation from the store writes.
+
+For the database backends it prints the round trips each approach needs for
+the same upload. Per row, POST /products costs a product insert plus a
+transaction insert. The import costs one call per IMPORT_BATCH_SIZE rows for
+each of inserts, increments and transactions, plus the catalogue read. The
+estimate is round trips x --rtt-ms.
+
+Usage: python benchmarks/bench_import.py [--rows 50000] [--duplicates 0.2] [--rtt-ms 20]
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+import bulk_import
+import server
+
+
+def make_csv(rows, duplicate_share, seed=5):
+    rng = random.Random(seed)
+    lines = ["name,quantity,price_per_kg,category,description"]
+    distinct = 0
+    for i in range(rows):
+        if distinct and rng.random() < duplicate_share:
+            name = f"SKU {rng.randrange(distinct):06d}"
+        else:
+            name = f"SKU {distinct:06d}"
+            distinct += 1
+        quantity = "-1" if i % 997 == 0 else f"{rng.uniform(1, 50):.2f}"  # a few invalid rows
+        lines.append(f'{name},{quantity},{rng.uniform(10, 200):.2f},grocery,"Imported, batch {i // 1000}"')
+    return ("\n".join(lines) + "\n").encode(), distinct
+
+
+async def chunked(body, size=64 * 1024):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+async def run_endpoint(body):
+    server.products_store.clear()
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        response = await client.post("/products/import", content=chunked(body),
+                                     headers={"content-type": "text/csv"}, timeout=300)
+        return time.perf_counter() - started, response.json()
+
+
+async def run_parse(body):
+    started = time.perf_counter()
+    parsed = await bulk_import.parse_upload(chunked(body), "csv")
+    return time.perf_counter() - started, parsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--duplicates", type=float, default=0.2)
+    parser.add_argument("--rtt-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    body, distinct = make_csv(args.rows, args.duplicates)
+    parse_s, parsed = asyncio.run(run_parse(body))
+    total_s, result = asyncio.run(run_endpoint(body))
+
+    print(f"=== IMPORT ({args.rows} rows, {distinct} distinct SKUs, {len(body) / 2**20:.1f} MiB) ===")
+    print(f"parse+validate+merge {parse_s * 1000:>9.0f} ms  {args.rows / parse_s:>10.0f} rows/s")
+    print(f"endpoint (in-memory) {total_s * 1000:>9.0f} ms  {args.rows / total_s:>10.0f} rows/s")
+    print(f"created={result['created']} updated={result['updated']} "
+          f"merged={result['merged_duplicates']} errors={result['error_count']}")
+
+    batch = bulk_import.IMPORT_BATCH_SIZE
+    valid = args.rows - parsed.error_count
+    before = valid * 2
+    after = 1 + math.ceil(len(parsed.products) / batch) * 2
+    print(f"\nDB round trips   per-row POST /products: {before:>7}  (~{before * args.rtt_ms / 1000:.0f} s "
+          f"at {args.rtt_ms:.0f} ms)")
+    print(f"                 /products/import:       {after:>7}  (~{after * args.rtt_ms / 1000:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Serialization cost of large product payloads.
+
+Compares FastAPI's default path (jsonable_encoder + json.dumps) with
+fast_json.dumps using the stdlib encoder and, if installed, orjson. Rows
+look like the product store: strings, floats and a datetime created_at.
+
+Usage: python benchmarks/bench_json.py [--rows 10000] [--rounds 20]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+
+import fast_json
+
+
+def make_rows(count):
+    start = datetime(2024, 1, 1)
+    return [{
+        "_id": str(uuid.uuid4()),
+        "name": f"product {i}",
+        "quantity": round(i % 50 * 0.75, 2),
+        "price_per_kg": float(20 + i % 200),
+        "description": "",
+        "category": "vegetables" if i % 3 else "grains",
+        "created_at": start + timedelta(minutes=i),
+    } for i in range(count)]
+
+
+def fastapi_default(rows):
+    return json.dumps(jsonable_encoder(rows), ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def stdlib_fast(rows):
+    enabled, fast_json.ORJSON_ENABLED = fast_json.ORJSON_ENABLED, False
+    try:
+        return fast_json.dumps(rows)
+    finally:
+        fast_json.ORJSON_ENABLED = enabled
+
+
+def measure(fn, rows, rounds):
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        body = fn(rows)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    modes = [("jsonable_encoder", fastapi_default), ("stdlib_fast", stdlib_fast)]
+    if fast_json.ORJSON_ENABLED:
+        modes.append(("orjson", fast_json.dumps))
+
+    print(f"=== JSON SERIALIZATION ({args.rows} rows, median of {args.rounds}) ===")
+    print(f"{'mode':<18}{'ms':>9}{'KB':>9}{'speedup':>9}")
+    baseline = None
+    for name, fn in modes:
+        ms, size = measure(fn, rows, args.rounds)
+        baseline = baseline or ms
+        print(f"{name:<18}{ms:>9.2f}{size / 1024:>9.0f}{baseline / ms:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the micro-batched LLM dispatcher.
+Replays a burst of low-confidence voice commands against a local fake model
+(fixed per-call latency, limited concurrent calls like a real API quota) and
+compares one-call-per-command with batched dispatch.
+
+Usage: python benchmarks/bench_llm_batching.py [--commands 400] [--rate 800]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_batcher import LLMBatchDispatcher
+
+COMMANDS = [
+    "tamatar do kilo chalis rupaye",
+    "pyaz teen kilo",
+    "aloo ka stock kitna hai",
+    "kela half kg",
+    "put some apples in",
+    "chawal 10 kg sixty",
+    "doodh 2 litre",
+    "hata do gobi",
+]
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """Stands in for Gemini: fixed call latency plus a small per-item cost."""
+
+    def __init__(self, call_latency=0.15, per_item=0.002, max_concurrent_calls=8):
+        self.call_latency = call_latency
+        self.per_item = per_item
+        self.calls = 0
+        self._quota = asyncio.Semaphore(max_concurrent_calls)
+
+    async def generate_content_async(self, prompt):
+        ids = re.findall(r'^(\d+)\. ', prompt, re.MULTILINE)
+        async with self._quota:
+            self.calls += 1
+            await asyncio.sleep(self.call_latency + self.per_item * len(ids))
+        return FakeResponse(json.dumps([
+            {"id": int(i), "action": "add", "product_name": "tomato", "quantity": 2, "price": 40}
+            for i in ids
+        ]))
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run(window_ms, max_batch_size, commands, rate):
+    model = FakeModel()
+    dispatcher = LLMBatchDispatcher(model, window_ms=window_ms, max_batch_size=max_batch_size, timeout=30)
+    latencies = []
+
+    async def one(command):
+        start = time.perf_counter()
+        await dispatcher.submit(command, {"action": "unknown", "confidence": 0.0})
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    tasks = []
+    for i in range(commands):
+        tasks.append(asyncio.create_task(one(random.choice(COMMANDS))))
+        await asyncio.sleep(random.expovariate(rate))
+    await asyncio.gather(*tasks)
+
+    return {
+        "model_calls": model.calls,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--commands", type=int, default=400)
+    parser.add_argument("--rate", type=float, default=800, help="arrivals per second")
+    parser.add_argument("--window-ms", type=float, default=50)
+    parser.add_argument("--batch-size", type=int, default=16)
+    args = parser.parse_args()
+
+    random.seed(7)
+    unbatched = asyncio.run(run(0, 1, args.commands, args.rate))
+    random.seed(7)
+    batched = asyncio.run(run(args.window_ms, args.batch_size, args.commands, args.rate))
+
+    print(f"=== LLM DISPATCH: {args.commands} commands at ~{args.rate:.0f}/s ===")
+    print(f"{'mode':<12}{'calls':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, r in (("unbatched", unbatched), ("batched", batched)):
+        print(f"{name:<12}{r['model_calls']:>8}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}")
+    print(f"Model calls reduced {unbatched['model_calls'] / max(1, batched['model_calls']):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Request latency under different logging setups, against a slow log sink.
+
+The sink sleeps on every write to mimic a log collector applying
+backpressure. Modes:
+  off         - INFO level, hot-path debug logs skipped
+  sync_debug  - every hot-path debug record written inline (the old print() behaviour)
+  queued      - DEBUG level through the queue-backed handler, all records kept
+  queued_sampled - DEBUG level through the queue, hot-path logs sampled at LOG_SAMPLE_RATE
+
+Usage: python benchmarks/bench_logging.py [--requests 500] [--sink-delay-ms 0.2]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app_logging
+    import server
+
+
+class SlowSink(io.TextIOBase):
+    def __init__(self, delay):
+        self.delay = delay
+        self.lines = 0
+
+    def write(self, text):
+        time.sleep(self.delay)
+        self.lines += text.count("\n")
+        return len(text)
+
+
+def configure(mode, sink):
+    if mode == "sync_debug":
+        logger = logging.getLogger(app_logging.ROOT_LOGGER)
+        app_logging.shutdown_logging()
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        handler = logging.StreamHandler(sink)
+        handler.addFilter(app_logging.RequestIdFilter())
+        handler.setFormatter(app_logging.JsonFormatter())
+        logger.addHandler(handler)
+        logger.setLevel("DEBUG")
+        app_logging.LOG_SAMPLE_RATE = 1.0
+    else:
+        app_logging.configure_logging(level="INFO" if mode == "off" else "DEBUG", stream=sink)
+        app_logging.LOG_SAMPLE_RATE = 0.01 if mode == "queued_sampled" else 1.0
+
+
+async def measure(requests):
+    latencies = []
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for i in range(requests):
+            start = time.perf_counter()
+            if i % 2:
+                await client.get("/products")
+            else:
+                await client.post("/voice-command", json={"command": f"add onion {i % 4 + 1} kg at 30 rupees"})
+            latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--sink-delay-ms", type=float, default=0.2)
+    args = parser.parse_args()
+
+    print(f"=== LOGGING OVERHEAD ({args.requests} requests, sink write {args.sink_delay_ms} ms) ===")
+    print(f"{'mode':<16}{'p50 ms':>9}{'p99 ms':>9}{'lines':>8}")
+    for mode in ("off", "sync_debug", "queued", "queued_sampled"):
+        sink = SlowSink(args.sink_delay_ms / 1000)
+        configure(mode, sink)
+        p50, p99 = asyncio.run(measure(args.requests))
+        app_logging.shutdown_logging()
+        print(f"{mode:<16}{p50:>9.3f}{p99:>9.3f}{sink.lines:>8}")
+
+
+if __name__ == "__main__":
+    main()
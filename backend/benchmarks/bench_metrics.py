@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Measures the cost of metrics recording on the request path.
+
+1. End to end: alternating rounds of in-process requests against server.py
+   with recording switched on and off, comparing median request latency.
+2. Per request: the raw cost of the observations a voice command makes
+   (route histogram, stages, DB helpers) relative to the request itself.
+
+The target is under 2% overhead.
+
+Usage: python benchmarks/bench_metrics.py [--rounds 20] [--requests 300]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import metrics
+    import server
+
+
+async def one_round(client, requests):
+    latencies = []
+    for i in range(requests):
+        start = time.perf_counter()
+        if i % 2:
+            await client.get("/products")
+        else:
+            await client.post("/voice-command", json={"command": f"add tomato {i % 5 + 1} kg at 40 rupees"})
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies)
+
+
+async def end_to_end(rounds, requests):
+    transport = httpx.ASGITransport(app=server.app)
+    medians = {True: [], False: []}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await one_round(client, 100)
+        for r in range(rounds * 2):
+            # ABBA ordering so slow drift over the run cancels out.
+            enabled = r % 4 in (0, 3)
+            metrics.METRICS_ENABLED = enabled
+            medians[enabled].append(await one_round(client, requests))
+    metrics.METRICS_ENABLED = True
+    return statistics.median(medians[True]), statistics.median(medians[False])
+
+
+def recording_cost(iterations=200_000):
+    """Seconds spent recording what one voice-command request records."""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        metrics.REQUEST_LATENCY.observe(0.002, "POST", "/voice-command", "200")
+        metrics.VOICE_STAGE_LATENCY.observe(0.0002, "regex")
+        metrics.VOICE_STAGE_LATENCY.observe(0.0001, "db")
+        metrics.DB_CALL_LATENCY.observe(0.00001, "find_product")
+        metrics.DB_CALL_LATENCY.observe(0.00001, "save_product")
+        time.perf_counter(); time.perf_counter(); time.perf_counter(); time.perf_counter()
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        on, off = asyncio.run(end_to_end(args.rounds, args.requests))
+    per_request = recording_cost()
+
+    print("=== METRICS OVERHEAD ===")
+    print(f"median request, metrics on : {on * 1e6:8.1f} us")
+    print(f"median request, metrics off: {off * 1e6:8.1f} us")
+    print(f"end-to-end overhead        : {(on - off) / off:8.2%}")
+    print(f"recording cost per request : {per_request * 1e6:8.2f} us "
+          f"({per_request / off:.2%} of a median request)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for voice-command parsers over the labeled corpus.
+
+Reports commands per second, mean time per parse and, from tracemalloc,
+the peak transient memory and retained blocks per parse, plus accuracy
+against the corpus labels so a speedup can be weighed against correctness.
+
+Usage (from backend/):
+    python benchmarks/bench_parser.py
+    python benchmarks/bench_parser.py --parser server:process_voice_command --parser my_fast_parser:parse
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parser_corpus import CORPUS_PATH, REFERENCE_PARSER, accuracy, load_corpus, load_parser
+
+
+def throughput(parse, corpus, passes):
+    for row in corpus[:200]:
+        parse(row["command"], row["language"])
+    start = time.perf_counter()
+    for _ in range(passes):
+        for row in corpus:
+            parse(row["command"], row["language"])
+    elapsed = time.perf_counter() - start
+    count = passes * len(corpus)
+    return count / elapsed, elapsed / count * 1e6
+
+
+def allocations(parse, corpus, sample):
+    """Mean peak traced bytes and mean retained blocks per parse."""
+    rows = corpus[:sample]
+    peak_total, blocks_total = 0, 0
+    tracemalloc.start()
+    try:
+        for row in rows:
+            tracemalloc.reset_peak()
+            before_blocks = sys.getallocatedblocks()
+            before, _ = tracemalloc.get_traced_memory()
+            parse(row["command"], row["language"])
+            _, peak = tracemalloc.get_traced_memory()
+            peak_total += peak - before
+            blocks_total += sys.getallocatedblocks() - before_blocks
+    finally:
+        tracemalloc.stop()
+    return peak_total / len(rows), blocks_total / len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--parser", action="append", help="module:function (repeatable)")
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--passes", type=int, default=5)
+    parser.add_argument("--alloc-sample", type=int, default=500)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    specs = args.parser or [REFERENCE_PARSER]
+
+    print(f"=== PARSER BENCHMARK: {len(corpus)} commands x {args.passes} passes ===")
+    print(f"{'parser':<40}{'cmds/s':>10}{'us/cmd':>9}{'peak B':>9}{'blocks':>8}{'exact':>8}")
+    for spec in specs:
+        parse = load_parser(spec)
+        rate, per_call = throughput(parse, corpus, args.passes)
+        peak, blocks = allocations(parse, corpus, args.alloc_sample)
+        acc = accuracy(parse, corpus)
+        print(f"{spec:<40}{rate:>10.0f}{per_call:>9.1f}{peak:>9.0f}{blocks:>8.2f}{acc['exact_match']:>8.2%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Batch linear regression per request vs. running price accumulators.
+
+Builds --products products with --prices priced transactions each
+(default 1000 x 365) and times:
+  batch    one scipy.stats.linregress per product over its full price history,
+           as each /analytics/trends request had to do
+  online   trend_summary over the accumulators (what a request costs now)
+  update   folding one more price into an accumulator (paid per transaction)
+
+Usage: python benchmarks/bench_price_trends.py [--products 1000] [--prices 365]
+"""
+
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from scipy import stats
+
+import price_trends
+from bench_forecast import timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--prices", type=int, default=365)
+    args = parser.parse_args()
+
+    rng = random.Random(9)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    book = price_trends.PriceTrendBook()
+    history = {}
+    for p in range(args.products):
+        name, drift = f"p{p}", rng.uniform(-0.1, 0.1)
+        xs, ys = [], []
+        for day in range(args.prices):
+            when = start + timedelta(days=day, hours=rng.uniform(0, 24))
+            price = 40 + drift * day + rng.gauss(0, 3)
+            book.record("shop", {"product_name": name, "price_per_kg": price, "created_at": when})
+            xs.append(price_trends.day_number(when))
+            ys.append(price)
+        history[name] = (np.array(xs), np.array(ys))
+    rows = book.rows("shop")
+
+    def batch():
+        return [stats.linregress(xs, ys) for xs, ys in history.values()]
+
+    accumulator = price_trends.PriceStats.from_row(rows[0])
+    x = price_trends.day_number(start + timedelta(days=args.prices))
+
+    def update():
+        for _ in range(1000):
+            accumulator.update(x, 41.0)
+
+    batch_ms = timed(batch)
+    online_ms = timed(lambda: price_trends.trend_summary(rows))
+    summary = price_trends.trend_summary(rows)
+    print(f"=== PRICE TRENDS ({args.products} products x {args.prices} prices, "
+          f"{summary['significant_count']} significant) ===")
+    print(f"{'mode':<24}{'ms':>12}{'speedup':>10}")
+    print(f"{'batch linregress':<24}{batch_ms:>12.2f}{1:>9.0f}x")
+    print(f"{'online accumulators':<24}{online_ms:>12.2f}{batch_ms / online_ms:>9.0f}x")
+    print(f"update per transaction  {timed(update) * 1000 / 1000:>9.2f} us")
+
+
+if __name__ == "__main__":
+    main()
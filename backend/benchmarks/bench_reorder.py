@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Per-product reorder calculation vs. the vectorized reorder planner.
+
+Uses the synthetic history of bench_forecast.py (default 10000 products x
+90 days) and times:
+  per_product    one DataFrame filter per product, then mean/std, safety
+                 stock, reorder point and EOQ for that product (timed on
+                 --legacy-sample products, extrapolated)
+  engine_arrays  demand_stats + reorder_arrays on a prebuilt demand matrix
+  engine_rows    reorder_plan end to end from row dicts (parsing, the matrix
+                 and the result rows included)
+  cached         a repeat request at the same inventory version (SingleFlight hit)
+
+Usage: python benchmarks/bench_reorder.py [--products 10000] [--days 90] [--legacy-sample 100]
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+import forecasting
+import reorder
+from bench_forecast import make_history, timed
+from singleflight import SingleFlight
+
+
+def per_product(products, rows, n_days):
+    df = pd.DataFrame(rows)
+    df["day"] = pd.to_datetime(df["created_at"]).dt.normalize()
+    z = stats.norm.ppf(reorder.REORDER_SERVICE_LEVEL)
+    lead = reorder.REORDER_LEAD_TIME_DAYS
+    out = []
+    for product in products:
+        pdf = df[(df["product_name"] == product["name"]) & (df["transaction_type"] == "remove")]
+        daily = pdf.groupby("day")["quantity_change"].sum().reindex(
+            pd.date_range(df["day"].min(), periods=n_days), fill_value=0.0)
+        mean, std = daily.mean(), daily.std()
+        rop = product["minimum_stock"] + mean * lead + z * std * math.sqrt(lead)
+        holding = reorder.REORDER_HOLDING_RATE * product["price_per_kg"]
+        eoq = math.sqrt(2 * mean * 365 * reorder.REORDER_ORDER_COST / holding) if mean > 0 and holding > 0 else None
+        out.append((rop, eoq))
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=10_000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--legacy-sample", type=int, default=100)
+    args = parser.parse_args()
+
+    now, products, rows, (product_idx, day_idx, removed) = make_history(args.products, args.days)
+    rng = np.random.default_rng(3)
+    for product, price in zip(products, rng.uniform(10, 200, len(products))):
+        product["price_per_kg"] = float(price)
+    n = len(products)
+    stock = np.array([p["quantity"] for p in products])
+    minimum = np.array([p["minimum_stock"] for p in products])
+    price = np.array([p["price_per_kg"] for p in products])
+    first_day = np.zeros(n, dtype=np.int64)
+
+    def engine_arrays():
+        demand = forecasting.daily_matrix(product_idx, day_idx, removed, n, args.days)
+        mean, std = reorder.demand_stats(demand, first_day)
+        return reorder.reorder_arrays(stock, minimum, price, mean, std)
+
+    sample = products[:args.legacy_sample]
+    legacy_ms = timed(lambda: per_product(sample, rows, args.days), repeat=1) * n / len(sample)
+
+    flights = SingleFlight("bench", cache_ttl=3600)
+    plan = reorder.reorder_plan(products, rows, now=now, history_days=args.days)
+
+    async def fill():
+        async def compute():
+            return plan
+        await flights.do(("shop", 1), compute)
+
+    asyncio.run(fill())
+
+    def cached():
+        async def hit():
+            return await flights.do(("shop", 1), None)
+        return asyncio.run(hit())
+
+    results = [
+        ("per_product (extrapolated)", legacy_ms),
+        ("engine_arrays", timed(engine_arrays)),
+        ("engine_rows", timed(lambda: reorder.reorder_plan(products, rows, now=now, history_days=args.days))),
+        ("cached", timed(cached)),
+    ]
+
+    print(f"=== REORDER PLAN ({n} products x {args.days} days, {len(rows)} transactions, "
+          f"{plan['order_now_count']} to order now) ===")
+    print(f"{'mode':<28}{'ms':>12}{'speedup':>10}")
+    for name, ms in results:
+        print(f"{name:<28}{ms:>12.2f}{legacy_ms / ms:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Per-product Monte Carlo loop vs. the vectorized stockout simulation.
+
+Uses the synthetic history of bench_forecast.py (default 10000 products x
+90 days) and a --days horizon, and times:
+  per_path      a Python loop over products, paths and days
+                (timed on --legacy-sample products, extrapolated)
+  per_product   one numpy draw and cumsum per product for all its paths
+                (timed on --legacy-sample products, extrapolated)
+  vectorized    simulate_stockouts with no runtime budget
+  budgeted      simulate_stockouts under STOCKOUT_BUDGET_MS, with the
+                number of paths it reached
+
+Throughput is in simulated product-days per second.
+
+Usage: python benchmarks/bench_stockout.py [--products 10000] [--days 14] [--paths 2000] [--legacy-sample 200]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import forecasting
+import stockout
+from bench_forecast import make_history
+
+
+def per_path(demand, first_day, stock, horizon, paths, rng):
+    lasted = []
+    for i in range(demand.shape[0]):
+        history = demand[i, first_day[i]:].tolist()
+        counts = [0] * (horizon + 1)
+        for _ in range(paths):
+            left, day = stock[i], 0
+            for need in rng.choices(history, k=horizon):
+                left -= need
+                if left <= 0:
+                    break
+                day += 1
+            counts[day] += 1
+        lasted.append(counts)
+    return lasted
+
+
+def per_product(demand, first_day, stock, horizon, paths, rng):
+    lasted = []
+    for i in range(demand.shape[0]):
+        history = demand[i, first_day[i]:]
+        used = rng.choice(history, size=(paths, horizon)).cumsum(axis=1)
+        lasted.append(np.bincount((used < stock[i]).sum(axis=1), minlength=horizon + 1))
+    return lasted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=10_000)
+    parser.add_argument("--history", type=int, default=90)
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--paths", type=int, default=2000)
+    parser.add_argument("--legacy-sample", type=int, default=200)
+    args = parser.parse_args()
+
+    now, products, rows, (product_idx, day_idx, removed) = make_history(args.products, args.history)
+    n = len(products)
+    demand = forecasting.daily_matrix(product_idx, day_idx, removed, n, args.history)
+    first_day = np.zeros(n, dtype=np.int64)
+    stock = np.array([p["quantity"] for p in products], dtype=float)
+    cells = n * args.paths * args.days
+    rng = np.random.default_rng(1)
+
+    def extrapolated(loop, sample, rng):
+        started = time.perf_counter()
+        loop(demand[:sample], first_day[:sample], stock[:sample], args.days, args.paths, rng)
+        return (time.perf_counter() - started) * 1000 * n / sample
+
+    legacy_ms = extrapolated(per_path, max(1, args.legacy_sample // 20), random.Random(1))
+    per_product_ms = extrapolated(per_product, args.legacy_sample, rng)
+
+    started = time.perf_counter()
+    counts, done = stockout.simulate_stockouts(demand, first_day, stock, args.days, args.paths,
+                                               budget_ms=float("inf"), rng=rng)
+    vector_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    _, budget_paths = stockout.simulate_stockouts(demand, first_day, stock, args.days, args.paths, rng=rng)
+    budget_ms = (time.perf_counter() - started) * 1000
+    at_risk = int((1 - counts[:, args.days] / done >= stockout.STOCKOUT_RISK_LEVEL).sum())
+
+    print(f"=== STOCKOUT RISK ({n} products x {args.paths} paths x {args.days} days, "
+          f"{at_risk} at risk) ===")
+    print(f"{'mode':<28}{'ms':>12}{'paths':>8}{'Mcells/s':>10}{'speedup':>10}")
+    for name, ms, paths in (("per_path (extrapolated)", legacy_ms, args.paths),
+                            ("per_product (extrapolated)", per_product_ms, args.paths),
+                            ("vectorized", vector_ms, done),
+                            (f"budgeted ({stockout.STOCKOUT_BUDGET_MS:.0f} ms)", budget_ms, budget_paths)):
+        rate = n * paths * args.days / ms / 1000
+        print(f"{name:<28}{ms:>12.1f}{paths:>8}{rate:>10.1f}{legacy_ms / ms * paths / args.paths:>9.1f}x")
+    print(f"cells per full run: {cells / 1e6:.0f}M")
+
+
+if __name__ == "__main__":
+    main()
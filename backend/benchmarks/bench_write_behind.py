@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Database writes saved by the write-behind buffer.
+
+Replays --ops stock changes (default 200k) from --shops shops, arriving at
+--rate changes per second. Products are picked with a Zipf-like skew, so a
+few hot products (onion, tomato, milk) take most of the writes. Time is
+simulated, so the run takes seconds whatever the rate. The baseline writes
+each change at once: one UPDATE of the product plus one INSERT of its
+transaction. With the buffer, each flush makes one apply_stock_deltas call
+per shop with changes.
+
+For each flush interval it reports database calls per second, product rows
+updated per second, and how long a change waited before it was written.
+It then measures what buffering costs the request path: an add with the
+journal flushed to the OS, and with an fsync per change.
+
+Usage: python benchmarks/bench_write_behind.py [--ops 200000] [--rate 2000] [--shops 50] [--products 200]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import write_behind
+
+
+class SimClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_ops(n, rate, shops, products, seed=5):
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) ** 1.1 for rank in range(products)]
+    picks = rng.choices(range(products), weights=weights, k=n)
+    return [(i / rate, f"shop-{rng.randrange(shops)}", f"p{product}", -rng.uniform(0.25, 3)) for i, product in enumerate(picks)]
+
+
+def replay(ops, flush_ms, max_ops):
+    calls, rows, waits = [0], [0], []
+    clock = SimClock()
+
+    async def flush(batch_id, user_id, items, transactions):
+        calls[0] += 1
+        rows[0] += len(items)
+        waits.extend(clock.now - t["at"] for t in transactions)
+
+    buffer = write_behind.WriteBehindBuffer(flush, flush_ms=flush_ms, max_ops=max_ops, clock=clock)
+
+    async def run():
+        for at, shop, product, delta in ops:
+            clock.now = at
+            buffer.add(shop, product, product, delta, {"at": at})
+            if buffer.due():
+                await buffer.flush()
+        await buffer.flush()
+
+    asyncio.run(run())
+    waits.sort()
+    return calls[0], rows[0], waits[len(waits) // 2], waits[int(len(waits) * 0.99)]
+
+
+def add_cost_us(fsync, n):
+    with tempfile.TemporaryDirectory() as tmp:
+        async def flush(*batch):
+            pass
+
+        buffer = write_behind.WriteBehindBuffer(flush, write_behind.DeltaJournal(os.path.join(tmp, "j"), fsync=fsync),
+                                                max_ops=n + 1)
+        started = time.perf_counter()
+        for i in range(n):
+            buffer.add("shop", "p0", "p0", -1.0, {"id": i, "transaction_type": "remove", "quantity_change": 1.0})
+        elapsed = time.perf_counter() - started
+        buffer.journal.close()
+    return elapsed / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ops", type=int, default=200_000)
+    parser.add_argument("--rate", type=float, default=2000)
+    parser.add_argument("--shops", type=int, default=50)
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--max-ops", type=int, default=write_behind.WRITE_BEHIND_MAX_OPS)
+    args = parser.parse_args()
+
+    ops = make_ops(args.ops, args.rate, args.shops, args.products)
+    seconds = args.ops / args.rate
+    print(f"=== WRITE-BEHIND ({args.ops} changes at {args.rate:.0f}/s over {seconds:.0f} s, "
+          f"{args.shops} shops, {args.products} products) ===")
+    print(f"{'mode':<18}{'db calls/s':>12}{'rows/s':>10}{'saved':>9}{'wait p50':>11}{'wait p99':>11}")
+    direct = 2 * args.rate
+    print(f"{'write-through':<18}{direct:>12.0f}{args.rate:>10.0f}{'':>9}{0:>10.0f}ms{0:>10.0f}ms")
+    for flush_ms in (50, 250, 1000):
+        calls, rows, p50, p99 = replay(ops, flush_ms, args.max_ops)
+        print(f"{f'flush {flush_ms} ms':<18}{calls / seconds:>12.0f}{rows / seconds:>10.0f}"
+              f"{1 - calls / seconds / direct:>8.1%}{p50 * 1000:>10.0f}ms{p99 * 1000:>10.0f}ms")
+
+    print(f"add, journal          {add_cost_us(False, 50_000):>8.1f} us")
+    print(f"add, journal + fsync  {add_cost_us(True, 2_000):>8.1f} us")
+
+
+if __name__ == "__main__":
+    main()
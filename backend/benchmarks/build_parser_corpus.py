@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Builds the labeled voice-command corpus used by bench_parser.py and diff_parsers.py.
+
+Seeds are the commands used across the test scripts, demos and README,
+labeled by hand with the intended result. They are expanded with templated
+phrasings over the multilingual product vocabulary, quantities and prices, so
+each generated label is known by construction rather than by running a parser.
+
+Usage: python benchmarks/build_parser_corpus.py [--size 3000] [--out benchmarks/corpus/voice_commands.jsonl]
+"""
+
+import argparse
+import json
+import os
+import random
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus', 'voice_commands.jsonl')
+
+
+def label(action, product=None, quantity=None, price=None):
+    return {"action": action, "product_name": product, "quantity": quantity, "price": price}
+
+
+# (command, language, expected) taken from the test scripts, demos and README.
+SEEDS = [
+    ("Add tomato 2 kg at 25 rupees", "en", label("add", "tomato", 2, 25)),
+    ("Store onion 1.5 kg ₹30", "en", label("add", "onion", 1.5, 30)),
+    ("Create apple 3 kg fifty rupees", "en", label("add", "apple", 3, 50)),
+    ("Update tomato price to ₹30", "en", label("update", "tomato", None, 30)),
+    ("Search for apple", "en", label("search", "apple")),
+    ("List all products", "en", label("list")),
+    ("Remove onion", "en", label("remove", "onion")),
+    ("Add tamatar 1 kg ₹25", "en", label("add", "tomato", 1, 25)),
+    ("Update aloo price to ₹30", "en", label("update", "potato", None, 30)),
+    ("I want to add 2 kg of grapes at 120 rupees per kg", "en", label("add", "grapes", 2, 120)),
+    ("Please update the price of mango to 85 rupees", "en", label("update", "mango", None, 85)),
+    ("Can you show me all the products in stock?", "en", label("list")),
+    ("What is the stock of tomato?", "en", label("stock", "tomato")),
+    ("Remove mango from inventory", "en", label("remove", "mango")),
+    ("Orange one KG ₹50", "en", label("add", "orange", 1, 50)),
+    ("Add tomato 2 kg at 30 rupees", "en", label("add", "tomato", 2, 30)),
+    ("Apple 1.5 kg ₹80", "en", label("add", "apple", 1.5, 80)),
+    ("Banana two kg 40 rupees", "en", label("add", "banana", 2, 40)),
+    ("Add onion 3 kg at ₹25", "en", label("add", "onion", 3, 25)),
+    ("Potato 5 kg ₹20", "en", label("add", "potato", 5, 20)),
+    ("Rice 10 kg at 60 rupees", "en", label("add", "rice", 10, 60)),
+    ("Milk 2 kg for ₹45", "en", label("add", "milk", 2, 45)),
+    ("Sugar 1 kg price 35 rupees", "en", label("add", "sugar", 1, 35)),
+    ("Oil half kg ₹120", "en", label("add", "oil", 0.5, 120)),
+    ("Carrot 2 kg ₹40", "en", label("add", "carrot", 2, 40)),
+    ("Chicken 1 kg ₹200", "en", label("add", "chicken", 1, 200)),
+    ("Fish 1.5 kg ₹150", "en", label("add", "fish", 1.5, 150)),
+    ("Show all items", "en", label("list")),
+    ("Search for tomato", "en", label("search", "tomato")),
+    ("Find apple", "en", label("search", "apple")),
+    ("Update tomato price to 35 rupees", "en", label("update", "tomato", None, 35)),
+    ("Change onion price to ₹30", "en", label("update", "onion", None, 30)),
+    ("Remove tomato", "en", label("remove", "tomato")),
+    ("Delete apple", "en", label("remove", "apple")),
+    ("Bitter gourd 1 kg ₹60", "en", label("add", "bitter gourd", 1, 60)),
+    ("Green beans 2 kg at 45 rupees", "en", label("add", "beans", 2, 45)),
+    ("Bottle gourd half kg ₹25", "en", label("add", "bottle gourd", 0.5, 25)),
+    ("Add tomato 2 kg", "en", label("add", "tomato", 2)),
+    ("Orange ₹50", "en", label("add", "orange", None, 50)),
+    ("orange 1 kg 50 rupees", "en", label("add", "orange", 1, 50)),
+    ("ORANGE ONE KILOGRAM FIFTY RUPEES", "en", label("add", "orange", 1, 50)),
+    ("Add orange one kg at fifty rupees", "en", label("add", "orange", 1, 50)),
+    ("add 5 kg tomato at 50 rupees", "en", label("add", "tomato", 5, 50)),
+    ("add 3 kg tomato at 60 rupees", "en", label("add", "tomato", 3, 60)),
+    ("add apple 4 kg at 50 rupees", "en", label("add", "apple", 4, 50)),
+    ("Add rice 10 kg at 50 rupees", "en", label("add", "rice", 10, 50)),
+    ("Update apple price to ₹65", "en", label("update", "apple", None, 65)),
+    ("Remove apple", "en", label("remove", "apple")),
+    ("Add tamatar 1 kg ₹30", "en", label("add", "tomato", 1, 30)),
+    ("Update aloo price to ₹40", "en", label("update", "potato", None, 40)),
+    ("I want to add 2 kg of mangoes at 80 rupees per kg", "en", label("add", "mango", 2, 80)),
+    ("Stock of tomato", "en", label("stock", "tomato")),
+    ("Add 5 kg tomato at 50 rupees", "en", label("add", "tomato", 5, 50)),
+    ("Update tomato price to 60", "en", label("update", "tomato", None, 60)),
+    ("Sold 2 kg tomato", "en", label("sell", "tomato", 2)),
+    ("sell 3 kg onion", "en", label("sell", "onion", 3)),
+    ("add 10 kg wholesale rice at 40 rupees", "en", label("add", "rice", 10, 40)),
+    ("add 5 kg sugar at 40 rs used for tea", "en", label("add", "sugar", 5, 40)),
+    ("2 किलो प्याज 40 रुपये में जोड़ो", "hi", label("add", "onion", 2, 40)),
+    ("1 किलो चावल 60 रुपये में जोड़ो", "hi", label("add", "rice", 1, 60)),
+    ("5 किलो टमाटर 50 रुपये में जोड़ो", "hi", label("add", "tomato", 5, 50)),
+    ("5 ಕಿಲೋ ಟೊಮೇಟೊ 50 ರೂಪಾಯಿ ಸೇರಿಸಿ", "kn", label("add", "tomato", 5, 50)),
+    ("1 ಕಿಲೋ ಅಕ್ಕಿ 80 ರೂಪಾಯಿ ಸೇರಿಸಿ", "kn", label("add", "rice", 1, 80)),
+    ("5 kg ಆಲೂಗಡ್ಡೆ 30 ರೂಪಾಯಿ ಸೇರಿಸಿ", "kn", label("add", "potato", 5, 30)),
+    ("3 கிலோ தக்காளி 45 ரூபாய் சேர்", "ta", label("add", "tomato", 3, 45)),
+    ("2 కిలో ఉల్లిపాయ 35 రూపాయలు చేర్చు", "te", label("add", "onion", 2, 35)),
+]
+
+# Standard name -> spoken variations (English, romanized Hindi, Devanagari).
+VOCABULARY = {
+    'apple': ['apple', 'apples', 'seb', 'सेब'],
+    'banana': ['banana', 'bananas', 'kela', 'केला'],
+    'orange': ['orange', 'oranges', 'santra', 'संतरा'],
+    'mango': ['mango', 'mangoes', 'aam', 'आम'],
+    'grapes': ['grapes', 'angur', 'अंगूर'],
+    'lemon': ['lemon', 'nimbu'],
+    'tomato': ['tomato', 'tomatoes', 'tamatar', 'टमाटर'],
+    'onion': ['onion', 'onions', 'pyaz', 'प्याज'],
+    'potato': ['potato', 'potatoes', 'aloo', 'आलू'],
+    'carrot': ['carrot', 'carrots', 'gajar', 'गाजर'],
+    'cabbage': ['cabbage', 'patta gobi'],
+    'cauliflower': ['cauliflower', 'phool gobi'],
+    'spinach': ['spinach', 'palak', 'पालक'],
+    'brinjal': ['brinjal', 'baingan', 'बैंगन'],
+    'okra': ['okra', 'bhindi', 'भिंडी'],
+    'peas': ['peas', 'matar', 'मटर'],
+    'cucumber': ['cucumber', 'kheera', 'खीरा'],
+    'radish': ['radish', 'mooli', 'मूली'],
+    'pumpkin': ['pumpkin', 'kaddu'],
+    'garlic': ['garlic', 'lahsun', 'लहसुन'],
+    'ginger': ['ginger', 'adrak', 'अदरक'],
+    'rice': ['rice', 'chawal', 'चावल'],
+    'wheat': ['wheat', 'atta', 'gehun'],
+    'dal': ['dal', 'lentils'],
+    'salt': ['salt', 'namak', 'नमक'],
+    'sugar': ['sugar', 'cheeni', 'चीनी'],
+    'milk': ['milk', 'doodh', 'दूध'],
+    'eggs': ['eggs', 'ande'],
+    'chicken': ['chicken', 'murgi'],
+    'fish': ['fish', 'machli', 'मछली'],
+    'tea': ['tea', 'chai', 'चाय'],
+    'coffee': ['coffee'],
+}
+
+QUANTITIES = [0.5, 1, 1.5, 2, 2.5, 3, 4, 5, 7.5, 10, 12, 20, 25, 50]
+PRICES = [10, 15, 20, 25, 30, 35, 40, 45, 50, 60, 75, 80, 99, 120, 150, 200, 250]
+KG_WORDS = ['kg', 'kilo', 'kilogram', 'kilos']
+
+# (template name, format, expected action, fields the command states)
+TEMPLATES = [
+    ("add_verb", "add {p} {q} {kg} at {r} rupees", "add", "pqr"),
+    ("add_rupee_sign", "add {q} {kg} {p} at ₹{r}", "add", "pqr"),
+    ("store_verb", "store {p} {q} {kg} ₹{r}", "add", "pqr"),
+    ("no_verb_rupee", "{p} {q} {kg} ₹{r}", "add", "pqr"),
+    ("no_verb_rs", "{p} {q} {kg} {r} rs", "add", "pqr"),
+    ("polite_add", "please add {q} {kg} of {p} for {r} rupees", "add", "pqr"),
+    ("add_missing_price", "add {p} {q} {kg}", "add", "pq"),
+    ("update_price", "update {p} price to ₹{r}", "update", "pr"),
+    ("change_price", "change the price of {p} to {r} rupees", "update", "pr"),
+    ("sold", "sold {q} {kg} {p}", "sell", "pq"),
+    ("sale", "sale of {q} {kg} {p}", "sell", "pq"),
+    ("bech", "{p} {q} {kg} bech diya", "sell", "pq"),
+    ("remove", "remove {p}", "remove", "p"),
+    ("delete", "delete {p} from inventory", "remove", "p"),
+    ("hata", "{p} hata do", "remove", "p"),
+    ("search", "search for {p}", "search", "p"),
+    ("find", "find {p}", "search", "p"),
+    ("stock", "how much {p} stock is left", "stock", "p"),
+    ("list", "list all products", "list", ""),
+    ("list_hinglish", "sabhi products dikhao", "list", ""),
+]
+
+
+def _fmt_number(value):
+    return str(int(value)) if float(value).is_integer() else str(value)
+
+
+def generate(size, seed=42):
+    rng = random.Random(seed)
+    rows = []
+    for command, language, expected in SEEDS:
+        rows.append({"command": command, "language": language, "expected": expected, "source": "seed"})
+
+    products = list(VOCABULARY.items())
+    while len(rows) < size:
+        name, fmt, action, fields = rng.choice(TEMPLATES)
+        standard, variations = rng.choice(products)
+        variation = rng.choice(variations)
+        quantity, price = rng.choice(QUANTITIES), rng.choice(PRICES)
+        command = fmt.format(p=variation, q=_fmt_number(quantity), r=price, kg=rng.choice(KG_WORDS))
+        if rng.random() < 0.3:
+            command = command.capitalize()
+        language = 'hi' if any('ऀ' <= ch <= 'ॿ' for ch in variation) else 'en'
+        rows.append({
+            "command": command,
+            "language": language,
+            "expected": label(
+                action,
+                standard if 'p' in fields else None,
+                float(quantity) if 'q' in fields else None,
+                float(price) if 'r' in fields else None,
+            ),
+            "source": f"template:{name}",
+        })
+
+    for i, row in enumerate(rows, start=1):
+        row["id"] = i
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=3000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default=CORPUS_PATH)
+    args = parser.parse_args()
+
+    rows = generate(args.size, args.seed)
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, 'w', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps({k: row[k] for k in ("id", "command", "language", "expected", "source")},
+                               ensure_ascii=False) + "\n")
+    print(f"Wrote {len(rows)} labeled commands to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Differential checker for voice-command parsers.
+
+Runs a candidate parser and the reference parser over the labeled corpus and
+lists every command where they disagree, together with each parser's accuracy
+against the labels. Exits non-zero when there is any disagreement, so it can
+gate an optimized parser in CI.
+
+Usage (from backend/):
+    python benchmarks/diff_parsers.py --candidate my_fast_parser:process_voice_command
+    python benchmarks/diff_parsers.py --candidate server_clean:process_voice_command --limit 20
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parser_corpus import (CORPUS_PATH, REFERENCE_PARSER, accuracy, load_corpus, load_parser,
+                           mismatched_fields, normalize)
+
+
+def diff(reference, candidate, corpus):
+    """Yields (row, reference result, candidate result, fields) for every disagreement."""
+    for row in corpus:
+        ref = normalize(reference(row["command"], row["language"]))
+        cand = normalize(candidate(row["command"], row["language"]))
+        fields = mismatched_fields(ref, cand)
+        if fields:
+            yield row, ref, cand, fields
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--reference", default=REFERENCE_PARSER)
+    parser.add_argument("--candidate", required=True)
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--limit", type=int, default=50, help="max disagreements to print (0 = all)")
+    parser.add_argument("--json", help="write all disagreements to this file")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    reference, candidate = load_parser(args.reference), load_parser(args.candidate)
+    disagreements = list(diff(reference, candidate, corpus))
+
+    print(f"=== {args.candidate} vs {args.reference} on {len(corpus)} commands ===")
+    for name, fn in (("reference", reference), ("candidate", candidate)):
+        acc = accuracy(fn, corpus)
+        print(f"{name:<10} exact {acc['exact_match']:.2%}  " +
+              "  ".join(f"{k} {v:.2%}" for k, v in acc['fields'].items()))
+
+    print(f"\n{len(disagreements)} disagreement(s)")
+    shown = disagreements if args.limit == 0 else disagreements[:args.limit]
+    for row, ref, cand, fields in shown:
+        print(f"#{row['id']} [{row['source']}] {row['command']!r}")
+        for field in fields:
+            print(f"    {field}: reference={ref[field]!r} candidate={cand[field]!r} "
+                  f"label={normalize(row['expected'])[field]!r}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump([{"id": row["id"], "command": row["command"], "fields": fields,
+                        "reference": ref, "candidate": cand, "expected": row["expected"]}
+                       for row, ref, cand, fields in disagreements], f, indent=2, ensure_ascii=False)
+
+    sys.exit(1 if disagreements else 0)
+
+
+if __name__ == "__main__":
+    main()
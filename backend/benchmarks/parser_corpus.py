@@ -0,0 +1,63 @@
+import importlib
+import json
+import os
+from typing import Callable, Dict, Iterable, List, Optional
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus', 'voice_commands.jsonl')
+
+# The production parser (served through api/index.py) is the reference.
+REFERENCE_PARSER = 'server:process_voice_command'
+
+FIELDS = ("action", "product_name", "quantity", "price")
+
+
+def load_corpus(path: str = CORPUS_PATH) -> List[dict]:
+    """Loads the labeled JSON-lines corpus."""
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_parser(spec: str) -> Callable[[str, str], dict]:
+    """Imports a parser given as 'module:function' (e.g. server_clean:process_voice_command)."""
+    module_name, attr = spec.split(':')
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def normalize(result: dict) -> Dict[str, Optional[object]]:
+    """Reduces a parser result to the compared fields.
+
+    server.py reports an add without a price as action 'incomplete'; that is
+    still an add intent, so it is compared as one.
+    """
+    action = result.get("action")
+    if action == "incomplete":
+        action = "add"
+    normalized = {"action": action, "product_name": result.get("product_name")}
+    for key in ("quantity", "price"):
+        value = result.get(key)
+        normalized[key] = round(float(value), 3) if value is not None else None
+    return normalized
+
+
+def mismatched_fields(a: dict, b: dict) -> List[str]:
+    """Fields on which two normalized results disagree."""
+    return [field for field in FIELDS if a.get(field) != b.get(field)]
+
+
+def accuracy(parser: Callable, corpus: Iterable[dict]) -> dict:
+    """Per-field and whole-command agreement of a parser with the corpus labels."""
+    total, exact = 0, 0
+    per_field = dict.fromkeys(FIELDS, 0)
+    for row in corpus:
+        total += 1
+        got = normalize(parser(row["command"], row["language"]))
+        expected = normalize(row["expected"])
+        wrong = mismatched_fields(got, expected)
+        exact += not wrong
+        for field in FIELDS:
+            per_field[field] += field not in wrong
+    return {
+        "commands": total,
+        "exact_match": round(exact / total, 4) if total else 0.0,
+        "fields": {field: round(count / total, 4) if total else 0.0 for field, count in per_field.items()},
+    }
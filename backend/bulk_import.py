@@ -0,0 +1,227 @@
+import asyncio
+import codecs
+import csv
+import json
+import os
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel, Field, ValidationError
+
+# --- Bulk Product Import ---
+# POST /products/import takes a CSV (header row with the column names below)
+# or JSON-lines body and reads it as it streams in. Rows are validated in
+# chunks, yielding to the event loop between chunks, and rows for the same
+# product (case-insensitive name) are merged in memory: quantities add up,
+# the last given price/category/etc. wins. The merged set is then written
+# with one round trip per batch for new products, one per batch of stock
+# increments on existing products and one per batch of 'add' transactions,
+# instead of three calls per row. Invalid rows are reported by row number
+# and skipped; the rest are imported.
+#
+# Columns: name, quantity, price_per_kg (needed for new products),
+#          category, description, minimum_stock, supplier
+#
+# IMPORT_MAX_ROWS     rows accepted per upload (default 100000)
+# IMPORT_CHUNK_ROWS   rows validated between event loop yields (default 1000)
+# IMPORT_BATCH_SIZE   rows per database write (default 500)
+# IMPORT_MAX_ERRORS   row errors listed in the response (default 100)
+
+IMPORT_MAX_ROWS = int(os.getenv('IMPORT_MAX_ROWS', '100000'))
+IMPORT_CHUNK_ROWS = int(os.getenv('IMPORT_CHUNK_ROWS', '1000'))
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '500'))
+IMPORT_MAX_ERRORS = int(os.getenv('IMPORT_MAX_ERRORS', '100'))
+
+MAX_LINE_CHARS = 1 << 20
+MERGED_FIELDS = ('price_per_kg', 'category', 'description', 'minimum_stock', 'supplier')
+
+
+class ImportFormatError(ValueError):
+    """The upload as a whole cannot be read (bad header, too many rows, ...)."""
+
+
+class ImportRow(BaseModel):
+    name: str = Field(min_length=1, max_length=255)
+    quantity: float = Field(ge=0)
+    price_per_kg: Optional[float] = Field(default=None, ge=0)
+    category: Optional[str] = None
+    description: Optional[str] = None
+    minimum_stock: Optional[float] = Field(default=None, ge=0)
+    supplier: Optional[str] = None
+
+
+class ParsedImport:
+    """Merged products keyed by lowercased name, plus per-row errors."""
+
+    def __init__(self, max_errors: int = IMPORT_MAX_ERRORS):
+        self.rows = 0
+        self.merged = 0
+        self.products: Dict[str, dict] = {}
+        self.errors: List[dict] = []
+        self.error_count = 0
+        self.max_errors = max_errors
+
+    def add_error(self, row: int, message: str):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"row": row, "error": message})
+
+    def add(self, row: int, item: ImportRow):
+        name = item.name.strip()
+        key = name.lower()
+        current = self.products.get(key)
+        if current is None:
+            self.products[key] = {"row": row, "name": name, "quantity": item.quantity,
+                                  **{field: getattr(item, field) for field in MERGED_FIELDS}}
+            return
+        self.merged += 1
+        current["quantity"] += item.quantity
+        for field in MERGED_FIELDS:
+            value = getattr(item, field)
+            if value is not None:
+                current[field] = value
+
+
+def upload_format(content_type: Optional[str], requested: Optional[str] = None) -> str:
+    """csv or ndjson, from ?format= or the Content-Type header."""
+    if requested:
+        return requested
+    content_type = (content_type or '').lower()
+    if 'json' in content_type:
+        return 'ndjson'
+    if 'csv' in content_type or content_type.startswith('text/plain'):
+        return 'csv'
+    raise ImportFormatError("Send text/csv or application/x-ndjson, or pass ?format=csv|ndjson")
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    buffer = ''
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        if '\n' not in buffer:
+            if len(buffer) > MAX_LINE_CHARS:
+                raise ImportFormatError("Line too long")
+            continue
+        *lines, buffer = buffer.split('\n')
+        for line in lines:
+            yield line.rstrip('\r')
+    buffer += decoder.decode(b'', final=True)
+    if buffer.strip():
+        yield buffer.rstrip('\r')
+
+
+async def iter_records(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """(row number, record, error) for every data row of the upload."""
+    number = 0
+    if fmt == 'ndjson':
+        async for line in _lines(chunks):
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield number, None, f"invalid JSON: {e}"
+                continue
+            if isinstance(record, dict):
+                yield number, record, None
+            else:
+                yield number, None, "expected a JSON object"
+        return
+
+    header, pending = None, ''
+    async for line in _lines(chunks):
+        # A quoted field may span lines; wait until the quotes balance.
+        pending = f"{pending}\n{line}" if pending else line
+        if pending.count('"') % 2:
+            if len(pending) > MAX_LINE_CHARS:
+                raise ImportFormatError("Unterminated quoted field")
+            continue
+        record, pending = pending, ''
+        if not record.strip():
+            continue
+        values = next(csv.reader([record]))
+        if header is None:
+            header = [column.strip().lower() for column in values]
+            if 'name' not in header or 'quantity' not in header:
+                raise ImportFormatError("CSV header must include name and quantity")
+            continue
+        number += 1
+        if len(values) > len(header):
+            yield number, None, f"expected {len(header)} columns, got {len(values)}"
+            continue
+        yield number, dict(zip(header, values)), None
+    if pending:
+        yield number + 1, None, "unterminated quoted field"
+
+
+def _describe(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}" for e in error.errors())
+
+
+def _validate(parsed: ParsedImport, records: List[Tuple[int, dict]]):
+    for number, record in records:
+        cleaned = {key: value for key, value in record.items() if value not in ('', None)}
+        try:
+            parsed.add(number, ImportRow(**cleaned))
+        except ValidationError as e:
+            parsed.add_error(number, _describe(e))
+
+
+async def parse_upload(chunks: AsyncIterator[bytes], fmt: str, max_rows: int = IMPORT_MAX_ROWS,
+                       chunk_rows: int = IMPORT_CHUNK_ROWS) -> ParsedImport:
+    """Reads, validates and merges an upload as it arrives."""
+    parsed = ParsedImport()
+    records = []
+    async for number, record, error in iter_records(chunks, fmt):
+        parsed.rows += 1
+        if parsed.rows > max_rows:
+            raise ImportFormatError(f"Imports are limited to {max_rows} rows")
+        if error:
+            parsed.add_error(number, error)
+            continue
+        records.append((number, record))
+        if len(records) >= chunk_rows:
+            _validate(parsed, records)
+            records = []
+            await asyncio.sleep(0)
+    _validate(parsed, records)
+    return parsed
+
+
+def plan_import(parsed: ParsedImport, existing: Dict[str, dict]) -> Tuple[List[dict], List[Tuple[dict, dict]]]:
+    """Splits merged rows into new products and (existing product, increment) pairs."""
+    creates, updates = [], []
+    for key, item in parsed.products.items():
+        current = existing.get(key)
+        if current is not None:
+            updates.append((current, item))
+        elif item['price_per_kg'] is None:
+            parsed.add_error(item['row'], "price_per_kg: required for a new product")
+        else:
+            creates.append(item)
+    return creates, updates
+
+
+def import_transaction(item: dict, product_name: str) -> dict:
+    """The 'add' transaction logged for an imported row."""
+    return {"product_name": product_name, "transaction_type": "add", "quantity_change": item['quantity'],
+            "price_per_kg": item['price_per_kg'], "notes": "bulk import"}
+
+
+def batches(items: List, size: int = IMPORT_BATCH_SIZE) -> Iterator[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def import_summary(parsed: ParsedImport, created: int, updated: int, dry_run: bool = False) -> dict:
+    return {
+        "success": parsed.error_count == 0 or created + updated > 0,
+        "dry_run": dry_run,
+        "rows": parsed.rows,
+        "merged_duplicates": parsed.merged,
+        "created": created,
+        "updated": updated,
+        "error_count": parsed.error_count,
+        "errors": sorted(parsed.errors, key=lambda e: e["row"]),
+    }
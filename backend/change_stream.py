@@ -0,0 +1,333 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from app_logging import get_logger
+from conditional import bump_all_inventory_versions, bump_inventory_version
+
+try:
+    import redis.asyncio as aioredis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+logger = get_logger("change_stream")
+
+# --- Realtime Change Stream ---
+# Write helpers publish product/transaction deltas to a ChangeHub. The hub
+# hands them to a bus, and every worker's hub fans bus messages out to its own
+# subscribers (SSE or WebSocket connections of that user).
+#
+# Per subscriber, deltas are coalesced by (entity, id) so a product updated
+# ten times in a debounce window is sent once with its latest state. A slow
+# client keeps coalescing while its previous send is in flight; if its
+# backlog still exceeds CHANGE_STREAM_MAX_PENDING distinct items it is sent a
+# single "resync" instead, telling it to refetch /products. Bulk writes
+# (product imports) publish op "resync" directly.
+#
+# If the Redis subscription drops, the bus logs it and resubscribes with
+# backoff. Writes published meanwhile are lost to this worker, so after a
+# reconnect every inventory version moves and every local client is told to
+# resync.
+#
+# CHANGE_BUS_URL                redis://... to share one bus across workers;
+#                               unset = in-process bus (single worker, tests)
+# CHANGE_STREAM_DEBOUNCE_MS     delay before flushing a subscriber (default 100)
+# CHANGE_STREAM_MAX_PENDING     coalesced items before forcing resync (default 500)
+# CHANGE_STREAM_HEARTBEAT_S     idle keep-alive interval (default 15)
+# CHANGE_STREAM_SEND_TIMEOUT_S  drop clients whose send stalls this long (default 10)
+# CHANGE_BUS_RECONNECT_MAX_S    longest wait between Redis resubscribe attempts (default 30)
+
+CHANGE_BUS_URL = os.getenv('CHANGE_BUS_URL')
+CHANGE_BUS_CHANNEL = os.getenv('CHANGE_BUS_CHANNEL', 'vocal_verse:changes')
+CHANGE_STREAM_DEBOUNCE_MS = float(os.getenv('CHANGE_STREAM_DEBOUNCE_MS', '100'))
+CHANGE_STREAM_MAX_PENDING = int(os.getenv('CHANGE_STREAM_MAX_PENDING', '500'))
+CHANGE_STREAM_HEARTBEAT_S = float(os.getenv('CHANGE_STREAM_HEARTBEAT_S', '15'))
+CHANGE_STREAM_SEND_TIMEOUT_S = float(os.getenv('CHANGE_STREAM_SEND_TIMEOUT_S', '10'))
+CHANGE_BUS_RECONNECT_MAX_S = float(os.getenv('CHANGE_BUS_RECONNECT_MAX_S', '30'))
+
+RECONNECTED = {"reconnected": True}  # delivered locally after messages may have been missed
+
+
+class InProcessBus:
+    """Delivers published messages straight to the attached hub (one process)."""
+
+    shared = False
+
+    def __init__(self):
+        self._handlers = []
+
+    def attach(self, handler: Callable[[dict], None]):
+        self._handlers.append(handler)
+
+    async def publish(self, message: dict):
+        for handler in self._handlers:
+            handler(message)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class RedisBus:
+    """Redis pub/sub bus so every uvicorn worker sees every worker's writes."""
+
+    shared = True
+
+    def __init__(self, url: str, channel: str = CHANGE_BUS_CHANNEL):
+        self.url = url
+        self.channel = channel
+        self._handlers = []
+        self._redis = None
+        self._listener: Optional[asyncio.Task] = None
+
+    def attach(self, handler: Callable[[dict], None]):
+        self._handlers.append(handler)
+
+    async def publish(self, message: dict):
+        await self._redis.publish(self.channel, json.dumps(message, default=str))
+
+    async def start(self):
+        self._redis = aioredis.from_url(self.url)
+        self._listener = asyncio.create_task(self._listen(await self._subscribe()))
+
+    async def _subscribe(self):
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(self.channel)
+        return pubsub
+
+    async def _listen(self, pubsub, first_delay: float = 0.5, max_delay: float = CHANGE_BUS_RECONNECT_MAX_S):
+        delay = first_delay
+        while True:
+            try:
+                if pubsub is None:
+                    pubsub = await self._subscribe()
+                    logger.info("Change bus resubscribed to %s", self.channel)
+                    delay = first_delay
+                    self._deliver(RECONNECTED)
+                async for item in pubsub.listen():
+                    if item.get("type") != "message":
+                        continue
+                    try:
+                        message = json.loads(item["data"])
+                    except ValueError:
+                        continue
+                    self._deliver(message)
+                raise ConnectionError("subscription closed")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Change bus subscription lost, retrying in %.1fs: %s", delay, e)
+                if pubsub is not None:
+                    try:
+                        await pubsub.close()
+                    except Exception:
+                        pass
+                    pubsub = None
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, max_delay)
+
+    def _deliver(self, message: dict):
+        for handler in self._handlers:
+            try:
+                handler(message)
+            except Exception as e:
+                logger.warning("Change bus handler failed: %s", e)
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+        if self._redis is not None:
+            await self._redis.close()
+
+
+def create_bus(url: Optional[str] = CHANGE_BUS_URL):
+    """Picks the shared Redis bus when configured, else the in-process one."""
+    if url and REDIS_AVAILABLE:
+        return RedisBus(url)
+    if url:
+        logger.warning("CHANGE_BUS_URL is set but 'redis' is not installed; using the in-process bus.")
+    return InProcessBus()
+
+
+def _coalesce(previous: dict, change: dict) -> dict:
+    if previous["op"] == "upsert" and change["op"] == "upsert":
+        return {**change, "data": {**(previous.get("data") or {}), **(change.get("data") or {})}}
+    return change
+
+
+class Subscription:
+    """One connected client: a coalescing backlog plus a wake-up event."""
+
+    def __init__(self, user_id: str, max_pending: int = CHANGE_STREAM_MAX_PENDING):
+        self.user_id = user_id
+        self.max_pending = max_pending
+        self.pending: Dict[Tuple[str, str], dict] = {}
+        self.resync = False
+        self._ready = asyncio.Event()
+
+    def offer(self, change: dict):
+        if change["op"] == "resync":  # bulk writes announce one resync instead of every row
+            self.pending.clear()
+            self.resync = True
+            self._ready.set()
+            return
+        key = (change["entity"], str(change["id"]))
+        previous = self.pending.pop(key, None)
+        if previous is not None:
+            self.pending[key] = _coalesce(previous, change)
+        elif self.resync or len(self.pending) >= self.max_pending:
+            self.pending.clear()
+            self.resync = True
+        else:
+            self.pending[key] = change
+        self._ready.set()
+
+    async def next_message(self, debounce: float, heartbeat: float) -> dict:
+        """Waits for changes, lets more arrive for `debounce`, then drains the backlog."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=heartbeat)
+        except asyncio.TimeoutError:
+            return {"type": "ping"}
+        await asyncio.sleep(debounce)
+        self._ready.clear()
+        if self.resync:
+            self.resync = False
+            self.pending.clear()
+            return {"type": "resync"}
+        changes, self.pending = list(self.pending.values()), {}
+        return {"type": "changes", "changes": changes}
+
+
+class ChangeHub:
+    """Publishes inventory deltas to the bus and fans bus messages out to local subscribers."""
+
+    def __init__(self, bus=None, debounce_ms: float = CHANGE_STREAM_DEBOUNCE_MS,
+                 max_pending: int = CHANGE_STREAM_MAX_PENDING,
+                 heartbeat: float = CHANGE_STREAM_HEARTBEAT_S):
+        self.origin = uuid.uuid4().hex
+        self.bus = bus or InProcessBus()
+        self.bus.attach(self._dispatch)
+        self.debounce = debounce_ms / 1000.0
+        self.max_pending = max_pending
+        self.heartbeat = heartbeat
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._listeners: List[Callable[[str, dict], None]] = []
+
+    def add_listener(self, listener: Callable[[str, dict], None]):
+        """Calls listener(user_id, change) for every change, from this worker or others."""
+        self._listeners.append(listener)
+
+    async def start(self):
+        await self.bus.start()
+
+    async def stop(self):
+        await self.bus.stop()
+
+    def subscribe(self, user_id: str) -> Subscription:
+        subscription = Subscription(user_id, self.max_pending)
+        self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.user_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.user_id]
+
+    def subscriber_count(self) -> int:
+        return sum(len(subs) for subs in self._subscribers.values())
+
+    async def publish(self, user_id: str, entity: str, op: str, item_id, data: Optional[dict] = None):
+        """Announces a committed write. Never raises: a lost delta must not fail the write."""
+        message = {
+            "origin": self.origin,
+            "user_id": str(user_id),
+            "change": {"entity": entity, "op": op, "id": str(item_id), "data": data, "ts": time.time()},
+        }
+        try:
+            await self.bus.publish(message)
+        except Exception as e:
+            logger.warning("Failed to publish %s %s change: %s", entity, op, e)
+
+    def _dispatch(self, message: dict):
+        if message.get("reconnected"):
+            bump_all_inventory_versions()
+            for subscriptions in self._subscribers.values():
+                for subscription in subscriptions:
+                    subscription.offer({"op": "resync"})
+            return
+        user_id = message["user_id"]
+        if message.get("origin") != self.origin and message["change"]["entity"] != "alerts":
+            # Another worker wrote; keep this worker's ETags honest too. Alert
+            # runs change no inventory (see AlertScheduler.apply_change).
+            bump_inventory_version(user_id)
+        for listener in self._listeners:
+            try:
+                listener(user_id, message["change"])
+            except Exception as e:
+                logger.warning("Change listener failed: %s", e)
+        for subscription in self._subscribers.get(user_id, ()):
+            subscription.offer(message["change"])
+
+
+def _encode(message: dict) -> str:
+    return json.dumps(message, default=str, ensure_ascii=False)
+
+
+async def sse_events(hub: ChangeHub, user_id: str, request=None):
+    """Async generator of text/event-stream frames for one subscriber."""
+    subscription = hub.subscribe(user_id)
+    try:
+        yield "event: ready\ndata: {}\n\n"
+        while True:
+            if request is not None and await request.is_disconnected():
+                break
+            message = await subscription.next_message(hub.debounce, hub.heartbeat)
+            if message["type"] == "ping":
+                yield ": ping\n\n"
+            else:
+                yield f"event: {message['type']}\ndata: {_encode(message)}\n\n"
+    finally:
+        hub.unsubscribe(subscription)
+
+
+async def serve_websocket(hub: ChangeHub, websocket: WebSocket, user_id: str):
+    """Streams one subscriber's deltas over an accepted WebSocket until it goes away or stalls."""
+    subscription = hub.subscribe(user_id)
+    receiver = asyncio.create_task(websocket.receive())
+    message_task: Optional[asyncio.Task] = None
+    try:
+        await websocket.send_text(_encode({"type": "ready"}))
+        while True:
+            # Kept across client messages: cancelling it could drop a backlog it already drained
+            if message_task is None:
+                message_task = asyncio.create_task(subscription.next_message(hub.debounce, hub.heartbeat))
+            done, _ = await asyncio.wait({message_task, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if message_task in done:
+                message, message_task = message_task.result(), None
+                try:
+                    await asyncio.wait_for(websocket.send_text(_encode(message)), timeout=CHANGE_STREAM_SEND_TIMEOUT_S)
+                except asyncio.TimeoutError:
+                    logger.info("Dropping change stream client of %s: send stalled", user_id)
+                    await websocket.close(code=1013)
+                    break
+            if receiver in done:
+                if receiver.result()["type"] == "websocket.disconnect":
+                    break
+                receiver = asyncio.create_task(websocket.receive())
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        receiver.cancel()
+        if message_task is not None:
+            message_task.cancel()
+        hub.unsubscribe(subscription)
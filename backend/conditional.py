@@ -0,0 +1,138 @@
+import gzip
+import hashlib
+import os
+import threading
+import uuid
+from typing import Any, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from fast_json import FastJSONResponse, dumps
+
+# --- Conditional GET ---
+# Every write to a user's inventory bumps a per-user version counter. Read
+# endpoints build a strong ETag from (resource, process epoch, user, version)
+# *before* querying, so an If-None-Match hit is answered with 304 without
+# touching the database, and a write racing with a read always yields a new
+# ETag on the next poll.
+#
+# Counters live in process memory: with several workers, each worker has its
+# own epoch, so a client bouncing between workers just gets a fresh 200.
+# Writes handled by other workers arrive through the shared change bus,
+# which bumps this worker's counter too (see change_stream.py). Without a
+# shared bus a worker would keep answering 304 for data another worker has
+# changed, so require_shared_versions refuses to start more than one worker
+# unless CHANGE_BUS_URL is set.
+#
+# WEB_CONCURRENCY          worker count the server is started with (default 1)
+# RESPONSE_GZIP            gzip large ETag'd payloads when accepted (default 1)
+# RESPONSE_GZIP_MIN_BYTES  smallest body worth compressing (default 4096)
+# RESPONSE_GZIP_LEVEL      zlib level; higher costs event-loop time (default 5)
+
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', '1'))
+RESPONSE_GZIP = os.getenv('RESPONSE_GZIP', '1') != '0'
+RESPONSE_GZIP_MIN_BYTES = int(os.getenv('RESPONSE_GZIP_MIN_BYTES', '4096'))
+RESPONSE_GZIP_LEVEL = int(os.getenv('RESPONSE_GZIP_LEVEL', '5'))
+
+GZIP_ETAG_SUFFIX = "-gz"
+
+
+class InventoryVersions:
+    """Per-user monotonically increasing inventory version counters."""
+
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:8]
+        self._versions = {}
+        self._base = 0  # added to every user's count; bump_all moves it
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> int:
+        return self._base + self._versions.get(user_id, 0)
+
+    def bump(self, user_id: str) -> int:
+        with self._lock:
+            count = self._versions.get(user_id, 0) + 1
+            self._versions[user_id] = count
+            return self._base + count
+
+    def bump_all(self):
+        """Moves every user's version, including users this process has not seen yet."""
+        with self._lock:
+            self._base += 1
+
+    def snapshot(self) -> dict:
+        """A copy of every known user's current version."""
+        with self._lock:
+            return {user_id: self._base + count for user_id, count in self._versions.items()}
+
+
+INVENTORY_VERSIONS = InventoryVersions()
+
+
+def bump_inventory_version(user_id: str) -> int:
+    """Marks a user's inventory as changed; call after every committed write."""
+    return INVENTORY_VERSIONS.bump(user_id)
+
+
+def bump_all_inventory_versions():
+    """Marks every inventory as changed, e.g. after missing writes from other workers."""
+    INVENTORY_VERSIONS.bump_all()
+
+
+def require_shared_versions(shared_bus: bool, workers: int = WEB_CONCURRENCY):
+    """Fails startup when several workers would each keep their own, unsynchronised versions."""
+    if workers > 1 and not shared_bus:
+        raise RuntimeError(
+            f"WEB_CONCURRENCY={workers} needs CHANGE_BUS_URL (and the 'redis' package) so that "
+            "every worker sees every write; otherwise workers answer 304 for stale data"
+        )
+
+
+def inventory_etag(user_id: str, resource: str, versions: InventoryVersions = INVENTORY_VERSIONS) -> str:
+    """Builds the strong ETag for a user's view of a resource at its current version."""
+    user_tag = hashlib.sha1(str(user_id).encode()).hexdigest()[:10]
+    return f'"{resource}-{versions.epoch}-{user_tag}-{versions.get(user_id)}"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    opaque = etag.strip('"')
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        candidate = candidate.strip('"')
+        if candidate == opaque or candidate == opaque + GZIP_ETAG_SUFFIX:
+            return True
+    return False
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """Returns a 304 response if the client's If-None-Match already has this ETag."""
+    header = request.headers.get("if-none-match")
+    if not header or not _etag_matches(header, etag):
+        return None
+    return Response(status_code=304, headers=_cache_headers(etag))
+
+
+def _cache_headers(etag: str) -> dict:
+    return {
+        "ETag": etag,
+        "Cache-Control": "private, no-cache",
+        "Vary": "Authorization, Accept-Encoding",
+    }
+
+
+def etag_json_response(request: Request, content: Any, etag: str) -> Response:
+    """Serializes content with its ETag, gzip-compressing large bodies for clients that accept it."""
+    body = dumps(content)
+    headers = _cache_headers(etag)
+    accepts_gzip = "gzip" in request.headers.get("accept-encoding", "")
+    if RESPONSE_GZIP and accepts_gzip and len(body) >= RESPONSE_GZIP_MIN_BYTES:
+        body = gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL)
+        headers["Content-Encoding"] = "gzip"
+        # A different representation needs a different strong validator.
+        headers["ETag"] = etag[:-1] + GZIP_ETAG_SUFFIX + '"'
+    return Response(body, media_type=FastJSONResponse.media_type, headers=headers)
@@ -0,0 +1,253 @@
+import base64
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, List, Literal, Optional
+
+from fastapi import HTTPException
+from pydantic import BaseModel, Field
+
+from app_logging import get_logger
+
+logger = get_logger("delta_sync")
+
+# --- Delta Sync ---
+# Devices that were offline pull GET /products/changes?since=<cursor> instead
+# of the whole catalog: rows whose updated_at moved past the cursor plus
+# tombstones for deleted rows. The cursor is an opaque wrapper around the
+# newest timestamp the device has seen. Each pull re-reads a small overlap
+# window before the cursor, because a write can commit with a timestamp a
+# little older than one already handed out; replaying a row is harmless since
+# clients apply changes as upserts by id.
+#
+# POST /sync applies a batch of offline-recorded operations in order. Every
+# operation carries a client-generated client_op_id; an operation that was
+# already applied is not run again, its stored outcome is returned instead.
+# A transaction operation's recorded_at (when the device recorded it) becomes
+# the created_at of the transaction it logs, so rollups, lots and price
+# trends date it correctly; device clocks running ahead are clamped to now.
+#
+# SYNC_OVERLAP_S              overlap window re-read before the cursor (default 5)
+# SYNC_TOMBSTONE_RETENTION_DAYS  older cursors get a full reset (default 30)
+# SYNC_MAX_OPERATIONS         operations accepted per /sync call (default 500)
+# SYNC_OPS_RETAINED           applied op ids remembered per user in memory (default 10000)
+# SYNC_CLAIM_LEASE_S          a claim still pending after this long (its request
+#                             crashed) may be taken over by a retry (default 120)
+
+SYNC_OVERLAP_S = float(os.getenv('SYNC_OVERLAP_S', '5'))
+SYNC_TOMBSTONE_RETENTION_DAYS = float(os.getenv('SYNC_TOMBSTONE_RETENTION_DAYS', '30'))
+SYNC_MAX_OPERATIONS = int(os.getenv('SYNC_MAX_OPERATIONS', '500'))
+SYNC_OPS_RETAINED = int(os.getenv('SYNC_OPS_RETAINED', '10000'))
+SYNC_CLAIM_LEASE_S = float(os.getenv('SYNC_CLAIM_LEASE_S', '120'))
+
+
+class SyncOperation(BaseModel):
+    client_op_id: str = Field(min_length=1, max_length=128)
+    type: Literal["voice", "transaction"]
+    # voice
+    command: Optional[str] = None
+    language: Optional[str] = "en"
+    # transaction
+    product_name: Optional[str] = None
+    transaction_type: Optional[Literal["add", "remove"]] = None
+    quantity_change: Optional[float] = None
+    price_per_kg: Optional[float] = None
+    recorded_at: Optional[datetime] = None
+
+
+class SyncRequest(BaseModel):
+    device_id: Optional[str] = None
+    operations: List[SyncOperation] = Field(max_length=SYNC_MAX_OPERATIONS)
+
+
+def encode_cursor(ts: datetime) -> str:
+    return base64.urlsafe_b64encode(ts.isoformat().encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> datetime:
+    """Turns a cursor back into its timestamp; malformed cursors are a 400."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return datetime.fromisoformat(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid sync cursor")
+
+
+def as_datetime(value) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+
+
+def recorded_time(recorded_at: Optional[datetime]) -> Optional[datetime]:
+    """An operation's recorded_at in UTC (naive times are UTC), no later than now."""
+    if recorded_at is None:
+        return None
+    if recorded_at.tzinfo is None:
+        recorded_at = recorded_at.replace(tzinfo=timezone.utc)
+    return min(recorded_at, datetime.now(timezone.utc))
+
+
+def _now_like(reference: Optional[datetime]) -> datetime:
+    if reference is not None and reference.tzinfo is not None:
+        return datetime.now(timezone.utc)
+    return datetime.now()
+
+
+def read_window_start(since: datetime) -> datetime:
+    """Lower bound actually queried for a cursor (cursor minus the overlap window)."""
+    return since - timedelta(seconds=SYNC_OVERLAP_S)
+
+
+def cursor_expired(since: datetime) -> bool:
+    """True when tombstones older than the cursor may already have been pruned."""
+    return since < _now_like(since) - timedelta(days=SYNC_TOMBSTONE_RETENTION_DAYS)
+
+
+def build_changes(changed: list, deleted: list, since: Optional[datetime], reset: bool) -> dict:
+    """Assembles the /products/changes payload and the next cursor."""
+    stamps = [as_datetime(row.get("updated_at") or row.get("created_at")) for row in changed]
+    stamps += [as_datetime(row.get("deleted_at")) for row in deleted]
+    stamps = [ts for ts in stamps if ts is not None]
+    if since is not None:
+        stamps.append(since)
+    high_water = max(stamps) if stamps else _now_like(since)
+    return {
+        "success": True,
+        "reset": reset,
+        "cursor": encode_cursor(high_water),
+        "changed": changed,
+        "deleted": deleted,
+    }
+
+
+def changes_since(products: list, tombstones: list, since: Optional[datetime]) -> dict:
+    """In-memory /products/changes: full snapshot without a cursor, else rows touched after it."""
+    if since is None or cursor_expired(since):
+        return build_changes(list(products), [], None, reset=True)
+    start = read_window_start(since)
+    changed = [p for p in products if as_datetime(p.get("updated_at") or p.get("created_at")) > start]
+    deleted = [t for t in tombstones if as_datetime(t["deleted_at"]) > start]
+    return build_changes(changed, deleted, since, reset=False)
+
+
+def prune_tombstones(tombstones: list) -> list:
+    cutoff = datetime.now() - timedelta(days=SYNC_TOMBSTONE_RETENTION_DAYS)
+    return [t for t in tombstones if as_datetime(t["deleted_at"]) >= cutoff]
+
+
+# --- Applied-operation stores ---
+# claim() returns None if the caller now owns the operation, or the stored
+# outcome (status "pending" while another request is still applying it). A
+# pending claim older than the lease belongs to a request that died, so the
+# next claim takes it over.
+
+class AppliedOperations:
+    """In-memory record of applied sync operations, bounded per user."""
+
+    def __init__(self, retained: int = SYNC_OPS_RETAINED, lease: float = SYNC_CLAIM_LEASE_S,
+                 clock: Callable[[], float] = time.monotonic):
+        self.retained = retained
+        self.lease = lease
+        self.clock = clock
+        self._ops = {}
+
+    async def claim(self, user_id: str, op_id: str) -> Optional[dict]:
+        ops = self._ops.setdefault(user_id, OrderedDict())
+        now = self.clock()
+        previous = ops.get(op_id)
+        if previous is not None and not (previous["status"] == "pending" and now - previous["claimed_at"] >= self.lease):
+            return previous
+        ops[op_id] = {"status": "pending", "claimed_at": now}
+        while len(ops) > self.retained:
+            ops.popitem(last=False)
+        return None
+
+    async def complete(self, user_id: str, op_id: str, outcome: dict):
+        self._ops.setdefault(user_id, OrderedDict())[op_id] = {"status": "done", "result": outcome}
+
+    async def release(self, user_id: str, op_id: str):
+        self._ops.get(user_id, {}).pop(op_id, None)
+
+
+class SupabaseAppliedOperations:
+    """sync_operations table; UNIQUE(user_id, client_op_id) makes the claim atomic across workers."""
+
+    def __init__(self, client_factory: Callable, lease: float = SYNC_CLAIM_LEASE_S):
+        self.client_factory = client_factory
+        self.lease = lease
+
+    def _table(self):
+        return self.client_factory().table('sync_operations')
+
+    async def claim(self, user_id: str, op_id: str) -> Optional[dict]:
+        now = datetime.now(timezone.utc)
+        try:
+            self._table().insert({'user_id': user_id, 'client_op_id': op_id, 'status': 'pending',
+                                  'claimed_at': now.isoformat()}).execute()
+            return None
+        except Exception:
+            rows = self._table().select('status,result,claimed_at') \
+                .eq('user_id', user_id).eq('client_op_id', op_id).execute().data
+            if not rows:
+                raise
+        existing = rows[0]
+        if existing['status'] == 'pending' and \
+                as_datetime(existing['claimed_at']) <= now - timedelta(seconds=self.lease):
+            # Lease expired: take it over, unless another retry just did (the claimed_at match fails)
+            taken = self._table().update({'claimed_at': now.isoformat()}) \
+                .eq('user_id', user_id).eq('client_op_id', op_id) \
+                .eq('status', 'pending').eq('claimed_at', existing['claimed_at']).execute().data
+            if taken:
+                return None
+        return existing
+
+    async def complete(self, user_id: str, op_id: str, outcome: dict):
+        self._table().update({'status': 'done', 'result': outcome}) \
+            .eq('user_id', user_id).eq('client_op_id', op_id).execute()
+
+    async def release(self, user_id: str, op_id: str):
+        self._table().delete().eq('user_id', user_id).eq('client_op_id', op_id).execute()
+
+
+def _outcome(result) -> dict:
+    """Keeps only what a replay needs to report; full rows are fetched via /products/changes."""
+    if not isinstance(result, dict):
+        return {"success": True}
+    return {"success": bool(result.get("success", True)), "message": result.get("message")}
+
+
+async def apply_operations(user_id: str, operations: List[SyncOperation], store,
+                           apply: Callable[[SyncOperation], Awaitable[dict]]) -> dict:
+    """Applies operations in order, skipping ones already applied. Server faults are left retryable."""
+    results = []
+    applied = 0
+    for op in operations:
+        previous = await store.claim(user_id, op.client_op_id)
+        if previous is not None:
+            if previous.get("status") == "done":
+                results.append({"client_op_id": op.client_op_id, "duplicate": True, **(previous.get("result") or {})})
+            else:
+                results.append({"client_op_id": op.client_op_id, "success": False, "retryable": True,
+                                "message": "Operation is being applied by another request"})
+            continue
+
+        try:
+            outcome = _outcome(await apply(op))
+        except HTTPException as e:
+            if e.status_code >= 500:
+                await store.release(user_id, op.client_op_id)
+                results.append({"client_op_id": op.client_op_id, "success": False, "retryable": True, "message": e.detail})
+                continue
+            outcome = {"success": False, "message": e.detail}
+        except Exception as e:
+            logger.warning("Sync operation %s failed: %s", op.client_op_id, e)
+            await store.release(user_id, op.client_op_id)
+            results.append({"client_op_id": op.client_op_id, "success": False, "retryable": True, "message": str(e)})
+            continue
+
+        await store.complete(user_id, op.client_op_id, outcome)
+        applied += 1
+        results.append({"client_op_id": op.client_op_id, "duplicate": False, **outcome})
+    return {"success": True, "applied": applied, "results": results}
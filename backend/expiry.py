@@ -0,0 +1,274 @@
+import heapq
+import itertools
+import os
+import re
+import time
+from bisect import bisect_left, insort
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from alert_scheduler import ALERT_EXPIRY_DAYS
+from metrics import EXPIRY_EVENTS_FIRED
+from rollups import as_utc
+
+# --- Expiry Index ---
+# Products that have an expiry_date and stock on hand are kept per user,
+# sorted by (expiry time, product id) in chunks of a few hundred entries.
+# "What expires in the next N days" is then a bisect plus the k matches,
+# O(log n + k), not a scan of the catalogue, and a write shifts one chunk.
+# One min-heap across all users holds the next moments that need
+# attention: a product entering the ALERT_EXPIRY_DAYS warning window and
+# the product expiring. A sweep pops only the entries that are due and
+# hands their users to the alert scheduler, so expiry_warning alerts appear
+# without scanning products. An updated or deleted product leaves stale
+# heap entries behind. They are skipped when popped and dropped when the
+# heap is compacted.
+#
+# The index follows product writes through the change stream, so writes on
+# every worker reach it. Bulk imports mark the user for a reload.
+#
+# EXPIRY_INDEX     keep the index and run sweeps (default 1)
+# EXPIRY_SWEEP_S   seconds between sweeps (default 60)
+
+EXPIRY_INDEX = os.getenv('EXPIRY_INDEX', '1') != '0'
+EXPIRY_SWEEP_S = float(os.getenv('EXPIRY_SWEEP_S', '60'))
+
+DAY_S = 86400.0
+_MAX_ID = '\U0010ffff'
+
+_EXPIRY_WORDS = re.compile(r'\b(?:expir\w*|going bad|spoil\w*)')
+_QUESTION_WORDS = re.compile(r'\b(?:what|which|anything|any|list|show|tell)\b')
+
+
+def _product_id(product: dict) -> str:
+    return str(product.get('id') or product.get('_id'))
+
+
+class SortedEntries:
+    """(expires_at, product id) pairs kept sorted in chunks, so a write shifts one chunk, not the list."""
+
+    CHUNK = 512
+
+    def __init__(self, entries: Iterable[Tuple[float, str]] = ()):
+        entries = sorted(entries)
+        self._chunks = [entries[i:i + self.CHUNK] for i in range(0, len(entries), self.CHUNK)]
+        self._maxes = [chunk[-1] for chunk in self._chunks]
+        self._len = len(entries)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def add(self, entry: Tuple[float, str]):
+        self._len += 1
+        if not self._chunks:
+            self._chunks, self._maxes = [[entry]], [entry]
+            return
+        i = min(bisect_left(self._maxes, entry), len(self._maxes) - 1)
+        chunk = self._chunks[i]
+        insort(chunk, entry)
+        self._maxes[i] = chunk[-1]
+        if len(chunk) > 2 * self.CHUNK:
+            tail = chunk[self.CHUNK:]
+            del chunk[self.CHUNK:]
+            self._chunks.insert(i + 1, tail)
+            self._maxes[i:i + 1] = [chunk[-1], tail[-1]]
+
+    def remove(self, entry: Tuple[float, str]):
+        i = bisect_left(self._maxes, entry)
+        chunk = self._chunks[i]
+        del chunk[bisect_left(chunk, entry)]
+        self._len -= 1
+        if chunk:
+            self._maxes[i] = chunk[-1]
+        else:
+            del self._chunks[i]
+            del self._maxes[i]
+
+    def between(self, low: Tuple[float, str], high: Tuple[float, str]) -> Iterator[Tuple[float, str]]:
+        """Entries with low <= entry <= high, in order: a bisect, then only the matches."""
+        i = bisect_left(self._maxes, low)
+        start = bisect_left(self._chunks[i], low) if i < len(self._chunks) else 0
+        for chunk in self._chunks[i:]:
+            for entry in itertools.islice(chunk, start, None):
+                if entry > high:
+                    return
+                yield entry
+            start = 0
+
+
+class ExpiryIndex:
+    """Per-user sorted expiry lists plus one heap of due warning/expiry events."""
+
+    def __init__(self, warn_days: float = ALERT_EXPIRY_DAYS, ready: bool = False):
+        self.warn_s = warn_days * DAY_S
+        self.ready = ready  # False until the first full load
+        self._sorted: Dict[str, SortedEntries] = {}
+        self._items: Dict[str, Dict[str, dict]] = {}
+        self._heap: List[Tuple[float, float, str, str]] = []  # (fire_at, expires_at, user, id)
+        self._stale: Set[str] = set()
+        self._swept_until = float('-inf')
+        self._compact_at = 1024
+
+    def __len__(self) -> int:
+        return sum(len(items) for items in self._items.values())
+
+    def _drop(self, user_id: str, product_id: str):
+        item = self._items.get(user_id, {}).pop(product_id, None)
+        if item is not None:
+            self._sorted[user_id].remove((item['expires_at'], product_id))
+
+    def _add(self, user_id: str, product: dict, now: float, events: list, fire_past: bool):
+        expiry, quantity = product.get('expiry_date'), float(product.get('quantity') or 0)
+        if expiry is None or expiry == '' or quantity <= 0:
+            return None
+        product_id = _product_id(product)
+        expires_at = as_utc(expiry).timestamp()
+        self._items.setdefault(user_id, {})[product_id] = {
+            "id": product_id, "name": product.get('name'), "quantity": quantity,
+            "expiry_date": None, "expires_at": expires_at, "indexed_at": now}
+        for fire_at in (expires_at - self.warn_s, expires_at):
+            if fire_past or fire_at > now:
+                events.append((fire_at, expires_at, user_id, product_id))
+        return expires_at, product_id
+
+    def _push(self, events: list):
+        if len(events) > len(self._heap) // 8:
+            self._heap.extend(events)
+            heapq.heapify(self._heap)
+        else:
+            for event in events:
+                heapq.heappush(self._heap, event)
+        self._maybe_compact()
+
+    def upsert(self, user_id: str, product: dict, now: Optional[float] = None):
+        """Indexes a written product; products without expiry or stock leave the index."""
+        now = time.time() if now is None else now
+        product_id = _product_id(product)
+        current = self._items.get(user_id, {}).get(product_id)
+        expiry, quantity = product.get('expiry_date'), float(product.get('quantity') or 0)
+        if current is not None and expiry and quantity > 0 and as_utc(expiry).timestamp() == current["expires_at"]:
+            # A sale or restock: same position, same pending events
+            current.update(name=product.get('name'), quantity=quantity)
+            return
+        self._drop(user_id, product_id)
+        events = []
+        entry = self._add(user_id, product, now, events, fire_past=True)
+        if entry is not None:
+            self._sorted.setdefault(user_id, SortedEntries()).add(entry)
+        self._push(events)
+
+    def remove(self, user_id: str, product_id: str):
+        self._drop(user_id, str(product_id))
+
+    def load(self, user_id: str, products: Iterable[dict], now: Optional[float] = None):
+        """Replaces a user's entries. Expiries already inside the window do not fire again."""
+        now = time.time() if now is None else now
+        events = []
+        self._load(user_id, products, now, events)
+        self._push(events)
+
+    def _load(self, user_id: str, products: Iterable[dict], now: float, events: list):
+        self._items[user_id] = {}
+        entries = [self._add(user_id, product, now, events, fire_past=False) for product in products]
+        self._sorted[user_id] = SortedEntries(entry for entry in entries if entry is not None)
+        self._stale.discard(user_id)
+
+    def load_all(self, rows: Iterable[dict], now: Optional[float] = None):
+        """Loads every user's products from rows carrying a user_id."""
+        by_user: Dict[str, List[dict]] = {}
+        for row in rows:
+            by_user.setdefault(str(row['user_id']), []).append(row)
+        now = time.time() if now is None else now
+        events = []
+        for user_id, products in by_user.items():
+            self._load(user_id, products, now, events)
+        self._push(events)
+        self.ready = True
+
+    def mark_stale(self, user_id: str):
+        self._stale.add(user_id)
+
+    def needs_load(self, user_id: str) -> bool:
+        return not self.ready or user_id in self._stale
+
+    def stale_users(self) -> List[str]:
+        return sorted(self._stale)
+
+    def apply_change(self, user_id: str, change: dict):
+        """ChangeHub listener: follows product upserts, deletes and resyncs."""
+        if change.get("entity") != "product":
+            return
+        if change["op"] == "upsert" and change.get("data"):
+            self.upsert(user_id, change["data"])
+        elif change["op"] == "delete":
+            self.remove(user_id, change["id"])
+        elif change["op"] == "resync":
+            self.mark_stale(user_id)
+
+    def expiring(self, user_id: str, days: float, now: Optional[float] = None,
+                 include_expired: bool = True) -> List[dict]:
+        """Products expiring within `days` (and already expired ones, unless excluded), soonest first."""
+        now = time.time() if now is None else now
+        entries = self._sorted.get(user_id)
+        if not entries:
+            return []
+        items = self._items[user_id]
+        low = (now if not include_expired else float('-inf'), '')
+        results = []
+        for expires_at, product_id in entries.between(low, (now + days * DAY_S, _MAX_ID)):
+            item = items[product_id]
+            if item["expiry_date"] is None:  # formatted on first read, not for every loaded product
+                item["expiry_date"] = datetime.fromtimestamp(expires_at, timezone.utc).isoformat()
+            results.append({"id": product_id, "name": item["name"], "quantity": item["quantity"],
+                            "expiry_date": item["expiry_date"], "days_left": round((expires_at - now) / DAY_S, 2),
+                            "expired": expires_at <= now})
+        return results
+
+    def sweep(self, now: Optional[float] = None) -> Dict[str, List[str]]:
+        """Pops due events; returns the names of products that need attention per user."""
+        now = time.time() if now is None else now
+        fired: Dict[str, List[str]] = {}
+        while self._heap and self._heap[0][0] <= now:
+            _, expires_at, user_id, product_id = heapq.heappop(self._heap)
+            item = self._items.get(user_id, {}).get(product_id)
+            if item is None or item["expires_at"] != expires_at:
+                continue  # updated or removed since it was pushed
+            fired.setdefault(user_id, []).append(item["name"])
+        self._swept_until = now
+        EXPIRY_EVENTS_FIRED.inc(amount=sum(len(names) for names in fired.values()))
+        return fired
+
+    def _maybe_compact(self):
+        if len(self._heap) <= self._compact_at:
+            return
+        heap = []
+        for user_id, items in self._items.items():
+            for product_id, item in items.items():
+                expires_at = item["expires_at"]
+                for fire_at in (expires_at - self.warn_s, expires_at):
+                    # keep what has not fired yet, including past-due entries pushed since the last sweep
+                    if fire_at > self._swept_until or item["indexed_at"] >= self._swept_until:
+                        heap.append((fire_at, expires_at, user_id, product_id))
+        heapq.heapify(heap)
+        self._heap = heap
+        self._compact_at = 2 * len(heap) + 1024
+
+
+def expiry_query_days(command: str, default: int = 7) -> Optional[int]:
+    """Days asked about if a lowercased command is an expiry question ("what is expiring this week")."""
+    if not _EXPIRY_WORDS.search(command):
+        return None
+    if not _QUESTION_WORDS.search(command) and re.search(r'\d+(?:\.\d+)?\s*(?:kg|kilo|rs|rupees|₹)', command):
+        return None  # "add 5 kg milk expiring friday at 40 rs" is an add
+    match = re.search(r'(\d+)\s*days?', command)
+    if match:
+        return int(match.group(1))
+    if 'today' in command:
+        return 1
+    if 'tomorrow' in command:
+        return 2
+    if 'next week' in command:
+        return 14
+    if 'month' in command:
+        return 30
+    return default
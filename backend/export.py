@@ -0,0 +1,103 @@
+import csv
+import io
+import os
+from datetime import datetime, timezone
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from fastapi.responses import StreamingResponse
+
+from fast_json import dumps
+
+# --- Streaming Export ---
+# Full exports of products, inventory_transactions and voice_commands for
+# accounting. Rows are read one page at a time with a keyset cursor on
+# (created_at, id), which stays a single index range scan however deep the
+# export is (OFFSET paging re-reads every earlier row), and each page is
+# encoded and handed to a StreamingResponse before the next one is fetched.
+# Memory use is one page, not the whole history.
+#
+# EXPORT_PAGE_SIZE   rows per database round trip (default 1000, the PostgREST cap)
+
+EXPORT_PAGE_SIZE = int(os.getenv('EXPORT_PAGE_SIZE', '1000'))
+
+EXPORT_RESOURCES = {
+    "products": ("products", ["id", "name", "quantity", "price_per_kg", "category", "minimum_stock",
+                              "supplier", "expiry_date", "description", "created_at", "updated_at"]),
+    "transactions": ("inventory_transactions", ["id", "product_name", "transaction_type", "quantity_change",
+                                                "price_per_kg", "notes", "created_at"]),
+    "voice_commands": ("voice_commands", ["id", "command_text", "parsed_action", "parsed_product",
+                                          "parsed_quantity", "parsed_price", "success", "language", "created_at"]),
+}
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+# Spreadsheet apps run cells starting with these as formulas
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+FetchPage = Callable[[Optional[Tuple[str, str]], int], List[dict]]
+
+
+def keyset_pages(fetch_page: FetchPage, page_size: int = EXPORT_PAGE_SIZE) -> Iterator[List[dict]]:
+    """Yields pages ordered by (created_at, id) until a short page ends the scan."""
+    after = None
+    while True:
+        page = fetch_page(after, page_size)
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        after = (page[-1]['created_at'], page[-1]['id'])
+
+
+def supabase_page_fetcher(client, table: str, user_id: str, columns: List[str],
+                          until: Optional[str] = None) -> FetchPage:
+    """Keyset page reader for one user's rows of a Supabase table (created before `until`, if given)."""
+    select = ','.join(columns)
+
+    def fetch(after, limit):
+        query = client.table(table).select(select).eq('user_id', user_id)
+        if until is not None:
+            query = query.lt('created_at', until)
+        if after is not None:
+            created_at, row_id = after
+            query = query.or_(f'created_at.gt."{created_at}",'
+                              f'and(created_at.eq."{created_at}",id.gt.{row_id})')
+        return query.order('created_at').order('id').limit(limit).execute().data
+
+    return fetch
+
+
+def ndjson_chunks(pages: Iterable[List[dict]]) -> Iterator[bytes]:
+    """One newline-delimited JSON chunk per page."""
+    for page in pages:
+        yield b''.join(dumps(row) + b'\n' for row in page)
+
+
+def _csv_cell(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_chunks(pages: Iterable[List[dict]], columns: List[str]) -> Iterator[bytes]:
+    """A header chunk, then one CSV chunk per page."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue().encode('utf-8')
+    for page in pages:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_csv_cell(row.get(column)) for column in columns] for row in page)
+        yield buffer.getvalue().encode('utf-8')
+
+
+def export_response(pages: Iterable[List[dict]], fmt: str, columns: List[str], name: str) -> StreamingResponse:
+    """Streams pages as an NDJSON or CSV attachment."""
+    chunks = csv_chunks(pages, columns) if fmt == "csv" else ndjson_chunks(pages)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%d')
+    extension = "csv" if fmt == "csv" else "ndjson"
+    return StreamingResponse(chunks, media_type=MEDIA_TYPES[fmt],
+                             headers={"Content-Disposition": f'attachment; filename="{name}-{stamp}.{extension}"'})
@@ -0,0 +1,59 @@
+import json
+import os
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any
+
+from fastapi.responses import Response
+
+# --- Fast JSON Responses ---
+# Product and transaction rows are already plain dicts of str/float/datetime,
+# so FastAPI's recursive jsonable_encoder walk is pure overhead for them.
+# These responses serialize the rows directly with orjson when it is
+# installed, falling back to the stdlib encoder. Set FAST_JSON=0 to go back
+# to FastAPI's default encoding.
+
+try:
+    import orjson
+    ORJSON_ENABLED = True
+except ImportError:
+    ORJSON_ENABLED = False
+
+FAST_JSON = os.getenv('FAST_JSON', '1') != '0'
+
+
+def _default(value: Any):
+    """Encodes the few non-JSON types that appear in rows."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if hasattr(value, 'item'):  # numpy scalars from pandas aggregations
+        return value.item()
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Serializes plain data to JSON bytes with the fastest available encoder."""
+    if ORJSON_ENABLED:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def json_response(content: Any, status_code: int = 200):
+    """Wraps already-plain data in a FastJSONResponse, or returns it as-is when FAST_JSON is off."""
+    if not FAST_JSON:
+        return content
+    return FastJSONResponse(content, status_code=status_code)
@@ -0,0 +1,162 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from scipy.signal import lfilter
+
+# --- Vectorized Demand Forecasting ---
+# Forecasts consumption for every product of a user in one pass. Removals
+# are bucketed into a (products x days) matrix, each row is aligned to the
+# product's first recorded day (so a product added last week is not diluted
+# by a year of leading zeros), and a daily rate is fitted for all rows at
+# once:
+#   ses     simple exponential smoothing, level_t = a*x_t + (1-a)*level_t-1
+#   window  mean daily removal over the last FORECAST_WINDOW_DAYS days
+# The spread of daily demand around that rate gives a confidence interval
+# for the depletion date: cumulative demand over h days is taken as
+# N(h*rate, h*sigma^2), and the interval is where it crosses the usable stock.
+#
+# FORECAST_METHOD        ses or window (default ses)
+# FORECAST_ALPHA         smoothing factor for ses (default 0.2)
+# FORECAST_WINDOW_DAYS   window length for the window method (default 28)
+# FORECAST_HISTORY_DAYS  history read per forecast (default 730)
+# FORECAST_CONFIDENCE    two-sided interval level (default 0.9)
+
+FORECAST_METHOD = os.getenv('FORECAST_METHOD', 'ses')
+FORECAST_ALPHA = float(os.getenv('FORECAST_ALPHA', '0.2'))
+FORECAST_WINDOW_DAYS = int(os.getenv('FORECAST_WINDOW_DAYS', '28'))
+FORECAST_HISTORY_DAYS = int(os.getenv('FORECAST_HISTORY_DAYS', '730'))
+FORECAST_CONFIDENCE = float(os.getenv('FORECAST_CONFIDENCE', '0.9'))
+
+
+def daily_matrix(product_idx: np.ndarray, day_idx: np.ndarray, quantities: np.ndarray,
+                 n_products: int, n_days: int) -> np.ndarray:
+    """Sums quantities into a (n_products, n_days) matrix of daily buckets."""
+    flat = np.bincount(product_idx * n_days + day_idx, weights=quantities, minlength=n_products * n_days)
+    return flat.reshape(n_products, n_days)
+
+
+def _align_to_first_day(demand: np.ndarray, first_day: np.ndarray) -> np.ndarray:
+    n_days = demand.shape[1]
+    cols = np.arange(n_days)[None, :] + first_day[:, None]
+    valid = cols < n_days
+    rows = np.broadcast_to(np.arange(demand.shape[0])[:, None], cols.shape)
+    aligned = np.zeros_like(demand)
+    aligned[valid] = demand[rows[valid], cols[valid]]
+    return aligned
+
+
+def forecast_rates(demand: np.ndarray, first_day: np.ndarray, method: str = FORECAST_METHOD,
+                   alpha: float = FORECAST_ALPHA, window: int = FORECAST_WINDOW_DAYS):
+    """Daily consumption rate and its standard deviation for every row of `demand`."""
+    n_products, n_days = demand.shape
+    observed = np.maximum(n_days - first_day, 1)  # days since each product's first record
+
+    if method == "window":
+        span = np.minimum(observed, window)
+        recent = np.arange(n_days)[None, :] >= (n_days - span)[:, None]
+        rate = np.where(recent, demand, 0.0).sum(axis=1) / span
+        deviation = np.where(recent, demand - rate[:, None], 0.0)
+        sigma = np.sqrt((deviation ** 2).sum(axis=1) / np.maximum(span - 1, 1))
+        return rate, sigma
+
+    if method != "ses":
+        raise ValueError(f"Unknown forecast method: {method}")
+
+    aligned = _align_to_first_day(demand, first_day)
+    # level_t = alpha*x_t + (1-alpha)*level_{t-1}, seeded with the first day's value.
+    seed = aligned[:, :1] * (1 - alpha)
+    levels, _ = lfilter([alpha], [1, alpha - 1], aligned, axis=1, zi=seed)
+    previous = np.concatenate([aligned[:, :1], levels[:, :-1]], axis=1)
+    sq_error = (aligned - previous) ** 2
+    ew_var, _ = lfilter([alpha], [1, alpha - 1], sq_error, axis=1, zi=sq_error[:, :1] * (1 - alpha))
+
+    last = np.clip(observed - 1, 0, n_days - 1)
+    rows = np.arange(n_products)
+    return levels[rows, last], np.sqrt(ew_var[rows, last])
+
+
+def depletion_days(usable_stock: np.ndarray, rate: np.ndarray, sigma: np.ndarray,
+                   confidence: float = FORECAST_CONFIDENCE):
+    """Point estimate and (early, late) interval of days until usable stock runs out.
+
+    Solves h*rate +/- z*sigma*sqrt(h) = stock for h; NaN where there is no consumption.
+    """
+    z = stats.norm.ppf(0.5 + confidence / 2)
+    stock = np.maximum(usable_stock, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        point = np.where(rate > 0, stock / rate, np.nan)
+        root = np.sqrt((z * sigma) ** 2 + 4 * rate * stock)
+        early = np.where(rate > 0, ((-z * sigma + root) / (2 * rate)) ** 2, np.nan)
+        late = np.where(rate > 0, ((z * sigma + root) / (2 * rate)) ** 2, np.nan)
+    return point, early, late
+
+
+def _date_after(today: datetime, days: float) -> Optional[str]:
+    if days is None or not np.isfinite(days) or days > 3650:
+        return None
+    return (today + timedelta(days=float(days))).date().isoformat()
+
+
+def _clean(value) -> Optional[float]:
+    return round(float(value), 3) if np.isfinite(value) else None
+
+
+def demand_matrix(products: List[dict], transactions: List[dict], now: datetime, n_days: int):
+    """Daily removals as a (products x n_days) matrix ending today, plus each product's first recorded day."""
+    index = {p['name'].lower(): i for i, p in enumerate(products)}
+    demand = np.zeros((len(products), n_days))
+    first_day = np.full(len(products), n_days - 1)
+    if transactions:
+        frame = pd.DataFrame(transactions, columns=['product_name', 'transaction_type', 'quantity_change', 'created_at'])
+        frame['product'] = frame['product_name'].str.lower().map(index)
+        # Timestamps repeat (rollup rows carry one per day): parse each distinct value once
+        codes, stamps = pd.factorize(frame['created_at'])
+        parsed = pd.to_datetime(pd.Series(stamps), utc=True, format='ISO8601').dt.tz_localize(None)
+        days_ago = (pd.Timestamp(now).normalize() - parsed.dt.normalize()).dt.days.to_numpy()
+        frame['day'] = (n_days - 1) - days_ago[codes]
+        frame = frame[frame['product'].notna() & (frame['day'] >= 0) & (frame['day'] < n_days)]
+
+        product_idx = frame['product'].to_numpy(dtype=np.int64)
+        day_idx = frame['day'].to_numpy(dtype=np.int64)
+        np.minimum.at(first_day, product_idx, day_idx)
+        removed = (frame['transaction_type'] == 'remove').to_numpy()
+        quantities = np.abs(frame['quantity_change'].to_numpy(dtype=float)) * removed
+        demand = daily_matrix(product_idx, day_idx, quantities, len(products), n_days)
+    return demand, first_day
+
+
+def forecast_products(products: List[dict], transactions: List[dict], now: Optional[datetime] = None,
+                      method: str = FORECAST_METHOD, alpha: float = FORECAST_ALPHA,
+                      window: int = FORECAST_WINDOW_DAYS, history_days: int = FORECAST_HISTORY_DAYS,
+                      confidence: float = FORECAST_CONFIDENCE) -> List[dict]:
+    """Depletion forecasts for all products from raw product and transaction rows."""
+    if not products:
+        return []
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)  # transactions are compared in UTC
+    stock = np.array([float(p.get('quantity') or 0) for p in products])
+    minimum = np.array([float(p['minimum_stock']) if p.get('minimum_stock') is not None else 1.0
+                        for p in products])
+
+    demand, first_day = demand_matrix(products, transactions, now, max(1, history_days))
+    rate, sigma = forecast_rates(demand, first_day, method, alpha, window)
+    point, early, late = depletion_days(stock - minimum, rate, sigma, confidence)
+
+    results = []
+    for i, product in enumerate(products):
+        results.append({
+            "product_name": product['name'],
+            "current_stock": float(stock[i]),
+            "minimum_stock": float(minimum[i]),
+            "consumption_rate_per_day": _clean(rate[i]),
+            "daily_demand_std": _clean(sigma[i]),
+            "days_until_depletion": _clean(point[i]),
+            "days_until_depletion_interval": [_clean(early[i]), _clean(late[i])],
+            "depletion_date": _date_after(now, point[i]),
+            "depletion_date_interval": [_date_after(now, early[i]), _date_after(now, late[i])],
+        })
+    results.sort(key=lambda r: (r["days_until_depletion"] is None, r["days_until_depletion"] or 0))
+    return results
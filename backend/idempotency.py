@@ -0,0 +1,305 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+from app_logging import get_logger
+
+logger = get_logger("idempotency")
+
+# --- Idempotency Keys ---
+# Mobile clients retry writes on timeouts. A POST carrying an Idempotency-Key
+# header is executed once; retries with the same key (same user, route and
+# body) get the stored response back with an Idempotent-Replayed header
+# instead of inserting another product and transaction.
+#
+# Keys live in a bounded, TTL-evicted in-memory store. With a durable tier
+# (the idempotency_keys table) claims are shared across workers and restarts.
+# A retry that arrives while the first attempt is still running waits for it
+# in the same worker, or gets 409 + Retry-After if another worker owns it.
+# 5xx responses are not stored, so a failed attempt can be retried for real.
+# Neither are bodies with "success": false, which the handlers return with a
+# 200 when they catch an error.
+#
+# IDEMPOTENCY_TTL_S            how long a key is remembered (default 86400)
+# IDEMPOTENCY_MAX_KEYS         in-memory entries before LRU eviction (default 10000)
+# IDEMPOTENCY_WAIT_S           how long a retry waits for the in-flight attempt (default 10)
+# IDEMPOTENCY_MAX_BODY_BYTES   larger responses are not stored (default 65536)
+
+IDEMPOTENCY_TTL_S = float(os.getenv('IDEMPOTENCY_TTL_S', '86400'))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv('IDEMPOTENCY_MAX_KEYS', '10000'))
+IDEMPOTENCY_WAIT_S = float(os.getenv('IDEMPOTENCY_WAIT_S', '10'))
+IDEMPOTENCY_MAX_BODY_BYTES = int(os.getenv('IDEMPOTENCY_MAX_BODY_BYTES', '65536'))
+
+IDEMPOTENT_ROUTES = {("POST", "/voice-command"), ("POST", "/products"), ("POST", "/sync")}
+
+_SKIPPED_HEADERS = {b"x-request-id", b"x-profile-id"}
+
+
+class MemoryIdempotencyStore:
+    """Bounded LRU of keys with TTL; pending entries carry an event retries can wait on."""
+
+    def __init__(self, max_entries: int = IDEMPOTENCY_MAX_KEYS, ttl: float = IDEMPOTENCY_TTL_S):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evict(self, now: float):
+        for key, entry in list(self._entries.items()):
+            expired = entry["expires"] <= now
+            if not expired and len(self._entries) <= self.max_entries:
+                break
+            if entry["status"] == "pending" and not expired:
+                continue  # in flight; its retries are waiting on it
+            del self._entries[key]
+            entry["event"].set()
+
+    async def claim(self, key: str, fingerprint: str) -> Optional[dict]:
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and entry["expires"] <= now:
+            del self._entries[key]
+            entry = None
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+        self._entries[key] = {"fingerprint": fingerprint, "status": "pending",
+                              "event": asyncio.Event(), "expires": now + self.ttl}
+        self._evict(now)
+        return None
+
+    async def complete(self, key: str, response: dict):
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        entry.update(status="done", response=response)
+        entry["event"].set()
+
+    async def remember(self, key: str, fingerprint: str, response: dict):
+        """Caches a response that was produced elsewhere (e.g. found in the durable tier)."""
+        event = asyncio.Event()
+        event.set()
+        self._entries[key] = {"fingerprint": fingerprint, "status": "done", "response": response,
+                              "event": event, "expires": time.monotonic() + self.ttl}
+        self._evict(time.monotonic())
+
+    async def release(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry["event"].set()
+
+
+class SupabaseIdempotencyStore:
+    """idempotency_keys table; the primary key on `key` makes claims atomic across workers."""
+
+    def __init__(self, client_factory: Callable, ttl: float = IDEMPOTENCY_TTL_S):
+        self.client_factory = client_factory
+        self.ttl = ttl
+
+    def _table(self):
+        return self.client_factory().table('idempotency_keys')
+
+    async def claim(self, key: str, fingerprint: str) -> Optional[dict]:
+        now = datetime.now(timezone.utc)
+        row = {'key': key, 'fingerprint': fingerprint, 'status': 'pending',
+               'expires_at': (now + timedelta(seconds=self.ttl)).isoformat()}
+        try:
+            self._table().insert(row).execute()
+            return None
+        except Exception:
+            rows = self._table().select('*').eq('key', key).execute().data
+            if not rows:
+                raise
+        existing = rows[0]
+        if datetime.fromisoformat(existing['expires_at'].replace('Z', '+00:00')) <= now:
+            # Expired: take it over for this request.
+            self._table().update(row).eq('key', key).execute()
+            return None
+        entry = {"fingerprint": existing['fingerprint'], "status": existing['status']}
+        if existing['status'] == 'done':
+            stored = existing['response']
+            entry["response"] = {"status": stored["status"],
+                                 "headers": [(k.encode('latin-1'), v.encode('latin-1')) for k, v in stored["headers"]],
+                                 "body": base64.b64decode(stored["body"])}
+        return entry
+
+    async def complete(self, key: str, response: dict):
+        stored = {"status": response["status"],
+                  "headers": [(k.decode('latin-1'), v.decode('latin-1')) for k, v in response["headers"]],
+                  "body": base64.b64encode(response["body"]).decode()}
+        self._table().update({'status': 'done', 'response': stored}).eq('key', key).execute()
+
+    async def release(self, key: str):
+        self._table().delete().eq('key', key).eq('status', 'pending').execute()
+
+    def purge_expired(self):
+        self._table().delete().lt('expires_at', datetime.now(timezone.utc).isoformat()).execute()
+
+
+class TieredIdempotencyStore:
+    """In-memory store in front of an optional durable one."""
+
+    def __init__(self, memory: MemoryIdempotencyStore = None, durable=None):
+        self.memory = memory or MemoryIdempotencyStore()
+        self.durable = durable
+
+    async def claim(self, key: str, fingerprint: str) -> Optional[dict]:
+        entry = await self.memory.claim(key, fingerprint)
+        if entry is not None or self.durable is None:
+            return entry
+        try:
+            entry = await self.durable.claim(key, fingerprint)
+        except Exception as e:
+            logger.warning("Durable idempotency tier unavailable, using memory only: %s", e)
+            return None
+        if entry is None:
+            return None
+        await self.memory.release(key)
+        if entry["status"] == "done":
+            await self.memory.remember(key, entry["fingerprint"], entry["response"])
+        return entry
+
+    async def complete(self, key: str, response: dict):
+        await self.memory.complete(key, response)
+        if self.durable is not None:
+            try:
+                await self.durable.complete(key, response)
+            except Exception as e:
+                logger.warning("Failed to persist idempotent response: %s", e)
+
+    async def release(self, key: str):
+        await self.memory.release(key)
+        if self.durable is not None:
+            try:
+                await self.durable.release(key)
+            except Exception as e:
+                logger.warning("Failed to release idempotency key: %s", e)
+
+
+def _header(scope, name: bytes) -> Optional[bytes]:
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value
+    return None
+
+
+async def _send_json(send, status: int, detail: str, extra_headers=()):
+    body = ('{"detail":"%s"}' % detail).encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"),
+                            (b"content-length", str(len(body)).encode()), *extra_headers]})
+    await send({"type": "http.response.body", "body": body})
+
+
+def _reports_failure(body: bytes) -> bool:
+    """True for a JSON object body with "success": false (an error caught by the handler)."""
+    if not body.startswith(b"{"):
+        return False
+    try:
+        return json.loads(body).get("success") is False
+    except ValueError:
+        return False
+
+
+class IdempotencyMiddleware:
+    """Pure ASGI middleware: executes a keyed POST once and replays its response to retries."""
+
+    def __init__(self, app, store=None, routes=IDEMPOTENT_ROUTES, wait: float = IDEMPOTENCY_WAIT_S,
+                 max_body_bytes: int = IDEMPOTENCY_MAX_BODY_BYTES):
+        self.app = app
+        self.store = store or TieredIdempotencyStore()
+        self.routes = routes
+        self.wait = wait
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (scope["method"], scope["path"]) not in self.routes:
+            return await self.app(scope, receive, send)
+        raw_key = _header(scope, b"idempotency-key")
+        if raw_key is None:
+            return await self.app(scope, receive, send)
+        if not 0 < len(raw_key) <= 255:
+            return await _send_json(send, 400, "Idempotency-Key must be 1-255 characters")
+
+        # Keys are scoped to the caller's credentials and the route.
+        caller = hashlib.sha256(_header(scope, b"authorization") or b"").hexdigest()[:16]
+        key = f"{caller}:{scope['method']}:{scope['path']}:{raw_key.decode('latin-1')}"
+
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        body = b"".join(chunks)
+        fingerprint = hashlib.sha256(body).hexdigest()
+
+        deadline = time.monotonic() + self.wait
+        while True:
+            entry = await self.store.claim(key, fingerprint)
+            if entry is None:
+                break
+            if entry["fingerprint"] != fingerprint:
+                return await _send_json(send, 422, "Idempotency-Key reused with a different request body")
+            if entry["status"] == "done":
+                return await self._replay(send, entry["response"])
+            remaining = deadline - time.monotonic()
+            if "event" not in entry or remaining <= 0:
+                return await _send_json(send, 409, "A request with this Idempotency-Key is in progress",
+                                        [(b"retry-after", b"1")])
+            try:
+                await asyncio.wait_for(entry["event"].wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                pass
+
+        await self._execute(scope, body, send, key)
+
+    async def _execute(self, scope, body: bytes, send, key: str):
+        replayed_body = False
+
+        async def receive_body():
+            nonlocal replayed_body
+            if replayed_body:
+                return {"type": "http.disconnect"}
+            replayed_body = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        captured = {"status": 500, "headers": [], "body": []}
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal size
+            if message["type"] == "http.response.start":
+                captured["status"] = message["status"]
+                captured["headers"] = [(k, v) for k, v in message.get("headers", []) if k not in _SKIPPED_HEADERS]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+                if size <= self.max_body_bytes:
+                    captured["body"].append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_body, send_wrapper)
+        except BaseException:
+            await self.store.release(key)
+            raise
+
+        response_body = b"".join(captured["body"])
+        if captured["status"] >= 500 or size > self.max_body_bytes or _reports_failure(response_body):
+            await self.store.release(key)
+        else:
+            await self.store.complete(key, {"status": captured["status"], "headers": captured["headers"],
+                                            "body": response_body})
+
+    async def _replay(self, send, response: dict):
+        await send({"type": "http.response.start", "status": response["status"],
+                    "headers": list(response["headers"]) + [(b"idempotent-replayed", b"true")]})
+        await send({"type": "http.response.body", "body": response["body"]})
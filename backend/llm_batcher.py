@@ -0,0 +1,180 @@
+import asyncio
+import json
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+from app_logging import get_logger
+
+logger = get_logger("llm_batcher")
+
+# --- LLM Micro-Batching ---
+# Under load many unrelated voice commands arrive within a few hundred
+# milliseconds of each other. Instead of one Gemini call per command, the
+# dispatcher collects low-confidence commands for a short window and sends
+# them as a single numbered prompt, then fans the answers back out.
+
+LLM_BATCH_WINDOW_MS = float(os.getenv('LLM_BATCH_WINDOW_MS', '50'))
+LLM_BATCH_MAX_SIZE = int(os.getenv('LLM_BATCH_MAX_SIZE', '16'))
+LLM_BATCH_TIMEOUT_S = float(os.getenv('LLM_BATCH_TIMEOUT_S', '5'))
+LLM_CONFIDENCE_THRESHOLD = float(os.getenv('LLM_CONFIDENCE_THRESHOLD', '0.6'))
+
+VALID_ACTIONS = {'add', 'sell', 'update', 'remove', 'list', 'search', 'stock', 'unknown'}
+
+BATCH_PROMPT_HEADER = """You parse inventory voice commands for a grocery shop in India.
+Commands may be in English, Hindi or Hinglish.
+Return ONLY a JSON array with one object per numbered command, in any order.
+Each object must have the keys:
+  "id": the command number,
+  "action": one of add, sell, update, remove, list, search, stock, unknown
+            (sell = stock sold or used up),
+  "product_name": lowercase English product name or null,
+  "quantity": quantity in kg as a number or null,
+  "price": price in rupees per kg as a number or null.
+
+Commands:
+"""
+
+
+def needs_llm(result: dict, threshold: float = LLM_CONFIDENCE_THRESHOLD) -> bool:
+    """Returns True if a regex parse result is weak enough to ask the LLM."""
+    if result.get("action") in ("list", "incomplete", "expiring"):
+        return False
+    return result.get("confidence", 0.0) < threshold
+
+
+def build_batch_prompt(commands: List[str]) -> str:
+    """Builds one multi-item prompt for a batch of commands."""
+    lines = [f"{i}. {json.dumps(cmd, ensure_ascii=False)}" for i, cmd in enumerate(commands, start=1)]
+    return BATCH_PROMPT_HEADER + "\n".join(lines)
+
+
+def parse_batch_response(text: str, size: int) -> List[Optional[dict]]:
+    """Parses the model's JSON array into per-command results (None if missing)."""
+    match = re.search(r'\[.*\]', text, re.DOTALL)
+    if not match:
+        raise ValueError("No JSON array in LLM response")
+    items = json.loads(match.group(0))
+
+    results: List[Optional[dict]] = [None] * size
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        try:
+            index = int(item.get("id")) - 1
+        except (TypeError, ValueError):
+            continue
+        if 0 <= index < size and item.get("action") in VALID_ACTIONS:
+            results[index] = item
+    return results
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def merge_llm_result(fallback: dict, item: dict) -> dict:
+    """Overlays an LLM answer on the regex result, keeping the regex value where the LLM has none."""
+    merged = dict(fallback)
+    merged["action"] = item["action"]
+    product_name = item.get("product_name")
+    if product_name:
+        merged["product_name"] = str(product_name).lower().strip()
+    for key in ("quantity", "price"):
+        value = _to_float(item.get(key))
+        if value is not None:
+            merged[key] = value
+    merged["source"] = "llm"
+    # The same guard the regex parser applies: an add needs a quantity and a price.
+    if merged["action"] == "add" and (merged.get("quantity") is None or merged.get("price") is None):
+        missing = "price" if merged.get("price") is None else "quantity"
+        return {"action": "incomplete", "message": f"Please specify the {missing} for {merged.get('product_name')}."}
+    return merged
+
+
+def _resolve(batch: List[Tuple[str, dict, asyncio.Future]], items: List[Optional[dict]]):
+    for (_, fallback, future), item in zip(batch, items):
+        if future.done():
+            continue
+        future.set_result(merge_llm_result(fallback, item) if item else fallback)
+
+
+class LLMBatchDispatcher:
+    """Collects commands over a short window and resolves them with one model call."""
+
+    def __init__(self, model, window_ms: float = LLM_BATCH_WINDOW_MS,
+                 max_batch_size: int = LLM_BATCH_MAX_SIZE,
+                 timeout: float = LLM_BATCH_TIMEOUT_S):
+        self.model = model
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        self.timeout = timeout
+        self._pending: List[Tuple[str, dict, asyncio.Future]] = []
+        self._timer: Optional[asyncio.Task] = None
+        self._batches: Dict[asyncio.Task, list] = {}
+        self.stats = {"commands": 0, "model_calls": 0, "failed_batches": 0}
+
+    async def submit(self, command: str, fallback: dict) -> dict:
+        """Queues a command and waits for its (possibly LLM-refined) parse result."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((command, fallback, future))
+        self.stats["commands"] += 1
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.create_task(self._flush_after_window())
+        return await future
+
+    async def _flush_after_window(self):
+        await asyncio.sleep(self.window)
+        self._timer = None
+        self._flush()
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run_batch(batch))
+            self._batches[task] = batch
+            task.add_done_callback(lambda done: self._batches.pop(done, None))
+
+    async def stop(self):
+        """Cancels queued and in-flight batches; their commands get the regex result."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batches = [self._pending, *self._batches.values()]
+        self._pending = []
+        tasks = list(self._batches)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for batch in batches:
+            _resolve(batch, [None] * len(batch))
+
+    async def _call_model(self, prompt: str) -> str:
+        if hasattr(self.model, 'generate_content_async'):
+            response = await self.model.generate_content_async(prompt)
+        else:
+            response = await asyncio.to_thread(self.model.generate_content, prompt)
+        return response.text
+
+    async def _run_batch(self, batch: List[Tuple[str, dict, asyncio.Future]]):
+        prompt = build_batch_prompt([command for command, _, _ in batch])
+        self.stats["model_calls"] += 1
+        try:
+            text = await asyncio.wait_for(self._call_model(prompt), timeout=self.timeout)
+            items = parse_batch_response(text, len(batch))
+        except Exception as e:
+            self.stats["failed_batches"] += 1
+            logger.warning("LLM batch of %d failed: %s. Falling back to regex parser.", len(batch), e)
+            items = [None] * len(batch)
+        _resolve(batch, items)
+
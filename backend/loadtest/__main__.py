@@ -0,0 +1,100 @@
+"""
+Async load generator for the Vocal Verse API.
+
+Runs a scenario from loadtest/scenarios/ either in-process against the
+in-memory backend (server.py, the default) or against a live server, and
+writes per-route latency/throughput/error results as JSON.
+
+Usage (from backend/):
+    python -m loadtest voice_add_storm
+    python -m loadtest mixed_read_write --concurrency 100 --rate 500 --duration 30
+    python -m loadtest login_burst --base-url http://localhost:8000
+    python -m loadtest dashboard_polling --compare loadtest/results/dashboard_polling-old.json
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import sys
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+from loadtest.harness import LoadRunner, compare, load_scenario
+
+SCENARIO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scenarios')
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def resolve_scenario(name: str) -> str:
+    if os.path.exists(name):
+        return name
+    return os.path.join(SCENARIO_DIR, f"{name}.json")
+
+
+def make_client(args) -> httpx.AsyncClient:
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    if args.base_url:
+        return httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits)
+    module_name, attr = args.app.split(':')
+    app = getattr(importlib.import_module(module_name), attr)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest",
+                             timeout=args.timeout, limits=limits)
+
+
+async def main_async(args):
+    scenario = load_scenario(resolve_scenario(args.scenario), duration_s=args.duration,
+                             concurrency=args.concurrency, arrival_rate=args.rate)
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else None
+    async with make_client(args) as client:
+        runner = LoadRunner(client, scenario, seed=args.seed, headers=headers)
+        return await runner.run()
+
+
+def print_report(result: dict):
+    print(f"\n=== {result['scenario']} ({result['elapsed_s']}s, {result['config']}) ===")
+    print(f"{'route':<28}{'reqs':>8}{'rps':>10}{'err%':>8}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for route, s in list(result['routes'].items()) + [("TOTAL", result['total'])]:
+        print(f"{route:<28}{s['requests']:>8}{s['throughput_rps']:>10}{s['error_rate']:>8.2%}"
+              f"{s['p50_ms']:>9}{s['p95_ms']:>9}{s['p99_ms']:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vocal Verse load generator")
+    parser.add_argument("scenario", help="scenario name in loadtest/scenarios or a path to a JSON file")
+    parser.add_argument("--app", default="server:app", help="in-process ASGI app (module:attr)")
+    parser.add_argument("--base-url", help="run against a live server instead of in-process")
+    parser.add_argument("--token", help="bearer token for authenticated routes")
+    parser.add_argument("--concurrency", type=int)
+    parser.add_argument("--rate", type=float, help="arrivals per second (0 = closed loop)")
+    parser.add_argument("--duration", type=float, help="seconds")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="result JSON path (default: loadtest/results/<scenario>-<time>.json)")
+    parser.add_argument("--compare", help="previous result JSON to diff against")
+    args = parser.parse_args()
+
+    result = asyncio.run(main_async(args))
+    print_report(result)
+
+    out = args.out or os.path.join(
+        RESULTS_DIR, f"{result['scenario']}-{result['started_at'].replace(':', '')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    print(f"\nResults written to {out}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print("\nChange vs baseline:")
+        for line in compare(baseline, result):
+            print(f"  {line}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import asyncio
+import json
+import math
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+# --- Request Templating ---
+# Scenario bodies may contain {product}, {hindi_product}, {quantity} and {price}
+# placeholders, filled with a fresh random value for every request.
+PRODUCTS = ['tomato', 'onion', 'potato', 'rice', 'milk', 'sugar', 'banana', 'apple',
+            'carrot', 'wheat', 'dal', 'garlic', 'ginger', 'mango', 'spinach']
+HINDI_PRODUCTS = ['tamatar', 'pyaz', 'aloo', 'chawal', 'doodh', 'cheeni', 'kela', 'seb', 'gajar']
+
+
+def _placeholders(rng: random.Random) -> Dict[str, str]:
+    return {
+        "{product}": rng.choice(PRODUCTS),
+        "{hindi_product}": rng.choice(HINDI_PRODUCTS),
+        "{quantity}": str(rng.choice([0.5, 1, 2, 3, 5, 10])),
+        "{price}": str(rng.randint(10, 200)),
+    }
+
+
+def render(value, values: Dict[str, str]):
+    """Fills placeholders in strings nested anywhere inside a JSON body."""
+    if isinstance(value, str):
+        for key, replacement in values.items():
+            value = value.replace(key, replacement)
+        return value
+    if isinstance(value, dict):
+        return {k: render(v, values) for k, v in value.items()}
+    if isinstance(value, list):
+        return [render(v, values) for v in value]
+    return value
+
+
+def load_scenario(path: str, **overrides) -> dict:
+    """Loads a scenario file, applying non-None CLI overrides."""
+    with open(path, encoding='utf-8') as f:
+        scenario = json.load(f)
+    scenario.update({k: v for k, v in overrides.items() if v is not None})
+    return scenario
+
+
+# --- Statistics ---
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an unsorted list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class RouteStats:
+    def __init__(self):
+        self.latencies_ms: List[float] = []
+        self.errors = 0
+        self.status_counts: Dict[int, int] = defaultdict(int)
+
+    def record(self, latency_ms: float, status: Optional[int]):
+        self.latencies_ms.append(latency_ms)
+        if status is None or status >= 400:
+            self.errors += 1
+        self.status_counts[status or 0] += 1
+
+    def summary(self, elapsed_s: float) -> dict:
+        count = len(self.latencies_ms)
+        return {
+            "requests": count,
+            "throughput_rps": round(count / elapsed_s, 2) if elapsed_s else 0.0,
+            "error_rate": round(self.errors / count, 4) if count else 0.0,
+            "p50_ms": round(percentile(self.latencies_ms, 50), 2),
+            "p95_ms": round(percentile(self.latencies_ms, 95), 2),
+            "p99_ms": round(percentile(self.latencies_ms, 99), 2),
+            "max_ms": round(max(self.latencies_ms), 2) if count else 0.0,
+            "status_counts": {str(k): v for k, v in sorted(self.status_counts.items())},
+        }
+
+
+# --- Runner ---
+class LoadRunner:
+    """Drives a scenario against an httpx client and collects per-route stats."""
+
+    def __init__(self, client: httpx.AsyncClient, scenario: dict, seed: int = 0,
+                 headers: Optional[dict] = None):
+        self.client = client
+        self.scenario = scenario
+        self.rng = random.Random(seed)
+        self.headers = headers or {}
+        self.stats: Dict[str, RouteStats] = defaultdict(RouteStats)
+        self._weights = [r.get("weight", 1) for r in scenario["requests"]]
+
+    async def _send(self, spec: dict, scheduled_at: float):
+        route = f"{spec['method']} {spec['path']}"
+        values = _placeholders(self.rng)
+        status = None
+        try:
+            response = await self.client.request(
+                spec['method'], render(spec['path'], values),
+                json=render(spec.get('json'), values), headers=self.headers
+            )
+            status = response.status_code
+        except Exception:
+            pass
+        # Latency is measured from the scheduled send time, so time spent
+        # queued behind the concurrency limit counts (no coordinated omission).
+        self.stats[route].record((time.perf_counter() - scheduled_at) * 1000, status)
+
+    def _pick(self) -> dict:
+        return self.rng.choices(self.scenario["requests"], weights=self._weights)[0]
+
+    async def setup(self):
+        for spec in self.scenario.get("setup", []):
+            for _ in range(spec.get("repeat", 1)):
+                values = _placeholders(self.rng)
+                await self.client.request(spec['method'], render(spec['path'], values),
+                                          json=render(spec.get('json'), values), headers=self.headers)
+
+    async def _open_loop(self, deadline: float, limit: asyncio.Semaphore):
+        rate = self.scenario["arrival_rate"]
+        tasks = []
+
+        async def bounded(spec, scheduled_at):
+            async with limit:
+                await self._send(spec, scheduled_at)
+
+        next_at = time.perf_counter()
+        while next_at < deadline:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(bounded(self._pick(), next_at)))
+            next_at += self.rng.expovariate(rate)
+        await asyncio.gather(*tasks)
+
+    async def _closed_loop(self, deadline: float):
+        async def worker():
+            while time.perf_counter() < deadline:
+                await self._send(self._pick(), time.perf_counter())
+
+        await asyncio.gather(*(worker() for _ in range(self.scenario["concurrency"])))
+
+    async def run(self) -> dict:
+        await self.setup()
+        start = time.perf_counter()
+        deadline = start + self.scenario["duration_s"]
+        if self.scenario.get("arrival_rate"):
+            await self._open_loop(deadline, asyncio.Semaphore(self.scenario["concurrency"]))
+        else:
+            await self._closed_loop(deadline)
+        elapsed = time.perf_counter() - start
+        return self.report(elapsed)
+
+    def report(self, elapsed_s: float) -> dict:
+        total = RouteStats()
+        for route_stats in self.stats.values():
+            total.latencies_ms.extend(route_stats.latencies_ms)
+            total.errors += route_stats.errors
+            for status, count in route_stats.status_counts.items():
+                total.status_counts[status] += count
+        return {
+            "scenario": self.scenario["name"],
+            "started_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "config": {k: self.scenario.get(k) for k in ("duration_s", "concurrency", "arrival_rate")},
+            "elapsed_s": round(elapsed_s, 3),
+            "total": total.summary(elapsed_s),
+            "routes": {route: s.summary(elapsed_s) for route, s in sorted(self.stats.items())},
+        }
+
+
+def compare(baseline: dict, current: dict) -> List[str]:
+    """Formats per-route p95/throughput/error deltas between two result files."""
+    lines = []
+    for route, cur in current["routes"].items():
+        base = baseline.get("routes", {}).get(route)
+        if not base:
+            lines.append(f"{route}: new route")
+            continue
+        lines.append(
+            f"{route}: p95 {base['p95_ms']} -> {cur['p95_ms']} ms, "
+            f"rps {base['throughput_rps']} -> {cur['throughput_rps']}, "
+            f"errors {base['error_rate']:.2%} -> {cur['error_rate']:.2%}"
+        )
+    return lines
@@ -0,0 +1,135 @@
+import itertools
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+# --- Lot Tracking ---
+# Every 'add' transaction opens a lot with its own price (and expiry date,
+# if given). Every 'remove' consumes the oldest open lots first (FIFO). A
+# LotBook per (user, product) keeps its open lots in a deque. Receiving
+# appends, and consuming pops fully used lots from the left. Each operation
+# costs O(1) per lot it touches, however long the history.
+#
+# Valuation is kept up to date as lots move instead of being recomputed:
+# stock on hand, the FIFO value of the open lots, the moving weighted
+# average cost, and the cost of goods sold under both methods. Removals
+# beyond the open lots (stock that predates tracking, manual edits) are
+# counted as `unmatched`. They carry no cost.
+#
+# The in-memory server keeps LotBooks. Supabase does the same bookkeeping in
+# SQL with a trigger on inventory_transactions that writes inventory_lots
+# and lot_valuations (see supabase_schema.sql).
+
+EPSILON = 1e-9
+
+VALUATION_FIELDS = ('on_hand', 'fifo_value', 'avg_cost', 'cogs_fifo', 'cogs_avg', 'unmatched')
+
+
+class LotBook:
+    """Open lots of one product, oldest first, with running valuation totals."""
+
+    def __init__(self, product_name: str):
+        self.product_name = product_name
+        self.lots: deque = deque()
+        self.on_hand = 0.0
+        self.fifo_value = 0.0
+        self.avg_cost = 0.0
+        self.cogs_fifo = 0.0
+        self.cogs_avg = 0.0
+        self.unmatched = 0.0
+        self._ids = itertools.count(1)
+
+    def receive(self, quantity: float, price_per_kg: Optional[float] = None, expiry_date=None,
+                received_at: Optional[datetime] = None) -> dict:
+        """Opens a lot; without a price it is booked at the current average cost."""
+        price = self.avg_cost if price_per_kg is None else float(price_per_kg)
+        lot = {"lot_id": next(self._ids), "quantity_received": quantity, "quantity_remaining": quantity,
+               "price_per_kg": price, "expiry_date": expiry_date,
+               "received_at": received_at or datetime.now(timezone.utc)}
+        self.lots.append(lot)
+        self.avg_cost = (self.on_hand * self.avg_cost + quantity * price) / (self.on_hand + quantity)
+        self.on_hand += quantity
+        self.fifo_value += quantity * price
+        return lot
+
+    def consume(self, quantity: float) -> dict:
+        """Takes stock from the oldest lots; returns what was taken and its cost under both methods."""
+        left, cost, taken = quantity, 0.0, []
+        while left > EPSILON and self.lots:
+            lot = self.lots[0]
+            take = min(lot["quantity_remaining"], left)
+            lot["quantity_remaining"] -= take
+            left -= take
+            cost += take * lot["price_per_kg"]
+            taken.append({"lot_id": lot["lot_id"], "quantity": take, "price_per_kg": lot["price_per_kg"]})
+            if lot["quantity_remaining"] <= EPSILON:
+                self.lots.popleft()
+        left = max(left, 0.0)
+        consumed = quantity - left
+        avg_cost = consumed * self.avg_cost
+        self.cogs_fifo += cost
+        self.cogs_avg += avg_cost
+        self.unmatched += left
+        if self.lots:
+            self.on_hand -= consumed
+            self.fifo_value -= cost
+        else:
+            self.on_hand = self.fifo_value = 0.0  # no float drift once the product is sold out
+        return {"consumed": consumed, "unmatched": left, "cogs_fifo": cost, "cogs_avg": avg_cost, "lots": taken}
+
+    def valuation(self) -> dict:
+        return {"product_name": self.product_name, "on_hand": self.on_hand, "fifo_value": self.fifo_value,
+                "avg_cost": self.avg_cost, "avg_value": self.on_hand * self.avg_cost,
+                "cogs_fifo": self.cogs_fifo, "cogs_avg": self.cogs_avg, "unmatched": self.unmatched,
+                "open_lots": len(self.lots)}
+
+
+class LotLedger:
+    """LotBooks per (user, lowercased product name)."""
+
+    def __init__(self):
+        self._books: Dict[Tuple[str, str], LotBook] = {}
+
+    def book(self, user_id: str, product_name: str) -> LotBook:
+        key = (user_id, product_name.lower())
+        book = self._books.get(key)
+        if book is None:
+            book = self._books[key] = LotBook(product_name.lower())
+        return book
+
+    def record(self, user_id: str, transaction: dict) -> Optional[dict]:
+        """Applies an 'add' or 'remove' transaction; other types do not move lots."""
+        quantity = float(transaction.get('quantity_change') or 0)
+        if quantity <= 0:
+            return None
+        book = self.book(user_id, transaction['product_name'])
+        if transaction['transaction_type'] == 'add':
+            return book.receive(quantity, transaction.get('price_per_kg'), transaction.get('expiry_date'),
+                                transaction.get('created_at'))
+        if transaction['transaction_type'] == 'remove':
+            return book.consume(quantity)
+        return None
+
+    def open_lots(self, user_id: str, product_name: str) -> List[dict]:
+        book = self._books.get((user_id, product_name.lower()))
+        return list(book.lots) if book else []
+
+    def valuations(self, user_id: str) -> List[dict]:
+        return [book.valuation() for (user, _), book in sorted(self._books.items()) if user == user_id]
+
+
+def valuation_summary(rows: List[dict]) -> dict:
+    """Per-product valuation rows (LotBook.valuation or lot_valuations) plus inventory totals."""
+    products = []
+    for row in rows:
+        row = {**row, **{field: float(row.get(field) or 0) for field in VALUATION_FIELDS}}
+        row["open_lots"] = int(row.get("open_lots") or 0)
+        row["avg_value"] = row["on_hand"] * row["avg_cost"]
+        products.append(row)
+    return {
+        "products": products,
+        "inventory_value_fifo": sum(p["fifo_value"] for p in products),
+        "inventory_value_avg": sum(p["avg_value"] for p in products),
+        "cogs_fifo": sum(p["cogs_fifo"] for p in products),
+        "cogs_avg": sum(p["cogs_avg"] for p in products),
+    }
@@ -0,0 +1,264 @@
+import asyncio
+import functools
+import os
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, Optional, Tuple
+
+# --- Prometheus-Style Metrics ---
+# Recording is lock-free: every metric is written only from the event loop
+# thread, so an observation is a bisect plus a couple of list/float updates.
+# Set METRICS_ENABLED=0 to turn all recording into a no-op.
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') != '0'
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+SCHEDULER_LAG_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram:
+    """A labeled histogram with fixed upper bounds (seconds by convention)."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._children: Dict[Tuple[str, ...], _HistogramChild] = {}
+
+    def labels(self, *values: str) -> _HistogramChild:
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = _HistogramChild(self.buckets)
+        return child
+
+    def observe(self, value: float, *labelvalues: str):
+        if METRICS_ENABLED:
+            self.labels(*labelvalues).observe(value)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for values, child in sorted(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), child.counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{_fmt(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, values)} {_fmt(child.sum)}"
+            yield f"{self.name}_count{_labels(self.labelnames, values)} {child.count}"
+
+
+class Counter:
+    """A labeled monotonically increasing counter."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1):
+        if METRICS_ENABLED:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for values, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.labelnames, values)} {_fmt(value)}"
+
+
+class Gauge(Counter):
+    """A labeled value that can go up and down."""
+
+    def set(self, value: float, *labelvalues: str):
+        if METRICS_ENABLED:
+            self._values[labelvalues] = value
+
+    def render(self) -> Iterable[str]:
+        for line in super().render():
+            yield line.replace(" counter", " gauge", 1) if line.startswith("# TYPE") else line
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+REQUEST_LATENCY = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template.",
+    ("method", "route", "status")))
+VOICE_STAGE_LATENCY = registry.register(Histogram(
+    "voice_parse_stage_duration_seconds", "Voice command processing time per stage.",
+    ("stage",), buckets=STAGE_BUCKETS))
+DB_CALL_LATENCY = registry.register(Histogram(
+    "db_call_duration_seconds", "Database helper latency.", ("helper",)))
+DB_CALL_ERRORS = registry.register(Counter(
+    "db_call_errors_total", "Database helper calls that raised.", ("helper",)))
+CACHE_REQUESTS = registry.register(Counter(
+    "cache_requests_total", "Cache lookups by cache and result (hit/miss).", ("cache", "result")))
+EVENT_LOOP_LAG = registry.register(Histogram(
+    "event_loop_lag_seconds", "How late the event loop woke a periodic probe.", buckets=STAGE_BUCKETS))
+EVENT_LOOP_LAG_LAST = registry.register(Gauge(
+    "event_loop_lag_last_seconds", "Most recent event loop lag sample."))
+ALERT_SCHEDULER_LAG = registry.register(Histogram(
+    "alert_scheduler_lag_seconds", "How long after its due time an alert run started.",
+    buckets=SCHEDULER_LAG_BUCKETS))
+ALERT_RUN_DURATION = registry.register(Histogram(
+    "alert_run_duration_seconds", "Time to recompute and store one user's alerts."))
+ALERT_RUNS = registry.register(Counter(
+    "alert_runs_total", "Alert recomputations by result (ok/error).", ("result",)))
+ALERT_ROWS_WRITTEN = registry.register(Counter(
+    "alert_rows_written_total", "stock_alerts rows written by alert runs."))
+EXPIRY_EVENTS_FIRED = registry.register(Counter(
+    "expiry_events_fired_total", "Products that entered the expiry warning window or expired, found by sweeps."))
+ALERT_QUEUE_DEPTH = registry.register(Gauge(
+    "alert_scheduler_queue_depth", "Users waiting for an alert recomputation."))
+WRITE_BEHIND_OPS = registry.register(Counter(
+    "write_behind_ops_total", "Stock changes buffered by the write-behind layer."))
+WRITE_BEHIND_FLUSHES = registry.register(Counter(
+    "write_behind_flushes_total", "Write-behind batches written, by result (ok/error).", ("result",)))
+WRITE_BEHIND_PENDING = registry.register(Gauge(
+    "write_behind_pending_ops", "Buffered stock changes not yet written."))
+
+
+# --- Recording Helpers ---
+class stage:
+    """Times a block as one voice-parse stage: `with stage("regex"): ...`."""
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        VOICE_STAGE_LATENCY.observe(time.perf_counter() - self.start, self.name)
+        return False
+
+
+def timed_db(helper: Optional[str] = None):
+    """Decorates an async DB helper to record its call latency and errors."""
+    def decorator(func):
+        name = helper or func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                DB_CALL_ERRORS.inc(name)
+                raise
+            finally:
+                DB_CALL_LATENCY.observe(time.perf_counter() - start, name)
+        return wrapper
+    return decorator
+
+
+def record_cache(cache: str, hit: bool):
+    """Counts one cache lookup; the hit ratio is derived at query time."""
+    CACHE_REQUESTS.inc(cache, "hit" if hit else "miss")
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording latency per route template, not per raw path."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status_holder = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            REQUEST_LATENCY.observe(time.perf_counter() - start, scope["method"], path, str(status_holder[0]))
+
+
+async def monitor_event_loop_lag(interval: float = 0.5):
+    """Samples how late the loop wakes a sleeping task; run as a background task."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - start - interval)
+        EVENT_LOOP_LAG.observe(lag)
+        EVENT_LOOP_LAG_LAST.set(lag)
+
+
+def render_metrics() -> str:
+    """Renders all metrics plus derived per-cache hit ratios."""
+    ratios = {}
+    for (cache, result), value in CACHE_REQUESTS._values.items():
+        hits, total = ratios.get(cache, (0, 0))
+        ratios[cache] = (hits + (value if result == "hit" else 0), total + value)
+    lines = ["# HELP cache_hit_ratio Share of cache lookups that were hits.", "# TYPE cache_hit_ratio gauge"]
+    for cache, (hits, total) in sorted(ratios.items()):
+        lines.append(f'cache_hit_ratio{{cache="{_escape(cache)}"}} {hits / total if total else 0.0}')
+    return registry.render() + "\n".join(lines) + "\n"
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
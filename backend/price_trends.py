@@ -0,0 +1,160 @@
+import math
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from scipy import special
+
+# --- Price Trends ---
+# Linear-regression price trends (price per kg against time) that do not
+# re-read the history. Each (user, product) keeps a PriceStats
+# accumulator: the count, the means of time and price, and their centred
+# sums of squares and cross-products. Every transaction with a price
+# updates it in O(1) with Welford's method, which stays accurate when the
+# times are large numbers (days since 1970) that differ only slightly.
+# Slope, intercept, r, R², p-value and standard errors then follow from
+# the accumulator directly, with the same formulas as
+# scipy.stats.linregress.
+#
+# Time is measured in days, so the slope is the price change per kg per day.
+#
+# A trend counts as increasing or decreasing only when
+# R² >= TREND_MIN_R_SQUARED, p < TREND_MAX_P_VALUE and it rests on at least
+# TREND_MIN_POINTS prices. Otherwise it is reported as stable.
+#
+# The in-memory server keeps a PriceTrendBook. Supabase keeps the same
+# accumulators in price_stats, updated by a trigger on
+# inventory_transactions (see supabase_schema.sql).
+#
+# TREND_MIN_POINTS     prices needed before a trend is called (default 3)
+# TREND_MIN_R_SQUARED  share of price variance the line must explain (default 0.5)
+# TREND_MAX_P_VALUE    significance level of the slope (default 0.05)
+
+TREND_MIN_POINTS = int(os.getenv('TREND_MIN_POINTS', '3'))
+TREND_MIN_R_SQUARED = float(os.getenv('TREND_MIN_R_SQUARED', '0.5'))
+TREND_MAX_P_VALUE = float(os.getenv('TREND_MAX_P_VALUE', '0.05'))
+
+SECONDS_PER_DAY = 86400.0
+TINY = 1.0e-20  # as in scipy.stats.linregress
+STATS_FIELDS = ('n', 'mean_x', 'mean_y', 'm2_x', 'm2_y', 'c_xy')
+
+
+def day_number(when) -> float:
+    """Days since 1970-01-01 UTC for a datetime or ISO string (naive times are UTC)."""
+    if isinstance(when, str):
+        when = datetime.fromisoformat(when.replace('Z', '+00:00'))
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return when.timestamp() / SECONDS_PER_DAY
+
+
+class PriceStats:
+    """Running count, means and centred (co)moments of (day, price) pairs."""
+
+    def __init__(self, n: int = 0, mean_x: float = 0.0, mean_y: float = 0.0,
+                 m2_x: float = 0.0, m2_y: float = 0.0, c_xy: float = 0.0):
+        self.n = n
+        self.mean_x = mean_x
+        self.mean_y = mean_y
+        self.m2_x = m2_x
+        self.m2_y = m2_y
+        self.c_xy = c_xy
+
+    @classmethod
+    def from_row(cls, row: dict) -> "PriceStats":
+        return cls(int(row.get('n') or 0), *(float(row.get(field) or 0) for field in STATS_FIELDS[1:]))
+
+    def update(self, x: float, y: float):
+        self.n += 1
+        dx = x - self.mean_x
+        dy = y - self.mean_y
+        self.mean_x += dx / self.n
+        self.mean_y += dy / self.n
+        self.m2_x += dx * (x - self.mean_x)
+        self.m2_y += dy * (y - self.mean_y)
+        self.c_xy += dx * (y - self.mean_y)
+
+    def regression(self) -> Optional[dict]:
+        """What scipy.stats.linregress returns for the pairs seen; None while all days are the same."""
+        n = self.n
+        if n < 2 or self.m2_x <= 0:
+            return None
+        ssxm, ssym, ssxym = self.m2_x / n, self.m2_y / n, self.c_xy / n
+        if ssym == 0.0:
+            r = math.nan if ssxym == 0 else 0.0
+        else:
+            r = max(-1.0, min(1.0, ssxym / math.sqrt(ssxm * ssym)))
+        slope = ssxym / ssxm
+        intercept = self.mean_y - slope * self.mean_x
+        if n == 2:
+            p_value, stderr, intercept_stderr = 0.0 if ssym else 1.0, 0.0, 0.0
+        else:
+            df = n - 2
+            t = r * math.sqrt(df / ((1.0 - r + TINY) * (1.0 + r + TINY)))
+            p_value = float(2 * special.stdtr(df, -abs(t)))  # two-sided Student t tail
+            stderr = math.sqrt((1 - r ** 2) * ssym / ssxm / df)
+            intercept_stderr = stderr * math.sqrt(ssxm + self.mean_x ** 2)
+        return {"slope": slope, "intercept": intercept, "rvalue": r, "pvalue": p_value,
+                "stderr": stderr, "intercept_stderr": intercept_stderr}
+
+
+def _finite(value: float, digits: int) -> Optional[float]:
+    return round(value, digits) if math.isfinite(value) else None
+
+
+def describe_trend(product_name: str, price_stats: PriceStats, now: Optional[datetime] = None) -> dict:
+    """A product's trend for the API: fit, significance, direction and today's fitted price."""
+    fit = price_stats.regression()
+    trend = {"product_name": product_name, "points": price_stats.n,
+             "mean_price": round(price_stats.mean_y, 4) if price_stats.n else None,
+             "slope_per_day": None, "r_squared": None, "p_value": None, "std_err": None,
+             "predicted_price": None, "trend_type": "stable", "significant": False}
+    if fit is None:
+        return trend
+    r_squared = fit["rvalue"] ** 2
+    significant = (price_stats.n >= TREND_MIN_POINTS and r_squared >= TREND_MIN_R_SQUARED
+                   and fit["pvalue"] < TREND_MAX_P_VALUE and fit["slope"] != 0)
+    today = day_number(now or datetime.now(timezone.utc))
+    trend.update({
+        "slope_per_day": round(fit["slope"], 6),
+        "r_squared": _finite(r_squared, 6),
+        "p_value": _finite(fit["pvalue"], 6),
+        "std_err": _finite(fit["stderr"], 6),
+        "predicted_price": round(fit["intercept"] + fit["slope"] * today, 2),
+        "trend_type": ("increasing" if fit["slope"] > 0 else "decreasing") if significant else "stable",
+        "significant": significant,
+    })
+    return trend
+
+
+class PriceTrendBook:
+    """PriceStats per (user, lowercased product name)."""
+
+    def __init__(self):
+        self._stats: Dict[Tuple[str, str], PriceStats] = {}
+
+    def record(self, user_id: str, transaction: dict) -> Optional[PriceStats]:
+        """Folds in a transaction's price; transactions without one are skipped."""
+        price = transaction.get('price_per_kg')
+        if price is None:
+            return None
+        key = (user_id, transaction['product_name'].lower())
+        price_stats = self._stats.get(key)
+        if price_stats is None:
+            price_stats = self._stats[key] = PriceStats()
+        price_stats.update(day_number(transaction.get('created_at') or datetime.now(timezone.utc)), float(price))
+        return price_stats
+
+    def rows(self, user_id: str) -> List[dict]:
+        """Accumulators in the shape of price_stats rows, for trend_summary."""
+        return [{"product_name": product, **vars(price_stats)}
+                for (user, product), price_stats in sorted(self._stats.items()) if user == user_id]
+
+
+def trend_summary(rows: List[dict], product_name: Optional[str] = None, now: Optional[datetime] = None) -> dict:
+    """Trends from accumulator rows (PriceTrendBook.rows or price_stats); significant ones first."""
+    if product_name:
+        rows = [row for row in rows if row['product_name'] == product_name.lower()]
+    trends = [describe_trend(row['product_name'], PriceStats.from_row(row), now) for row in rows]
+    trends.sort(key=lambda t: (not t["significant"], t["p_value"] if t["p_value"] is not None else 1.0))
+    return {"trends": trends, "significant_count": sum(t["significant"] for t in trends)}
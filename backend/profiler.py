@@ -0,0 +1,186 @@
+import asyncio
+import hmac
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import PlainTextResponse
+
+from app_logging import get_logger
+
+logger = get_logger("profiler")
+
+# --- On-Demand Request Profiling ---
+# A request carrying the admin token (X-Profile-Token header or
+# ?profile_token= query flag) is profiled by a sampling thread that reads
+# the event loop thread's stack every PROFILING_INTERVAL_MS. Stacks are
+# stored in the collapsed format understood by flamegraph.pl and speedscope
+# ("outer;inner;leaf <samples>"), and the response gets an X-Profile-Id
+# header for GET /debug/profiles/{id}.
+#
+# The sampler sees the loop thread, not the request: every stack on that
+# thread during the request is counted, including other requests handled
+# concurrently, while work the request hands to asyncio.to_thread or an
+# executor does not appear at all. Profile on a quiet worker, and read a
+# thin profile of a slow request as time spent off the loop thread.
+#
+# Stored profiles expire after PROFILE_TTL_S, and only the newest
+# PROFILE_MAX_FILES are kept, so the directory stays bounded.
+#
+# When PROFILING_TOKEN is unset nothing is installed, so there is no cost.
+#
+# PROFILE_MAX_FILES  profiles kept before the oldest are deleted (default 200)
+# PROFILE_TTL_S      how long a profile is kept (default 604800)
+
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN')
+PROFILING_INTERVAL_MS = float(os.getenv('PROFILING_INTERVAL_MS', '1'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles'))
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', '200'))
+PROFILE_TTL_S = float(os.getenv('PROFILE_TTL_S', '604800'))
+
+PROFILE_HEADER = b"x-profile-token"
+PROFILE_QUERY_FLAG = "profile_token="
+
+
+def _frame_label(frame) -> str:
+    module = frame.f_globals.get('__name__', '?')
+    return f"{module}:{frame.f_code.co_name}"
+
+
+class StackSampler(threading.Thread):
+    """Samples one thread's Python stack at a fixed interval into collapsed stacks."""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        current_frames = sys._current_frames
+        while not self._stop_event.wait(self.interval):
+            frame = current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(labels))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware; only requests with the admin token are sampled."""
+
+    def __init__(self, app, token: str, profile_dir: str = PROFILE_DIR,
+                 interval_ms: float = PROFILING_INTERVAL_MS, max_files: int = PROFILE_MAX_FILES,
+                 ttl: float = PROFILE_TTL_S):
+        self.app = app
+        self.token = token.encode()
+        self.profile_dir = profile_dir
+        self.interval = interval_ms / 1000.0
+        self.max_files = max_files
+        self.ttl = ttl
+        # One profile at a time: overlapping samplers would see each other's requests.
+        self._busy = threading.Lock()
+
+    def _requested(self, scope) -> bool:
+        for name, value in scope.get("headers", ()):
+            if name == PROFILE_HEADER:
+                return hmac.compare_digest(value, self.token)
+        query = scope.get("query_string", b"").decode("latin-1")
+        if PROFILE_QUERY_FLAG in query:
+            for part in query.split("&"):
+                if part.startswith(PROFILE_QUERY_FLAG):
+                    return hmac.compare_digest(part[len(PROFILE_QUERY_FLAG):].encode(), self.token)
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._requested(scope) or not self._busy.acquire(blocking=False):
+            return await self.app(scope, receive, send)
+
+        profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            elapsed = time.perf_counter() - started
+            self._busy.release()
+            await asyncio.to_thread(self._store, profile_id, scope, sampler, elapsed)
+
+    def _store(self, profile_id: str, scope, sampler: StackSampler, elapsed: float):
+        """Writes the profile and prunes old ones; runs in a worker thread, off the event loop."""
+        os.makedirs(self.profile_dir, exist_ok=True)
+        with open(os.path.join(self.profile_dir, f"{profile_id}.collapsed"), "w", encoding="utf-8") as f:
+            f.write(f"# {scope['method']} {scope['path']} {elapsed * 1000:.1f}ms {sampler.samples} samples\n")
+            f.write(sampler.collapsed())
+        logger.info("Profiled %s %s -> %s (%d samples)", scope['method'], scope['path'], profile_id, sampler.samples)
+        self._prune()
+
+    def _prune(self):
+        """Deletes expired profiles, then the oldest ones beyond max_files."""
+        paths = [os.path.join(self.profile_dir, name) for name in os.listdir(self.profile_dir)
+                 if name.endswith(".collapsed")]
+        by_age = sorted(((os.path.getmtime(path), path) for path in paths), reverse=True)
+        cutoff = time.time() - self.ttl
+        for i, (modified, path) in enumerate(by_age):
+            if i >= self.max_files or modified < cutoff:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+def read_profile(profile_dir: str, profile_id: str) -> Optional[str]:
+    """Returns a stored collapsed-stack profile, or None if it does not exist."""
+    if not profile_id.replace("-", "").isalnum():
+        return None
+    path = os.path.join(profile_dir, f"{profile_id}.collapsed")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def install_profiling(app, token: Optional[str] = PROFILING_TOKEN, profile_dir: str = PROFILE_DIR):
+    """Adds the profiling middleware and the admin download route when a token is configured."""
+    if not token:
+        return
+
+    app.add_middleware(ProfilingMiddleware, token=token, profile_dir=profile_dir)
+
+    async def get_profile(profile_id: str, request: Request):
+        supplied = request.headers.get("x-profile-token", "")
+        if not hmac.compare_digest(supplied.encode(), token.encode()):
+            raise HTTPException(status_code=403, detail="Profiling token required")
+        profile = read_profile(profile_dir, profile_id)
+        if profile is None:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        return PlainTextResponse(profile)
+
+    app.add_api_route("/debug/profiles/{profile_id}", get_profile, methods=["GET"], include_in_schema=False)
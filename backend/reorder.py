@@ -0,0 +1,128 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+import numpy as np
+from scipy import stats
+
+from forecasting import demand_matrix
+
+# --- Reorder Planning ---
+# Reorder point, safety stock and economic order quantity (EOQ) for every
+# product of a user in one vectorized pass. It uses the same
+# (products x days) daily demand matrix that the forecasts use (see
+# forecasting.py). For each row, over the days since the product's first
+# record (at most REORDER_HISTORY_DAYS):
+#   d, sigma      mean and standard deviation of daily demand
+#   safety stock  SS  = z * sigma * sqrt(L), with z for REORDER_SERVICE_LEVEL
+#                       and L = REORDER_LEAD_TIME_DAYS
+#   reorder point ROP = minimum_stock + d * L + SS
+#   EOQ           Q*  = sqrt(2 * D * S / H), with yearly demand D = 365 * d,
+#                       S = REORDER_ORDER_COST per order and
+#                       H = REORDER_HOLDING_RATE * price_per_kg per kg per year
+# Products at or below their reorder point are flagged order_now. Their
+# suggested order is the larger of Q* and what brings stock back up to the
+# ROP. Products without demand or a price get no EOQ.
+#
+# Plans are cached per inventory version, so they are recomputed only after
+# the user's stock has moved.
+#
+# REORDER_LEAD_TIME_DAYS  days between placing an order and receiving it (default 2)
+# REORDER_SERVICE_LEVEL   chance of not running out during the lead time (default 0.95)
+# REORDER_ORDER_COST      fixed cost of placing one order, in rupees (default 100)
+# REORDER_HOLDING_RATE    yearly holding cost as a share of the price per kg (default 0.25)
+# REORDER_HISTORY_DAYS    days of demand the statistics use (default 90)
+# REORDER_CACHE_TTL_S     longest a plan is reused at the same inventory version (default 3600)
+
+REORDER_LEAD_TIME_DAYS = float(os.getenv('REORDER_LEAD_TIME_DAYS', '2'))
+REORDER_SERVICE_LEVEL = float(os.getenv('REORDER_SERVICE_LEVEL', '0.95'))
+REORDER_ORDER_COST = float(os.getenv('REORDER_ORDER_COST', '100'))
+REORDER_HOLDING_RATE = float(os.getenv('REORDER_HOLDING_RATE', '0.25'))
+REORDER_HISTORY_DAYS = int(os.getenv('REORDER_HISTORY_DAYS', '90'))
+REORDER_CACHE_TTL_S = float(os.getenv('REORDER_CACHE_TTL_S', '3600'))
+
+DAYS_PER_YEAR = 365.0
+
+
+def demand_stats(demand: np.ndarray, first_day: np.ndarray):
+    """Mean and sample standard deviation of each row's daily demand from its first recorded day on."""
+    n_days = demand.shape[1]
+    observed = np.maximum(n_days - first_day, 1)
+    recent = np.arange(n_days)[None, :] >= first_day[:, None]
+    mean = np.where(recent, demand, 0.0).sum(axis=1) / observed
+    deviation = np.where(recent, demand - mean[:, None], 0.0)
+    std = np.sqrt((deviation ** 2).sum(axis=1) / np.maximum(observed - 1, 1))
+    return mean, std
+
+
+def reorder_arrays(stock: np.ndarray, minimum: np.ndarray, price: np.ndarray, mean: np.ndarray, std: np.ndarray,
+                   lead_time: float = REORDER_LEAD_TIME_DAYS, service_level: float = REORDER_SERVICE_LEVEL,
+                   order_cost: float = REORDER_ORDER_COST, holding_rate: float = REORDER_HOLDING_RATE) -> dict:
+    """The plan as arrays, one entry per product; NaN where a figure is undefined."""
+    z = stats.norm.ppf(service_level)
+    safety = z * std * np.sqrt(lead_time)
+    reorder_point = minimum + mean * lead_time + safety
+    yearly = mean * DAYS_PER_YEAR
+    holding = holding_rate * price
+    with np.errstate(divide='ignore', invalid='ignore'):
+        eoq = np.where((yearly > 0) & (holding > 0), np.sqrt(2 * yearly * order_cost / holding), np.nan)
+        orders_per_year = yearly / eoq
+        annual_cost = orders_per_year * order_cost + eoq / 2 * holding
+        days_until_reorder = np.where(mean > 0, np.maximum(stock - reorder_point, 0.0) / mean, np.nan)
+    order_now = stock <= reorder_point
+    shortfall = np.maximum(reorder_point - stock, 0.0)
+    suggested = np.where(order_now, np.fmax(np.nan_to_num(eoq), shortfall), 0.0)
+    return {"safety_stock": safety, "reorder_point": reorder_point, "economic_order_quantity": eoq,
+            "orders_per_year": orders_per_year, "annual_cost": annual_cost,
+            "days_until_reorder": days_until_reorder, "order_now": order_now, "suggested_order_quantity": suggested}
+
+
+def _num(value) -> Optional[float]:
+    return round(float(value), 3) if np.isfinite(value) else None
+
+
+def reorder_plan(products: List[dict], transactions: List[dict], now: Optional[datetime] = None,
+                 lead_time: float = REORDER_LEAD_TIME_DAYS, service_level: float = REORDER_SERVICE_LEVEL,
+                 order_cost: float = REORDER_ORDER_COST, holding_rate: float = REORDER_HOLDING_RATE,
+                 history_days: int = REORDER_HISTORY_DAYS) -> dict:
+    """Reorder plan for all products from raw product and transaction rows; products to order first."""
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    stock = np.array([float(p.get('quantity') or 0) for p in products])
+    minimum = np.array([float(p['minimum_stock']) if p.get('minimum_stock') is not None else 1.0
+                        for p in products])
+    price = np.array([float(p.get('price_per_kg') or 0) for p in products])
+    demand, first_day = demand_matrix(products, transactions, now, max(1, history_days))
+    mean, std = demand_stats(demand, first_day)
+    plan = reorder_arrays(stock, minimum, price, mean, std, lead_time, service_level, order_cost, holding_rate)
+
+    rows = []
+    for i, product in enumerate(products):
+        days = plan["days_until_reorder"][i]
+        rows.append({
+            "product_name": product['name'],
+            "current_stock": float(stock[i]),
+            "minimum_stock": float(minimum[i]),
+            "price_per_kg": float(price[i]),
+            "mean_daily_demand": _num(mean[i]),
+            "daily_demand_std": _num(std[i]),
+            "safety_stock": _num(plan["safety_stock"][i]),
+            "reorder_point": _num(plan["reorder_point"][i]),
+            "economic_order_quantity": _num(plan["economic_order_quantity"][i]),
+            "order_now": bool(plan["order_now"][i]),
+            "suggested_order_quantity": _num(plan["suggested_order_quantity"][i]),
+            "days_until_reorder": _num(days),
+            "reorder_date": (now + timedelta(days=float(days))).date().isoformat()
+                            if np.isfinite(days) and days <= 3650 else None,
+            "orders_per_year": _num(plan["orders_per_year"][i]),
+            "annual_cost": _num(plan["annual_cost"][i]),
+        })
+    rows.sort(key=lambda r: (not r["order_now"], r["days_until_reorder"] is None, r["days_until_reorder"] or 0))
+    to_order = [r for r in rows if r["order_now"]]
+    return {
+        "products": rows,
+        "order_now_count": len(to_order),
+        "order_now_value": round(sum(r["suggested_order_quantity"] * r["price_per_kg"] for r in to_order), 2),
+        "parameters": {"lead_time_days": lead_time, "service_level": service_level, "order_cost": order_cost,
+                       "holding_rate": holding_rate, "history_days": history_days},
+        "computed_at": datetime.now(timezone.utc).isoformat(),
+    }
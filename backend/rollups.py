@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Daily transaction rollups.
+
+Backfill (rebuilds daily_product_rollups from inventory_transactions):
+  python rollups.py backfill [--user USER_ID] [--since YYYY-MM-DD] [--client-side] [--batch-size 500]
+
+By default each user is rebuilt by the rebuild_daily_rollups() SQL function
+in one database transaction. --client-side aggregates in Python instead
+(for databases without the function); writes that land while it runs may be
+missed, so run it when the shop is idle.
+
+Once old transactions have been moved to the archive (archive.py), pass
+--since with a date inside the database's retention so the buckets of
+archived days are kept instead of being rebuilt from nothing.
+"""
+
+import argparse
+import os
+import sys
+from datetime import date, datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+# --- Daily Rollups ---
+# One bucket per (user, product, UTC day) with the added and removed
+# quantities, price sum/count and first/last transaction time. Analytics read
+# O(days) buckets instead of O(transactions) raw rows, and give the same
+# numbers as aggregating the raw rows.
+#
+# In Supabase the buckets live in daily_product_rollups and are maintained by
+# a trigger on inventory_transactions (see supabase_schema.sql); the
+# in-memory server keeps a MemoryRollupStore. Product names are bucketed
+# lowercase.
+#
+# ROLLUPS_ENABLED   read analytics from rollups (default 1); 0 = raw transactions
+
+ROLLUPS_ENABLED = os.getenv('ROLLUPS_ENABLED', '1') != '0'
+
+BUCKET_FIELDS = ('added', 'removed', 'price_sum', 'price_count', 'transaction_count')
+
+
+def as_utc(value) -> datetime:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def new_bucket(user_id: str, product_name: str, day: date) -> dict:
+    return {"user_id": user_id, "product_name": product_name, "day": day,
+            "added": 0.0, "removed": 0.0, "price_sum": 0.0, "price_count": 0,
+            "transaction_count": 0, "first_at": None, "last_at": None}
+
+
+def apply_transaction(bucket: dict, transaction: dict):
+    """Folds one transaction into its day bucket (mirrors the SQL trigger)."""
+    quantity = float(transaction.get('quantity_change') or 0)
+    if transaction.get('transaction_type') == 'add':
+        bucket['added'] += quantity
+    elif transaction.get('transaction_type') == 'remove':
+        bucket['removed'] += quantity
+    if transaction.get('price_per_kg') is not None:
+        bucket['price_sum'] += float(transaction['price_per_kg'])
+        bucket['price_count'] += 1
+    bucket['transaction_count'] += 1
+    created = as_utc(transaction['created_at'])
+    bucket['first_at'] = created if bucket['first_at'] is None else min(bucket['first_at'], created)
+    bucket['last_at'] = created if bucket['last_at'] is None else max(bucket['last_at'], created)
+
+
+class MemoryRollupStore:
+    """In-memory daily buckets keyed by (user, product, day)."""
+
+    def __init__(self):
+        self._buckets: Dict[Tuple[str, str, date], dict] = {}
+
+    def apply(self, user_id: str, transaction: dict):
+        product = transaction['product_name'].lower()
+        day = as_utc(transaction['created_at']).date()
+        key = (user_id, product, day)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = new_bucket(user_id, product, day)
+        apply_transaction(bucket, transaction)
+
+    def rebuild(self, user_id: str, transactions: Iterable[dict]):
+        """Drops a user's buckets and re-derives them from raw transactions."""
+        for key in [k for k in self._buckets if k[0] == user_id]:
+            del self._buckets[key]
+        for transaction in transactions:
+            self.apply(user_id, transaction)
+
+    def buckets(self, user_id: str, product_name: Optional[str] = None, since: Optional[date] = None) -> List[dict]:
+        product = product_name.lower() if product_name else None
+        rows = [b for (user, name, day), b in self._buckets.items()
+                if user == user_id and (product is None or name == product) and (since is None or day >= since)]
+        return sorted(rows, key=lambda b: (b['product_name'], b['day']))
+
+
+def fold(transactions: Iterable[dict]) -> List[dict]:
+    """Day buckets for a request-sized batch of rows (no DataFrame setup cost)."""
+    buckets: Dict[Tuple[str, date], dict] = {}
+    for transaction in transactions:
+        key = (transaction['product_name'].lower(), as_utc(transaction['created_at']).date())
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = new_bucket(transaction.get('user_id'), *key)
+        apply_transaction(bucket, transaction)
+    return [buckets[key] for key in sorted(buckets)]
+
+
+def aggregate(transactions: List[dict]) -> List[dict]:
+    """Builds day buckets for a batch of raw transaction rows in one groupby (used by backfill)."""
+    if not transactions:
+        return []
+    df = pd.DataFrame(transactions)
+    df['created_at'] = pd.to_datetime(df['created_at'], utc=True, format='ISO8601')
+    df['product_name'] = df['product_name'].str.lower()
+    df['day'] = df['created_at'].dt.date
+    df['quantity_change'] = df['quantity_change'].astype(float)
+    df['added'] = df['quantity_change'].where(df['transaction_type'] == 'add', 0.0)
+    df['removed'] = df['quantity_change'].where(df['transaction_type'] == 'remove', 0.0)
+    df['price'] = df['price_per_kg'].astype(float) if 'price_per_kg' in df else float('nan')
+
+    grouped = df.groupby(['user_id', 'product_name', 'day'], sort=True).agg(
+        added=('added', 'sum'), removed=('removed', 'sum'),
+        price_sum=('price', 'sum'), price_count=('price', 'count'),
+        transaction_count=('quantity_change', 'size'),
+        first_at=('created_at', 'min'), last_at=('created_at', 'max'),
+    ).reset_index()
+    rows = grouped.to_dict('records')
+    for row in rows:
+        row['price_count'] = int(row['price_count'])
+        row['transaction_count'] = int(row['transaction_count'])
+        row['first_at'] = row['first_at'].to_pydatetime()
+        row['last_at'] = row['last_at'].to_pydatetime()
+    return rows
+
+
+def summarize(buckets: List[dict], product_name: str) -> dict:
+    """Product analytics from day buckets; same fields and values as the raw-row version."""
+    if not buckets:
+        return {"message": "No transaction history found"}
+    total_added = sum(float(b['added']) for b in buckets)
+    total_removed = sum(float(b['removed']) for b in buckets)
+    transaction_count = sum(int(b['transaction_count']) for b in buckets)
+    price_count = sum(int(b['price_count']) for b in buckets)
+    first_at = min(as_utc(b['first_at']) for b in buckets)
+    last_at = max(as_utc(b['last_at']) for b in buckets)
+
+    days_span = (last_at - first_at).days
+    consumption_rate = total_removed / days_span if transaction_count > 1 and days_span > 0 else 0
+    return {
+        "product_name": product_name,
+        "current_stock": total_added - total_removed,
+        "total_added": total_added,
+        "total_consumed": total_removed,
+        "consumption_rate_per_day": consumption_rate,
+        "average_price": sum(float(b['price_sum']) for b in buckets) / price_count if price_count else 0,
+        "transaction_count": transaction_count,
+        "first_transaction": first_at.isoformat(),
+        "last_transaction": last_at.isoformat(),
+    }
+
+
+def as_forecast_rows(buckets: List[dict]) -> List[dict]:
+    """Turns day buckets into the transaction-shaped rows forecasting.forecast_products reads."""
+    rows = []
+    for b in buckets:
+        day = b['day'].isoformat() if isinstance(b['day'], date) else str(b['day'])
+        if float(b['added']):
+            rows.append({"product_name": b['product_name'], "transaction_type": "add",
+                         "quantity_change": float(b['added']), "created_at": day})
+        if float(b['removed']) or not float(b['added']):
+            rows.append({"product_name": b['product_name'], "transaction_type": "remove",
+                         "quantity_change": float(b['removed']), "created_at": day})
+    return rows
+
+
+def to_record(bucket: dict) -> dict:
+    """JSON-ready row for the daily_product_rollups table."""
+    record = dict(bucket)
+    record['day'] = bucket['day'].isoformat()
+    record['first_at'] = bucket['first_at'].isoformat()
+    record['last_at'] = bucket['last_at'].isoformat()
+    return record
+
+
+def backfill(client, user_id: Optional[str] = None, batch_size: int = 500, page_size: int = 1000,
+             client_side: bool = False, since: Optional[date] = None) -> int:
+    """Recomputes rollups (from `since` on, if given) from inventory_transactions; returns buckets written."""
+    users = [user_id] if user_id else [row['id'] for row in client.table('users').select('id').execute().data]
+    written = 0
+    for uid in users:
+        if not client_side:
+            params = {'p_user_id': uid, 'p_since': since.isoformat() if since else None}
+            count = client.rpc('rebuild_daily_rollups', params).execute().data
+            written += int(count or 0)
+            print(f"{uid}: {count} daily buckets")
+            continue
+
+        transactions, offset = [], 0
+        while True:
+            query = client.table('inventory_transactions') \
+                .select('user_id,product_name,transaction_type,quantity_change,price_per_kg,created_at') \
+                .eq('user_id', uid)
+            if since:
+                query = query.gte('created_at', since.isoformat())
+            page = query.order('created_at').range(offset, offset + page_size - 1).execute().data
+            transactions.extend(page)
+            if len(page) < page_size:
+                break
+            offset += page_size
+
+        records = [to_record(bucket) for bucket in aggregate(transactions)]
+        stale = client.table('daily_product_rollups').delete().eq('user_id', uid)
+        (stale.gte('day', since.isoformat()) if since else stale).execute()
+        for start in range(0, len(records), batch_size):
+            client.table('daily_product_rollups').upsert(records[start:start + batch_size]).execute()
+        written += len(records)
+        print(f"{uid}: {len(transactions)} transactions -> {len(records)} daily buckets")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--user", help="only rebuild this user's rollups")
+    parser.add_argument("--since", type=date.fromisoformat, help="only rebuild days from this date on")
+    parser.add_argument("--client-side", action="store_true", help="aggregate in Python instead of SQL")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from supabase import create_client
+
+    load_dotenv()
+    url, key = os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+    if not url or not key:
+        sys.exit("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set")
+    total = backfill(create_client(url, key), args.user, args.batch_size, client_side=args.client_side, since=args.since)
+    print(f"Backfill complete: {total} buckets")
+
+
+if __name__ == "__main__":
+    main()
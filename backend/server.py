@@ -1,12 +1,14 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Literal, Optional
 import os
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import re
 import math
+import time
 import json
 import asyncio
 from collections import defaultdict
@@ -17,6 +19,13 @@ import warnings
 
 warnings.filterwarnings('ignore')
 
+# --- Logging ---
+# Structured logs go through a queue drained on a background thread, so
+# request handlers never block on stdout. See app_logging.py for settings.
+from app_logging import CorrelationIdMiddleware, configure_logging, get_logger, hot_debug
+configure_logging()
+logger = get_logger("server")
+
 # --- Translation Support (googletrans) ---
 # The 'googletrans' library can be unstable. If translation fails,
 # consider using a more robust official API for production use.
@@ -24,17 +33,17 @@ try:
     from googletrans import Translator
     from langdetect import detect
     TRANSLATION_ENABLED = True
-    print("✅ Translation libraries loaded successfully. Translation is enabled.")
+    logger.info("Translation libraries loaded successfully. Translation is enabled.")
 except ImportError:
     TRANSLATION_ENABLED = False
-    print("⚠️ Translation libraries (googletrans, langdetect) not found. Running in fallback mode without translation.")
+    logger.warning("Translation libraries (googletrans, langdetect) not found. Running in fallback mode without translation.")
 
 # --- Environment Variables ---
 # Load environment variables from a .env file if it exists
 try:
     from dotenv import load_dotenv
     load_dotenv()
-    print("✅ .env file loaded.")
+    logger.info(".env file loaded.")
 except ImportError:
     pass
 
@@ -51,16 +60,119 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --- Metrics ---
+# Per-route latency, voice-parse stages and DB helper timings, exposed at /metrics.
+from metrics import (MetricsMiddleware, PROMETHEUS_CONTENT_TYPE, VOICE_STAGE_LATENCY,
+                     monitor_event_loop_lag, render_metrics, stage, timed_db)
+app.add_middleware(MetricsMiddleware)
+
+# --- Fast JSON ---
+# Large product/dashboard payloads skip jsonable_encoder (FAST_JSON=0 to disable).
+from fast_json import json_response
+
+# --- Conditional GET ---
+# ETags from a per-user inventory version; the in-memory store has one owner.
+from conditional import bump_inventory_version, etag_json_response, inventory_etag, not_modified
+INVENTORY_OWNER = "local"
+
+# --- Realtime Change Stream ---
+# Product deltas pushed over SSE (/changes/stream) or WebSocket (/ws/changes).
+from change_stream import ChangeHub, create_bus, serve_websocket, sse_events
+change_hub = ChangeHub(create_bus())
+
+# --- Delta Sync ---
+# GET /products/changes?since=<cursor> and idempotent POST /sync for devices
+# that were offline; see delta_sync.py.
+from delta_sync import (AppliedOperations, SyncOperation, SyncRequest, apply_operations,
+                        changes_since, decode_cursor, prune_tombstones, recorded_time)
+applied_sync_ops = AppliedOperations()
+
+# --- Idempotency Keys ---
+# Retried writes carrying the same Idempotency-Key replay the stored response.
+from idempotency import IdempotencyMiddleware, TieredIdempotencyStore
+idempotency_store = TieredIdempotencyStore()
+app.add_middleware(IdempotencyMiddleware, store=idempotency_store)
+# Added last so it is outermost: replayed responses get an x-request-id too
+app.add_middleware(CorrelationIdMiddleware)
+
+# --- Single-Flight Analytics ---
+# Identical concurrent analytics requests share one computation.
+from singleflight import SingleFlight, analytics_key
+analytics_flights = SingleFlight("analytics")
+
+# --- Daily Rollups ---
+# Stock movements are folded into per-day buckets; product analytics read
+# those instead of a raw transaction log. See rollups.py.
+from rollups import MemoryRollupStore, summarize
+rollup_store = MemoryRollupStore()
+
+# --- Streaming Export ---
+# Products stream out page by page as NDJSON or CSV; see export.py.
+from export import EXPORT_PAGE_SIZE, export_response
+PRODUCT_EXPORT_COLUMNS = ["_id", "name", "quantity", "price_per_kg", "created_at", "updated_at"]
+
+# --- Bulk Product Import ---
+# POST /products/import streams a CSV or JSON-lines upload; see bulk_import.py.
+from bulk_import import (ImportFormatError, batches, import_summary, parse_upload, plan_import,
+                         upload_format)
+
+# --- Alert Scheduler ---
+# Alerts are recomputed in the background after inventory changes and read
+# from a store by /analytics/alerts and the dashboard; see alert_scheduler.py.
+# This server is always a single process, so it always runs the loop.
+from alert_scheduler import AlertScheduler, MemoryAlertStore, alerts_payload, build_alerts
+from forecasting import FORECAST_HISTORY_DAYS, forecast_products
+from rollups import as_forecast_rows
+
+# --- Expiry Index ---
+# Products with an expiry date are kept in time order for "what expires
+# this week" queries; sweeps feed the alert scheduler. See expiry.py.
+from expiry import EXPIRY_INDEX, EXPIRY_SWEEP_S, ExpiryIndex, expiry_query_days
+expiry_index = ExpiryIndex(ready=True)
+change_hub.add_listener(expiry_index.apply_change)
+
+# --- Lot Tracking ---
+# Each 'add' opens a lot and each 'remove' consumes the oldest lots first,
+# keeping FIFO and weighted-average valuation current. See lots.py.
+from lots import LotLedger, valuation_summary
+lot_ledger = LotLedger()
+
+# --- Price Trends ---
+# Running regression accumulators per product, updated in O(1) by every
+# transaction with a price; see price_trends.py.
+from price_trends import PriceTrendBook, trend_summary
+price_trends = PriceTrendBook()
+
+# --- Reorder Planning ---
+# Reorder points, safety stock and EOQ for the whole catalogue, cached per
+# inventory version; see reorder.py.
+from reorder import REORDER_CACHE_TTL_S, REORDER_HISTORY_DAYS, reorder_plan
+reorder_flights = SingleFlight("reorder_plan", cache_ttl=REORDER_CACHE_TTL_S)
+
+# --- Stockout Risk ---
+# Monte Carlo chance of running out within N days, from resampled daily
+# demand; cached per inventory version and horizon. See stockout.py.
+from stockout import (STOCKOUT_CACHE_TTL_S, STOCKOUT_HISTORY_DAYS, STOCKOUT_HORIZON_DAYS,
+                      STOCKOUT_MAX_DAYS, stockout_risk)
+stockout_flights = SingleFlight("stockout_risk", cache_ttl=STOCKOUT_CACHE_TTL_S)
+
+# --- On-Demand Profiling ---
+# Only active when PROFILING_TOKEN is set; see profiler.py.
+from profiler import install_profiling
+install_profiling(app)
+
 # --- In-Memory Storage ---
 # This will act as our database for now.
 # NOTE: This data is not persistent and will be lost when the server restarts.
 # You should replace these with your Supabase logic.
 products_store = []
+tombstones_store = []  # deleted product ids, for /products/changes
 analytics_store = []
 suggestions_store = []
 user_behavior_store = []
 market_trends_store = []
 
+
 # --- Gemini AI Initialization ---
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 if GEMINI_API_KEY:
@@ -68,13 +180,18 @@ if GEMINI_API_KEY:
         import google.generativeai as genai
         genai.configure(api_key=GEMINI_API_KEY)
         model = genai.GenerativeModel('gemini-pro')
-        print("✅ Gemini AI initialized successfully.")
+        logger.info("Gemini AI initialized successfully.")
     except ImportError:
         model = None
-        print("⚠️ 'google.generativeai' not installed. Using fallback parsing.")
+        logger.warning("'google.generativeai' not installed. Using fallback parsing.")
 else:
     model = None
-    print("⚠️ Gemini API key not found. Using fallback parsing.")
+    logger.warning("Gemini API key not found. Using fallback parsing.")
+
+# --- LLM Batch Dispatcher ---
+# Low-confidence commands are micro-batched into a single Gemini prompt.
+from llm_batcher import LLMBatchDispatcher, needs_llm
+llm_dispatcher = LLMBatchDispatcher(model) if model else None
 
 # --- Translator Initialization ---
 if TRANSLATION_ENABLED:
@@ -86,9 +203,10 @@ def detect_language(text: str) -> str:
     if not TRANSLATION_ENABLED:
         return 'en'
     try:
-        return detect(text)
+        with stage("detect"):
+            return detect(text)
     except Exception as e:
-        print(f"🧐 Language detection failed: {e}. Defaulting to English.")
+        logger.warning("Language detection failed: %s. Defaulting to English.", e)
         return 'en'
 
 def translate_to_english(text: str) -> str:
@@ -98,11 +216,12 @@ def translate_to_english(text: str) -> str:
     try:
         if detect_language(text) == 'en':
             return text
-        result = translator.translate(text, dest='en')
-        print(f"🌍 Translated '{text}' to '{result.text}'")
+        with stage("translate"):
+            result = translator.translate(text, dest='en')
+        hot_debug(logger, "Translated %r to %r", text, result.text)
         return result.text
     except Exception as e:
-        print(f"❌ Translation error: {e}. Returning original text.")
+        logger.error("Translation error: %s. Returning original text.", e)
         return text
 
 def get_multilingual_product_mapping():
@@ -159,6 +278,7 @@ class Product(BaseModel):
     price_per_kg: float
     description: Optional[str] = ""
     category: Optional[str] = "general"
+    expiry_date: Optional[datetime] = None
 
 class ProductUpdate(BaseModel):
     name: str
@@ -166,6 +286,7 @@ class ProductUpdate(BaseModel):
     price_per_kg: Optional[float] = None
     description: Optional[str] = None
     category: Optional[str] = None
+    expiry_date: Optional[datetime] = None
 
 class VoiceCommand(BaseModel):
     command: str
@@ -183,11 +304,22 @@ def process_voice_command(command: str, language: str = "en") -> dict:
     """Processes a voice command to extract product details."""
     original_command = command
     translated_command = translate_to_english(command)
-    command = translated_command.lower().strip()
+    with stage("regex"):
+        return extract_command_fields(translated_command.lower().strip(), original_command)
+
+def extract_command_fields(command: str, original_command: str) -> dict:
+    """Extracts action, product, quantity and price from a lowercased English command."""
+    expiry_days = expiry_query_days(command)
+    if expiry_days is not None:
+        return {"action": "expiring", "product_name": None, "quantity": None, "price": None,
+                "days": expiry_days, "confidence": 1.0, "raw_command": original_command,
+                "message": "Command processed."}
 
     action_patterns = {
         'add': r'(?:add|create|insert|new|store|put|include|daal|daalna|जोड़)\b',
         'update': r'(?:update|change|modify|edit|alter|adjust|badal|बदल|price.*to|set.*price)\b',
+        # After add/update, so "add 10 kg wholesale rice" or "... used for tea" stays an add
+        'sell': r'\b(?:sold|sell|sale|consumed?|used|bech|बेच|bika|बिका)\b',
         'remove': r'(?:remove|delete|del|eliminate|take out|hata|हटा|nikaal|निकाल)\b',
         'list': r'(?:list|show|display|get all|show all|view all|sabhi|सभी|dikha|दिखा)\b',
         'search': r'(?:search|find|get|show|look for|where is|dhund|ढूंढ|kaha|कहा)\b',
@@ -225,57 +357,120 @@ def process_voice_command(command: str, language: str = "en") -> dict:
     if action == "add" and not price:
         return {"action": "incomplete", "message": f"Please specify the price for {product_name}."}
 
+    # Rough share of the expected fields the regex parser could fill in.
+    confidence = (0.4 if action else 0.0) + (0.3 if product_name else 0.0) \
+        + (0.15 if quantity else 0.0) + (0.15 if price else 0.0)
+
     return {
         "action": action or "unknown",
         "product_name": product_name,
         "quantity": quantity,
         "price": price,
+        "confidence": round(confidence, 2),
         "raw_command": original_command,
         "message": "Command processed."
     }
 
 # --- Database Operations (Using In-Memory Store) ---
 # TODO: Replace the logic in these functions with your Supabase client calls.
+@timed_db()
 async def save_product(product: Product):
     """Saves a product to the in-memory store."""
     product_dict = product.dict()
     product_dict['_id'] = str(uuid.uuid4())
     product_dict['created_at'] = datetime.now()
+    product_dict['updated_at'] = product_dict['created_at']
     products_store.append(product_dict)
-    print(f"📦 Product '{product.name}' saved to in-memory store.")
+    bump_inventory_version(INVENTORY_OWNER)
+    await change_hub.publish(INVENTORY_OWNER, "product", "upsert", product_dict['_id'], product_dict)
+    hot_debug(logger, "Product %r saved to in-memory store.", product.name)
     return product_dict
 
+@timed_db()
 async def get_all_products():
     """Gets all products from the in-memory store."""
-    print("📦 Fetching all products from in-memory store.")
+    hot_debug(logger, "Fetching all products from in-memory store.")
     return products_store
 
-async def find_product(name: str):
-    """Finds a product by name in the in-memory store."""
+def _match_product(name: str):
     for product in products_store:
         if name.lower() in product['name'].lower():
-            print(f"📦 Found product '{name}' in in-memory store.")
             return product
     return None
 
+@timed_db()
+async def find_product(name: str):
+    """Finds a product by name in the in-memory store."""
+    product = _match_product(name)
+    if product is not None:
+        hot_debug(logger, "Found product %r in in-memory store.", name)
+    return product
+
+@timed_db()
 async def update_product(name: str, updates: dict):
     """Updates a product in the in-memory store."""
     for product in products_store:
         if name.lower() in product['name'].lower():
             product.update(updates)
-            print(f"📦 Product '{name}' updated in in-memory store.")
+            product['updated_at'] = datetime.now()
+            bump_inventory_version(INVENTORY_OWNER)
+            await change_hub.publish(INVENTORY_OWNER, "product", "upsert", product['_id'], product)
+            hot_debug(logger, "Product %r updated in in-memory store.", name)
             return True
     return False
 
+@timed_db()
+async def sell_product(name: str, quantity: float, clamp: bool = False,
+                       created_at: Optional[datetime] = None):
+    """Takes quantity off a product's stock and logs the removal.
+
+    Refuses to go below zero unless clamp is set (offline sales that already
+    happened, logged at created_at when given). The check and the subtraction run with no await in between,
+    so concurrent sales cannot oversell.
+    """
+    product = _match_product(name)
+    if product is None:
+        return {"status": "not_found"}
+    available = product['quantity']
+    if quantity > available and not clamp:
+        return {"status": "insufficient", "available": available}
+    product['quantity'] = max(0.0, available - quantity)
+    product['updated_at'] = datetime.now()
+    bump_inventory_version(INVENTORY_OWNER)
+    await log_transaction(product['name'], "remove", quantity, created_at=created_at)
+    await change_hub.publish(INVENTORY_OWNER, "product", "upsert", product['_id'], product)
+    return {"status": "sold", "product": product}
+
+@timed_db()
 async def delete_product(name: str):
     """Deletes a product from the in-memory store."""
     for i, product in enumerate(products_store):
         if name.lower() in product['name'].lower():
             products_store.pop(i)
-            print(f"📦 Product '{name}' deleted from in-memory store.")
+            tombstones_store[:] = prune_tombstones(tombstones_store)
+            tombstones_store.append({"id": product['_id'], "name": product['name'], "deleted_at": datetime.now()})
+            bump_inventory_version(INVENTORY_OWNER)
+            await change_hub.publish(INVENTORY_OWNER, "product", "delete", product['_id'])
+            hot_debug(logger, "Product %r deleted from in-memory store.", name)
             return True
     return False
 
+async def log_transaction(product_name: str, transaction_type: str, quantity_change: float,
+                          price_per_kg: Optional[float] = None, expiry_date: Optional[datetime] = None,
+                          created_at: Optional[datetime] = None):
+    """Folds a stock movement into the daily rollups, the product's lots and its price trend, and announces it."""
+    transaction = {"product_name": product_name, "transaction_type": transaction_type,
+                   "quantity_change": quantity_change, "price_per_kg": price_per_kg,
+                   "expiry_date": expiry_date, "created_at": created_at or datetime.now(timezone.utc)}
+    rollup_store.apply(INVENTORY_OWNER, transaction)
+    lot_ledger.record(INVENTORY_OWNER, transaction)
+    price_trends.record(INVENTORY_OWNER, transaction)
+    transaction_id = str(uuid.uuid4())
+    await change_hub.publish(INVENTORY_OWNER, "transaction", "insert", transaction_id, {
+        **transaction, 'id': transaction_id, 'user_id': INVENTORY_OWNER,
+        'expiry_date': expiry_date.isoformat() if expiry_date else None,
+        'created_at': transaction['created_at'].isoformat()})
+
 # --- API Endpoints ---
 @app.get("/")
 async def root():
@@ -286,56 +481,367 @@ async def process_voice(command: VoiceCommand):
     """Processes a voice command to manage inventory."""
     try:
         result = process_voice_command(command.command, command.language)
-        action = result.get("action")
-        product_name = result.get("product_name")
-
-        if action == "add" and product_name:
-            # Logic to add or update a product
-            existing_product = await find_product(product_name)
-            if existing_product:
-                updates = {
-                    "quantity": existing_product["quantity"] + result["quantity"],
-                    "price_per_kg": result["price"]
-                }
-                await update_product(product_name, updates)
-                return {"success": True, "message": f"Updated {product_name}."}
-            else:
-                new_product = Product(
-                    name=product_name.title(),
-                    quantity=result["quantity"],
-                    price_per_kg=result["price"]
-                )
-                await save_product(new_product)
-                return {"success": True, "message": f"Added {product_name}."}
-
-        elif action == "list":
-            products = await get_all_products()
-            return {"success": True, "products": products}
-
-        elif action == "remove" and product_name:
-            deleted = await delete_product(product_name)
-            if deleted:
-                return {"success": True, "message": f"Deleted {product_name}."}
-            else:
-                raise HTTPException(status_code=404, detail="Product not found.")
-
-        else:
-            return {"success": False, "message": "Command not recognized.", "details": result}
+        if llm_dispatcher and needs_llm(result):
+            with stage("llm"):
+                result = await llm_dispatcher.submit(command.command, result)
+        db_started = time.perf_counter()
+        try:
+            return await execute_voice_action(result)
+        finally:
+            VOICE_STAGE_LATENCY.observe(time.perf_counter() - db_started, "db")
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def execute_voice_action(result: dict):
+    """Applies a parsed voice command to the in-memory store."""
+    action = result.get("action")
+    product_name = result.get("product_name")
+
+    if action == "add" and product_name:
+        # Logic to add or update a product
+        existing_product = await find_product(product_name)
+        if existing_product:
+            updates = {
+                "quantity": existing_product["quantity"] + result["quantity"],
+                "price_per_kg": result["price"]
+            }
+            await update_product(product_name, updates)
+            await log_transaction(existing_product["name"], "add", result["quantity"], result["price"])
+            return {"success": True, "message": f"Updated {product_name}."}
+        else:
+            new_product = Product(
+                name=product_name.title(),
+                quantity=result["quantity"],
+                price_per_kg=result["price"]
+            )
+            await save_product(new_product)
+            await log_transaction(new_product.name, "add", result["quantity"], result["price"])
+            return {"success": True, "message": f"Added {product_name}."}
+
+    elif action == "list":
+        products = await get_all_products()
+        return json_response({"success": True, "products": products})
+
+    elif action in ("sell", "remove") and product_name and result.get("quantity"):
+        sale = await sell_product(product_name, result["quantity"])
+        if sale["status"] == "not_found":
+            raise HTTPException(status_code=404, detail="Product not found.")
+        if sale["status"] == "insufficient":
+            return {"success": False, "available": sale["available"],
+                    "message": f"Only {sale['available']} kg of {product_name} in stock."}
+        verb = "Sold" if action == "sell" else "Removed"
+        return {"success": True, "product": sale["product"],
+                "message": f"{verb} {result['quantity']} kg of {product_name}, {sale['product']['quantity']} kg left."}
+
+    elif action == "sell" and product_name:
+        return {"success": False, "message": f"Please say how much {product_name} was sold."}
+
+    elif action == "remove" and product_name:
+        deleted = await delete_product(product_name)
+        if deleted:
+            return {"success": True, "message": f"Deleted {product_name}."}
+        else:
+            raise HTTPException(status_code=404, detail="Product not found.")
+
+    elif action == "expiring":
+        items = expiring_products(result["days"])
+        if not items:
+            return {"success": True, "message": f"Nothing expires within {result['days']} days.", "expiring": []}
+        names = ", ".join(item["name"] for item in items[:10])
+        return {"success": True, "message": f"{len(items)} product(s) expiring within {result['days']} days: {names}.",
+                "expiring": items}
+
+    else:
+        return {"success": False, "message": "Command not recognized.", "details": result}
+
 @app.get("/products", response_model=List[dict])
-async def get_products():
+async def get_products(request: Request):
     """Gets all products."""
-    return await get_all_products()
+    etag = inventory_etag(INVENTORY_OWNER, "products")
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    return etag_json_response(request, await get_all_products(), etag)
+
+async def import_products(parsed, dry_run: bool = False):
+    """Applies a parsed import to the in-memory store; returns (created, updated)."""
+    existing = {}
+    for product in products_store:
+        existing.setdefault(product['name'].lower(), product)
+    creates, updates = plan_import(parsed, existing)
+    if dry_run:
+        return len(creates), len(updates)
+
+    now = datetime.now()
+    for batch in batches(creates):
+        for item in batch:
+            product = Product(name=item['name'], quantity=item['quantity'], price_per_kg=item['price_per_kg'],
+                              description=item['description'] or "", category=item['category'] or "general").dict()
+            product.update(_id=str(uuid.uuid4()), created_at=now, updated_at=now)
+            products_store.append(product)
+            await log_transaction(product['name'], "add", item['quantity'], item['price_per_kg'])
+        await asyncio.sleep(0)
+    for batch in batches(updates):
+        for product, item in batch:
+            product['quantity'] += item['quantity']
+            if item['price_per_kg'] is not None:
+                product['price_per_kg'] = item['price_per_kg']
+            product['updated_at'] = now
+            await log_transaction(product['name'], "add", item['quantity'], item['price_per_kg'])
+        await asyncio.sleep(0)
+
+    if creates or updates:
+        bump_inventory_version(INVENTORY_OWNER)
+        await change_hub.publish(INVENTORY_OWNER, "product", "resync", "*")
+    return len(creates), len(updates)
+
+@app.post("/products/import")
+async def import_products_endpoint(request: Request, format: Optional[Literal["csv", "ndjson"]] = None,
+                                   dry_run: bool = False):
+    """Imports products from a streamed CSV or JSON-lines upload."""
+    try:
+        parsed = await parse_upload(request.stream(), upload_format(request.headers.get("content-type"), format))
+    except ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    created, updated = await import_products(parsed, dry_run)
+    return import_summary(parsed, created, updated, dry_run)
+
+@app.get("/products/expiring")
+async def get_expiring_products(days: float = 7):
+    """Gets products expiring within the next `days` days, soonest first."""
+    items = expiring_products(days)
+    return {"success": True, "days": days, "products": items, "count": len(items)}
+
+@app.get("/products/changes")
+async def get_product_changes(since: Optional[str] = None):
+    """Gets products changed or deleted since a sync cursor (full snapshot without one)."""
+    return json_response(changes_since(products_store, tombstones_store,
+                                       decode_cursor(since) if since else None))
+
+async def apply_stock_transaction(op: SyncOperation):
+    """Applies an offline-recorded stock movement to the in-memory store."""
+    if not op.product_name or op.transaction_type is None or op.quantity_change is None:
+        raise HTTPException(status_code=400, detail="Transaction needs product_name, transaction_type and quantity_change.")
+    recorded_at = recorded_time(op.recorded_at)
+
+    if op.transaction_type == "add":
+        existing_product = await find_product(op.product_name)
+        if existing_product:
+            updates = {"quantity": existing_product["quantity"] + op.quantity_change}
+            if op.price_per_kg is not None:
+                updates["price_per_kg"] = op.price_per_kg
+            await update_product(op.product_name, updates)
+        elif op.price_per_kg is None:
+            raise HTTPException(status_code=400, detail=f"Price needed to add new product {op.product_name}.")
+        else:
+            await save_product(Product(name=op.product_name.title(), quantity=op.quantity_change,
+                                       price_per_kg=op.price_per_kg))
+        await log_transaction(op.product_name, "add", op.quantity_change, op.price_per_kg, created_at=recorded_at)
+        return {"success": True, "message": f"Added {op.quantity_change} kg of {op.product_name}."}
+
+    sale = await sell_product(op.product_name, op.quantity_change, clamp=True, created_at=recorded_at)
+    if sale["status"] == "not_found":
+        raise HTTPException(status_code=404, detail="Product not found.")
+    return {"success": True, "message": f"Removed {op.quantity_change} kg of {op.product_name}."}
+
+async def apply_sync_operation(op: SyncOperation):
+    if op.type == "voice":
+        if not op.command:
+            raise HTTPException(status_code=400, detail="Voice operation needs a command.")
+        return await execute_voice_action(process_voice_command(op.command, op.language or "en"))
+    return await apply_stock_transaction(op)
+
+@app.post("/sync")
+async def sync_operations(request: SyncRequest):
+    """Applies offline-recorded operations in order; replayed client_op_ids are not re-applied."""
+    return await apply_operations(INVENTORY_OWNER, request.operations, applied_sync_ops, apply_sync_operation)
+
+async def compute_alerts(user_id: str):
+    """Builds alert rows from the in-memory products and their rollup-based forecasts."""
+    products = await get_all_products()
+    since = (datetime.now(timezone.utc) - timedelta(days=FORECAST_HISTORY_DAYS)).date()
+    history = as_forecast_rows(rollup_store.buckets(user_id, since=since))
+    return build_alerts(products, forecast_products(products, history))
+
+alert_store = MemoryAlertStore()
+alert_scheduler = AlertScheduler(compute_alerts, alert_store)
+
+def expiring_products(days: float):
+    """Products expiring within `days`, from the index (rebuilt after bulk imports)."""
+    if expiry_index.needs_load(INVENTORY_OWNER):
+        expiry_index.load(INVENTORY_OWNER, products_store)
+    return expiry_index.expiring(INVENTORY_OWNER, days)
+
+async def expiry_sweeps():
+    """Hands newly due expiries to the alert scheduler."""
+    while True:
+        if expiry_index.needs_load(INVENTORY_OWNER):
+            expiry_index.load(INVENTORY_OWNER, products_store)
+        for user_id in expiry_index.sweep():
+            alert_scheduler.mark_dirty(user_id)
+        await asyncio.sleep(EXPIRY_SWEEP_S)
+
+async def get_alerts_data():
+    """Reads the precomputed alerts, computing them once if none exist yet."""
+    await alert_scheduler.ensure(INVENTORY_OWNER)
+    return alerts_payload(alert_store.list(INVENTORY_OWNER))
+
+async def build_dashboard():
+    """Builds the dashboard summary from the in-memory store."""
+    products = await get_all_products()
+    alerts = await get_alerts_data()
+    return {
+        "success": True,
+        "dashboard": {
+            "summary": {
+                "total_products": len(products),
+                "total_inventory_value": sum(p['quantity'] * p['price_per_kg'] for p in products),
+                "low_stock_alerts": alerts["count"],
+                "recent_transactions": 0
+            },
+            "products": products,
+            "alerts": alerts,
+            "recent_transactions": []
+        }
+    }
+
+@app.get("/analytics/dashboard")
+async def get_dashboard_data(request: Request):
+    """Gets dashboard summary data from the in-memory store."""
+    await alert_scheduler.ensure(INVENTORY_OWNER)
+    etag = inventory_etag(INVENTORY_OWNER, f"dashboard.{alert_scheduler.generation(INVENTORY_OWNER)}")
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    dashboard = await analytics_flights.do(analytics_key(INVENTORY_OWNER, "dashboard"), build_dashboard)
+    return etag_json_response(request, dashboard, etag)
+
+@app.get("/analytics/alerts")
+async def get_alerts():
+    """Gets the precomputed stock alerts."""
+    return {"success": True, "alerts": await get_alerts_data()}
+
+@app.get("/analytics/valuation")
+async def get_valuation(request: Request):
+    """Gets inventory value and cost of goods sold, FIFO and weighted average."""
+    etag = inventory_etag(INVENTORY_OWNER, "valuation")
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    valuation = valuation_summary(lot_ledger.valuations(INVENTORY_OWNER))
+    return etag_json_response(request, {"success": True, "valuation": valuation}, etag)
+
+@app.get("/analytics/lots/{product_name}")
+async def get_open_lots(product_name: str):
+    """Gets a product's open lots, oldest (next to be consumed) first."""
+    return {"success": True, "product_name": product_name.lower(),
+            "lots": lot_ledger.open_lots(INVENTORY_OWNER, product_name)}
+
+@app.get("/analytics/trends")
+async def get_price_trends(request: Request, product_name: Optional[str] = None):
+    """Gets price trends (slope, R², p-value) for every product, or for one."""
+    etag = inventory_etag(INVENTORY_OWNER, f"trends-{(product_name or '').lower()}")
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    summary = trend_summary(price_trends.rows(INVENTORY_OWNER), product_name)
+    return etag_json_response(request, {"success": True, **summary}, etag)
+
+@app.get("/analytics/reorder-plan")
+async def get_reorder_plan(request: Request):
+    """Gets reorder point, safety stock and economic order quantity for every product."""
+    etag = inventory_etag(INVENTORY_OWNER, "reorder-plan")
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    since = (datetime.now(timezone.utc) - timedelta(days=REORDER_HISTORY_DAYS)).date()
+    plan = await reorder_flights.do(
+        analytics_key(INVENTORY_OWNER, "reorder-plan"),
+        lambda: asyncio.to_thread(reorder_plan, list(products_store),
+                                  as_forecast_rows(rollup_store.buckets(INVENTORY_OWNER, since=since))))
+    return etag_json_response(request, {"success": True, "plan": plan}, etag)
+
+@app.get("/analytics/stockout-risk")
+async def get_stockout_risk(request: Request, days: int = STOCKOUT_HORIZON_DAYS):
+    """Gets each product's chance of running out within `days` days, riskiest first."""
+    if not 1 <= days <= STOCKOUT_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"days must be between 1 and {STOCKOUT_MAX_DAYS}.")
+    etag = inventory_etag(INVENTORY_OWNER, f"stockout-risk-{days}")
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    since = (datetime.now(timezone.utc) - timedelta(days=STOCKOUT_HISTORY_DAYS)).date()
+    risk = await stockout_flights.do(
+        analytics_key(INVENTORY_OWNER, "stockout-risk", days),
+        lambda: asyncio.to_thread(stockout_risk, list(products_store),
+                                  as_forecast_rows(rollup_store.buckets(INVENTORY_OWNER, since=since)), days))
+    return etag_json_response(request, {"success": True, "risk": risk}, etag)
+
+@app.get("/analytics/product/{product_name}")
+async def get_product_analytics(product_name: str):
+    """Gets stock movement analytics for one product from the daily rollups."""
+    analytics = summarize(rollup_store.buckets(INVENTORY_OWNER, product_name), product_name)
+    return {"success": True, "analytics": analytics}
+
+@app.get("/export/products")
+async def export_products(format: Literal["ndjson", "csv"] = "ndjson"):
+    """Streams every product as NDJSON or CSV."""
+    snapshot = list(products_store)
+    pages = (snapshot[i:i + EXPORT_PAGE_SIZE] for i in range(0, len(snapshot), EXPORT_PAGE_SIZE))
+    return export_response(pages, format, PRODUCT_EXPORT_COLUMNS, "products")
+
+@app.get("/changes/stream")
+async def stream_changes(request: Request):
+    """Streams inventory deltas as server-sent events."""
+    return StreamingResponse(sse_events(change_hub, INVENTORY_OWNER, request), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.websocket("/ws/changes")
+async def websocket_changes(websocket: WebSocket):
+    """Streams inventory deltas over a WebSocket."""
+    await websocket.accept()
+    await serve_websocket(change_hub, websocket, INVENTORY_OWNER)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Exposes metrics in the Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
 
 # --- Application Startup ---
+# Background loops are kept here so shutdown can cancel them.
+background_tasks: List[asyncio.Task] = []
+
+def start_background(coro):
+    """Runs a background loop until shutdown."""
+    background_tasks.append(asyncio.create_task(coro))
+
+async def stop_background():
+    """Cancels the background loops and waits for them to finish."""
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+
 @app.on_event("startup")
 async def startup_event():
     """Initializes the application."""
-    print("🚀 Starting Vocal Verse API...")
-    print("✅ API is ready!")
+    logger.info("Starting Vocal Verse API...")
+    start_background(monitor_event_loop_lag())
+    await change_hub.start()
+    alert_scheduler.start()
+    if EXPIRY_INDEX:
+        start_background(expiry_sweeps())
+    logger.info("API is ready!")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stops the background loops, LLM batches and alert scheduler and releases the change bus connection."""
+    await stop_background()
+    if llm_dispatcher is not None:
+        await llm_dispatcher.stop()
+    await alert_scheduler.stop()
+    await change_hub.stop()
 
 if __name__ == "__main__":
     import uvicorn
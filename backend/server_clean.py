@@ -1,9 +1,10 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Literal, Optional
 import os
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import InsertOne, UpdateOne
 import uuid
 from datetime import datetime, timedelta
 import re
@@ -17,6 +18,9 @@ from scipy import stats
 import warnings
 warnings.filterwarnings('ignore')
 
+from bulk_import import (ImportFormatError, batches, import_summary, import_transaction, parse_upload,
+                         plan_import, upload_format)
+
 # Load environment variables
 try:
     from dotenv import load_dotenv
@@ -250,6 +254,59 @@ async def delete_product(name: str):
             return True
     return False
 
+async def import_products(parsed, dry_run: bool = False):
+    """Write a parsed import to MongoDB with bulk writes, or to in-memory storage"""
+    if db:
+        # No in-memory fallback here: a half-written import must not be applied twice
+        existing = {}
+        async for doc in db.products.find({}, {"name": 1}):
+            existing.setdefault(doc['name'].lower(), doc)
+        creates, updates = plan_import(parsed, existing)
+        if dry_run:
+            return len(creates), len(updates)
+
+        now = datetime.now()
+        writes = [InsertOne({**Product(name=item['name'], quantity=item['quantity'], price_per_kg=item['price_per_kg'],
+                                       description=item['description'] or "",
+                                       category=item['category'] or "general").dict(),
+                             '_id': str(uuid.uuid4()), 'created_at': now})
+                  for item in creates]
+        for doc, item in updates:
+            update = {"$inc": {"quantity": item['quantity']}}
+            if item['price_per_kg'] is not None:
+                update["$set"] = {"price_per_kg": item['price_per_kg']}
+            writes.append(UpdateOne({"_id": doc['_id']}, update))
+        for batch in batches(writes):
+            await db.products.bulk_write(batch, ordered=False)
+
+        transactions = [import_transaction(item, item['name']) for item in creates] + \
+                       [import_transaction(item, doc['name']) for doc, item in updates]
+        for batch in batches(transactions):
+            await db.inventory_transactions.insert_many(
+                [{**transaction, '_id': str(uuid.uuid4()), 'created_at': now} for transaction in batch],
+                ordered=False)
+        return len(creates), len(updates)
+
+    # In-memory storage
+    existing = {}
+    for product in products_store:
+        existing.setdefault(product['name'].lower(), product)
+    creates, updates = plan_import(parsed, existing)
+    if dry_run:
+        return len(creates), len(updates)
+    now = datetime.now()
+    for item in creates:
+        product_dict = Product(name=item['name'], quantity=item['quantity'], price_per_kg=item['price_per_kg'],
+                               description=item['description'] or "", category=item['category'] or "general").dict()
+        product_dict['_id'] = str(uuid.uuid4())
+        product_dict['created_at'] = now
+        products_store.append(product_dict)
+    for product, item in updates:
+        product['quantity'] += item['quantity']
+        if item['price_per_kg'] is not None:
+            product['price_per_kg'] = item['price_per_kg']
+    return len(creates), len(updates)
+
 # API Routes
 @app.get("/")
 async def root():
@@ -337,6 +394,20 @@ async def create_product(product: Product):
     except Exception as e:
         return {"success": False, "message": str(e)}
 
+@app.post("/products/import")
+async def import_products_endpoint(request: Request, format: Optional[Literal["csv", "ndjson"]] = None,
+                                   dry_run: bool = False):
+    """Import products from a streamed CSV or JSON-lines upload"""
+    try:
+        parsed = await parse_upload(request.stream(), upload_format(request.headers.get('content-type'), format))
+    except ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        created, updated = await import_products(parsed, dry_run)
+    except Exception as e:
+        return {"success": False, "message": str(e)}
+    return import_summary(parsed, created, updated, dry_run)
+
 @app.get("/products/{product_name}")
 async def get_product(product_name: str):
     """Get product by name"""
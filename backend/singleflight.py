@@ -0,0 +1,72 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable
+
+from conditional import INVENTORY_VERSIONS
+from metrics import record_cache
+
+# --- Single-Flight Analytics ---
+# When several devices of one shop open the dashboard at once they ask for
+# the same analytics over the same data. Concurrent calls with the same key
+# share one in-flight computation instead of each running the queries and
+# pandas work again. Keys include the user's inventory version (see
+# conditional.py), so a write always starts a fresh computation.
+#
+# The computation runs as its own task: a caller that disconnects does not
+# cancel the work the other callers are waiting on.
+#
+# ANALYTICS_CACHE_TTL_S        keep finished results this long (default 0 = off)
+# ANALYTICS_CACHE_MAX_ENTRIES  cached results kept before LRU eviction (default 1024)
+
+ANALYTICS_CACHE_TTL_S = float(os.getenv('ANALYTICS_CACHE_TTL_S', '0'))
+ANALYTICS_CACHE_MAX_ENTRIES = int(os.getenv('ANALYTICS_CACHE_MAX_ENTRIES', '1024'))
+
+
+def analytics_key(user_id: str, endpoint: str, *params) -> tuple:
+    """(user, endpoint, params, inventory version) key for a per-user analytics result."""
+    return (str(user_id), endpoint, params, INVENTORY_VERSIONS.get(user_id))
+
+
+class SingleFlight:
+    """Coalesces concurrent identical async calls, optionally caching results briefly."""
+
+    def __init__(self, name: str, cache_ttl: float = ANALYTICS_CACHE_TTL_S,
+                 max_entries: int = ANALYTICS_CACHE_MAX_ENTRIES):
+        self.name = name
+        self.cache_ttl = cache_ttl
+        self.max_entries = max_entries
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._cache: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.stats = {"calls": 0, "executions": 0, "shared": 0, "cache_hits": 0}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]):
+        """Returns fn()'s result, sharing it with every concurrent caller of the same key."""
+        self.stats["calls"] += 1
+        if self.cache_ttl > 0:
+            cached = self._cache.get(key)
+            hit = cached is not None and cached[0] > time.monotonic()
+            record_cache(self.name, hit)
+            if hit:
+                self.stats["cache_hits"] += 1
+                self._cache.move_to_end(key)
+                return cached[1]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["shared"] += 1
+        else:
+            self.stats["executions"] += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done, key=key: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if self.cache_ttl > 0 and not task.cancelled() and task.exception() is None:
+            self._cache[key] = (time.monotonic() + self.cache_ttl, task.result())
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
@@ -0,0 +1,144 @@
+import os
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import numpy as np
+
+from forecasting import demand_matrix
+
+# --- Stockout Risk ---
+# Monte Carlo estimate of the chance that each product runs out of stock
+# within the next N days. Each simulated path resamples N days of demand
+# (with replacement) from the product's own daily history, counted from its
+# first recorded day, and runs them down against current stock. All
+# products and a whole batch of paths are one (products x paths) array
+# stepped a day at a time, so a batch costs a few numpy calls per day
+# whatever the catalogue size. Batches hold STOCKOUT_BATCH_CELLS
+# product-paths and run until STOCKOUT_PATHS paths are done or
+# STOCKOUT_BUDGET_MS has passed (the first batch always runs); the path
+# count actually used is reported with each result. Only per-product
+# histograms of the stockout day are kept between batches, so memory does
+# not grow with the path count.
+#
+# Products with no demand in the history never run out, and neither do
+# products whose stock covers the horizon even at their busiest recorded
+# day; neither is simulated. Products already at zero always have.
+#
+# STOCKOUT_HORIZON_DAYS  default horizon N when the request does not give one (default 14)
+# STOCKOUT_MAX_DAYS      largest horizon a request may ask for (default 180)
+# STOCKOUT_PATHS         simulated paths per product (default 5000)
+# STOCKOUT_BUDGET_MS     time after which no further batch is started (default 500)
+# STOCKOUT_BATCH_CELLS   products x paths per batch, bounding memory (default 250000)
+# STOCKOUT_HISTORY_DAYS  days of demand history resampled (default 90)
+# STOCKOUT_RISK_LEVEL    probability from which a product counts as at risk (default 0.5)
+# STOCKOUT_CACHE_TTL_S   longest a result is reused at the same inventory version (default 3600)
+
+STOCKOUT_HORIZON_DAYS = int(os.getenv('STOCKOUT_HORIZON_DAYS', '14'))
+STOCKOUT_MAX_DAYS = int(os.getenv('STOCKOUT_MAX_DAYS', '180'))
+STOCKOUT_PATHS = int(os.getenv('STOCKOUT_PATHS', '5000'))
+STOCKOUT_BUDGET_MS = float(os.getenv('STOCKOUT_BUDGET_MS', '500'))
+STOCKOUT_BATCH_CELLS = int(os.getenv('STOCKOUT_BATCH_CELLS', '250000'))
+STOCKOUT_HISTORY_DAYS = int(os.getenv('STOCKOUT_HISTORY_DAYS', '90'))
+STOCKOUT_RISK_LEVEL = float(os.getenv('STOCKOUT_RISK_LEVEL', '0.5'))
+STOCKOUT_CACHE_TTL_S = float(os.getenv('STOCKOUT_CACHE_TTL_S', '3600'))
+
+PERCENTILES = (10, 50, 90)
+
+
+def simulate_stockouts(demand: np.ndarray, first_day: np.ndarray, stock: np.ndarray, horizon: int,
+                       paths: int = STOCKOUT_PATHS, budget_ms: float = STOCKOUT_BUDGET_MS,
+                       batch_cells: int = STOCKOUT_BATCH_CELLS, rng: Optional[np.random.Generator] = None):
+    """Histogram of the stockout day per product, shape (products, horizon + 1), plus the paths run.
+
+    Column d < horizon counts paths that ran out on day d + 1; the last column
+    counts paths that still had stock after `horizon` days.
+    """
+    rng = rng or np.random.default_rng()
+    n_products, n_days = demand.shape
+    counts = np.zeros((n_products, horizon + 1), dtype=np.int64)
+    has_demand = demand.sum(axis=1) > 0
+    # Stock above horizon x the largest day on record cannot run out: no need to simulate it
+    safe = (stock > 0) & (stock > horizon * demand.max(axis=1, initial=0.0))
+    active = np.flatnonzero((stock > 0) & has_demand & ~safe)
+    done = 0 if active.size else paths
+
+    # Paths advance one day at a time over a (products x paths) block: a day's
+    # draw is floor(u * span) into the product's history (clamped, as u * span
+    # can round up to span in float32), added to the demand so far. float32
+    # halves the memory traffic of every step.
+    rows = demand[active].astype(np.float32).ravel()
+    index_type = np.int32 if rows.size < 2 ** 31 else np.int64
+    offset = (np.arange(active.size) * n_days + first_day[active]).astype(index_type)[:, None]
+    span = (n_days - first_day[active]).astype(np.float32)[:, None]
+    last = (span - 1).astype(index_type)
+    level = stock[active].astype(np.float32)[:, None]
+    bins = (np.arange(active.size) * (horizon + 1))[:, None]
+    batch = max(1, min(paths, batch_cells // max(1, active.size)))
+    started = time.perf_counter()
+    while done < paths:
+        size = min(batch, paths - done)
+        used = np.zeros((active.size, size), dtype=np.float32)
+        lasted = np.zeros((active.size, size), dtype=np.int64)  # whole days before stock ran out
+        for _ in range(horizon):
+            draws = rng.random((active.size, size), dtype=np.float32)
+            draws *= span
+            days = draws.astype(index_type)
+            np.minimum(days, last, out=days)
+            days += offset
+            used += np.take(rows, days)  # bootstrap draw of one day's demand
+            lasted += used < level
+        counts[active] += np.bincount((bins + lasted).ravel(),
+                                      minlength=active.size * (horizon + 1)).reshape(active.size, horizon + 1)
+        done += size
+        if (time.perf_counter() - started) * 1000 >= budget_ms:
+            break
+    counts[stock <= 0, 0] = done
+    counts[(stock > 0) & (~has_demand | safe), horizon] = done
+    return counts, done
+
+
+def _day_percentiles(counts: np.ndarray, horizon: int) -> dict:
+    """Stockout day at each percentile of the paths; NaN where it lies beyond the horizon."""
+    share = counts.cumsum(axis=1) / counts.sum(axis=1, keepdims=True)
+    out = {}
+    for q in PERCENTILES:
+        day = np.argmax(share >= q / 100 - 1e-12, axis=1) + 1.0
+        out[f"p{q}"] = np.where(day > horizon, np.nan, day)
+    return out
+
+
+def stockout_risk(products: List[dict], transactions: List[dict], horizon: int = STOCKOUT_HORIZON_DAYS,
+                  now: Optional[datetime] = None, paths: int = STOCKOUT_PATHS,
+                  budget_ms: float = STOCKOUT_BUDGET_MS, history_days: int = STOCKOUT_HISTORY_DAYS,
+                  seed: Optional[int] = None) -> dict:
+    """Stockout probability and stockout-day percentiles for all products; riskiest first."""
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    stock = np.array([float(p.get('quantity') or 0) for p in products])
+    demand, first_day = demand_matrix(products, transactions, now, max(1, history_days))
+    counts, done = simulate_stockouts(demand, first_day, stock, horizon, paths, budget_ms,
+                                      rng=np.random.default_rng(seed))
+    probability = 1 - counts[:, horizon] / done
+    days = _day_percentiles(counts, horizon)
+
+    rows = []
+    for i, product in enumerate(products):
+        p = float(probability[i])
+        rows.append({
+            "product_name": product['name'],
+            "current_stock": float(stock[i]),
+            "stockout_probability": round(p, 4),
+            "standard_error": round(float(np.sqrt(p * (1 - p) / done)), 4),
+            "stockout_day": {name: (int(values[i]) if np.isfinite(values[i]) else None)
+                             for name, values in days.items()},
+        })
+    rows.sort(key=lambda r: -r["stockout_probability"])
+    return {
+        "products": rows,
+        "at_risk_count": sum(r["stockout_probability"] >= STOCKOUT_RISK_LEVEL for r in rows),
+        "horizon_days": horizon,
+        "paths": done,
+        "paths_requested": paths,
+        "history_days": history_days,
+        "computed_at": datetime.now(timezone.utc).isoformat(),
+    }
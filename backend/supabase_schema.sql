@@ -38,10 +38,111 @@ CREATE TABLE IF NOT EXISTS inventory_transactions (
     transaction_type VARCHAR(50) NOT NULL, -- 'add', 'remove', 'update'
     quantity_change DECIMAL(10,3) NOT NULL,
     price_per_kg DECIMAL(10,2),
+    expiry_date TIMESTAMP WITH TIME ZONE, -- of the lot an 'add' opens
     notes TEXT,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+ALTER TABLE inventory_transactions ADD COLUMN IF NOT EXISTS expiry_date TIMESTAMP WITH TIME ZONE;
+
+-- Tombstones for deleted products, so offline devices can sync deletes (GET /products/changes)
+CREATE TABLE IF NOT EXISTS product_tombstones (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    product_id UUID NOT NULL,
+    product_name VARCHAR(255),
+    deleted_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Offline operations already applied through POST /sync (one row per client_op_id)
+CREATE TABLE IF NOT EXISTS sync_operations (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    client_op_id VARCHAR(128) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending', -- 'pending', 'done'
+    result JSONB,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    claimed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(), -- a stale 'pending' claim can be taken over
+    UNIQUE(user_id, client_op_id)
+);
+
+ALTER TABLE sync_operations ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW();
+
+-- Idempotency-Key records for retried writes (see backend/idempotency.py)
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key VARCHAR(400) PRIMARY KEY, -- caller hash : method : path : client key
+    fingerprint VARCHAR(64) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending', -- 'pending', 'done'
+    response JSONB,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+-- Daily per-product rollups of inventory_transactions (maintained by trigger_apply_transaction_rollup)
+CREATE TABLE IF NOT EXISTS daily_product_rollups (
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    product_name VARCHAR(255) NOT NULL, -- lowercase
+    day DATE NOT NULL, -- UTC
+    added DECIMAL(14,3) NOT NULL DEFAULT 0,
+    removed DECIMAL(14,3) NOT NULL DEFAULT 0,
+    price_sum DECIMAL(14,2) NOT NULL DEFAULT 0,
+    price_count INTEGER NOT NULL DEFAULT 0,
+    transaction_count INTEGER NOT NULL DEFAULT 0,
+    first_at TIMESTAMP WITH TIME ZONE,
+    last_at TIMESTAMP WITH TIME ZONE,
+    PRIMARY KEY (user_id, product_name, day)
+);
+
+-- Stock lots: one per 'add' transaction, consumed oldest first (maintained by trigger_apply_transaction_lots)
+CREATE TABLE IF NOT EXISTS inventory_lots (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    seq BIGSERIAL, -- FIFO order
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    product_name VARCHAR(255) NOT NULL, -- lowercase
+    transaction_id UUID, -- NULL for opening balances
+    quantity_received DECIMAL(10,3) NOT NULL,
+    quantity_remaining DECIMAL(10,3) NOT NULL,
+    price_per_kg DECIMAL(10,2) NOT NULL DEFAULT 0,
+    expiry_date TIMESTAMP WITH TIME ZONE,
+    received_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Running FIFO / weighted-average valuation per product (see lots.py)
+CREATE TABLE IF NOT EXISTS lot_valuations (
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    product_name VARCHAR(255) NOT NULL, -- lowercase
+    on_hand DECIMAL(14,3) NOT NULL DEFAULT 0,
+    fifo_value DECIMAL(14,2) NOT NULL DEFAULT 0,
+    avg_cost DECIMAL(12,4) NOT NULL DEFAULT 0,
+    cogs_fifo DECIMAL(14,2) NOT NULL DEFAULT 0,
+    cogs_avg DECIMAL(14,2) NOT NULL DEFAULT 0,
+    unmatched DECIMAL(14,3) NOT NULL DEFAULT 0, -- removed beyond the open lots
+    open_lots INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (user_id, product_name)
+);
+
+-- Running price regression accumulators per product (see price_trends.py); x is days since 1970
+CREATE TABLE IF NOT EXISTS price_stats (
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    product_name VARCHAR(255) NOT NULL, -- lowercase
+    n BIGINT NOT NULL DEFAULT 0,
+    mean_x DOUBLE PRECISION NOT NULL DEFAULT 0,
+    mean_y DOUBLE PRECISION NOT NULL DEFAULT 0,
+    m2_x DOUBLE PRECISION NOT NULL DEFAULT 0,
+    m2_y DOUBLE PRECISION NOT NULL DEFAULT 0,
+    c_xy DOUBLE PRECISION NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (user_id, product_name)
+);
+
+-- Batches written by the write-behind buffer (write_behind.py); a batch replayed after a crash is skipped
+CREATE TABLE IF NOT EXISTS write_behind_batches (
+    batch_id UUID PRIMARY KEY,
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    applied_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
 -- Voice commands log table
 CREATE TABLE IF NOT EXISTS voice_commands (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -74,10 +175,16 @@ CREATE TABLE IF NOT EXISTS stock_alerts (
     product_name VARCHAR(255) NOT NULL,
     alert_type VARCHAR(50) NOT NULL, -- 'low_stock', 'expiry_warning', 'reorder_suggestion'
     alert_message TEXT NOT NULL,
+    details JSONB, -- what the alert was computed from (product, forecast, expiry)
     is_read BOOLEAN DEFAULT FALSE,
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() -- last alert scheduler run that produced it
 );
 
+-- Columns added for the alert scheduler (alert_scheduler.py) on existing databases
+ALTER TABLE stock_alerts ADD COLUMN IF NOT EXISTS details JSONB;
+ALTER TABLE stock_alerts ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW();
+
 -- Market trends table (for future price predictions)
 CREATE TABLE IF NOT EXISTS market_trends (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -94,16 +201,40 @@ CREATE INDEX IF NOT EXISTS idx_products_user_id ON products(user_id);
 CREATE INDEX IF NOT EXISTS idx_products_name ON products(name);
 CREATE INDEX IF NOT EXISTS idx_products_category ON products(category);
 CREATE INDEX IF NOT EXISTS idx_products_quantity ON products(quantity);
+CREATE INDEX IF NOT EXISTS idx_products_user_updated_at ON products(user_id, updated_at);
+-- Keyset cursors for GET /export/{resource}
+CREATE INDEX IF NOT EXISTS idx_products_user_created_id ON products(user_id, created_at, id);
+-- Expiry queries and the expiry index load (expiry.py); most products have no expiry date
+CREATE INDEX IF NOT EXISTS idx_products_user_expiry ON products(user_id, expiry_date)
+    WHERE expiry_date IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_product_tombstones_user_deleted_at ON product_tombstones(user_id, deleted_at);
+CREATE INDEX IF NOT EXISTS idx_sync_operations_created_at ON sync_operations(created_at);
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys(expires_at);
+CREATE INDEX IF NOT EXISTS idx_write_behind_batches_applied_at ON write_behind_batches(applied_at);
+CREATE INDEX IF NOT EXISTS idx_daily_product_rollups_user_day ON daily_product_rollups(user_id, day);
+-- Oldest open lot first; consumed lots drop out of the index
+CREATE INDEX IF NOT EXISTS idx_inventory_lots_open ON inventory_lots(user_id, product_name, seq)
+    WHERE quantity_remaining > 0;
 
 CREATE INDEX IF NOT EXISTS idx_inventory_transactions_user_id ON inventory_transactions(user_id);
 CREATE INDEX IF NOT EXISTS idx_inventory_transactions_product_name ON inventory_transactions(product_name);
 CREATE INDEX IF NOT EXISTS idx_inventory_transactions_created_at ON inventory_transactions(created_at);
+CREATE INDEX IF NOT EXISTS idx_inventory_transactions_user_created_id ON inventory_transactions(user_id, created_at, id);
 
 CREATE INDEX IF NOT EXISTS idx_voice_commands_user_id ON voice_commands(user_id);
 CREATE INDEX IF NOT EXISTS idx_voice_commands_created_at ON voice_commands(created_at);
+CREATE INDEX IF NOT EXISTS idx_voice_commands_user_created_id ON voice_commands(user_id, created_at, id);
 
 CREATE INDEX IF NOT EXISTS idx_stock_alerts_user_id ON stock_alerts(user_id);
 CREATE INDEX IF NOT EXISTS idx_stock_alerts_is_read ON stock_alerts(is_read);
+-- One row per (user, product, alert type): the scheduler upserts on it.
+-- Drop duplicates the old insert-only trigger left behind first.
+DELETE FROM stock_alerts a USING stock_alerts b
+    WHERE a.user_id = b.user_id AND a.product_name = b.product_name AND a.alert_type = b.alert_type
+      AND (a.created_at, a.id) < (b.created_at, b.id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_stock_alerts_user_product_type
+    ON stock_alerts(user_id, product_name, alert_type);
 
 -- Row Level Security (RLS) policies
 ALTER TABLE users ENABLE ROW LEVEL SECURITY;
@@ -112,6 +243,14 @@ ALTER TABLE inventory_transactions ENABLE ROW LEVEL SECURITY;
 ALTER TABLE voice_commands ENABLE ROW LEVEL SECURITY;
 ALTER TABLE user_preferences ENABLE ROW LEVEL SECURITY;
 ALTER TABLE stock_alerts ENABLE ROW LEVEL SECURITY;
+ALTER TABLE product_tombstones ENABLE ROW LEVEL SECURITY;
+ALTER TABLE sync_operations ENABLE ROW LEVEL SECURITY;
+ALTER TABLE idempotency_keys ENABLE ROW LEVEL SECURITY; -- service role only, no policies
+ALTER TABLE write_behind_batches ENABLE ROW LEVEL SECURITY; -- service role only, no policies
+ALTER TABLE daily_product_rollups ENABLE ROW LEVEL SECURITY;
+ALTER TABLE inventory_lots ENABLE ROW LEVEL SECURITY;
+ALTER TABLE lot_valuations ENABLE ROW LEVEL SECURITY;
+ALTER TABLE price_stats ENABLE ROW LEVEL SECURITY;
 
 -- RLS Policies for users table
 CREATE POLICY "Users can view own profile" ON users
@@ -158,6 +297,25 @@ CREATE POLICY "Users can view own alerts" ON stock_alerts
 CREATE POLICY "Users can update own alerts" ON stock_alerts
     FOR UPDATE USING (auth.uid()::text = user_id::text);
 
+-- RLS Policies for sync tables (written by the backend with the service role)
+CREATE POLICY "Users can view own tombstones" ON product_tombstones
+    FOR SELECT USING (auth.uid()::text = user_id::text);
+
+CREATE POLICY "Users can view own sync operations" ON sync_operations
+    FOR SELECT USING (auth.uid()::text = user_id::text);
+
+CREATE POLICY "Users can view own rollups" ON daily_product_rollups
+    FOR SELECT USING (auth.uid()::text = user_id::text);
+
+CREATE POLICY "Users can view own lots" ON inventory_lots
+    FOR SELECT USING (auth.uid()::text = user_id::text);
+
+CREATE POLICY "Users can view own valuations" ON lot_valuations
+    FOR SELECT USING (auth.uid()::text = user_id::text);
+
+CREATE POLICY "Users can view own price stats" ON price_stats
+    FOR SELECT USING (auth.uid()::text = user_id::text);
+
 -- Functions for automatic timestamp updates
 CREATE OR REPLACE FUNCTION update_updated_at_column()
 RETURNS TRIGGER AS $$
@@ -183,13 +341,16 @@ RETURNS TRIGGER AS $$
 BEGIN
     -- Check if stock is below minimum
     IF NEW.quantity <= NEW.minimum_stock THEN
+        -- Shows up immediately; the alert scheduler adds details on its next run
         INSERT INTO stock_alerts (user_id, product_name, alert_type, alert_message)
         VALUES (
             NEW.user_id,
             NEW.name,
             'low_stock',
             'Stock for ' || NEW.name || ' is running low (' || NEW.quantity || ' kg remaining)'
-        );
+        )
+        ON CONFLICT (user_id, product_name, alert_type)
+        DO UPDATE SET alert_message = EXCLUDED.alert_message;
     END IF;
     
     RETURN NEW;
@@ -202,6 +363,308 @@ CREATE TRIGGER trigger_check_low_stock
     FOR EACH ROW
     EXECUTE FUNCTION check_low_stock();
 
+-- Fold each new transaction into its daily rollup bucket
+CREATE OR REPLACE FUNCTION apply_transaction_rollup()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- Shared with the user's other inserts; waits while rebuild_daily_rollups holds it exclusively
+    PERFORM pg_advisory_xact_lock_shared(hashtext(NEW.user_id::text));
+    INSERT INTO daily_product_rollups AS r (
+        user_id, product_name, day, added, removed, price_sum, price_count,
+        transaction_count, first_at, last_at
+    )
+    VALUES (
+        NEW.user_id,
+        LOWER(NEW.product_name),
+        (COALESCE(NEW.created_at, NOW()) AT TIME ZONE 'UTC')::date,
+        CASE WHEN NEW.transaction_type = 'add' THEN NEW.quantity_change ELSE 0 END,
+        CASE WHEN NEW.transaction_type = 'remove' THEN NEW.quantity_change ELSE 0 END,
+        COALESCE(NEW.price_per_kg, 0),
+        CASE WHEN NEW.price_per_kg IS NULL THEN 0 ELSE 1 END,
+        1,
+        COALESCE(NEW.created_at, NOW()),
+        COALESCE(NEW.created_at, NOW())
+    )
+    ON CONFLICT (user_id, product_name, day) DO UPDATE SET
+        added = r.added + EXCLUDED.added,
+        removed = r.removed + EXCLUDED.removed,
+        price_sum = r.price_sum + EXCLUDED.price_sum,
+        price_count = r.price_count + EXCLUDED.price_count,
+        transaction_count = r.transaction_count + 1,
+        first_at = LEAST(r.first_at, EXCLUDED.first_at),
+        last_at = GREATEST(r.last_at, EXCLUDED.last_at);
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER trigger_apply_transaction_rollup
+    AFTER INSERT ON inventory_transactions
+    FOR EACH ROW
+    EXECUTE FUNCTION apply_transaction_rollup();
+
+-- Open a lot on 'add', consume the oldest open lots on 'remove', and keep lot_valuations current.
+-- The valuation row is locked first, so concurrent writes to one product apply one at a time.
+CREATE OR REPLACE FUNCTION apply_transaction_lots()
+RETURNS TRIGGER AS $$
+DECLARE
+    v lot_valuations%ROWTYPE;
+    lot RECORD;
+    pname VARCHAR(255) := LOWER(NEW.product_name);
+    price DECIMAL;
+    remaining DECIMAL := NEW.quantity_change;
+    take DECIMAL;
+    cost DECIMAL := 0;
+    closed INTEGER := 0;
+BEGIN
+    IF NEW.transaction_type NOT IN ('add', 'remove') OR NEW.quantity_change <= 0 THEN
+        RETURN NEW;
+    END IF;
+    INSERT INTO lot_valuations (user_id, product_name) VALUES (NEW.user_id, pname)
+    ON CONFLICT (user_id, product_name) DO NOTHING;
+    SELECT * INTO v FROM lot_valuations
+    WHERE user_id = NEW.user_id AND product_name = pname FOR UPDATE;
+
+    IF NEW.transaction_type = 'add' THEN
+        price := COALESCE(NEW.price_per_kg, v.avg_cost);
+        INSERT INTO inventory_lots (
+            user_id, product_name, transaction_id, quantity_received, quantity_remaining,
+            price_per_kg, expiry_date, received_at
+        )
+        VALUES (
+            NEW.user_id, pname, NEW.id, NEW.quantity_change, NEW.quantity_change,
+            price, NEW.expiry_date, COALESCE(NEW.created_at, NOW())
+        );
+        UPDATE lot_valuations SET
+            avg_cost = (v.on_hand * v.avg_cost + NEW.quantity_change * price) / (v.on_hand + NEW.quantity_change),
+            on_hand = v.on_hand + NEW.quantity_change,
+            fifo_value = v.fifo_value + NEW.quantity_change * price,
+            open_lots = v.open_lots + 1,
+            updated_at = NOW()
+        WHERE user_id = NEW.user_id AND product_name = pname;
+        RETURN NEW;
+    END IF;
+
+    FOR lot IN
+        SELECT id, quantity_remaining, price_per_kg FROM inventory_lots
+        WHERE user_id = NEW.user_id AND product_name = pname AND quantity_remaining > 0
+        ORDER BY seq
+    LOOP
+        EXIT WHEN remaining <= 0;
+        take := LEAST(lot.quantity_remaining, remaining);
+        UPDATE inventory_lots SET quantity_remaining = quantity_remaining - take WHERE id = lot.id;
+        remaining := remaining - take;
+        cost := cost + take * lot.price_per_kg;
+        IF take = lot.quantity_remaining THEN
+            closed := closed + 1;
+        END IF;
+    END LOOP;
+    UPDATE lot_valuations SET
+        on_hand = CASE WHEN v.open_lots = closed THEN 0 ELSE v.on_hand - (NEW.quantity_change - remaining) END,
+        fifo_value = CASE WHEN v.open_lots = closed THEN 0 ELSE v.fifo_value - cost END,
+        cogs_fifo = v.cogs_fifo + cost,
+        cogs_avg = v.cogs_avg + (NEW.quantity_change - remaining) * v.avg_cost,
+        unmatched = v.unmatched + remaining,
+        open_lots = v.open_lots - closed,
+        updated_at = NOW()
+    WHERE user_id = NEW.user_id AND product_name = pname;
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER trigger_apply_transaction_lots
+    AFTER INSERT ON inventory_transactions
+    FOR EACH ROW
+    EXECUTE FUNCTION apply_transaction_lots();
+
+-- Opening balances: stock that predates lot tracking becomes one lot at the current price
+INSERT INTO inventory_lots (user_id, product_name, quantity_received, quantity_remaining, price_per_kg, expiry_date)
+SELECT p.user_id, LOWER(p.name), p.quantity, p.quantity, COALESCE(p.price_per_kg, 0), p.expiry_date
+FROM products p
+WHERE p.quantity > 0
+  AND NOT EXISTS (SELECT 1 FROM lot_valuations v WHERE v.user_id = p.user_id AND v.product_name = LOWER(p.name));
+
+INSERT INTO lot_valuations (user_id, product_name, on_hand, fifo_value, avg_cost, open_lots)
+SELECT user_id, product_name, SUM(quantity_remaining), SUM(quantity_remaining * price_per_kg),
+       SUM(quantity_remaining * price_per_kg) / SUM(quantity_remaining), COUNT(*)
+FROM inventory_lots
+WHERE transaction_id IS NULL
+GROUP BY user_id, product_name
+ON CONFLICT (user_id, product_name) DO NOTHING;
+
+-- Welford update of the product's price accumulator for each transaction with a price.
+-- All SET expressions see the old row, and the upsert locks it, so concurrent prices apply one at a time.
+CREATE OR REPLACE FUNCTION apply_transaction_price_stats()
+RETURNS TRIGGER AS $$
+DECLARE
+    x DOUBLE PRECISION := EXTRACT(EPOCH FROM COALESCE(NEW.created_at, NOW())) / 86400.0;
+    y DOUBLE PRECISION := NEW.price_per_kg;
+BEGIN
+    IF NEW.price_per_kg IS NULL THEN
+        RETURN NEW;
+    END IF;
+    INSERT INTO price_stats AS s (user_id, product_name, n, mean_x, mean_y)
+    VALUES (NEW.user_id, LOWER(NEW.product_name), 1, x, y)
+    ON CONFLICT (user_id, product_name) DO UPDATE SET
+        n = s.n + 1,
+        mean_x = s.mean_x + (x - s.mean_x) / (s.n + 1),
+        mean_y = s.mean_y + (y - s.mean_y) / (s.n + 1),
+        m2_x = s.m2_x + (x - s.mean_x) * (x - s.mean_x) * s.n / (s.n + 1),
+        m2_y = s.m2_y + (y - s.mean_y) * (y - s.mean_y) * s.n / (s.n + 1),
+        c_xy = s.c_xy + (x - s.mean_x) * (y - s.mean_y) * s.n / (s.n + 1),
+        updated_at = NOW();
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER trigger_apply_transaction_price_stats
+    AFTER INSERT ON inventory_transactions
+    FOR EACH ROW
+    EXECUTE FUNCTION apply_transaction_price_stats();
+
+-- Accumulators for prices recorded before the trigger existed
+INSERT INTO price_stats (user_id, product_name, n, mean_x, mean_y, m2_x, m2_y, c_xy)
+SELECT user_id, product_name, COUNT(*), AVG(x), AVG(y),
+       VAR_POP(x) * COUNT(*), VAR_POP(y) * COUNT(*), COVAR_POP(x, y) * COUNT(*)
+FROM (
+    SELECT user_id, LOWER(product_name) AS product_name,
+           (EXTRACT(EPOCH FROM created_at) / 86400.0)::DOUBLE PRECISION AS x,
+           price_per_kg::DOUBLE PRECISION AS y
+    FROM inventory_transactions
+    WHERE price_per_kg IS NOT NULL AND created_at IS NOT NULL
+) priced
+GROUP BY user_id, product_name
+ON CONFLICT (user_id, product_name) DO NOTHING;
+
+-- Rebuild one user's rollups from raw transactions (backfill: python rollups.py backfill)
+CREATE OR REPLACE FUNCTION rebuild_daily_rollups(p_user_id UUID, p_since DATE DEFAULT NULL)
+RETURNS INTEGER AS $$
+DECLARE
+    bucket_count INTEGER;
+BEGIN
+    -- Waits for this user's in-flight inserts to commit and holds back new ones (the rollup
+    -- trigger takes the same lock, shared), so no transaction is counted twice or missed.
+    -- Other users' writes are not blocked.
+    PERFORM pg_advisory_xact_lock(hashtext(p_user_id::text));
+    -- Days before p_since keep their buckets (their transactions may be archived)
+    DELETE FROM daily_product_rollups
+    WHERE user_id = p_user_id AND (p_since IS NULL OR day >= p_since);
+    INSERT INTO daily_product_rollups (
+        user_id, product_name, day, added, removed, price_sum, price_count,
+        transaction_count, first_at, last_at
+    )
+    SELECT
+        user_id,
+        LOWER(product_name),
+        (created_at AT TIME ZONE 'UTC')::date,
+        SUM(CASE WHEN transaction_type = 'add' THEN quantity_change ELSE 0 END),
+        SUM(CASE WHEN transaction_type = 'remove' THEN quantity_change ELSE 0 END),
+        COALESCE(SUM(price_per_kg), 0),
+        COUNT(price_per_kg),
+        COUNT(*),
+        MIN(created_at),
+        MAX(created_at)
+    FROM inventory_transactions
+    WHERE user_id = p_user_id
+      AND (p_since IS NULL OR created_at >= p_since::timestamp AT TIME ZONE 'UTC')
+    GROUP BY user_id, LOWER(product_name), (created_at AT TIME ZONE 'UTC')::date;
+    GET DIAGNOSTICS bucket_count = ROW_COUNT;
+    RETURN bucket_count;
+END;
+$$ language 'plpgsql';
+
+-- Backfill only: called with the service-role key (rollups.py), never by clients
+REVOKE EXECUTE ON FUNCTION rebuild_daily_rollups(UUID, DATE) FROM PUBLIC, anon, authenticated;
+
+-- Stock increments for POST /products/import, one call per batch
+CREATE OR REPLACE FUNCTION import_add_stock(p_user_id UUID, p_items JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+    updated_count INTEGER;
+BEGIN
+    UPDATE products p
+    SET quantity = p.quantity + i.quantity,
+        price_per_kg = COALESCE(i.price_per_kg, p.price_per_kg),
+        updated_at = NOW()
+    FROM jsonb_to_recordset(p_items) AS i(id UUID, quantity DECIMAL, price_per_kg DECIMAL)
+    WHERE p.id = i.id AND p.user_id = p_user_id;
+    GET DIAGNOSTICS updated_count = ROW_COUNT;
+    RETURN updated_count;
+END;
+$$ language 'plpgsql';
+
+-- Sales: guarded decrement plus its 'remove' transaction in one round trip (POST /voice-command, /sync).
+-- The WHERE guard is re-checked on the locked row, so concurrent sales never take stock below zero.
+-- p_clamp sells what is left instead of refusing (offline sales that already happened).
+-- p_created_at dates the transaction (offline sales synced later); NULL means now.
+DROP FUNCTION IF EXISTS sell_stock(UUID, TEXT, DECIMAL, TEXT, BOOLEAN);
+CREATE OR REPLACE FUNCTION sell_stock(p_user_id UUID, p_product_name TEXT, p_quantity DECIMAL,
+                                      p_notes TEXT DEFAULT '', p_clamp BOOLEAN DEFAULT FALSE,
+                                      p_created_at TIMESTAMP WITH TIME ZONE DEFAULT NULL)
+RETURNS JSONB AS $$
+DECLARE
+    target UUID;
+    sold products%ROWTYPE;
+    new_transaction_id UUID := uuid_generate_v4();
+BEGIN
+    SELECT id INTO target FROM products
+    WHERE user_id = p_user_id
+      -- A spoken '%' or '_' is part of the name, not a wildcard
+      AND name ILIKE '%' || replace(replace(replace(p_product_name, '\', '\\'), '%', '\%'), '_', '\_') || '%' ESCAPE '\'
+    ORDER BY LOWER(name) = LOWER(p_product_name) DESC, created_at
+    LIMIT 1;
+    IF target IS NULL THEN
+        RETURN jsonb_build_object('status', 'not_found');
+    END IF;
+
+    UPDATE products
+    SET quantity = GREATEST(quantity - p_quantity, 0), updated_at = NOW()
+    WHERE id = target AND (p_clamp OR quantity >= p_quantity)
+    RETURNING * INTO sold;
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('status', 'insufficient',
+                                  'available', (SELECT quantity FROM products WHERE id = target));
+    END IF;
+
+    INSERT INTO inventory_transactions (id, user_id, product_name, transaction_type, quantity_change, notes,
+                                        created_at)
+    VALUES (new_transaction_id, p_user_id, sold.name, 'remove', p_quantity, p_notes, COALESCE(p_created_at, NOW()));
+    RETURN jsonb_build_object('status', 'sold', 'product', to_jsonb(sold), 'transaction_id', new_transaction_id);
+END;
+$$ language 'plpgsql';
+
+-- One write-behind batch: merged per-product deltas and every transaction row, applied at most once
+CREATE OR REPLACE FUNCTION apply_stock_deltas(p_user_id UUID, p_batch_id UUID, p_items JSONB, p_transactions JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+    updated_count INTEGER;
+BEGIN
+    INSERT INTO write_behind_batches (batch_id, user_id) VALUES (p_batch_id, p_user_id)
+    ON CONFLICT (batch_id) DO NOTHING;
+    IF NOT FOUND THEN
+        RETURN 0; -- already applied before a crash or a lost response
+    END IF;
+    UPDATE products p
+    SET quantity = GREATEST(p.quantity + i.delta, 0),
+        price_per_kg = COALESCE(i.price_per_kg, p.price_per_kg),
+        updated_at = NOW()
+    FROM jsonb_to_recordset(p_items) AS i(id UUID, delta DECIMAL, price_per_kg DECIMAL)
+    WHERE p.id = i.id AND p.user_id = p_user_id;
+    GET DIAGNOSTICS updated_count = ROW_COUNT;
+    -- In recorded order, so the lots trigger consumes FIFO as if written one by one
+    INSERT INTO inventory_transactions (id, user_id, product_name, transaction_type, quantity_change,
+                                        price_per_kg, notes, created_at)
+    SELECT t.id, p_user_id, t.product_name, t.transaction_type, t.quantity_change, t.price_per_kg, t.notes, t.created_at
+    FROM jsonb_to_recordset(p_transactions) AS t(id UUID, product_name VARCHAR, transaction_type VARCHAR,
+                                                  quantity_change DECIMAL, price_per_kg DECIMAL, notes TEXT,
+                                                  created_at TIMESTAMP WITH TIME ZONE)
+    ORDER BY t.created_at;
+    IF random() < 0.01 THEN
+        DELETE FROM write_behind_batches WHERE applied_at < NOW() - INTERVAL '7 days';
+    END IF;
+    RETURN updated_count;
+END;
+$$ language 'plpgsql';
+
 -- Sample data (optional - remove in production)
 -- INSERT INTO users (email, password_hash, full_name) VALUES 
 -- ('demo@example.com', '$2b$12$example_hash', 'Demo User');
@@ -1,14 +1,17 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Request, WebSocket, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, EmailStr
-from typing import List, Optional, Dict, Any
+from typing import List, Literal, Optional, Dict, Any
 import os
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import re
+import time
 import json
 import asyncio
+import itertools
 from collections import defaultdict
 import numpy as np
 import pandas as pd
@@ -25,6 +28,11 @@ from plotly.utils import PlotlyJSONEncoder
 
 warnings.filterwarnings('ignore')
 
+# Structured, queue-backed logging (see app_logging.py)
+from app_logging import CorrelationIdMiddleware, configure_logging, get_logger
+configure_logging()
+logger = get_logger("supabase_server")
+
 # Load environment variables
 try:
     from dotenv import load_dotenv
@@ -43,6 +51,79 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Metrics (exposed at /metrics)
+from metrics import (MetricsMiddleware, PROMETHEUS_CONTENT_TYPE, VOICE_STAGE_LATENCY,
+                     monitor_event_loop_lag, render_metrics, stage, timed_db)
+app.add_middleware(MetricsMiddleware)
+
+# Fast JSON responses for large payloads (FAST_JSON=0 to disable)
+from fast_json import json_response
+
+# Conditional GET: ETags from a per-user inventory version bumped on every write
+from conditional import (bump_inventory_version, etag_json_response, inventory_etag, not_modified,
+                         require_shared_versions)
+
+# Realtime change stream (SSE and WebSocket); set CHANGE_BUS_URL to share it across workers
+from change_stream import ChangeHub, create_bus, serve_websocket, sse_events
+change_hub = ChangeHub(create_bus())
+
+# Delta sync for devices that were offline (GET /products/changes, POST /sync)
+from delta_sync import (AppliedOperations, SupabaseAppliedOperations, SyncOperation, SyncRequest,
+                        SYNC_TOMBSTONE_RETENTION_DAYS, apply_operations, build_changes, cursor_expired,
+                        decode_cursor, read_window_start, recorded_time)
+
+# Single-flight: identical concurrent analytics requests share one computation
+from singleflight import SingleFlight, analytics_key
+analytics_flights = SingleFlight("analytics")
+
+# Vectorized demand forecasting for all of a user's products at once
+from forecasting import FORECAST_HISTORY_DAYS, FORECAST_METHOD, forecast_products
+
+# Daily per-product rollups, maintained by a trigger on inventory_transactions
+from rollups import ROLLUPS_ENABLED, as_forecast_rows, fold, summarize
+
+# Columnar archive of old inventory_transactions (python archive.py run)
+from archive import ARCHIVE_AVAILABLE, TransactionArchive
+transaction_archive = TransactionArchive() if ARCHIVE_AVAILABLE else None
+
+# Streaming NDJSON/CSV exports read with keyset pagination
+from export import EXPORT_RESOURCES, export_response, keyset_pages, supabase_page_fetcher
+
+# Bulk product import (POST /products/import) with batched writes
+from bulk_import import (ImportFormatError, batches, import_summary, import_transaction, parse_upload,
+                         plan_import, upload_format)
+
+# Background alert scheduler that keeps stock_alerts current (ALERT_SCHEDULER=1 on exactly one worker)
+from alert_scheduler import ALERT_SCHEDULER, AlertScheduler, SupabaseAlertStore, alerts_payload, build_alerts
+
+# Time-ordered expiry index with sweeps that feed the alert scheduler
+from expiry import EXPIRY_INDEX, EXPIRY_SWEEP_S, ExpiryIndex, expiry_query_days
+expiry_index = ExpiryIndex()
+if EXPIRY_INDEX:
+    change_hub.add_listener(expiry_index.apply_change)
+
+# FIFO lots and running valuation, maintained by a trigger on inventory_transactions
+from lots import valuation_summary
+
+# Price trends from running regression accumulators, maintained by a trigger on inventory_transactions
+from price_trends import trend_summary
+
+# Optional write-behind buffer for stock changes (WRITE_BEHIND=1)
+from write_behind import WRITE_BEHIND, DeltaJournal, WriteBehindBuffer
+
+# Reorder points, safety stock and EOQ for the whole catalogue, cached per inventory version
+from reorder import REORDER_CACHE_TTL_S, REORDER_HISTORY_DAYS, reorder_plan
+reorder_flights = SingleFlight("reorder_plan", cache_ttl=REORDER_CACHE_TTL_S)
+
+# Monte Carlo stockout risk per product, cached per inventory version and horizon
+from stockout import (STOCKOUT_CACHE_TTL_S, STOCKOUT_HISTORY_DAYS, STOCKOUT_HORIZON_DAYS,
+                      STOCKOUT_MAX_DAYS, stockout_risk)
+stockout_flights = SingleFlight("stockout_risk", cache_ttl=STOCKOUT_CACHE_TTL_S)
+
+# On-demand profiling of single requests (only when PROFILING_TOKEN is set)
+from profiler import install_profiling
+install_profiling(app)
+
 # Supabase configuration
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_ANON_KEY = os.getenv('SUPABASE_ANON_KEY')
@@ -58,9 +139,32 @@ supabase: Client = None
 if SUPABASE_URL and SUPABASE_ANON_KEY:
     try:
         supabase = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-        print("Supabase client initialized successfully")
+        logger.info("Supabase client initialized successfully")
     except Exception as e:
-        print(f"Failed to initialize Supabase client: {e}")
+        logger.error("Failed to initialize Supabase client: %s", e)
+
+# Idempotency-Key support for writes: memory tier plus the idempotency_keys table
+from idempotency import IdempotencyMiddleware, SupabaseIdempotencyStore, TieredIdempotencyStore
+idempotency_store = TieredIdempotencyStore(
+    durable=SupabaseIdempotencyStore(lambda: create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)) if supabase else None
+)
+app.add_middleware(IdempotencyMiddleware, store=idempotency_store)
+# Added last so it is outermost: replayed responses get an x-request-id too
+app.add_middleware(CorrelationIdMiddleware)
+
+alert_store = SupabaseAlertStore(lambda: create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY))
+alert_scheduler = AlertScheduler(
+    lambda user_id: compute_user_alerts(user_id), alert_store,
+    users=lambda: [row['id'] for row in fetch_all_rows(
+        create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY).table('users').select('id').order('id'))],
+    # Every worker's dashboard ETag follows the runs, wherever they happen
+    announce=lambda user_id, generation: change_hub.publish(user_id, "alerts", "refresh", user_id,
+                                                            {"generation": generation})
+)
+change_hub.add_listener(alert_scheduler.apply_change)
+
+write_behind = (WriteBehindBuffer(lambda *batch: flush_stock_deltas(*batch), DeltaJournal())
+                if supabase and WRITE_BEHIND else None)
 
 # Initialize Gemini AI
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
@@ -69,13 +173,13 @@ if GEMINI_API_KEY:
         import google.generativeai as genai
         genai.configure(api_key=GEMINI_API_KEY)
         model = genai.GenerativeModel('gemini-pro')
-        print("Gemini AI initialized successfully")
+        logger.info("Gemini AI initialized successfully")
     except ImportError:
         model = None
-        print("google-generativeai not installed, using fallback parsing")
+        logger.warning("google-generativeai not installed, using fallback parsing")
 else:
     model = None
-    print("Gemini API key not found, using fallback parsing")
+    logger.warning("Gemini API key not found, using fallback parsing")
 
 # Security
 security = HTTPBearer()
@@ -152,8 +256,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """Get current user from JWT token"""
+async def get_token_user_id(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
+    """Get the user id from the JWT token without a database lookup"""
     try:
         token = credentials.credentials
         payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
@@ -170,7 +274,10 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
+    return user_id
+
+async def get_current_user(user_id: str = Depends(get_token_user_id)):
+    """Get current user from JWT token"""
     if not supabase:
         raise HTTPException(status_code=500, detail="Database not available")
     
@@ -192,11 +299,18 @@ def process_voice_command(command: str, language: str = "en") -> dict:
     """Process voice command and extract action and product information"""
     command = command.lower().strip()
     
+    # Questions about expiry ("what is expiring this week")
+    expiry_days = expiry_query_days(command)
+    if expiry_days is not None:
+        return {"action": "expiring", "product_name": None, "quantity": None, "price": None,
+                "days": expiry_days, "raw_command": command}
+    
     # Enhanced pattern matching
     patterns = {
         'add': r'add|create|insert|new|stock|purchase|buy',
         'update': r'update|change|modify|edit|adjust',
-        'remove': r'remove|delete|del|sell|consume|use',
+        'sell': r'\b(?:sold|sell|sale|consumed?|used?)\b',
+        'remove': r'remove|delete|del',
         'list': r'list|show|display|get all|inventory',
         'search': r'search|find|get|show|check',
         'predict': r'predict|forecast|estimate|suggest|recommend',
@@ -304,8 +418,9 @@ def process_voice_command(command: str, language: str = "en") -> dict:
     }
 
 # Database operations
-async def save_product(product: Product, user_id: str):
-    """Save product to Supabase"""
+@timed_db()
+async def save_product(product: Product, user_id: str, created_at: Optional[datetime] = None):
+    """Save product to Supabase (its opening transaction dated created_at when given)"""
     if not supabase:
         raise HTTPException(status_code=500, detail="Database not available")
     
@@ -319,6 +434,9 @@ async def save_product(product: Product, user_id: str):
         # Use service role to bypass RLS
         service_supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
         result = service_supabase.table('products').insert(product_data).execute()
+        bump_inventory_version(user_id)
+        await change_hub.publish(user_id, "product", "upsert", product_data['id'],
+                                 result.data[0] if result.data else product_data)
         
         # Log transaction
         await log_transaction(
@@ -326,13 +444,16 @@ async def save_product(product: Product, user_id: str):
             product_name=product.name,
             transaction_type='add',
             quantity_change=product.quantity,
-            price_per_kg=product.price_per_kg
+            price_per_kg=product.price_per_kg,
+            expiry_date=product.expiry_date,
+            created_at=created_at
         )
         
         return result.data[0] if result.data else None
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+@timed_db()
 async def get_user_products(user_id: str):
     """Get all products for a user"""
     if not supabase:
@@ -341,22 +462,30 @@ async def get_user_products(user_id: str):
     try:
         # Use service role to bypass RLS
         service_supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
-        result = service_supabase.table('products').select('*').eq('user_id', user_id).execute()
-        return result.data
+        query = service_supabase.table('products').select('*').eq('user_id', user_id)
+        if write_behind is not None:
+            return await write_behind.read(user_id, lambda: asyncio.to_thread(lambda: query.execute().data))
+        return query.execute().data
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+@timed_db()
 async def find_user_product(user_id: str, name: str):
     """Find product by name for a user"""
     if not supabase:
         raise HTTPException(status_code=500, detail="Database not available")
     
     try:
-        result = supabase.table('products').select('*').eq('user_id', user_id).ilike('name', f'%{name}%').execute()
-        return result.data[0] if result.data else None
+        query = supabase.table('products').select('*').eq('user_id', user_id).ilike('name', f'%{name}%').limit(1)
+        if write_behind is not None:
+            rows = await write_behind.read(user_id, lambda: asyncio.to_thread(lambda: query.execute().data))
+        else:
+            rows = query.execute().data
+        return rows[0] if rows else None
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+@timed_db()
 async def update_user_product(user_id: str, product_id: str, updates: dict):
     """Update product"""
     if not supabase:
@@ -365,10 +494,79 @@ async def update_user_product(user_id: str, product_id: str, updates: dict):
     try:
         updates['updated_at'] = datetime.now().isoformat()
         result = supabase.table('products').update(updates).eq('id', product_id).eq('user_id', user_id).execute()
+        bump_inventory_version(user_id)
+        if result.data:
+            await change_hub.publish(user_id, "product", "upsert", product_id, result.data[0])
         return len(result.data) > 0
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+@timed_db()
+async def sell_product(user_id: str, product_name: str, quantity: float, notes: str = "", clamp: bool = False,
+                       created_at: Optional[datetime] = None):
+    """Take quantity off a product's stock and log the removal in one round trip (sell_stock)"""
+    if not supabase:
+        raise HTTPException(status_code=500, detail="Database not available")
+    if write_behind is not None:
+        return await buffer_sale(user_id, product_name, quantity, notes, clamp, created_at)
+    service_supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    sale = service_supabase.rpc('sell_stock', {
+        'p_user_id': user_id, 'p_product_name': product_name, 'p_quantity': quantity,
+        'p_notes': notes, 'p_clamp': clamp,
+        'p_created_at': created_at.isoformat() if created_at else None}).execute().data
+    if sale['status'] == 'sold':
+        product = sale['product']
+        bump_inventory_version(user_id)
+        await change_hub.publish(user_id, "product", "upsert", product['id'], product)
+        await change_hub.publish(user_id, "transaction", "insert", sale['transaction_id'], {
+            'id': sale['transaction_id'], 'user_id': user_id, 'product_name': product['name'],
+            'transaction_type': 'remove', 'quantity_change': quantity, 'notes': notes,
+            'created_at': created_at.isoformat() if created_at else product['updated_at']})
+    return sale
+
+async def buffer_sale(user_id: str, product_name: str, quantity: float, notes: str, clamp: bool,
+                      created_at: Optional[datetime] = None):
+    """sell_product through the write-behind buffer; the guard sees every pending change of this process"""
+    product = await find_user_product(user_id, product_name)
+    if product is None:
+        return {'status': 'not_found'}
+    # No await between the exact read above and buffering the change below
+    available = float(product['quantity'])
+    if quantity > available and not clamp:
+        return {'status': 'insufficient', 'available': available}
+    transaction = {'id': str(uuid.uuid4()), 'product_name': product['name'], 'transaction_type': 'remove',
+                   'quantity_change': quantity, 'price_per_kg': None, 'notes': notes,
+                   'created_at': (created_at or datetime.now(timezone.utc)).isoformat()}
+    write_behind.add(user_id, product['id'], product['name'], -min(quantity, available), transaction)
+    await publish_buffered_change(user_id, {**product, 'quantity': max(0.0, available - quantity)}, transaction)
+    return {'status': 'sold', 'product': {**product, 'quantity': max(0.0, available - quantity)},
+            'transaction_id': transaction['id']}
+
+async def buffer_restock(user_id: str, product: dict, quantity: float, price_per_kg: Optional[float], notes: str,
+                         created_at: Optional[datetime] = None):
+    """Add stock to an existing product through the write-behind buffer"""
+    transaction = {'id': str(uuid.uuid4()), 'product_name': product['name'], 'transaction_type': 'add',
+                   'quantity_change': quantity, 'price_per_kg': price_per_kg, 'notes': notes,
+                   'created_at': (created_at or datetime.now(timezone.utc)).isoformat()}
+    write_behind.add(user_id, product['id'], product['name'], quantity, transaction, price_per_kg)
+    updated = {**product, 'quantity': float(product['quantity']) + quantity}
+    if price_per_kg is not None:
+        updated['price_per_kg'] = price_per_kg
+    await publish_buffered_change(user_id, updated, transaction)
+
+async def publish_buffered_change(user_id: str, product: dict, transaction: dict):
+    """Buffered changes are visible at once, so versions and subscribers move now, not at the flush"""
+    bump_inventory_version(user_id)
+    await change_hub.publish(user_id, "product", "upsert", product['id'], product)
+    await change_hub.publish(user_id, "transaction", "insert", transaction['id'], {**transaction, 'user_id': user_id})
+
+async def flush_stock_deltas(batch_id: str, user_id: str, items: List[dict], transactions: List[dict]):
+    """Write one write-behind batch: merged deltas plus its transaction rows, in one call"""
+    service_supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    await asyncio.to_thread(lambda: service_supabase.rpc('apply_stock_deltas', {
+        'p_user_id': user_id, 'p_batch_id': batch_id, 'p_items': items, 'p_transactions': transactions}).execute())
+
+@timed_db()
 async def delete_user_product(user_id: str, product_id: str):
     """Delete product"""
     if not supabase:
@@ -376,14 +574,33 @@ async def delete_user_product(user_id: str, product_id: str):
     
     try:
         result = supabase.table('products').delete().eq('id', product_id).eq('user_id', user_id).execute()
+        if result.data:
+            await record_tombstone(user_id, result.data[0])
+        bump_inventory_version(user_id)
+        if result.data:
+            await change_hub.publish(user_id, "product", "delete", product_id)
         return len(result.data) > 0
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+async def record_tombstone(user_id: str, product: dict):
+    """Remember a deleted product for /products/changes, pruning expired tombstones"""
+    service_supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    tombstones = service_supabase.table('product_tombstones')
+    tombstones.insert({
+        'user_id': user_id,
+        'product_id': product['id'],
+        'product_name': product.get('name'),
+    }).execute()
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=SYNC_TOMBSTONE_RETENTION_DAYS)).isoformat()
+    tombstones.delete().eq('user_id', user_id).lt('deleted_at', cutoff).execute()
+
+@timed_db()
 async def log_transaction(user_id: str, product_name: str, transaction_type: str, 
                          quantity_change: float, price_per_kg: Optional[float] = None, 
-                         notes: Optional[str] = ""):
-    """Log inventory transaction"""
+                         notes: Optional[str] = "", expiry_date: Optional[datetime] = None,
+                         created_at: Optional[datetime] = None):
+    """Log inventory transaction (the lots trigger opens or consumes lots from it)"""
     if not supabase:
         return
     
@@ -395,67 +612,51 @@ async def log_transaction(user_id: str, product_name: str, transaction_type: str
             'transaction_type': transaction_type,
             'quantity_change': quantity_change,
             'price_per_kg': price_per_kg,
+            'expiry_date': expiry_date.isoformat() if expiry_date else None,
             'notes': notes,
-            'created_at': datetime.now().isoformat()
+            'created_at': (created_at or datetime.now()).isoformat()
         }
         
         # Use service role to bypass RLS
         service_supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
         service_supabase.table('inventory_transactions').insert(transaction_data).execute()
+        bump_inventory_version(user_id)
+        await change_hub.publish(user_id, "transaction", "insert", transaction_data['id'], transaction_data)
     except Exception as e:
-        print(f"Failed to log transaction: {e}")
+        logger.error("Failed to log transaction: %s", e)
 
 # Analytics and prediction functions
+def escape_like(value: str) -> str:
+    """Escape LIKE wildcards so ilike matches the text itself, ignoring case"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+@timed_db()
 async def get_product_analytics(user_id: str, product_name: str):
     """Get analytics for a specific product"""
     if not supabase:
         raise HTTPException(status_code=500, detail="Database not available")
     
     try:
-        # Get transaction history
-        result = supabase.table('inventory_transactions').select('*').eq('user_id', user_id).eq('product_name', product_name).order('created_at').execute()
-        transactions = result.data
-        
-        if not transactions:
-            return {"message": "No transaction history found"}
-        
-        # Convert to DataFrame for analysis
-        df = pd.DataFrame(transactions)
-        df['created_at'] = pd.to_datetime(df['created_at'])
-        
-        # Calculate metrics
-        total_added = df[df['transaction_type'] == 'add']['quantity_change'].sum()
-        total_removed = df[df['transaction_type'] == 'remove']['quantity_change'].sum()
-        current_stock = total_added - total_removed
-        
-        # Calculate consumption rate (kg per day)
-        if len(df) > 1:
-            days_span = (df['created_at'].max() - df['created_at'].min()).days
-            if days_span > 0:
-                consumption_rate = total_removed / days_span
-            else:
-                consumption_rate = 0
-        else:
-            consumption_rate = 0
-        
-        # Price trend
-        price_data = df[df['price_per_kg'].notna()]
-        avg_price = price_data['price_per_kg'].mean() if not price_data.empty else 0
-        
-        return {
-            "product_name": product_name,
-            "current_stock": current_stock,
-            "total_added": total_added,
-            "total_consumed": total_removed,
-            "consumption_rate_per_day": consumption_rate,
-            "average_price": avg_price,
-            "transaction_count": len(transactions),
-            "first_transaction": df['created_at'].min().isoformat(),
-            "last_transaction": df['created_at'].max().isoformat()
-        }
+        if ROLLUPS_ENABLED:
+            buckets = fetch_all_rows(
+                supabase.table('daily_product_rollups').select('*')
+                .eq('user_id', user_id).eq('product_name', product_name.lower()).order('day')
+            )
+            return summarize(buckets, product_name)
+
+        # Hot rows from the database plus the archived months' columns
+        transactions = fetch_all_rows(
+            supabase.table('inventory_transactions').select('*')
+            .eq('user_id', user_id).ilike('product_name', escape_like(product_name)).order('created_at')
+        )
+        buckets = fold(transactions)
+        if transaction_archive:
+            buckets += transaction_archive.product_buckets(user_id, product_name)
+        return summarize(buckets, product_name)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analytics error: {str(e)}")
 
+@timed_db()
 async def predict_stock_depletion(user_id: str, product_name: str, days_ahead: int = 7):
     """Predict when stock will be depleted and suggest reorder"""
     if not supabase:
@@ -516,24 +717,109 @@ async def predict_stock_depletion(user_id: str, product_name: str, days_ahead: i
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
 
+def fetch_all_rows(query, page_size: int = 1000):
+    """Page through a PostgREST query (responses are capped at 1000 rows)"""
+    rows, offset = [], 0
+    while True:
+        page = query.range(offset, offset + page_size - 1).execute().data
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+        offset += page_size
+
+@timed_db()
+async def forecast_user_products(user_id: str, method: str = FORECAST_METHOD):
+    """Forecast depletion for every product of a user from the transaction history"""
+    if not supabase:
+        raise HTTPException(status_code=500, detail="Database not available")
+    
+    try:
+        products, transactions = load_demand_history(user_id, FORECAST_HISTORY_DAYS)
+        # Keep the numpy work off the event loop for long histories
+        return await asyncio.to_thread(forecast_products, products, transactions, method=method)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Forecast error: {str(e)}")
+
+def load_demand_history(user_id: str, history_days: int, product_columns: str = 'name,quantity,minimum_stock'):
+    """A user's products plus their stock movements over the last history_days (daily rollups or raw rows)"""
+    service_supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    # Pages are cut by offset, so every query needs a total order
+    products = fetch_all_rows(service_supabase.table('products').select(product_columns)
+                              .eq('user_id', user_id).order('id'))
+    since = datetime.now(timezone.utc) - timedelta(days=history_days)
+    if ROLLUPS_ENABLED:
+        buckets = fetch_all_rows(
+            service_supabase.table('daily_product_rollups')
+            .select('product_name,day,added,removed')
+            .eq('user_id', user_id).gte('day', since.date().isoformat()).order('day').order('product_name')
+        )
+        return products, as_forecast_rows(buckets)
+    transactions = fetch_all_rows(
+        service_supabase.table('inventory_transactions')
+        .select('product_name,transaction_type,quantity_change,created_at')
+        .eq('user_id', user_id).gte('created_at', since.isoformat()).order('created_at').order('id')
+    )
+    if transaction_archive:
+        transactions = transaction_archive.read_rows(user_id, since) + transactions
+    return products, transactions
+
+def fetch_expiring_products(user_id: Optional[str] = None, page_size: int = 1000):
+    """Products with an expiry date and stock on hand, for one user or everyone (keyset on id)"""
+    service_supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    rows, last_id = [], None
+    while True:
+        query = service_supabase.table('products').select('id,user_id,name,quantity,expiry_date') \
+            .not_.is_('expiry_date', 'null').gt('quantity', 0)
+        if user_id is not None:
+            query = query.eq('user_id', user_id)
+        if last_id is not None:
+            query = query.gt('id', last_id)
+        page = query.order('id').limit(page_size).execute().data
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+        last_id = page[-1]['id']
+
+async def get_expiring_products(user_id: str, days: float):
+    """Products of a user expiring within `days`, soonest first (expired ones included)"""
+    if expiry_index.needs_load(user_id):
+        expiry_index.load(user_id, await asyncio.to_thread(fetch_expiring_products, user_id))
+    return expiry_index.expiring(user_id, days)
+
+async def expiry_sweeps():
+    """Load the expiry index, then hand users with newly due expiries to the alert scheduler"""
+    try:
+        expiry_index.load_all(await asyncio.to_thread(fetch_expiring_products))
+    except Exception as e:
+        logger.warning("Failed to load the expiry index: %s", e)
+    while True:
+        try:
+            for user_id in expiry_index.stale_users():
+                expiry_index.load(user_id, await asyncio.to_thread(fetch_expiring_products, user_id))
+            for user_id in expiry_index.sweep():
+                alert_scheduler.mark_dirty(user_id)
+        except Exception as e:
+            logger.warning("Expiry sweep failed: %s", e)
+        await asyncio.sleep(EXPIRY_SWEEP_S)
+
+async def compute_user_alerts(user_id: str):
+    """Build a user's stock_alerts rows from their products and depletion forecasts"""
+    service_supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    products = await asyncio.to_thread(
+        fetch_all_rows, service_supabase.table('products').select('*').eq('user_id', user_id).order('id'))
+    forecasts = await forecast_user_products(user_id)
+    return build_alerts(products, forecasts)
+
+@timed_db()
 async def get_low_stock_alerts(user_id: str):
-    """Get all products with low stock alerts"""
+    """Read a user's precomputed alerts from stock_alerts"""
     if not supabase:
         raise HTTPException(status_code=500, detail="Database not available")
     
     try:
-        products = await get_user_products(user_id)
-        alerts = []
-        
-        for product in products:
-            if product['quantity'] <= product.get('minimum_stock', 1.0):
-                prediction = await predict_stock_depletion(user_id, product['name'])
-                alerts.append({
-                    "product": product,
-                    "prediction": prediction
-                })
-        
-        return {"alerts": alerts, "count": len(alerts)}
+        await alert_scheduler.ensure(user_id)
+        rows = await asyncio.to_thread(alert_store.list, user_id)
+        return alerts_payload(rows)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Alert error: {str(e)}")
 
@@ -654,117 +940,171 @@ async def root():
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.now(), "supabase_connected": supabase is not None}
 
-@app.post("/voice-command")
-async def process_voice(command: VoiceCommand, current_user: dict = Depends(get_current_user)):
-    """Process voice command"""
-    try:
-        result = process_voice_command(command.command, command.language)
-        user_id = current_user['id']
-        
-        if result["action"] == "add" and result["product_name"]:
-            # Check if we have all required information
-            if result["quantity"] and result["price"]:
-                # Add product
-                product = Product(
-                    name=result["product_name"],
-                    quantity=result["quantity"],
-                    price_per_kg=result["price"]
-                )
-                saved_product = await save_product(product, user_id)
-                return {
-                    "success": True,
-                    "message": f"Added {result['quantity']} kg of {result['product_name']} at ₹{result['price']} per kg",
-                    "product": saved_product,
-                    "parsed_command": result
-                }
-            else:
-                # Handle missing information with helpful message
-                missing_info = []
-                if not result["quantity"]:
-                    missing_info.append("quantity")
-                if not result["price"]:
-                    missing_info.append("price")
-                
-                return {
-                    "success": False,
-                    "message": f"To add {result['product_name']}, please specify the {' and '.join(missing_info)}. Try: 'Add {result['product_name']} 2 kg at ₹20 per kg'",
-                    "parsed_command": result,
-                    "missing_info": missing_info
-                }
-        
-        elif result["action"] == "list":
-            products = await get_user_products(user_id)
+async def execute_voice_action(result: dict, user_id: str):
+    """Apply a parsed voice command for a user"""
+    if result["action"] == "add" and result["product_name"]:
+        # Check if we have all required information
+        if result["quantity"] and result["price"]:
+            # Add product
+            product = Product(
+                name=result["product_name"],
+                quantity=result["quantity"],
+                price_per_kg=result["price"]
+            )
+            saved_product = await save_product(product, user_id)
             return {
                 "success": True,
-                "message": f"Found {len(products)} products",
-                "products": products,
+                "message": f"Added {result['quantity']} kg of {result['product_name']} at ₹{result['price']} per kg",
+                "product": saved_product,
                 "parsed_command": result
             }
-        
-        elif result["action"] == "search" and result["product_name"]:
-            product = await find_user_product(user_id, result["product_name"])
-            if product:
-                return {
-                    "success": True,
-                    "message": f"Found product: {product['name']}",
-                    "product": product,
-                    "parsed_command": result
-                }
-            else:
-                return {
-                    "success": False,
-                    "message": f"Product '{result['product_name']}' not found",
-                    "parsed_command": result
-                }
-        
-        elif result["action"] == "predict" and result["product_name"]:
-            days = result.get("days", 7)
-            prediction = await predict_stock_depletion(user_id, result["product_name"], days)
+        else:
+            # Handle missing information with helpful message
+            missing_info = []
+            if not result["quantity"]:
+                missing_info.append("quantity")
+            if not result["price"]:
+                missing_info.append("price")
+            
+            return {
+                "success": False,
+                "message": f"To add {result['product_name']}, please specify the {' and '.join(missing_info)}. Try: 'Add {result['product_name']} 2 kg at ₹20 per kg'",
+                "parsed_command": result,
+                "missing_info": missing_info
+            }
+    
+    elif result["action"] in ("sell", "remove") and result["product_name"]:
+        if not result["quantity"]:
+            return {
+                "success": False,
+                "message": f"Please say how much {result['product_name']}. Try: 'Sold 2 kg {result['product_name']}'",
+                "parsed_command": result,
+                "missing_info": ["quantity"]
+            }
+        sale = await sell_product(user_id, result["product_name"], result["quantity"], notes="voice")
+        if sale['status'] == 'not_found':
+            return {
+                "success": False,
+                "message": f"Product '{result['product_name']}' not found",
+                "parsed_command": result
+            }
+        if sale['status'] == 'insufficient':
+            return {
+                "success": False,
+                "message": f"Only {sale['available']} kg of {result['product_name']} in stock",
+                "available": sale['available'],
+                "parsed_command": result
+            }
+        verb = "Sold" if result["action"] == "sell" else "Removed"
+        return {
+            "success": True,
+            "message": f"{verb} {result['quantity']} kg of {result['product_name']}, {sale['product']['quantity']} kg left",
+            "product": sale['product'],
+            "parsed_command": result
+        }
+    
+    elif result["action"] == "list":
+        products = await get_user_products(user_id)
+        return json_response({
+            "success": True,
+            "message": f"Found {len(products)} products",
+            "products": products,
+            "parsed_command": result
+        })
+    
+    elif result["action"] == "search" and result["product_name"]:
+        product = await find_user_product(user_id, result["product_name"])
+        if product:
             return {
                 "success": True,
-                "message": f"Stock prediction for {result['product_name']}",
-                "prediction": prediction,
+                "message": f"Found product: {product['name']}",
+                "product": product,
                 "parsed_command": result
             }
-        
-        elif result["action"] == "analyze":
-            if result["product_name"]:
-                analytics = await get_product_analytics(user_id, result["product_name"])
-                return {
-                    "success": True,
-                    "message": f"Analytics for {result['product_name']}",
-                    "analytics": analytics,
-                    "parsed_command": result
-                }
-            else:
-                alerts = await get_low_stock_alerts(user_id)
-                return {
-                    "success": True,
-                    "message": "Inventory analysis",
-                    "alerts": alerts,
-                    "parsed_command": result
-                }
-        
         else:
             return {
                 "success": False,
-                "message": "Command not fully recognized or missing required information",
+                "message": f"Product '{result['product_name']}' not found",
                 "parsed_command": result
             }
     
+    elif result["action"] == "predict" and result["product_name"]:
+        days = result.get("days", 7)
+        prediction = await predict_stock_depletion(user_id, result["product_name"], days)
+        return {
+            "success": True,
+            "message": f"Stock prediction for {result['product_name']}",
+            "prediction": prediction,
+            "parsed_command": result
+        }
+    
+    elif result["action"] == "analyze":
+        if result["product_name"]:
+            analytics = await get_product_analytics(user_id, result["product_name"])
+            return {
+                "success": True,
+                "message": f"Analytics for {result['product_name']}",
+                "analytics": analytics,
+                "parsed_command": result
+            }
+        else:
+            alerts = await get_low_stock_alerts(user_id)
+            return {
+                "success": True,
+                "message": "Inventory analysis",
+                "alerts": alerts,
+                "parsed_command": result
+            }
+    
+    elif result["action"] == "expiring":
+        items = await get_expiring_products(user_id, result["days"])
+        if items:
+            names = ", ".join(f"{item['name']} ({'expired' if item['expired'] else item['expiry_date'][:10]})"
+                              for item in items[:10])
+            message = f"{len(items)} product(s) expiring within {result['days']} days: {names}"
+        else:
+            message = f"Nothing expires within {result['days']} days"
+        return {"success": True, "message": message, "expiring": items, "parsed_command": result}
+    
+    else:
+        return {
+            "success": False,
+            "message": "Command not fully recognized or missing required information",
+            "parsed_command": result
+        }
+
+@app.post("/voice-command")
+async def process_voice(command: VoiceCommand, current_user: dict = Depends(get_current_user)):
+    """Process voice command"""
+    db_started = None
+    try:
+        with stage("regex"):
+            result = process_voice_command(command.command, command.language)
+        user_id = current_user['id']
+        db_started = time.perf_counter()
+        return await execute_voice_action(result, user_id)
+    
     except Exception as e:
-        print(f"Error processing voice command: {e}")
+        logger.exception("Error processing voice command: %s", e)
         return {
             "success": False,
             "message": f"Error processing command: {str(e)}"
         }
+    finally:
+        if db_started is not None:
+            VOICE_STAGE_LATENCY.observe(time.perf_counter() - db_started, "db")
 
 @app.get("/products")
-async def get_products(current_user: dict = Depends(get_current_user)):
+async def get_products(request: Request, user_id: str = Depends(get_token_user_id)):
     """Get all products for current user"""
+    etag = inventory_etag(user_id, "products")
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    await get_current_user(user_id)
     try:
-        products = await get_user_products(current_user['id'])
-        return {"success": True, "products": products}
+        products = await get_user_products(user_id)
+        return etag_json_response(request, {"success": True, "products": products}, etag)
     except Exception as e:
         return {"success": False, "message": str(e)}
 
@@ -777,6 +1117,142 @@ async def create_product(product: Product, current_user: dict = Depends(get_curr
     except Exception as e:
         return {"success": False, "message": str(e)}
 
+@timed_db()
+async def import_products(user_id: str, parsed, dry_run: bool = False):
+    """Write a parsed import in batches: inserts, stock increments and their transactions"""
+    service_supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+
+    def write():
+        existing = {}
+        for product in fetch_all_rows(service_supabase.table('products').select('id,name')
+                                      .eq('user_id', user_id).order('id')):
+            existing.setdefault(product['name'].lower(), product)
+        creates, updates = plan_import(parsed, existing)
+        if dry_run:
+            return len(creates), len(updates)
+
+        now = datetime.now(timezone.utc).isoformat()
+        for batch in batches(creates):
+            service_supabase.table('products').insert([{
+                'id': str(uuid.uuid4()), 'user_id': user_id, 'name': item['name'],
+                'quantity': item['quantity'], 'price_per_kg': item['price_per_kg'],
+                'description': item['description'] or "", 'category': item['category'] or "general",
+                'minimum_stock': item['minimum_stock'] if item['minimum_stock'] is not None else 1.0,
+                'supplier': item['supplier'] or "", 'created_at': now, 'updated_at': now,
+            } for item in batch]).execute()
+        for batch in batches(updates):
+            # Increments are applied in SQL so concurrent voice updates are not lost
+            service_supabase.rpc('import_add_stock', {'p_user_id': user_id, 'p_items': [
+                {'id': product['id'], 'quantity': item['quantity'], 'price_per_kg': item['price_per_kg']}
+                for product, item in batch]}).execute()
+        transactions = [import_transaction(item, item['name']) for item in creates] + \
+                       [import_transaction(item, product['name']) for product, item in updates]
+        for batch in batches(transactions):
+            service_supabase.table('inventory_transactions').insert([
+                {**transaction, 'id': str(uuid.uuid4()), 'user_id': user_id, 'created_at': now}
+                for transaction in batch]).execute()
+        return len(creates), len(updates)
+
+    created, updated = await asyncio.to_thread(write)
+    if created or updated:
+        bump_inventory_version(user_id)
+        await change_hub.publish(user_id, "product", "resync", "*")
+    return created, updated
+
+@app.post("/products/import")
+async def import_products_endpoint(request: Request, format: Optional[Literal["csv", "ndjson"]] = None,
+                                   dry_run: bool = False, current_user: dict = Depends(get_current_user)):
+    """Import products from a streamed CSV or JSON-lines upload"""
+    if not supabase:
+        raise HTTPException(status_code=500, detail="Database not available")
+    try:
+        parsed = await parse_upload(request.stream(), upload_format(request.headers.get('content-type'), format))
+    except ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        created, updated = await import_products(current_user['id'], parsed, dry_run)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Import error: {str(e)}")
+    return import_summary(parsed, created, updated, dry_run)
+
+@app.get("/products/changes")
+async def get_product_changes(since: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """Get products changed or deleted since a sync cursor (full snapshot without one)"""
+    since_ts = decode_cursor(since) if since else None
+    user_id = current_user['id']
+    try:
+        service_supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+        products = service_supabase.table('products').select('*').eq('user_id', user_id)
+        if since_ts is None or cursor_expired(since_ts):
+            return json_response(build_changes(products.execute().data, [], None, reset=True))
+
+        window_start = read_window_start(since_ts).isoformat()
+        changed = products.gt('updated_at', window_start).execute().data
+        tombstones = service_supabase.table('product_tombstones').select('product_id,product_name,deleted_at') \
+            .eq('user_id', user_id).gt('deleted_at', window_start).execute().data
+        deleted = [{"id": t['product_id'], "name": t['product_name'], "deleted_at": t['deleted_at']} for t in tombstones]
+        return json_response(build_changes(changed, deleted, since_ts, reset=False))
+    except Exception as e:
+        return {"success": False, "message": str(e)}
+
+@app.get("/products/expiring")
+async def get_expiring(days: float = 7, current_user: dict = Depends(get_current_user)):
+    """Get products expiring within the next `days` days"""
+    try:
+        items = await get_expiring_products(current_user['id'], days)
+        return {"success": True, "days": days, "products": items, "count": len(items)}
+    except Exception as e:
+        return {"success": False, "message": str(e)}
+
+async def apply_stock_transaction(op: SyncOperation, user_id: str):
+    """Apply an offline-recorded stock movement"""
+    if not op.product_name or op.transaction_type is None or op.quantity_change is None:
+        raise HTTPException(status_code=400, detail="Transaction needs product_name, transaction_type and quantity_change")
+    notes = f"offline sync {op.client_op_id}"
+    recorded_at = recorded_time(op.recorded_at)
+
+    if op.transaction_type == "add":
+        existing_product = await find_user_product(user_id, op.product_name)
+        if existing_product is None:
+            if op.price_per_kg is None:
+                raise HTTPException(status_code=400, detail=f"Price needed to add new product {op.product_name}")
+            product = Product(name=op.product_name, quantity=op.quantity_change, price_per_kg=op.price_per_kg)
+            await save_product(product, user_id, created_at=recorded_at)
+        elif write_behind is not None:
+            await buffer_restock(user_id, existing_product, op.quantity_change, op.price_per_kg, notes, recorded_at)
+        else:
+            updates = {'quantity': float(existing_product['quantity']) + op.quantity_change}
+            if op.price_per_kg is not None:
+                updates['price_per_kg'] = op.price_per_kg
+            await update_user_product(user_id, existing_product['id'], updates)
+            await log_transaction(user_id, existing_product['name'], 'add', op.quantity_change,
+                                  op.price_per_kg, notes, created_at=recorded_at)
+        return {"success": True, "message": f"Added {op.quantity_change} kg of {op.product_name}"}
+
+    sale = await sell_product(user_id, op.product_name, op.quantity_change, notes=notes, clamp=True,
+                              created_at=recorded_at)
+    if sale['status'] == 'not_found':
+        raise HTTPException(status_code=404, detail="Product not found")
+    return {"success": True, "message": f"Removed {op.quantity_change} kg of {op.product_name}"}
+
+# Applied sync operations live in the database so retries are caught by any worker
+applied_sync_ops = (SupabaseAppliedOperations(lambda: create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY))
+                    if supabase else AppliedOperations())
+
+@app.post("/sync")
+async def sync_operations(request: SyncRequest, current_user: dict = Depends(get_current_user)):
+    """Apply offline-recorded voice commands and transactions in order, at most once each"""
+    user_id = current_user['id']
+
+    async def apply(op: SyncOperation):
+        if op.type == "voice":
+            if not op.command:
+                raise HTTPException(status_code=400, detail="Voice operation needs a command")
+            return await execute_voice_action(process_voice_command(op.command, op.language or "en"), user_id)
+        return await apply_stock_transaction(op, user_id)
+
+    return await apply_operations(user_id, request.operations, applied_sync_ops, apply)
+
 @app.get("/products/{product_name}")
 async def get_product(product_name: str, current_user: dict = Depends(get_current_user)):
     """Get product by name"""
@@ -794,16 +1270,35 @@ async def get_product(product_name: str, current_user: dict = Depends(get_curren
 async def get_product_analytics_endpoint(product_name: str, current_user: dict = Depends(get_current_user)):
     """Get analytics for a specific product"""
     try:
-        analytics = await get_product_analytics(current_user['id'], product_name)
+        user_id = current_user['id']
+        analytics = await analytics_flights.do(
+            analytics_key(user_id, "product", product_name.lower()),
+            lambda: get_product_analytics(user_id, product_name))
         return {"success": True, "analytics": analytics}
     except Exception as e:
         return {"success": False, "message": str(e)}
 
+@app.get("/analytics/predictions")
+async def get_all_predictions(method: Literal["ses", "window"] = FORECAST_METHOD,
+                              current_user: dict = Depends(get_current_user)):
+    """Get depletion forecasts with confidence intervals for all products"""
+    try:
+        user_id = current_user['id']
+        predictions = await analytics_flights.do(
+            analytics_key(user_id, "predictions", method),
+            lambda: forecast_user_products(user_id, method))
+        return json_response({"success": True, "method": method, "predictions": predictions})
+    except Exception as e:
+        return {"success": False, "message": str(e)}
+
 @app.get("/analytics/predictions/{product_name}")
 async def get_product_prediction(product_name: str, days_ahead: int = 7, current_user: dict = Depends(get_current_user)):
     """Get stock prediction for a product"""
     try:
-        prediction = await predict_stock_depletion(current_user['id'], product_name, days_ahead)
+        user_id = current_user['id']
+        prediction = await analytics_flights.do(
+            analytics_key(user_id, "prediction", product_name.lower(), days_ahead),
+            lambda: predict_stock_depletion(user_id, product_name, days_ahead))
         return {"success": True, "prediction": prediction}
     except Exception as e:
         return {"success": False, "message": str(e)}
@@ -812,52 +1307,248 @@ async def get_product_prediction(product_name: str, days_ahead: int = 7, current
 async def get_alerts(current_user: dict = Depends(get_current_user)):
     """Get low stock alerts"""
     try:
-        alerts = await get_low_stock_alerts(current_user['id'])
+        user_id = current_user['id']
+        alerts = await analytics_flights.do(analytics_key(user_id, "alerts"),
+                                            lambda: get_low_stock_alerts(user_id))
         return {"success": True, "alerts": alerts}
     except Exception as e:
         return {"success": False, "message": str(e)}
 
+@app.get("/analytics/valuation")
+async def get_valuation(request: Request, user_id: str = Depends(get_token_user_id)):
+    """Inventory value and cost of goods sold, FIFO and weighted average"""
+    if not supabase:
+        raise HTTPException(status_code=500, detail="Database not available")
+    etag = inventory_etag(user_id, "valuation")
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    await get_current_user(user_id)
+    service_supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    rows = fetch_all_rows(service_supabase.table('lot_valuations').select('*')
+                          .eq('user_id', user_id).order('product_name'))
+    return etag_json_response(request, {"success": True, "valuation": valuation_summary(rows)}, etag)
+
+@app.get("/analytics/lots/{product_name}")
+async def get_open_lots(product_name: str, current_user: dict = Depends(get_current_user)):
+    """Open lots of a product, oldest (next to be consumed) first"""
+    if not supabase:
+        raise HTTPException(status_code=500, detail="Database not available")
+    service_supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    lots = fetch_all_rows(service_supabase.table('inventory_lots').select('*')
+                          .eq('user_id', current_user['id']).eq('product_name', product_name.lower())
+                          .gt('quantity_remaining', 0).order('seq'))
+    return {"success": True, "product_name": product_name.lower(), "lots": lots}
+
+@app.get("/analytics/trends")
+async def get_price_trends(request: Request, product_name: Optional[str] = None,
+                           user_id: str = Depends(get_token_user_id)):
+    """Price trends (slope, R², p-value) for every product, or for one, from price_stats"""
+    if not supabase:
+        raise HTTPException(status_code=500, detail="Database not available")
+    etag = inventory_etag(user_id, f"trends-{(product_name or '').lower()}")
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    await get_current_user(user_id)
+    service_supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    query = service_supabase.table('price_stats').select('*').eq('user_id', user_id)
+    if product_name:
+        query = query.eq('product_name', product_name.lower())
+    summary = trend_summary(fetch_all_rows(query.order('product_name')))
+    return etag_json_response(request, {"success": True, **summary}, etag)
+
+def build_reorder_plan(user_id: str):
+    """Load demand history and compute the reorder plan (runs in a worker thread)"""
+    products, transactions = load_demand_history(user_id, REORDER_HISTORY_DAYS,
+                                                 'id,name,quantity,minimum_stock,price_per_kg')
+    if write_behind is not None:
+        products = write_behind.overlay(user_id, products)
+    return reorder_plan(products, transactions)
+
+@app.get("/analytics/reorder-plan")
+async def get_reorder_plan(request: Request, user_id: str = Depends(get_token_user_id)):
+    """Reorder point, safety stock and economic order quantity for every product"""
+    if not supabase:
+        raise HTTPException(status_code=500, detail="Database not available")
+    etag = inventory_etag(user_id, "reorder-plan")
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    await get_current_user(user_id)
+    plan = await reorder_flights.do(analytics_key(user_id, "reorder-plan"),
+                                    lambda: asyncio.to_thread(build_reorder_plan, user_id))
+    return etag_json_response(request, {"success": True, "plan": plan}, etag)
+
+def build_stockout_risk(user_id: str, days: int):
+    """Load demand history and simulate stockouts over the next days (runs in a worker thread)"""
+    products, transactions = load_demand_history(user_id, STOCKOUT_HISTORY_DAYS, 'id,name,quantity,minimum_stock')
+    if write_behind is not None:
+        products = write_behind.overlay(user_id, products)
+    return stockout_risk(products, transactions, days)
+
+@app.get("/analytics/stockout-risk")
+async def get_stockout_risk(request: Request, days: int = STOCKOUT_HORIZON_DAYS,
+                            user_id: str = Depends(get_token_user_id)):
+    """Chance of running out within the next days for every product, riskiest first"""
+    if not supabase:
+        raise HTTPException(status_code=500, detail="Database not available")
+    if not 1 <= days <= STOCKOUT_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"days must be between 1 and {STOCKOUT_MAX_DAYS}")
+    etag = inventory_etag(user_id, f"stockout-risk-{days}")
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    await get_current_user(user_id)
+    risk = await stockout_flights.do(analytics_key(user_id, "stockout-risk", days),
+                                     lambda: asyncio.to_thread(build_stockout_risk, user_id, days))
+    return etag_json_response(request, {"success": True, "risk": risk}, etag)
+
+async def build_dashboard(user_id: str):
+    """Assemble dashboard analytics for a user"""
+    # Get all products
+    products = await get_user_products(user_id)
+    
+    # Get low stock alerts
+    alerts = await get_low_stock_alerts(user_id)
+    
+    # Calculate summary statistics
+    total_products = len(products)
+    total_value = sum(p['quantity'] * p['price_per_kg'] for p in products)
+    low_stock_count = alerts['count']
+    
+    # Get recent transactions
+    if supabase:
+        recent_transactions = supabase.table('inventory_transactions').select('*').eq('user_id', user_id).order('created_at', desc=True).limit(10).execute()
+        transactions = recent_transactions.data
+    else:
+        transactions = []
+    
+    return {
+        "success": True,
+        "dashboard": {
+            "summary": {
+                "total_products": total_products,
+                "total_inventory_value": total_value,
+                "low_stock_alerts": low_stock_count,
+                "recent_transactions": len(transactions)
+            },
+            "products": products,
+            "alerts": alerts,
+            "recent_transactions": transactions
+        }
+    }
+
 @app.get("/analytics/dashboard")
-async def get_dashboard_data(current_user: dict = Depends(get_current_user)):
+async def get_dashboard_data(request: Request, user_id: str = Depends(get_token_user_id)):
     """Get dashboard analytics data"""
+    # A run moves the generation in the ETag, so the 304 check need not wait for one
+    etag = inventory_etag(user_id, f"dashboard.{alert_scheduler.generation(user_id)}")
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    await get_current_user(user_id)
+    await alert_scheduler.ensure(user_id)
+    etag = inventory_etag(user_id, f"dashboard.{alert_scheduler.generation(user_id)}")
     try:
-        user_id = current_user['id']
-        
-        # Get all products
-        products = await get_user_products(user_id)
-        
-        # Get low stock alerts
-        alerts = await get_low_stock_alerts(user_id)
-        
-        # Calculate summary statistics
-        total_products = len(products)
-        total_value = sum(p['quantity'] * p['price_per_kg'] for p in products)
-        low_stock_count = alerts['count']
-        
-        # Get recent transactions
-        if supabase:
-            recent_transactions = supabase.table('inventory_transactions').select('*').eq('user_id', user_id).order('created_at', desc=True).limit(10).execute()
-            transactions = recent_transactions.data
-        else:
-            transactions = []
-        
-        return {
-            "success": True,
-            "dashboard": {
-                "summary": {
-                    "total_products": total_products,
-                    "total_inventory_value": total_value,
-                    "low_stock_alerts": low_stock_count,
-                    "recent_transactions": len(transactions)
-                },
-                "products": products,
-                "alerts": alerts,
-                "recent_transactions": transactions
-            }
-        }
+        dashboard = await analytics_flights.do(analytics_key(user_id, "dashboard"),
+                                               lambda: build_dashboard(user_id))
+        return etag_json_response(request, dashboard, etag)
     except Exception as e:
         return {"success": False, "message": str(e)}
 
+# Export routes
+@app.get("/export/{resource}")
+async def export_rows(resource: Literal["products", "transactions", "voice_commands"],
+                      format: Literal["ndjson", "csv"] = "ndjson",
+                      current_user: dict = Depends(get_current_user)):
+    """Stream all of the user's rows of a table as NDJSON or CSV"""
+    if not supabase:
+        raise HTTPException(status_code=500, detail="Database not available")
+    table, columns = EXPORT_RESOURCES[resource]
+    fetch_page = supabase_page_fetcher(create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY),
+                                       table, current_user['id'], columns)
+    pages = keyset_pages(fetch_page)
+    if resource == "transactions" and transaction_archive:
+        # Archived rows are all older than the database's, so they come first
+        pages = itertools.chain(transaction_archive.pages(current_user['id']), pages)
+    return export_response(pages, format, columns, resource)
+
+# Realtime change stream
+@app.get("/changes/stream")
+async def stream_changes(request: Request, current_user: dict = Depends(get_current_user)):
+    """Stream product and transaction deltas as server-sent events"""
+    return StreamingResponse(sse_events(change_hub, current_user['id'], request), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.websocket("/ws/changes")
+async def websocket_changes(websocket: WebSocket, token: str):
+    """Stream product and transaction deltas over a WebSocket (JWT in ?token=)"""
+    try:
+        user_id = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM]).get("sub")
+    except jwt.PyJWTError:
+        user_id = None
+    if not user_id:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    await serve_websocket(change_hub, websocket, user_id)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Expose metrics in the Prometheus text format"""
+    return PlainTextResponse(render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+# Background loops, kept so shutdown can cancel them
+background_tasks: List[asyncio.Task] = []
+
+def start_background(coro):
+    """Run a background loop until shutdown"""
+    background_tasks.append(asyncio.create_task(coro))
+
+async def stop_background():
+    """Cancel the background loops and wait for them to finish"""
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+
+@app.on_event("startup")
+async def startup_event():
+    """Start background monitors"""
+    require_shared_versions(change_hub.bus.shared)
+    start_background(monitor_event_loop_lag())
+    await change_hub.start()
+    if idempotency_store.durable is not None:
+        start_background(purge_idempotency_keys())
+    if supabase and ALERT_SCHEDULER:
+        alert_scheduler.start()
+    if supabase and EXPIRY_INDEX:
+        start_background(expiry_sweeps())
+    if write_behind is not None:
+        recovered = write_behind.replay()
+        if recovered:
+            logger.info("Replaying %d journaled stock changes", recovered)
+        write_behind.start()
+
+async def purge_idempotency_keys():
+    """Drop expired idempotency records once an hour"""
+    while True:
+        try:
+            await asyncio.to_thread(idempotency_store.durable.purge_expired)
+        except Exception as e:
+            logger.warning("Failed to purge idempotency keys: %s", e)
+        await asyncio.sleep(3600)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background loops and the alert scheduler, write buffered stock changes and release the change bus"""
+    await stop_background()
+    await alert_scheduler.stop()
+    if write_behind is not None:
+        await write_behind.stop()
+    await change_hub.stop()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,408 @@
+import asyncio
+import fcntl
+import glob
+import itertools
+import json
+import os
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app_logging import get_logger
+from metrics import WRITE_BEHIND_FLUSHES, WRITE_BEHIND_OPS, WRITE_BEHIND_PENDING
+
+logger = get_logger("write_behind")
+
+# --- Write-Behind Stock Counters ---
+# A few hot products take most stock writes, each one an UPDATE of the
+# product plus an INSERT of its transaction. With WRITE_BEHIND=1, sales and
+# restocks of existing products are buffered in memory as quantity deltas
+# per (user, product). At most every WRITE_BEHIND_FLUSH_MS, or sooner once
+# WRITE_BEHIND_MAX_OPS changes are waiting, each user's changes go out as
+# one batch: one merged delta per product and every transaction row,
+# written in a single call (apply_stock_deltas in supabase_schema.sql).
+#
+# Reads stay exact. Stored rows are combined with the pending deltas, and
+# a read that overlapped a flush is retried, so a batch is never counted
+# twice or missed.
+#
+# Every change is appended to a local journal before it is acknowledged.
+# Each batch is journaled under an id before it is written, and the id is
+# committed once it is written. After a crash, replay() rebuilds the buffer:
+# uncommitted batches are written again under their old ids, and the
+# database skips ids it has already applied. Changes are therefore written
+# exactly once. After every flush the journal is rewritten to hold only
+# the changes still pending, so it stays small under steady sales.
+#
+# Each worker process owns one journal: it claims the first slot
+# (WRITE_BEHIND_JOURNAL.0, .1, ...) whose lock no live process holds. A
+# restarted worker replays the slot it claimed, plus slots left behind by
+# workers that are gone; a journal that a live worker holds is never read.
+#
+# Buffered deltas live in one process. Sales still refuse to oversell
+# within that process, and across workers the flush clamps stock at zero.
+#
+# WRITE_BEHIND           buffer stock changes (default 0: write each change at once)
+# WRITE_BEHIND_FLUSH_MS  longest a change waits before it is written (default 250)
+# WRITE_BEHIND_MAX_OPS   flush early once this many changes are waiting (default 500)
+# WRITE_BEHIND_JOURNAL   journal path; each worker appends .N (default write_behind.journal)
+# WRITE_BEHIND_FSYNC     fsync the journal on every append; otherwise it survives
+#                        a process crash but not a power cut (default 0)
+
+WRITE_BEHIND = os.getenv('WRITE_BEHIND', '0') == '1'
+WRITE_BEHIND_FLUSH_MS = float(os.getenv('WRITE_BEHIND_FLUSH_MS', '250'))
+WRITE_BEHIND_MAX_OPS = int(os.getenv('WRITE_BEHIND_MAX_OPS', '500'))
+WRITE_BEHIND_JOURNAL = os.getenv('WRITE_BEHIND_JOURNAL', 'write_behind.journal')
+WRITE_BEHIND_FSYNC = os.getenv('WRITE_BEHIND_FSYNC', '0') == '1'
+
+EPSILON = 1e-9
+
+FlushFn = Callable[[str, str, List[dict], List[dict]], Awaitable[None]]
+
+
+class DeltaJournal:
+    """Append-only JSON-lines log of buffered changes and batch outcomes, one file per process.
+
+    The file is claimed lazily, under a lock held until close(), so two
+    workers never share a journal.
+    """
+
+    def __init__(self, path: str = WRITE_BEHIND_JOURNAL, fsync: bool = WRITE_BEHIND_FSYNC):
+        self.base = path
+        self.path: Optional[str] = None
+        self.fsync = fsync
+        self._file = None
+        self._lock = None
+        self._adopted: List[Tuple[str, object]] = []
+
+    @staticmethod
+    def _try_lock(path: str):
+        # Lock files are never deleted: a new inode under the same name would let two processes claim one slot
+        handle = open(path + '.lock', 'a')
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return None
+        return handle
+
+    def _claim(self):
+        if self._lock is not None:
+            return
+        for n in itertools.count():
+            lock = self._try_lock(f"{self.base}.{n}")
+            if lock is not None:
+                self.path, self._lock = f"{self.base}.{n}", lock
+                return
+
+    def _append(self, path: str, records: List[dict]):
+        with open(path, 'a', encoding='utf-8') as f:
+            f.writelines(json.dumps(record, default=str) + '\n' for record in records)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    def write(self, record: dict):
+        if self._file is None:
+            self._claim()
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(json.dumps(record, default=str) + '\n')
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    @staticmethod
+    def _read(path: str) -> List[dict]:
+        if not os.path.exists(path):
+            return []
+        records = []
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break  # torn last line from a crash mid-append
+        return records
+
+    def read(self) -> List[dict]:
+        self._claim()
+        return self._read(self.path)
+
+    def orphans(self) -> List[Tuple[str, List[dict]]]:
+        """Slots left by processes that are gone, locked by this one until discard_orphans()."""
+        self._claim()
+        found = []
+        for path in sorted(glob.glob(glob.escape(self.base) + '.*')):
+            if path == self.path or not path[len(self.base) + 1:].isdigit():
+                continue
+            lock = self._try_lock(path)
+            if lock is None:
+                continue  # a live worker owns it
+            self._adopted.append((path, lock))
+            found.append((path, self._read(path)))
+        return found
+
+    def extend(self, path: str, records: List[dict]):
+        """Appends records to an adopted slot."""
+        self._append(path, records)
+
+    def discard_orphans(self):
+        """Deletes adopted slots once their records are in this process's journal."""
+        for path, lock in self._adopted:
+            os.remove(path)
+            lock.close()
+        self._adopted = []
+
+    def rewrite(self, records: List[dict]):
+        """Replaces the journal with records, atomically."""
+        self._claim()
+        self._close_file()
+        tmp = self.path + '.tmp'
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        self._append(tmp, records)
+        os.replace(tmp, self.path)
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        """Closes the file and gives up the slot."""
+        self._close_file()
+        for _, lock in self._adopted:
+            lock.close()
+        self._adopted = []
+        if self._lock is not None:
+            self._lock.close()
+            self._lock = None
+
+
+def merge_ops(ops: List[dict]) -> List[dict]:
+    """One item per product: summed delta and the last price given."""
+    merged: Dict[str, dict] = {}
+    for op in ops:
+        item = merged.setdefault(op['product_id'], {'id': op['product_id'], 'delta': 0.0, 'price_per_kg': None})
+        item['delta'] += op['delta']
+        if op.get('price_per_kg') is not None:
+            item['price_per_kg'] = op['price_per_kg']
+    return list(merged.values())
+
+
+class WriteBehindBuffer:
+    """Journaled per-(user, product) quantity deltas, flushed as one batch per user."""
+
+    def __init__(self, flush: FlushFn, journal: Optional[DeltaJournal] = None,
+                 flush_ms: float = WRITE_BEHIND_FLUSH_MS, max_ops: int = WRITE_BEHIND_MAX_OPS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.flush_fn = flush
+        self.journal = journal
+        self.flush_s = flush_ms / 1000
+        self.max_ops = max_ops
+        self.clock = clock
+        self._ops: Dict[str, List[dict]] = {}  # not yet in a batch, per user
+        self._batches: List[dict] = []  # journaled batches not confirmed written
+        self._deltas: Dict[Tuple[str, str], float] = {}
+        self._count = 0
+        self._oldest: Optional[float] = None
+        self._seq = 0
+        self._epoch = 0  # bumped when a write starts; reads retry if it moved
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._kick: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        return self._count
+
+    def pending_delta(self, user_id: str, product_id: str) -> float:
+        return self._deltas.get((user_id, str(product_id)), 0.0)
+
+    def add(self, user_id: str, product_id: str, product_name: str, delta: float,
+            transaction: dict, price_per_kg: Optional[float] = None):
+        """Buffers a stock change and its transaction row; journaled before it returns."""
+        self._seq += 1
+        op = {"seq": self._seq, "user_id": user_id, "product_id": str(product_id), "product_name": product_name,
+              "delta": delta, "price_per_kg": price_per_kg, "transaction": transaction}
+        if self.journal is not None:
+            self.journal.write({"op": op})
+        self._buffer(op)
+        WRITE_BEHIND_OPS.inc()
+        if self._count >= self.max_ops and (self._kick is None or self._kick.done()):
+            try:
+                self._kick = asyncio.get_running_loop().create_task(self.flush())
+            except RuntimeError:
+                pass  # no running loop: the next due() check picks it up
+
+    def _buffer(self, op: dict, queue: bool = True):
+        if queue:
+            self._ops.setdefault(op["user_id"], []).append(op)
+        key = (op["user_id"], op["product_id"])
+        self._deltas[key] = self._deltas.get(key, 0.0) + op["delta"]
+        self._count += 1
+        if self._oldest is None:
+            self._oldest = self.clock()
+        WRITE_BEHIND_PENDING.set(self._count)
+
+    def overlay(self, user_id: str, rows: List[dict]) -> List[dict]:
+        """Stored product rows with this process's pending deltas applied."""
+        result = []
+        for row in rows:
+            delta = self._deltas.get((user_id, str(row.get('id'))))
+            result.append({**row, 'quantity': max(0.0, float(row['quantity']) + delta)} if delta else row)
+        return result
+
+    async def read(self, user_id: str, fetch: Callable[[], Awaitable[List[dict]]]) -> List[dict]:
+        """Fetches rows and applies pending deltas, retrying if a batch was written meanwhile."""
+        while True:
+            await self._idle.wait()
+            epoch = self._epoch
+            rows = await fetch()
+            if self._idle.is_set() and self._epoch == epoch:
+                return self.overlay(user_id, rows)
+
+    def due(self, now: Optional[float] = None) -> bool:
+        now = self.clock() if now is None else now
+        return (self._count >= self.max_ops or bool(self._batches)
+                or (self._oldest is not None and now - self._oldest >= self.flush_s))
+
+    def _seal(self):
+        for user_id, ops in self._ops.items():
+            batch = {"batch_id": str(uuid.uuid4()), "user_id": user_id, "seqs": [op["seq"] for op in ops]}
+            if self.journal is not None:
+                self.journal.write({"batch": batch})
+            self._batches.append({**batch, "ops": ops})
+        self._ops = {}
+        self._oldest = None
+
+    async def flush(self) -> int:
+        """Writes every buffered change; returns the batches written. Failed batches stay for a retry."""
+        async with self._lock:
+            self._seal()
+            written, failed = 0, []
+            for batch in self._batches:
+                self._epoch += 1
+                self._idle.clear()
+                try:
+                    await self.flush_fn(batch["batch_id"], batch["user_id"], merge_ops(batch["ops"]),
+                                        [op["transaction"] for op in batch["ops"]])
+                except Exception as e:
+                    logger.warning("Write-behind batch %s failed, will retry: %s", batch["batch_id"], e)
+                    WRITE_BEHIND_FLUSHES.inc("error")
+                    failed.append(batch)
+                    self._idle.set()
+                    continue
+                if self.journal is not None:
+                    self.journal.write({"committed": batch["batch_id"]})
+                self._settle(batch["ops"])
+                self._idle.set()
+                WRITE_BEHIND_FLUSHES.inc("ok")
+                written += 1
+            self._batches = failed
+            if self.journal is not None:
+                self.journal.rewrite(self._records())
+            WRITE_BEHIND_PENDING.set(self._count)
+            return written
+
+    def _settle(self, ops: List[dict]):
+        for op in ops:
+            key = (op["user_id"], op["product_id"])
+            left = self._deltas.get(key, 0.0) - op["delta"]
+            if abs(left) < EPSILON:
+                self._deltas.pop(key, None)
+            else:
+                self._deltas[key] = left
+        self._count -= len(ops)
+
+    @staticmethod
+    def _recover(records: List[dict]) -> Tuple[List[dict], List[dict]]:
+        """Uncommitted batches, with their ops, and the ops not yet in a batch."""
+        ops: Dict[int, dict] = {}
+        batches: Dict[str, dict] = {}
+        committed = set()
+        for record in records:
+            if "op" in record:
+                ops[record["op"]["seq"]] = record["op"]
+            elif "batch" in record:
+                batches[record["batch"]["batch_id"]] = record["batch"]
+            elif "committed" in record:
+                committed.add(record["committed"])
+        pending = []
+        for batch_id, batch in batches.items():
+            batch_ops = [ops.pop(seq) for seq in batch["seqs"] if seq in ops]
+            if batch_id not in committed:
+                pending.append({**batch, "ops": batch_ops})  # same id: the database skips it if applied
+        return pending, list(ops.values())
+
+    def _renumber(self, op: dict) -> dict:
+        self._seq += 1
+        return {**op, "seq": self._seq}
+
+    def _records(self) -> List[dict]:
+        """The journal contents that describe the buffer as it stands."""
+        records = []
+        for batch in self._batches:
+            records.extend({"op": op} for op in batch["ops"])
+            records.append({"batch": {"batch_id": batch["batch_id"], "user_id": batch["user_id"], "seqs": batch["seqs"]}})
+        for ops in self._ops.values():
+            records.extend({"op": op} for op in ops)
+        return records
+
+    def replay(self) -> int:
+        """Rebuilds the buffer from this process's journal and orphaned ones; returns the changes recovered."""
+        if self.journal is None:
+            return 0
+        batches, loose = self._recover(self.journal.read())
+        for path, records in self.journal.orphans():
+            orphan_batches, orphan_loose = self._recover(records)
+            by_user: Dict[str, List[dict]] = {}
+            for op in orphan_loose:
+                by_user.setdefault(op["user_id"], []).append(op)
+            sealed = [{"batch_id": str(uuid.uuid4()), "user_id": user_id, "seqs": [op["seq"] for op in ops], "ops": ops}
+                      for user_id, ops in by_user.items()]
+            # Sealed in the orphan first: if we crash before it is deleted, both copies share a batch id
+            self.journal.extend(path, [{"batch": {k: v for k, v in batch.items() if k != "ops"}} for batch in sealed])
+            batches += orphan_batches + sealed
+        recovered = 0
+        for batch in batches:
+            ops = [self._renumber(op) for op in batch["ops"]]
+            for op in ops:
+                self._buffer(op, queue=False)
+            self._batches.append({**batch, "seqs": [op["seq"] for op in ops], "ops": ops})
+            recovered += len(ops)
+        for op in loose:
+            self._buffer(self._renumber(op))
+            recovered += 1
+        self.journal.rewrite(self._records())
+        self.journal.discard_orphans()
+        return recovered
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.flush_s / 2)
+            if self.due():
+                try:
+                    await self.flush()
+                except Exception as e:
+                    logger.warning("Write-behind flush failed: %s", e)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Stops the loop and writes what is left."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._count:
+            await self.flush()
+        if self.journal is not None:
+            self.journal.close()
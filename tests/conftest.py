@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The backend is a flat set of modules (server.py, llm_batcher.py, ...),
+# imported the same way api/index.py does it.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
@@ -0,0 +1,179 @@
+import asyncio
+import random
+from datetime import datetime, timezone
+
+from fastapi.testclient import TestClient
+
+import alert_scheduler
+import change_stream
+import conditional
+import metrics
+import server
+
+NOW = datetime(2025, 3, 10, tzinfo=timezone.utc)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _scheduler(versions, computed, **kwargs):
+    async def compute(user_id):
+        computed.append(user_id)
+        return [{"product_name": "Onion", "alert_type": "low_stock", "alert_message": "low",
+                 "details": {"product": {"name": "Onion"}, "prediction": {}}}]
+
+    options = dict(debounce=2, jitter=5, refresh=3600, concurrency=8, clock=FakeClock(), rng=random.Random(3))
+    options.update(kwargs)
+    return alert_scheduler.AlertScheduler(compute, alert_scheduler.MemoryAlertStore(), versions=versions, **options)
+
+
+def test_build_alerts_covers_low_stock_reorder_and_expiry():
+    products = [
+        {"name": "Onion", "quantity": 0.5, "minimum_stock": 1.0},
+        {"name": "Tomato", "quantity": 10, "minimum_stock": 1.0, "expiry_date": "2025-03-12"},
+        {"name": "Rice", "quantity": 50, "minimum_stock": 5.0, "expiry_date": "2025-06-01"},
+    ]
+    forecasts = [
+        {"product_name": "Onion", "consumption_rate_per_day": 0.5, "days_until_depletion": 0.0},
+        {"product_name": "tomato", "consumption_rate_per_day": 2.0, "days_until_depletion": 4.5},
+        {"product_name": "Rice", "consumption_rate_per_day": 1.0, "days_until_depletion": 45.0},
+    ]
+    alerts = alert_scheduler.build_alerts(products, forecasts, now=NOW)
+    by_key = {(a["product_name"], a["alert_type"]): a for a in alerts}
+
+    assert set(by_key) == {("Onion", "low_stock"), ("Tomato", "reorder_suggestion"), ("Tomato", "expiry_warning")}
+    low = by_key[("Onion", "low_stock")]["details"]
+    assert low["product"]["name"] == "Onion"
+    assert low["prediction"]["recommendation"]["urgency"] == "HIGH"
+    reorder = by_key[("Tomato", "reorder_suggestion")]["details"]["recommendation"]
+    assert reorder["urgency"] == "MEDIUM" and reorder["suggested_reorder_quantity"] == 28.0
+    assert by_key[("Tomato", "expiry_warning")]["details"]["days_left"] == 2
+
+
+def test_only_users_whose_inventory_changed_are_recomputed():
+    versions = conditional.InventoryVersions()
+    computed = []
+    scheduler = _scheduler(versions, computed)
+    clock = scheduler.clock
+    first_runs = {}
+
+    async def scenario():
+        for user in ("a", "b", "c"):
+            versions.bump(user)
+        clock.now += 10
+        assert await scheduler.tick() == 0  # changes noticed, still debouncing
+        clock.now += 10
+        assert await scheduler.tick() == 3
+        first_runs.update(a=scheduler.generation("a"), b=scheduler.generation("b"))
+
+        versions.bump("b")
+        versions.bump("b")
+        clock.now += 10
+        await scheduler.tick()
+        clock.now += 10
+        await scheduler.tick()
+
+    asyncio.run(scenario())
+    assert sorted(computed[:3]) == ["a", "b", "c"]
+    assert computed[3:] == ["b"]
+    assert scheduler.store.list("b")[0]["alert_type"] == "low_stock"
+    assert scheduler.generation("b") > first_runs["b"] and scheduler.generation("a") == first_runs["a"]
+
+
+def test_run_generations_are_shared_through_the_change_bus():
+    bus = change_stream.InProcessBus()
+    scheduler_worker, other_worker = change_stream.ChangeHub(bus), change_stream.ChangeHub(bus)
+    runner = _scheduler(conditional.InventoryVersions(), [],
+                        announce=lambda user_id, generation: scheduler_worker.publish(
+                            user_id, "alerts", "refresh", user_id, {"generation": generation}))
+    reader = _scheduler(conditional.InventoryVersions(), [])
+    other_worker.add_listener(reader.apply_change)
+    version = conditional.INVENTORY_VERSIONS.get("shop")
+
+    async def scenario():
+        await runner.run_user("shop")
+        await runner.run_user("shop")
+        await reader.ensure("shop")
+
+    asyncio.run(scenario())
+    assert reader.generation("shop") == runner.generation("shop") > 0
+    assert reader.store.list("shop") == []  # the announced run was enough; nothing recomputed here
+    assert conditional.INVENTORY_VERSIONS.get("shop") == version  # an alert run is not an inventory write
+
+
+def test_seeded_users_are_spread_over_the_refresh_interval():
+    scheduler = _scheduler(conditional.InventoryVersions(), [], refresh=600)
+    scheduler.seed([f"user-{i}" for i in range(200)], now=0)
+    due = sorted(scheduler.due(f"user-{i}") for i in range(200))
+    assert due[0] >= 0 and due[-1] <= 600
+    # roughly uniform: every 60 s slot gets some tenants
+    assert all(any(slot * 60 <= d < (slot + 1) * 60 for d in due) for slot in range(10))
+
+
+def test_failed_runs_retry_with_backoff_and_are_counted():
+    versions = conditional.InventoryVersions()
+    attempts = []
+
+    async def compute(user_id):
+        attempts.append(user_id)
+        raise RuntimeError("database down")
+
+    clock = FakeClock()
+    scheduler = alert_scheduler.AlertScheduler(compute, alert_scheduler.MemoryAlertStore(), versions=versions,
+                                               debounce=1, jitter=0, clock=clock, rng=random.Random(1))
+    errors = metrics.ALERT_RUNS.value("error")
+    versions.bump("shop")
+
+    async def scenario():
+        await scheduler.tick()
+        clock.now += 1
+        await scheduler.tick()
+        return scheduler.due("shop") - clock.now
+
+    assert asyncio.run(scenario()) == 2
+    assert attempts == ["shop"]
+    assert metrics.ALERT_RUNS.value("error") == errors + 1
+
+
+def test_alerts_endpoint_reads_precomputed_rows_and_reports_lag():
+    server.products_store.clear()
+    with TestClient(server.app) as client:
+        client.post("/voice-command", json={"command": "add onion 0.5 kg at 30 rupees"})
+        body = client.get("/analytics/alerts").json()
+        assert body["alerts"]["count"] == 1
+        assert body["alerts"]["alerts"][0]["product"]["name"].lower() == "onion"
+        assert body["alerts"]["stock_alerts"][0]["alert_type"] == "low_stock"
+
+        dashboard = client.get("/analytics/dashboard").json()["dashboard"]
+        assert dashboard["summary"]["low_stock_alerts"] == 1
+
+        text = client.get("/metrics").text
+        assert "alert_run_duration_seconds_count" in text
+        assert "alert_scheduler_lag_seconds_bucket" in text
+
+
+def test_without_the_loop_reads_recompute_after_inventory_changes():
+    versions = conditional.InventoryVersions()
+    computed = []
+    scheduler = _scheduler(versions, computed)
+
+    async def scenario():
+        await scheduler.ensure("shop")
+        await scheduler.ensure("shop")
+        versions.bump("shop")
+        await scheduler.ensure("shop")
+
+    asyncio.run(scenario())
+    assert computed == ["shop", "shop"]
+
+
+def test_alerts_payload_counts_trigger_rows_without_details():
+    rows = [{"product_name": "Dal", "alert_type": "low_stock", "alert_message": "Stock for Dal is running low",
+             "details": None, "updated_at": "2025-03-10T00:00:00+00:00"}]
+    payload = alert_scheduler.alerts_payload(rows)
+    assert payload["count"] == 1 and payload["alerts"][0]["product"]["name"] == "Dal"
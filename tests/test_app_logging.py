@@ -0,0 +1,80 @@
+import io
+import json
+import logging
+import queue
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import app_logging
+
+
+def test_records_are_json_with_request_id():
+    stream = io.StringIO()
+    app_logging.configure_logging(level="INFO", fmt="json", stream=stream)
+    logger = app_logging.get_logger("test")
+
+    app = FastAPI()
+    app.add_middleware(app_logging.CorrelationIdMiddleware)
+
+    @app.get("/ping")
+    async def ping():
+        logger.info("pong", extra={"product": "onion"})
+        return {}
+
+    response = TestClient(app).get("/ping", headers={"X-Request-ID": "req-42"})
+    app_logging.shutdown_logging()
+
+    assert response.headers["x-request-id"] == "req-42"
+    entry = json.loads(stream.getvalue().strip().splitlines()[-1])
+    assert entry["msg"] == "pong"
+    assert entry["level"] == "INFO"
+    assert entry["request_id"] == "req-42"
+    assert entry["product"] == "onion"
+
+
+def test_exceptions_keep_their_traceback_in_exc():
+    stream = io.StringIO()
+    app_logging.configure_logging(level="INFO", fmt="json", stream=stream)
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        app_logging.get_logger("test").exception("sale failed for %s", "onion")
+    app_logging.shutdown_logging()
+
+    entry = json.loads(stream.getvalue().strip().splitlines()[-1])
+    assert entry["msg"] == "sale failed for onion"
+    assert "ZeroDivisionError" in entry["exc"]
+
+
+def test_request_id_is_generated_when_missing():
+    app = FastAPI()
+    app.add_middleware(app_logging.CorrelationIdMiddleware)
+    app.get("/ping")(lambda: {})
+
+    first = TestClient(app).get("/ping").headers["x-request-id"]
+    second = TestClient(app).get("/ping").headers["x-request-id"]
+    assert len(first) == 32 and first != second
+
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = app_logging.DroppingQueueHandler(queue.Queue(maxsize=1))
+    before = app_logging.DroppingQueueHandler.dropped
+    record = logging.makeLogRecord({"msg": "x"})
+    handler.enqueue(record)
+    handler.enqueue(record)
+    assert app_logging.DroppingQueueHandler.dropped == before + 1
+
+
+def test_hot_debug_sampling():
+    stream = io.StringIO()
+    app_logging.configure_logging(level="DEBUG", fmt="text", stream=stream)
+    logger = app_logging.get_logger("hot")
+    for _ in range(50):
+        app_logging.hot_debug(logger, "never", rate=0.0)
+    app_logging.hot_debug(logger, "always", rate=1.0)
+    app_logging.shutdown_logging()
+
+    output = stream.getvalue()
+    assert "never" not in output
+    assert "always" in output
@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import archive
+import rollups
+
+
+def _rows(count=300, start=datetime(2023, 1, 20, tzinfo=timezone.utc)):
+    rows = []
+    for i in range(count):
+        kind = "add" if i % 4 == 0 else "remove"
+        rows.append({"id": f"t{i:05d}", "user_id": "u1", "product_name": ["Rice", "rice", "Onion"][i % 3],
+                     "transaction_type": kind, "quantity_change": 1 + i % 5,
+                     "price_per_kg": 30.0 + i % 7 if kind == "add" else None, "notes": "",
+                     "created_at": (start + timedelta(hours=7 * i)).isoformat()})
+    return rows
+
+
+def _by_month(rows):
+    months = {}
+    for row in rows:
+        months.setdefault(row["created_at"][:7], []).append(row)
+    return months
+
+
+@pytest.mark.parametrize("fmt", ["arrow", "parquet"])
+def test_query_through_matches_unarchived_history(tmp_path, fmt):
+    rows = _rows()
+    cutoff = rows[200]["created_at"]
+    store = archive.TransactionArchive(str(tmp_path), fmt)
+    for month, month_rows in _by_month([r for r in rows if r["created_at"] < cutoff]).items():
+        store.write_month("u1", month, month_rows)
+    hot = [r for r in rows if r["created_at"] >= cutoff]
+
+    for product in ("rice", "onion"):
+        hot_buckets = [b for b in rollups.fold(hot) if b["product_name"] == product]
+        combined = rollups.summarize(hot_buckets + store.product_buckets("u1", product), product)
+        everything = rollups.summarize([b for b in rollups.fold(rows) if b["product_name"] == product], product)
+        assert combined == pytest.approx(everything)
+    # A fresh reader takes the summaries from the files' metadata
+    assert archive.TransactionArchive(str(tmp_path), fmt).product_buckets("u1", "RICE") == \
+        store.product_buckets("u1", "rice")
+
+
+def test_stored_summary_matches_columns(tmp_path):
+    store = archive.TransactionArchive(str(tmp_path))
+    store.write_month("u1", "2023-01", _rows(50))
+    (_, path), = store.files("u1")
+    assert store._month_summary(path) == archive.summarize_table(store._read(path))
+
+
+def test_rewriting_a_month_skips_archived_ids(tmp_path):
+    store = archive.TransactionArchive(str(tmp_path))
+    rows = _rows(40)
+    assert store.write_month("u1", "2023-01", rows[:30]) == 30
+    assert store.write_month("u1", "2023-01", rows[20:]) == 10
+    assert [r["id"] for r in store.read_rows("u1")] == [r["id"] for r in rows]
+    assert store.product_buckets("u1", "onion")[0]["transaction_count"] == 13
+
+
+def test_pages_since_returns_iso_rows(tmp_path):
+    store = archive.TransactionArchive(str(tmp_path))
+    rows = _rows(200)
+    for month, month_rows in _by_month(rows).items():
+        store.write_month("u1", month, month_rows)
+    since = datetime(2023, 2, 10, tzinfo=timezone.utc)
+    kept = store.read_rows("u1", since)
+    assert [r["id"] for r in kept] == [r["id"] for r in rows if r["created_at"] >= since.isoformat()]
+    assert isinstance(kept[0]["created_at"], str)
+    assert all(len(page) <= 25 for page in store.pages("u1", page_size=25))
+
+
+def test_archive_user_writes_before_deleting(tmp_path, monkeypatch):
+    rows = _rows(120)
+    before = datetime(2023, 2, 15, tzinfo=timezone.utc)
+    old = [r for r in rows if r["created_at"] < before.isoformat()]
+
+    def fetcher(client, table, user_id, columns, until):
+        assert until == before.isoformat()
+        return lambda after, limit: [r for r in old if after is None or (r["created_at"], r["id"]) > after][:limit]
+
+    store = archive.TransactionArchive(str(tmp_path))
+    deleted = []
+
+    class Delete:
+        def in_(self, column, ids):
+            assert set(ids) <= {r["id"] for r in store.read_rows("u1")}
+            deleted.extend(ids)
+            return self
+
+        def execute(self):
+            return None
+
+    class Client:
+        def table(self, name):
+            assert name == "inventory_transactions"
+            return type("Table", (), {"delete": lambda self: Delete()})()
+
+    monkeypatch.setattr(archive, "supabase_page_fetcher", fetcher)
+    assert archive.archive_user(Client(), store, "u1", before, page_size=16, delete_batch=7) == len(old)
+    assert deleted == [r["id"] for r in old]
+    assert [month for month, _ in store.files("u1")] == ["2023-01", "2023-02"]
+
+
+def test_rejects_unsafe_user_ids(tmp_path):
+    with pytest.raises(ValueError):
+        archive.TransactionArchive(str(tmp_path)).files("../etc")
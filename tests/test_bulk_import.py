@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import bulk_import
+from change_stream import Subscription
+
+
+async def _chunks(body: bytes, size: int):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+def _parse(body: bytes, fmt: str, size: int = 7, **kwargs):
+    return asyncio.run(bulk_import.parse_upload(_chunks(body, size), fmt, **kwargs))
+
+
+def test_csv_rows_merge_and_report_errors_by_row():
+    body = ('name,quantity,price_per_kg,description\n'
+            'Basmati Rice,10,80,"long grain,\naged"\n'
+            'basmati rice,5,,\n'
+            'Jeera,-1,300,\n'
+            ',2,10,\n'
+            'Onion,3,abc,\n'
+            'Onion,4,30,extra,column\n'
+            'Dal,2,120,"ok"\n').encode()
+    parsed = _parse(body, "csv")
+    assert parsed.rows == 7
+    assert parsed.merged == 1
+    rice = parsed.products["basmati rice"]
+    assert rice["quantity"] == 15 and rice["price_per_kg"] == 80 and rice["description"] == "long grain,\naged"
+    assert sorted(parsed.products) == ["basmati rice", "dal"]
+    errors = sorted(parsed.errors, key=lambda e: e["row"])
+    assert [e["row"] for e in errors] == [3, 4, 5, 6]
+    assert "quantity" in errors[0]["error"] and "columns" in errors[3]["error"]
+
+
+def test_ndjson_and_utf8_split_across_chunks():
+    body = '{"name": "Ḍal", "quantity": 1, "price_per_kg": 90}\nnot json\n[1]\n\n{"name": "ḍal", "quantity": 2}\n'
+    parsed = _parse(body.encode(), "ndjson", size=1)
+    assert parsed.products["ḍal"]["quantity"] == 3
+    assert [e["row"] for e in parsed.errors] == [2, 3]
+
+
+def test_upload_limits_and_format_errors():
+    with pytest.raises(bulk_import.ImportFormatError):
+        _parse(b"name,quantity\na,1\nb,1\nc,1\n", "csv", max_rows=2)
+    with pytest.raises(bulk_import.ImportFormatError):
+        _parse(b"sku,qty\na,1\n", "csv")
+    with pytest.raises(bulk_import.ImportFormatError):
+        bulk_import.upload_format("application/octet-stream")
+    assert bulk_import.upload_format("text/csv; charset=utf-8") == "csv"
+    assert bulk_import.upload_format("application/x-ndjson") == "ndjson"
+
+
+def test_new_products_need_a_price():
+    parsed = _parse(b"name,quantity,price_per_kg\nRice,1,\nDal,2,\n", "csv")
+    creates, updates = bulk_import.plan_import(parsed, {"rice": {"name": "Rice"}})
+    assert creates == [] and [item["name"] for _, item in updates] == ["Rice"]
+    assert parsed.errors == [{"row": 2, "error": "price_per_kg: required for a new product"}]
+
+
+def test_resync_change_replaces_pending_deltas():
+    subscription = Subscription("u1")
+    subscription.offer({"entity": "product", "op": "upsert", "id": "1", "data": {}})
+    subscription.offer({"entity": "product", "op": "resync", "id": "*", "data": None})
+    message = asyncio.run(subscription.next_message(debounce=0, heartbeat=1))
+    assert message == {"type": "resync"}
+
+
+def test_in_memory_import_endpoint():
+    import server
+
+    server.products_store.clear()
+    asyncio.run(server.save_product(server.Product(name="Rice", quantity=2, price_per_kg=50)))
+    client = TestClient(server.app)
+    body = "name,quantity,price_per_kg\nrice,3,\nSugar,5,45\nsugar,1,46\nSalt,x,20\n"
+
+    preview = client.post("/products/import?dry_run=true", content=body, headers={"content-type": "text/csv"}).json()
+    assert (preview["created"], preview["updated"], preview["dry_run"]) == (1, 1, True)
+    assert len(server.products_store) == 1
+
+    result = client.post("/products/import", content=body, headers={"content-type": "text/csv"}).json()
+    assert result["success"] and (result["created"], result["updated"], result["merged_duplicates"]) == (1, 1, 1)
+    assert result["errors"] == [{"row": 4, "error": result["errors"][0]["error"]}]
+    stock = {p["name"]: (p["quantity"], p["price_per_kg"]) for p in server.products_store}
+    assert stock == {"Rice": (5, 50), "Sugar": (6, 46)}
+    assert server.summarize(server.rollup_store.buckets(server.INVENTORY_OWNER, "sugar"), "sugar")["total_added"] == 6
+
+    assert client.post("/products/import", content=b"x", headers={"content-type": "image/png"}).status_code == 400
@@ -0,0 +1,159 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+import change_stream
+import conditional
+import server
+
+
+def _change(item_id, op="upsert", **data):
+    return {"entity": "product", "op": op, "id": item_id, "data": data or None, "ts": 0}
+
+
+def test_subscription_coalesces_by_item():
+    async def scenario():
+        sub = change_stream.Subscription("u1")
+        sub.offer(_change("p1", quantity=1))
+        sub.offer(_change("p2", quantity=5))
+        sub.offer(_change("p1", price=30))
+        return await sub.next_message(debounce=0, heartbeat=1)
+
+    message = asyncio.run(scenario())
+    assert message["type"] == "changes"
+    assert len(message["changes"]) == 2
+    merged = next(c for c in message["changes"] if c["id"] == "p1")
+    assert merged["data"] == {"quantity": 1, "price": 30}
+
+
+def test_delete_supersedes_upsert():
+    async def scenario():
+        sub = change_stream.Subscription("u1")
+        sub.offer(_change("p1", quantity=1))
+        sub.offer(_change("p1", op="delete"))
+        return await sub.next_message(debounce=0, heartbeat=1)
+
+    changes = asyncio.run(scenario())["changes"]
+    assert [c["op"] for c in changes] == ["delete"]
+
+
+def test_slow_client_backlog_becomes_resync():
+    async def scenario():
+        sub = change_stream.Subscription("u1", max_pending=3)
+        for i in range(10):
+            sub.offer(_change(f"p{i}"))
+        first = await sub.next_message(debounce=0, heartbeat=1)
+        sub.offer(_change("p99"))
+        second = await sub.next_message(debounce=0, heartbeat=1)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == {"type": "resync"}
+    assert second["type"] == "changes" and len(second["changes"]) == 1
+
+
+def test_idle_subscription_heartbeats():
+    sub = change_stream.Subscription("u1")
+    assert asyncio.run(sub.next_message(debounce=0, heartbeat=0.01)) == {"type": "ping"}
+
+
+def test_shared_bus_fans_out_across_workers():
+    async def scenario():
+        bus = change_stream.InProcessBus()
+        worker_a, worker_b = change_stream.ChangeHub(bus), change_stream.ChangeHub(bus)
+        sub_b = worker_b.subscribe("u7")
+        other_user = worker_b.subscribe("u8")
+        before = conditional.INVENTORY_VERSIONS.get("u7")
+        await worker_a.publish("u7", "product", "upsert", "p1", {"quantity": 2})
+        message = await sub_b.next_message(debounce=0, heartbeat=1)
+        return message, other_user.pending, conditional.INVENTORY_VERSIONS.get("u7") - before
+
+    message, other_pending, bumps = asyncio.run(scenario())
+    assert message["changes"][0]["data"] == {"quantity": 2}
+    assert other_pending == {}
+    assert bumps == 1
+
+
+def test_websocket_receives_voice_add():
+    with TestClient(server.app) as client:
+        with client.websocket_connect("/ws/changes") as ws:
+            assert ws.receive_json() == {"type": "ready"}
+            client.post("/voice-command", json={"command": "add carrot 4 kg at 50 rupees"})
+            message = ws.receive_json()
+        assert message["type"] == "changes"
+        changes = {c["entity"]: c for c in message["changes"]}
+        assert changes["product"]["data"]["name"].lower() == "carrot"
+        assert changes["transaction"]["op"] == "insert"
+        assert changes["transaction"]["data"]["quantity_change"] == 4
+        assert server.change_hub.subscriber_count() == 0
+
+
+
+class FakeWebSocket:
+    """Says hello as soon as it is ready, while a change is published: both land in one wait."""
+
+    def __init__(self, hub):
+        self.hub = hub
+        self.sent = []
+        self.greeted = asyncio.Event()
+        self.gone = asyncio.Event()
+
+    async def receive(self):
+        if self.greeted.is_set():
+            await self.gone.wait()
+            return {"type": "websocket.disconnect"}
+        self.greeted.set()
+        return {"type": "websocket.receive", "text": "hello"}
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+        if self.sent[-1]["type"] == "ready":
+            await self.hub.publish("u1", "product", "upsert", "p1", {"quantity": 3})
+        else:
+            self.gone.set()
+
+
+def test_websocket_sends_changes_that_arrive_with_a_client_message():
+    async def scenario():
+        hub = change_stream.ChangeHub(debounce_ms=0)
+        ws = FakeWebSocket(hub)
+        await asyncio.wait_for(change_stream.serve_websocket(hub, ws, "u1"), timeout=1)
+        return ws.sent
+
+    sent = asyncio.run(scenario())
+    assert [m["type"] for m in sent] == ["ready", "changes"]
+
+
+class FakePubSub:
+    def __init__(self, drops):
+        self.drops = drops
+
+    async def listen(self):
+        if self.drops:
+            raise ConnectionError("connection reset by peer")
+        await asyncio.Event().wait()
+        yield
+
+    async def close(self):
+        pass
+
+
+def test_redis_bus_resubscribes_and_resyncs_after_a_dropped_connection():
+    async def scenario():
+        bus = change_stream.RedisBus("redis://unused")
+        hub = change_stream.ChangeHub(bus, debounce_ms=0)
+        sub = hub.subscribe("u5")
+        before = conditional.INVENTORY_VERSIONS.get("never-seen")
+
+        async def resubscribe():
+            return FakePubSub(drops=False)
+        bus._subscribe = resubscribe
+        listener = asyncio.create_task(bus._listen(FakePubSub(drops=True), first_delay=0))
+        message = await sub.next_message(debounce=0, heartbeat=1)
+        listener.cancel()
+        return message, conditional.INVENTORY_VERSIONS.get("never-seen") - before
+
+    message, moved = asyncio.run(scenario())
+    assert message == {"type": "resync"}
+    assert moved == 1
@@ -0,0 +1,64 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import conditional
+import server
+
+
+def test_etag_changes_only_on_write():
+    versions = conditional.InventoryVersions()
+    first = conditional.inventory_etag("user-1", "products", versions)
+    assert conditional.inventory_etag("user-1", "products", versions) == first
+    assert conditional.inventory_etag("user-2", "products", versions) != first
+
+    versions.bump("user-1")
+    assert conditional.inventory_etag("user-1", "products", versions) != first
+
+
+def test_if_none_match_parsing():
+    etag = '"products-abc-123-4"'
+    assert conditional._etag_matches(etag, etag)
+    assert conditional._etag_matches('"other", W/"products-abc-123-4"', etag)
+    assert conditional._etag_matches('"products-abc-123-4-gz"', etag)
+    assert conditional._etag_matches("*", etag)
+    assert not conditional._etag_matches('"products-abc-123-5"', etag)
+
+
+def test_products_304_until_write(monkeypatch):
+    with TestClient(server.app) as client:
+        first = client.get("/products")
+        etag = first.headers["etag"]
+
+        # A 304 must be served without reading the store.
+        async def fail():
+            raise AssertionError("store read on a conditional hit")
+        monkeypatch.setattr(server, "get_all_products", fail)
+        cached = client.get("/products", headers={"If-None-Match": etag})
+        assert cached.status_code == 304
+        assert cached.headers["etag"] == etag
+        monkeypatch.undo()
+
+        client.post("/voice-command", json={"command": "add garlic 2 kg at 120 rupees"})
+        fresh = client.get("/products", headers={"If-None-Match": etag})
+        assert fresh.status_code == 200
+        assert fresh.headers["etag"] != etag
+
+
+def test_large_payload_is_gzipped(monkeypatch):
+    monkeypatch.setattr(conditional, "RESPONSE_GZIP_MIN_BYTES", 10)
+    with TestClient(server.app) as client:
+        client.post("/voice-command", json={"command": "add potato 5 kg at 25 rupees"})
+        response = client.get("/analytics/dashboard", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["etag"].endswith('-gz"')
+        assert response.json()["success"] is True
+
+        again = client.get("/analytics/dashboard", headers={"If-None-Match": response.headers["etag"]})
+        assert again.status_code == 304
+
+
+def test_several_workers_need_a_shared_bus():
+    conditional.require_shared_versions(shared_bus=False, workers=1)
+    conditional.require_shared_versions(shared_bus=True, workers=4)
+    with pytest.raises(RuntimeError, match="CHANGE_BUS_URL"):
+        conditional.require_shared_versions(shared_bus=False, workers=4)
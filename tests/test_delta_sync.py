@@ -0,0 +1,136 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import delta_sync
+import server
+
+
+def _names(rows):
+    return sorted(row["name"].lower() for row in rows)
+
+
+def test_cursor_round_trip_and_rejects_garbage():
+    ts = datetime(2024, 6, 1, 12, 30, 0, 123456)
+    assert delta_sync.decode_cursor(delta_sync.encode_cursor(ts)) == ts
+    try:
+        delta_sync.decode_cursor("not-a-cursor")
+    except HTTPException as e:
+        assert e.status_code == 400
+    else:
+        raise AssertionError("expected a 400")
+
+
+def test_changes_since_returns_only_recent_rows_and_tombstones():
+    now = datetime.now()
+    old = now - timedelta(hours=1)
+    products = [{"_id": "1", "name": "rice", "updated_at": old},
+                {"_id": "2", "name": "dal", "updated_at": now}]
+    tombstones = [{"id": "3", "name": "salt", "deleted_at": now},
+                  {"id": "4", "name": "sugar", "deleted_at": old}]
+
+    delta = delta_sync.changes_since(products, tombstones, now - timedelta(minutes=1))
+    assert delta["reset"] is False
+    assert _names(delta["changed"]) == ["dal"]
+    assert [t["id"] for t in delta["deleted"]] == ["3"]
+    assert delta_sync.decode_cursor(delta["cursor"]) == now
+
+    snapshot = delta_sync.changes_since(products, tombstones, None)
+    assert snapshot["reset"] is True and len(snapshot["changed"]) == 2 and snapshot["deleted"] == []
+
+    expired = now - timedelta(days=delta_sync.SYNC_TOMBSTONE_RETENTION_DAYS + 1)
+    assert delta_sync.changes_since(products, tombstones, expired)["reset"] is True
+
+
+def test_reconnect_pulls_only_changes():
+    with TestClient(server.app) as client:
+        for name in ("okra", "ginger", "radish"):
+            client.post("/voice-command", json={"command": f"add {name} 2 kg at 60 rupees"})
+        cursor = client.get("/products/changes").json()["cursor"]
+
+        delta_sync.SYNC_OVERLAP_S, overlap = 0, delta_sync.SYNC_OVERLAP_S
+        try:
+            client.post("/voice-command", json={"command": "remove okra"})
+            client.post("/voice-command", json={"command": "add turnip 1 kg at 80 rupees"})
+            delta = client.get("/products/changes", params={"since": cursor}).json()
+        finally:
+            delta_sync.SYNC_OVERLAP_S = overlap
+
+    assert _names(delta["changed"]) == ["turnip"]
+    assert _names(delta["deleted"]) == ["okra"]
+
+
+def test_sync_replay_is_idempotent():
+    operations = [
+        {"client_op_id": "dev1-1", "type": "transaction", "product_name": "beetroot",
+         "transaction_type": "add", "quantity_change": 5, "price_per_kg": 40},
+        {"client_op_id": "dev1-2", "type": "transaction", "product_name": "beetroot",
+         "transaction_type": "remove", "quantity_change": 2},
+        {"client_op_id": "dev1-3", "type": "voice", "command": "add cabbage 3 kg at 30 rupees"},
+        {"client_op_id": "dev1-4", "type": "transaction", "product_name": "jackfruit",
+         "transaction_type": "remove", "quantity_change": 1},
+    ]
+    with TestClient(server.app) as client:
+        first = client.post("/sync", json={"operations": operations}).json()
+        replay = client.post("/sync", json={"operations": operations}).json()
+        products = {p["name"].lower(): p for p in client.get("/products").json()}
+
+    assert first["applied"] == 4
+    assert [r["success"] for r in first["results"]] == [True, True, True, False]
+    assert replay["applied"] == 0
+    assert all(r["duplicate"] for r in replay["results"])
+    assert products["beetroot"]["quantity"] == 3
+    assert products["cabbage"]["quantity"] == 3
+
+
+def test_server_faults_stay_retryable():
+    store = delta_sync.AppliedOperations()
+    op = delta_sync.SyncOperation(client_op_id="x1", type="voice", command="add rice 1 kg at 50")
+    calls = []
+
+    async def flaky(_):
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("db down")
+        return {"success": True, "message": "ok"}
+
+    first = asyncio.run(delta_sync.apply_operations("u", [op], store, flaky))
+    second = asyncio.run(delta_sync.apply_operations("u", [op], store, flaky))
+    assert first["results"][0]["retryable"] is True
+    assert second["applied"] == 1 and len(calls) == 2
+
+
+def test_claims_left_pending_by_a_dead_request_can_be_retried():
+    now = [0.0]
+    store = delta_sync.AppliedOperations(lease=60, clock=lambda: now[0])
+    op = delta_sync.SyncOperation(client_op_id="x2", type="voice", command="add rice 1 kg at 50")
+
+    async def apply(_):
+        return {"success": True, "message": "ok"}
+
+    asyncio.run(store.claim("u", "x2"))  # its request died before complete() or release()
+    blocked = asyncio.run(delta_sync.apply_operations("u", [op], store, apply))
+    now[0] = 61
+    retried = asyncio.run(delta_sync.apply_operations("u", [op], store, apply))
+    assert blocked["results"][0]["retryable"] is True
+    assert retried["applied"] == 1
+
+
+def test_offline_transactions_keep_their_recorded_time():
+    now = datetime.now(timezone.utc)
+    recorded = now - timedelta(days=3)
+    operations = [
+        {"client_op_id": "dev2-1", "type": "transaction", "product_name": "kohlrabi",
+         "transaction_type": "add", "quantity_change": 6, "price_per_kg": 35, "recorded_at": recorded.isoformat()},
+        {"client_op_id": "dev2-2", "type": "transaction", "product_name": "kohlrabi",
+         "transaction_type": "remove", "quantity_change": 2, "recorded_at": (now + timedelta(days=2)).isoformat()},
+    ]
+    with TestClient(server.app) as client:
+        assert client.post("/sync", json={"operations": operations}).json()["applied"] == 2
+
+    days = {b["day"]: b for b in server.rollup_store.buckets(server.INVENTORY_OWNER, "kohlrabi")}
+    assert days[recorded.date()]["added"] == 6
+    assert days[now.date()]["removed"] == 2  # a device clock ahead of ours is clamped to now
+    assert delta_sync.recorded_time(datetime(2024, 1, 1)).tzinfo is timezone.utc
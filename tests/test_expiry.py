@@ -0,0 +1,89 @@
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+
+import expiry
+import server
+
+NOW = datetime(2025, 3, 10, tzinfo=timezone.utc)
+T0 = NOW.timestamp()
+
+
+def _product(i, days, quantity=5.0):
+    return {"id": f"p{i:04d}", "name": f"Item {i}", "quantity": quantity,
+            "expiry_date": (NOW + timedelta(days=days)).isoformat()}
+
+
+def test_expiring_matches_a_full_scan():
+    rng = random.Random(4)
+    products = [_product(i, rng.uniform(-5, 60), quantity=rng.choice([0, 1, 2])) for i in range(2000)]
+    index = expiry.ExpiryIndex(warn_days=3)
+    index.load_all([{**p, "user_id": "shop"} for p in products], now=T0)
+    for p in products[:300]:  # writes after the load take the upsert path
+        p["expiry_date"] = (NOW + timedelta(days=rng.uniform(-5, 60))).isoformat()
+        index.upsert("shop", p, now=T0)
+
+    for days in (0, 1, 7, 30):
+        got = [item["id"] for item in index.expiring("shop", days, now=T0)]
+        horizon = T0 + days * expiry.DAY_S
+        expected = sorted((datetime.fromisoformat(p["expiry_date"]).timestamp(), p["id"]) for p in products
+                          if p["quantity"] > 0 and datetime.fromisoformat(p["expiry_date"]).timestamp() <= horizon)
+        assert got == [pid for _, pid in expected]
+
+
+def test_sweep_fires_once_when_entering_the_window_and_skips_stale_entries():
+    index = expiry.ExpiryIndex(warn_days=3)
+    index.load_all([], now=T0)
+    index.upsert("a", _product(1, 5), now=T0)
+    index.upsert("a", _product(2, 10), now=T0)
+    index.upsert("b", _product(3, 4), now=T0)
+
+    assert index.sweep(now=T0) == {}
+    assert index.sweep(now=T0 + 1.5 * expiry.DAY_S) == {"b": ["Item 3"]}
+    index.upsert("a", _product(1, 40), now=T0)  # pushed back: the old events are stale
+    assert index.sweep(now=T0 + 2.5 * expiry.DAY_S) == {}
+    index.remove("a", "p0002")
+    assert index.sweep(now=T0 + 9 * expiry.DAY_S) == {"b": ["Item 3"]}  # b has now expired
+
+
+def test_sales_keep_position_and_sold_out_products_leave_the_index():
+    index = expiry.ExpiryIndex(warn_days=3, ready=True)
+    index.upsert("a", _product(1, 2), now=T0)
+    index.upsert("a", _product(1, 2, quantity=1.5), now=T0)
+    assert [item["quantity"] for item in index.expiring("a", 7, now=T0)] == [1.5]
+    index.apply_change("a", {"entity": "product", "op": "upsert", "id": "p0001", "data": _product(1, 2, 0)})
+    assert index.expiring("a", 7, now=T0) == []
+    index.apply_change("a", {"entity": "product", "op": "resync", "id": "*"})
+    assert index.needs_load("a") and not index.needs_load("b")
+
+
+def test_voice_parser_recognizes_expiry_questions():
+    assert expiry.expiry_query_days("what is expiring this week") == 7
+    assert expiry.expiry_query_days("which items expire in 3 days") == 3
+    assert expiry.expiry_query_days("anything going bad tomorrow") == 2
+    assert expiry.expiry_query_days("add 5 kg milk expiring friday at 40 rs") is None
+    assert expiry.expiry_query_days("add 2 kg onion at 30 rupees") is None
+
+
+def test_voice_query_and_endpoint_use_the_index():
+    server.products_store.clear()
+    soon = (datetime.now(timezone.utc) + timedelta(days=2)).isoformat()
+    later = (datetime.now(timezone.utc) + timedelta(days=20)).isoformat()
+    with TestClient(server.app) as client:
+        asyncio.run(server.save_product(server.Product(name="Milk", quantity=3, price_per_kg=50, expiry_date=soon)))
+        asyncio.run(server.save_product(server.Product(name="Rice", quantity=9, price_per_kg=40, expiry_date=later)))
+
+        body = client.post("/voice-command", json={"command": "what is expiring this week"}).json()
+        assert body["success"] and [item["name"] for item in body["expiring"]] == ["Milk"]
+        listed = client.get("/products/expiring", params={"days": 30}).json()
+        assert [item["name"] for item in listed["products"]] == ["Milk", "Rice"]
+
+
+def test_expiry_sweeps_are_cancelled_at_shutdown():
+    with TestClient(server.app):
+        sweeps = list(server.background_tasks)
+        assert sweeps and not any(task.done() for task in sweeps)
+    assert all(task.cancelled() for task in sweeps)
+    assert server.background_tasks == []
@@ -0,0 +1,80 @@
+import asyncio
+import csv
+import io
+import json
+
+from fastapi.testclient import TestClient
+
+import export
+
+
+def _table(rows):
+    """Keyset reader over rows sorted by (created_at, id), like the composite index."""
+    ordered = sorted(rows, key=lambda r: (r["created_at"], r["id"]))
+    calls = []
+
+    def fetch(after, limit):
+        calls.append(after)
+        rest = [r for r in ordered if after is None or (r["created_at"], r["id"]) > after]
+        return rest[:limit]
+    return fetch, calls
+
+
+def test_keyset_pages_visit_every_row_once_with_timestamp_ties():
+    rows = [{"id": f"{i:03d}", "created_at": f"2024-01-0{1 + i % 3}T00:00:00+00:00"} for i in range(25)]
+    fetch, calls = _table(rows)
+    pages = list(export.keyset_pages(fetch, page_size=4))
+    seen = [row["id"] for page in pages for row in page]
+    assert sorted(seen) == sorted(r["id"] for r in rows) and len(seen) == len(set(seen))
+    assert all(len(page) <= 4 for page in pages)
+    assert len(calls) == 7  # 6 full pages, then a short one ends the scan
+
+
+def test_supabase_fetcher_builds_keyset_filter():
+    class Query:
+        def __init__(self):
+            self.calls = []
+
+        def __getattr__(self, name):
+            def record(*args):
+                self.calls.append((name, args))
+                return self
+            return record
+
+        def execute(self):
+            return type("Result", (), {"data": []})()
+
+    query = Query()
+    client = type("Client", (), {"table": lambda self, name: query})()
+    fetch = export.supabase_page_fetcher(client, "inventory_transactions", "u1", ["id", "created_at"])
+    fetch(("2024-01-01T00:00:00+00:00", "abc"), 500)
+    assert ("or_", ('created_at.gt."2024-01-01T00:00:00+00:00",'
+                    'and(created_at.eq."2024-01-01T00:00:00+00:00",id.gt.abc)',)) in query.calls
+    assert query.calls[-3:] == [("order", ("created_at",)), ("order", ("id",)), ("limit", (500,))]
+
+
+def test_csv_neutralizes_formula_cells():
+    pages = [[{"id": "1", "command_text": "=HYPERLINK(\"x\")", "quantity": -2.5}]]
+    body = b"".join(export.csv_chunks(pages, ["id", "command_text", "quantity"])).decode()
+    rows = list(csv.reader(io.StringIO(body)))
+    assert rows == [["id", "command_text", "quantity"], ["1", "'=HYPERLINK(\"x\")", "-2.5"]]
+
+
+def test_in_memory_products_export():
+    import server
+
+    server.products_store.clear()
+    client = TestClient(server.app)
+    for name in ("rice", "onion", "potato"):
+        asyncio.run(server.save_product(server.Product(name=name, quantity=5, price_per_kg=30)))
+
+    response = client.get("/export/products")
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert "attachment" in response.headers["content-disposition"]
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [p["name"] for p in lines] == ["rice", "onion", "potato"]
+
+    response = client.get("/export/products?format=csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [r["name"] for r in rows] == ["rice", "onion", "potato"]
+    assert rows[0]["quantity"] == "5.0"
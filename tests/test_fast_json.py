@@ -0,0 +1,49 @@
+import json
+from datetime import datetime, timezone
+
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+from fastapi.testclient import TestClient
+
+import fast_json
+import server
+
+
+def _rows():
+    return [
+        {"id": "a1", "name": "onion", "quantity": 2.5, "price": 30.0,
+         "created_at": datetime(2024, 5, 1, 9, 30, 15, 123456)},
+        {"id": "b2", "name": "प्याज", "quantity": 0.0, "price": None,
+         "updated_at": datetime(2024, 5, 2, tzinfo=timezone.utc)},
+    ]
+
+
+def test_dumps_matches_jsonable_encoder():
+    rows = _rows()
+    assert json.loads(fast_json.dumps(rows)) == jsonable_encoder(rows)
+
+
+def test_stdlib_fallback_matches_orjson(monkeypatch):
+    rows = _rows() + [{"avg": np.float64(1.5), "days": np.int64(3)}]
+    fast = json.loads(fast_json.dumps(rows))
+    monkeypatch.setattr(fast_json, "ORJSON_ENABLED", False)
+    assert json.loads(fast_json.dumps(rows)) == fast
+
+
+def test_json_response_toggle(monkeypatch):
+    payload = {"products": _rows()}
+    response = fast_json.json_response(payload)
+    assert isinstance(response, fast_json.FastJSONResponse)
+    assert response.media_type == "application/json"
+
+    monkeypatch.setattr(fast_json, "FAST_JSON", False)
+    assert fast_json.json_response(payload) is payload
+
+
+def test_products_endpoint_uses_fast_path():
+    with TestClient(server.app) as client:
+        client.post("/voice-command", json={"command": "add tomato 3 kg at 40 rupees"})
+        response = client.get("/products")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    assert any(p["name"].lower() == "tomato" for p in response.json())
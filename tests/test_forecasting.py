@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+import forecasting
+
+
+def _naive_ses(series, alpha):
+    level, variance = series[0], 0.0
+    for x in series[1:]:
+        variance = alpha * (x - level) ** 2 + (1 - alpha) * variance
+        level = alpha * x + (1 - alpha) * level
+    return level, np.sqrt(variance)
+
+
+def test_ses_matches_reference_loop_per_row():
+    rng = np.random.default_rng(1)
+    demand = rng.poisson(3, size=(5, 60)).astype(float)
+    first_day = np.array([0, 10, 30, 59, 0])
+    demand[np.arange(60)[None, :] < first_day[:, None]] = 0
+
+    rate, sigma = forecasting.forecast_rates(demand, first_day, method="ses", alpha=0.3)
+    for row in range(5):
+        level, std = _naive_ses(demand[row, first_day[row]:], 0.3)
+        assert rate[row] == pytest.approx(level)
+        assert sigma[row] == pytest.approx(std)
+
+
+def test_window_rate_ignores_days_before_first_record():
+    demand = np.zeros((2, 100))
+    demand[0, -28:] = 2.0
+    demand[1, -5:] = 4.0
+    rate, sigma = forecasting.forecast_rates(demand, np.array([0, 95]), method="window", window=28)
+    assert rate.tolist() == [2.0, 4.0]
+    assert sigma.tolist() == [0.0, 0.0]
+
+
+def test_depletion_interval_brackets_point_estimate():
+    point, early, late = forecasting.depletion_days(np.array([20.0, 20.0, 5.0]),
+                                                    np.array([2.0, 2.0, 0.0]),
+                                                    np.array([0.0, 1.5, 1.0]))
+    assert point[0] == pytest.approx(10.0) and early[0] == pytest.approx(10.0) and late[0] == pytest.approx(10.0)
+    assert early[1] < point[1] < late[1]
+    assert np.isnan(point[2]) and np.isnan(early[2])
+
+
+def test_forecast_products_from_rows():
+    now = datetime(2024, 3, 1, 12)
+    products = [{"name": "Rice", "quantity": 21, "minimum_stock": 1},
+                {"name": "Salt", "quantity": 2, "minimum_stock": None}]
+    transactions = [{"product_name": "rice", "transaction_type": "remove", "quantity_change": 2,
+                     "created_at": (now - timedelta(days=d)).isoformat()} for d in range(30)]
+    transactions.append({"product_name": "Rice", "transaction_type": "add", "quantity_change": 50,
+                         "created_at": (now - timedelta(days=40)).isoformat() + "+00:00"})
+
+    results = forecasting.forecast_products(products, transactions, now=now, method="window", history_days=90)
+    rice, salt = results
+    assert rice["product_name"] == "Rice"
+    assert rice["consumption_rate_per_day"] == pytest.approx(2.0)
+    assert rice["depletion_date"] is not None
+    assert salt["days_until_depletion"] is None and salt["minimum_stock"] == 1.0
+
+
+def test_unknown_method_is_rejected():
+    with pytest.raises(ValueError):
+        forecasting.forecast_rates(np.zeros((1, 3)), np.zeros(1, dtype=int), method="arima")
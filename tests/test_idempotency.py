@@ -0,0 +1,111 @@
+import asyncio
+
+import httpx
+
+import idempotency
+import server
+
+
+async def _storm(requests, headers):
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        command = {"command": "add pumpkin 7 kg at 20 rupees"}
+        return await asyncio.gather(*[client.post("/voice-command", json=command, headers=headers)
+                                      for _ in range(requests)])
+
+
+def _pumpkins():
+    return [p for p in server.products_store if p["name"].lower() == "pumpkin"]
+
+
+def test_retry_storm_creates_one_row():
+    server.products_store[:] = [p for p in server.products_store if p["name"].lower() != "pumpkin"]
+    responses = asyncio.run(_storm(50, {"Idempotency-Key": "storm-1"}))
+
+    assert all(r.status_code == 200 for r in responses)
+    assert len({r.content for r in responses}) == 1
+    assert sum(r.headers.get("idempotent-replayed") == "true" for r in responses) == 49
+    assert len(_pumpkins()) == 1 and _pumpkins()[0]["quantity"] == 7
+
+    later = asyncio.run(_storm(3, {"Idempotency-Key": "storm-1", "X-Request-ID": "retry-7"}))
+    assert all(r.headers.get("idempotent-replayed") == "true" for r in later)
+    assert all(r.headers.get("x-request-id") == "retry-7" for r in later)
+    assert _pumpkins()[0]["quantity"] == 7
+
+
+def test_same_key_different_body_is_rejected():
+    async def scenario():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            headers = {"Idempotency-Key": "reuse-1"}
+            await client.post("/voice-command", json={"command": "add corn 1 kg at 10 rupees"}, headers=headers)
+            return await client.post("/voice-command", json={"command": "add corn 9 kg at 10 rupees"}, headers=headers)
+
+    assert asyncio.run(scenario()).status_code == 422
+
+
+def test_failure_bodies_are_not_replayed():
+    async def scenario():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            headers = {"Idempotency-Key": "failed-1"}
+            command = {"command": "blah blah"}
+            first = await client.post("/voice-command", json=command, headers=headers)
+            return first, await client.post("/voice-command", json=command, headers=headers)
+
+    first, retry = asyncio.run(scenario())
+    assert first.json()["success"] is False
+    assert "idempotent-replayed" not in retry.headers
+
+
+def test_memory_store_is_bounded_and_expires():
+    async def scenario():
+        store = idempotency.MemoryIdempotencyStore(max_entries=3, ttl=60)
+        for i in range(5):
+            assert await store.claim(f"k{i}", "f") is None
+            await store.complete(f"k{i}", {"status": 200, "headers": [], "body": b""})
+        bounded = len(store)
+
+        short = idempotency.MemoryIdempotencyStore(ttl=0)
+        await short.claim("k", "f")
+        await short.complete("k", {"status": 200, "headers": [], "body": b""})
+        return bounded, await short.claim("k", "f")
+
+    bounded, reclaimed = asyncio.run(scenario())
+    assert bounded == 3
+    assert reclaimed is None
+
+
+class FakeDurableStore:
+    """Stand-in for the idempotency_keys table shared by several workers."""
+
+    def __init__(self):
+        self.rows = {}
+
+    async def claim(self, key, fingerprint):
+        if key in self.rows:
+            return dict(self.rows[key])
+        self.rows[key] = {"fingerprint": fingerprint, "status": "pending"}
+        return None
+
+    async def complete(self, key, response):
+        self.rows[key].update(status="done", response=response)
+
+    async def release(self, key):
+        self.rows.pop(key, None)
+
+
+def test_durable_tier_shares_keys_across_workers():
+    async def scenario():
+        durable = FakeDurableStore()
+        worker_a = idempotency.TieredIdempotencyStore(durable=durable)
+        worker_b = idempotency.TieredIdempotencyStore(durable=durable)
+        assert await worker_a.claim("k", "f") is None
+        in_flight = await worker_b.claim("k", "f")
+        await worker_a.complete("k", {"status": 201, "headers": [], "body": b"{}"})
+        done = await worker_b.claim("k", "f")
+        return in_flight, done
+
+    in_flight, done = asyncio.run(scenario())
+    assert in_flight["status"] == "pending" and "event" not in in_flight
+    assert done["response"]["status"] == 201
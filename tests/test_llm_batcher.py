@@ -0,0 +1,113 @@
+import asyncio
+import json
+import re
+
+from llm_batcher import LLMBatchDispatcher, merge_llm_result, needs_llm, parse_batch_response
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    def __init__(self, fail=False, reply=None):
+        self.prompts = []
+        self.fail = fail
+        self.reply = reply
+
+    async def generate_content_async(self, prompt):
+        self.prompts.append(prompt)
+        if self.fail:
+            raise RuntimeError("quota exceeded")
+        if self.reply is not None:
+            return FakeResponse(self.reply)
+        ids = re.findall(r'^(\d+)\. ', prompt, re.MULTILINE)
+        return FakeResponse(json.dumps([
+            {"id": int(i), "action": "add", "product_name": f"item{i}", "quantity": 1, "price": 10}
+            for i in ids
+        ]))
+
+
+def fallback(name):
+    return {"action": "unknown", "product_name": name, "confidence": 0.3}
+
+
+async def submit_many(dispatcher, count):
+    return await asyncio.gather(*(dispatcher.submit(f"cmd {i}", fallback(f"re{i}")) for i in range(count)))
+
+
+def test_concurrent_commands_share_one_model_call():
+    model = FakeModel()
+    dispatcher = LLMBatchDispatcher(model, window_ms=20, max_batch_size=10)
+    results = asyncio.run(submit_many(dispatcher, 5))
+
+    assert len(model.prompts) == 1
+    assert [r["product_name"] for r in results] == [f"item{i}" for i in range(1, 6)]
+    assert all(r["source"] == "llm" for r in results)
+
+
+def test_full_batch_flushes_before_window():
+    model = FakeModel()
+    dispatcher = LLMBatchDispatcher(model, window_ms=10_000, max_batch_size=3)
+    results = asyncio.run(asyncio.wait_for(submit_many(dispatcher, 6), timeout=2))
+
+    assert len(model.prompts) == 2
+    assert len(results) == 6
+
+
+def test_failed_batch_falls_back_to_regex_results():
+    dispatcher = LLMBatchDispatcher(FakeModel(fail=True), window_ms=5)
+    results = asyncio.run(submit_many(dispatcher, 3))
+
+    assert [r["product_name"] for r in results] == ["re0", "re1", "re2"]
+    assert dispatcher.stats["failed_batches"] == 1
+
+
+def test_missing_items_fall_back_individually():
+    reply = json.dumps([{"id": 2, "action": "remove", "product_name": "Onion"}])
+    dispatcher = LLMBatchDispatcher(FakeModel(reply=reply), window_ms=5)
+    results = asyncio.run(submit_many(dispatcher, 3))
+
+    assert results[0]["product_name"] == "re0"
+    assert results[1]["action"] == "remove"
+    assert results[1]["product_name"] == "onion"
+    assert results[2]["product_name"] == "re2"
+
+
+def test_stop_cancels_batches_and_falls_back():
+    class SlowModel(FakeModel):
+        async def generate_content_async(self, prompt):
+            await asyncio.sleep(60)
+
+    async def scenario():
+        dispatcher = LLMBatchDispatcher(SlowModel(), window_ms=1, max_batch_size=2)
+        in_flight = asyncio.gather(*(dispatcher.submit(f"cmd {i}", fallback(f"re{i}")) for i in range(2)))
+        queued = asyncio.ensure_future(dispatcher.submit("cmd 2", fallback("re2")))
+        await asyncio.sleep(0)
+        await dispatcher.stop()
+        return await in_flight + [await queued], dispatcher._batches
+
+    results, batches = asyncio.run(asyncio.wait_for(scenario(), timeout=5))
+    assert [r["product_name"] for r in results] == ["re0", "re1", "re2"]
+    assert not batches
+
+
+def test_llm_add_without_price_or_quantity_is_incomplete():
+    no_price = merge_llm_result(fallback("rice"), {"action": "add", "product_name": "Rice", "quantity": 5})
+    assert no_price == {"action": "incomplete", "message": "Please specify the price for rice."}
+    no_quantity = merge_llm_result({**fallback("rice"), "price": 40.0}, {"action": "add"})
+    assert no_quantity["action"] == "incomplete" and "quantity" in no_quantity["message"]
+    complete = merge_llm_result({**fallback("rice"), "price": 40.0}, {"action": "add", "quantity": "5"})
+    assert complete["action"] == "add" and complete["quantity"] == 5.0
+
+
+def test_parse_batch_response_ignores_invalid_actions():
+    text = '```json\n[{"id": 1, "action": "explode"}, {"id": 2, "action": "list"}]\n```'
+    assert parse_batch_response(text, 2) == [None, {"id": 2, "action": "list"}]
+
+
+def test_needs_llm():
+    assert needs_llm({"action": "unknown", "confidence": 0.0})
+    assert not needs_llm({"action": "add", "confidence": 1.0})
+    assert not needs_llm({"action": "list", "confidence": 0.4})
@@ -0,0 +1,49 @@
+import asyncio
+
+import httpx
+
+import server
+from loadtest.harness import LoadRunner, compare, percentile, render
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile([], 99) == 0.0
+
+
+def test_render_fills_nested_placeholders():
+    body = {"command": "add {product} {quantity} kg", "tags": ["{price}"]}
+    values = {"{product}": "onion", "{quantity}": "2", "{price}": "30"}
+    assert render(body, values) == {"command": "add onion 2 kg", "tags": ["30"]}
+
+
+def test_runner_reports_per_route_stats_against_in_memory_server():
+    scenario = {
+        "name": "tiny",
+        "duration_s": 0.3,
+        "concurrency": 4,
+        "arrival_rate": 0,
+        "setup": [{"repeat": 3, "method": "POST", "path": "/voice-command",
+                   "json": {"command": "add {product} 2 kg at {price} rupees"}}],
+        "requests": [
+            {"weight": 1, "method": "GET", "path": "/products"},
+            {"weight": 1, "method": "GET", "path": "/missing-route"},
+        ],
+    }
+
+    async def go():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await LoadRunner(client, scenario, seed=1).run()
+
+    result = asyncio.run(go())
+
+    products = result["routes"]["GET /products"]
+    missing = result["routes"]["GET /missing-route"]
+    assert products["requests"] > 0 and products["error_rate"] == 0
+    assert missing["error_rate"] == 1.0
+    assert result["total"]["requests"] == products["requests"] + missing["requests"]
+    assert compare(result, result)[0].startswith("GET /missing-route: p95")
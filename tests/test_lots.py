@@ -0,0 +1,72 @@
+import random
+
+from fastapi.testclient import TestClient
+
+import lots
+import server
+
+
+def test_removals_consume_the_oldest_lots_first():
+    book = lots.LotBook("tomato")
+    book.receive(5, 40)
+    book.receive(3, 60)
+    taken = book.consume(6)
+
+    assert [(lot["quantity"], lot["price_per_kg"]) for lot in taken["lots"]] == [(5, 40), (1, 60)]
+    assert taken["cogs_fifo"] == 5 * 40 + 1 * 60
+    assert taken["cogs_avg"] == 6 * (5 * 40 + 3 * 60) / 8
+    assert len(book.lots) == 1 and book.lots[0]["quantity_remaining"] == 2
+    valuation = book.valuation()
+    assert valuation["on_hand"] == 2 and valuation["fifo_value"] == 2 * 60
+
+
+def test_running_valuation_matches_a_recomputation_from_the_lots():
+    rng = random.Random(7)
+    book = lots.LotBook("rice")
+    received = removed = 0.0
+    for _ in range(2000):
+        if rng.random() < 0.55:
+            quantity = rng.uniform(1, 20)
+            book.receive(quantity, rng.uniform(30, 60))
+            received += quantity
+        else:
+            quantity = rng.uniform(1, 20)
+            removed += book.consume(quantity)["consumed"]
+
+    assert abs(book.on_hand - sum(lot["quantity_remaining"] for lot in book.lots)) < 1e-6
+    assert abs(book.fifo_value - sum(lot["quantity_remaining"] * lot["price_per_kg"] for lot in book.lots)) < 1e-4
+    assert abs(received - removed - book.on_hand) < 1e-6
+
+
+def test_removals_beyond_the_open_lots_are_unmatched_and_unpriced_adds_use_the_average():
+    ledger = lots.LotLedger()
+    ledger.record("shop", {"product_name": "Onion", "transaction_type": "add", "quantity_change": 2, "price_per_kg": 30})
+    taken = ledger.record("shop", {"product_name": "onion", "transaction_type": "remove", "quantity_change": 3})
+    assert taken["consumed"] == 2 and taken["unmatched"] == 1 and taken["cogs_fifo"] == 60
+
+    ledger.record("shop", {"product_name": "onion", "transaction_type": "add", "quantity_change": 4, "price_per_kg": None})
+    assert ledger.open_lots("shop", "ONION")[0]["price_per_kg"] == 30
+    assert ledger.record("shop", {"product_name": "onion", "transaction_type": "update", "quantity_change": 1}) is None
+
+    summary = lots.valuation_summary(ledger.valuations("shop"))
+    assert summary["inventory_value_fifo"] == 120 and summary["cogs_fifo"] == 60
+    assert summary["products"][0]["unmatched"] == 1
+
+
+def test_valuation_endpoint_follows_stock_movements(monkeypatch):
+    monkeypatch.setattr(server, "lot_ledger", lots.LotLedger())
+    server.products_store.clear()
+    client = TestClient(server.app)
+    client.post("/voice-command", json={"command": "add 5 kg tomato at 40 rupees"})
+    client.post("/voice-command", json={"command": "add 3 kg tomato at 60 rupees"})
+    client.post("/sync", json={"operations": [
+        {"client_op_id": "lots-1", "type": "transaction", "product_name": "tomato",
+         "transaction_type": "remove", "quantity_change": 6},
+    ]})
+
+    valuation = client.get("/analytics/valuation").json()["valuation"]
+    assert valuation["cogs_fifo"] == 260
+    assert valuation["inventory_value_fifo"] == 120
+    assert valuation["products"][0]["open_lots"] == 1
+    lots_left = client.get("/analytics/lots/Tomato").json()["lots"]
+    assert [(lot["quantity_remaining"], lot["price_per_kg"]) for lot in lots_left] == [(2, 60)]
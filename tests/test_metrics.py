@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import metrics
+import server
+
+
+def test_histogram_renders_cumulative_buckets():
+    hist = metrics.Histogram("demo_seconds", "Demo.", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        hist.observe(value, "/x")
+
+    lines = list(hist.render())
+    assert 'demo_seconds_bucket{route="/x",le="0.1"} 1' in lines
+    assert 'demo_seconds_bucket{route="/x",le="1"} 2' in lines
+    assert 'demo_seconds_bucket{route="/x",le="+Inf"} 3' in lines
+    assert 'demo_seconds_count{route="/x"} 3' in lines
+
+
+def test_timed_db_counts_errors():
+    @metrics.timed_db("flaky_helper")
+    async def flaky():
+        raise RuntimeError("db down")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(flaky())
+    assert metrics.DB_CALL_ERRORS.value("flaky_helper") == 1
+    assert metrics.DB_CALL_LATENCY.labels("flaky_helper").count == 1
+
+
+def test_cache_hit_ratio_is_derived():
+    metrics.record_cache("demo_cache", True)
+    metrics.record_cache("demo_cache", True)
+    metrics.record_cache("demo_cache", False)
+    ratio_line = next(line for line in metrics.render_metrics().splitlines()
+                      if line.startswith('cache_hit_ratio{cache="demo_cache"}'))
+    assert abs(float(ratio_line.split()[-1]) - 2 / 3) < 1e-9
+
+
+def test_metrics_endpoint_reports_routes_stages_and_db_helpers():
+    client = TestClient(server.app)
+    client.post("/voice-command", json={"command": "add onion 3 kg at 30 rupees"})
+    client.get("/products")
+
+    body = client.get("/metrics").text
+    assert 'http_request_duration_seconds_count{method="GET",route="/products",status="200"}' in body
+    assert 'voice_parse_stage_duration_seconds_count{stage="regex"}' in body
+    assert 'voice_parse_stage_duration_seconds_count{stage="db"}' in body
+    assert 'db_call_duration_seconds_count{helper="get_all_products"}' in body
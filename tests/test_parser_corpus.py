@@ -0,0 +1,29 @@
+from benchmarks.parser_corpus import (FIELDS, REFERENCE_PARSER, accuracy, load_corpus, load_parser,
+                                      mismatched_fields, normalize)
+
+VALID_ACTIONS = {"add", "sell", "update", "remove", "list", "search", "stock"}
+
+# Exact-match accuracy of server.process_voice_command when the corpus was
+# built. Parser edits may raise this, never lower it.
+REFERENCE_EXACT_MATCH_FLOOR = 0.911
+
+
+def test_corpus_is_large_and_well_labeled():
+    corpus = load_corpus()
+    assert len(corpus) >= 2000
+    assert len({row["id"] for row in corpus}) == len(corpus)
+    assert {row["language"] for row in corpus} >= {"en", "hi", "kn", "ta", "te"}
+    for row in corpus:
+        assert set(row["expected"]) == set(FIELDS)
+        assert row["expected"]["action"] in VALID_ACTIONS
+
+
+def test_normalize_treats_incomplete_as_add():
+    result = normalize({"action": "incomplete", "message": "Please specify the price"})
+    assert result == {"action": "add", "product_name": None, "quantity": None, "price": None}
+    assert mismatched_fields(normalize({"action": "add", "price": 40}), normalize({"action": "add", "price": 40.0})) == []
+
+
+def test_reference_parser_accuracy_does_not_regress():
+    acc = accuracy(load_parser(REFERENCE_PARSER), load_corpus())
+    assert acc["exact_match"] >= REFERENCE_EXACT_MATCH_FLOOR
@@ -0,0 +1,71 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+from scipy import stats
+
+import price_trends
+import server
+
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def _fit(pairs):
+    price_stats = price_trends.PriceStats()
+    for x, y in pairs:
+        price_stats.update(x, y)
+    return price_stats.regression()
+
+
+def test_online_regression_matches_scipy_linregress():
+    rng = random.Random(3)
+    for n, drift in ((2, 0.5), (3, 0.0), (40, 0.3), (500, -0.05), (5000, 0.0)):
+        pairs = []
+        for _ in range(n):
+            when = START + timedelta(days=rng.uniform(0, 400))  # arrival order is not time order
+            x = price_trends.day_number(when)
+            pairs.append((x, 40 + drift * (x - price_trends.day_number(START)) + rng.gauss(0, 2)))
+        online = _fit(pairs)
+        batch = stats.linregress([x for x, _ in pairs], [y for _, y in pairs])
+        for field in ("slope", "intercept", "rvalue", "pvalue", "stderr", "intercept_stderr"):
+            assert online[field] == pytest.approx(getattr(batch, field), rel=1e-9, abs=1e-12), (n, field)
+
+
+def test_trend_needs_fit_and_significance():
+    rising = price_trends.PriceStats()
+    flat = price_trends.PriceStats()
+    noisy = price_trends.PriceStats()
+    rng = random.Random(5)
+    for day in range(30):
+        x = price_trends.day_number(START + timedelta(days=day))
+        rising.update(x, 30 + 0.5 * day + rng.gauss(0, 0.5))
+        flat.update(x, 45.0)
+        noisy.update(x, 45 + rng.gauss(0, 5))
+    now = START + timedelta(days=30)
+
+    up = price_trends.describe_trend("onion", rising, now)
+    assert up["trend_type"] == "increasing" and up["significant"] and up["r_squared"] > 0.9
+    assert up["predicted_price"] == pytest.approx(45, abs=1.5)
+    level = price_trends.describe_trend("salt", flat, now)
+    assert level["trend_type"] == "stable" and level["slope_per_day"] == 0 and level["p_value"] is None
+    assert price_trends.describe_trend("chilli", noisy, now)["trend_type"] == "stable"
+    assert price_trends.describe_trend("new", price_trends.PriceStats(), now)["points"] == 0
+
+
+def test_trends_endpoint_follows_priced_transactions(monkeypatch):
+    monkeypatch.setattr(server, "price_trends", price_trends.PriceTrendBook())
+    server.products_store.clear()
+    with TestClient(server.app) as client:
+        for price in (40, 42, 44):
+            client.post("/voice-command", json={"command": f"add 5 kg tomato at {price} rupees"})
+        client.post("/voice-command", json={"command": "sold 2 kg tomato"})  # no price: not a data point
+
+        first = client.get("/analytics/trends", params={"product_name": "Tomato"})
+        trend = first.json()["trends"][0]
+        assert trend["product_name"] == "tomato" and trend["points"] == 3 and trend["mean_price"] == 42
+        assert client.get("/analytics/trends", params={"product_name": "Tomato"},
+                          headers={"If-None-Match": first.headers["etag"]}).status_code == 304
+
+        client.post("/voice-command", json={"command": "add 5 kg tomato at 46 rupees"})
+        assert client.get("/analytics/trends").json()["trends"][0]["points"] == 4
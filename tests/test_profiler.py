@@ -0,0 +1,86 @@
+import os
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from profiler import ProfilingMiddleware, install_profiling
+
+TOKEN = "s3cret"
+
+
+def busy_analytics():
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+
+
+def make_client(tmp_path):
+    app = FastAPI()
+
+    @app.get("/analytics/dashboard")
+    async def dashboard():
+        busy_analytics()
+        return {"success": True}
+
+    install_profiling(app, token=TOKEN, profile_dir=str(tmp_path))
+    return TestClient(app)
+
+
+def test_requests_without_token_are_not_profiled(tmp_path):
+    client = make_client(tmp_path)
+    response = client.get("/analytics/dashboard")
+    wrong = client.get("/analytics/dashboard", headers={"X-Profile-Token": "guess"})
+
+    assert "x-profile-id" not in response.headers
+    assert "x-profile-id" not in wrong.headers
+    assert os.listdir(tmp_path) == []
+
+
+def test_header_produces_collapsed_stack_profile(tmp_path):
+    client = make_client(tmp_path)
+    response = client.get("/analytics/dashboard", headers={"X-Profile-Token": TOKEN})
+    profile_id = response.headers["x-profile-id"]
+
+    profile = client.get(f"/debug/profiles/{profile_id}", headers={"X-Profile-Token": TOKEN}).text
+    header, *stacks = profile.strip().splitlines()
+    assert header.startswith("# GET /analytics/dashboard")
+    assert any("test_profiler:busy_analytics" in line for line in stacks)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in stacks)
+
+
+def test_query_flag_and_download_requires_token(tmp_path):
+    client = make_client(tmp_path)
+    response = client.get(f"/analytics/dashboard?profile_token={TOKEN}")
+    profile_id = response.headers["x-profile-id"]
+
+    assert client.get(f"/debug/profiles/{profile_id}").status_code == 403
+    assert client.get("/debug/profiles/missing", headers={"X-Profile-Token": TOKEN}).status_code == 404
+
+
+def test_profile_store_is_bounded_and_expires(tmp_path):
+    stale = tmp_path / "20200101T000000-deadbeef.collapsed"
+    stale.write_text("# old\n")
+    os.utime(stale, (0, 0))
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {}
+
+    app.add_middleware(ProfilingMiddleware, token=TOKEN, profile_dir=str(tmp_path), max_files=2, ttl=3600)
+    client = TestClient(app)
+    ids = []
+    for i in range(3):
+        ids.append(client.get("/ping", headers={"X-Profile-Token": TOKEN}).headers["x-profile-id"])
+        os.utime(tmp_path / f"{ids[-1]}.collapsed", (time.time() - 10 + i,) * 2)  # distinct ages
+
+    kept = sorted(os.listdir(tmp_path))
+    assert stale.name not in kept
+    assert kept == sorted(f"{profile_id}.collapsed" for profile_id in ids[1:])
+
+
+def test_install_is_a_no_op_without_token():
+    app = FastAPI()
+    install_profiling(app, token=None)
+    assert app.user_middleware == []
@@ -0,0 +1,87 @@
+import math
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+from fastapi.testclient import TestClient
+from scipy import stats
+
+import reorder
+import server
+
+NOW = datetime(2025, 3, 10, 12)
+
+
+def _removals(name, daily):
+    start = NOW - timedelta(days=len(daily) - 1)
+    return [{"product_name": name, "transaction_type": "remove", "quantity_change": q,
+             "created_at": (start + timedelta(days=i)).isoformat()} for i, q in enumerate(daily) if q]
+
+
+def test_plan_matches_the_textbook_formulas():
+    daily = [2, 4] * 15
+    products = [{"name": "Onion", "quantity": 10, "minimum_stock": 1, "price_per_kg": 40}]
+    plan = reorder.reorder_plan(products, _removals("onion", daily), now=NOW, lead_time=3, service_level=0.95,
+                                order_cost=100, holding_rate=0.25, history_days=30)
+    row = plan["products"][0]
+
+    sigma = np.std(daily, ddof=1)
+    safety = stats.norm.ppf(0.95) * sigma * math.sqrt(3)
+    assert row["mean_daily_demand"] == 3.0
+    assert row["safety_stock"] == round(safety, 3)
+    assert row["reorder_point"] == round(1 + 3 * 3 + safety, 3)
+    eoq = math.sqrt(2 * 365 * 3 * 100 / (0.25 * 40))
+    assert row["economic_order_quantity"] == round(eoq, 3)
+    assert row["order_now"] and row["suggested_order_quantity"] == round(eoq, 3)
+    assert plan["order_now_count"] == 1
+
+
+def test_vectorized_pass_agrees_with_a_per_product_loop():
+    rng = random.Random(11)
+    products, transactions, histories = [], [], {}
+    for i in range(150):
+        name = f"item{i}"
+        days = rng.randint(1, 60)
+        daily = [rng.choice([0, 0, rng.uniform(0.5, 8)]) for _ in range(days)]
+        histories[name] = daily
+        products.append({"name": name, "quantity": rng.uniform(0, 80), "minimum_stock": 1,
+                         "price_per_kg": rng.choice([0, 25, 60])})
+        transactions += _removals(name, daily)
+    products.append({"name": "untouched", "quantity": 5, "minimum_stock": 1, "price_per_kg": 30})
+
+    plan = reorder.reorder_plan(products, transactions, now=NOW, history_days=60)
+    by_name = {row["product_name"]: row for row in plan["products"]}
+    z = stats.norm.ppf(reorder.REORDER_SERVICE_LEVEL)
+    for product in products[:-1]:
+        daily = histories[product["name"]]
+        first = next((i for i, q in enumerate(daily) if q), None)
+        observed = daily[first:] if first is not None else [0.0]
+        mean = sum(observed) / len(observed)
+        std = np.std(observed, ddof=1) if len(observed) > 1 else 0.0
+        rop = 1 + mean * reorder.REORDER_LEAD_TIME_DAYS + z * std * math.sqrt(reorder.REORDER_LEAD_TIME_DAYS)
+        row = by_name[product["name"]]
+        assert row["reorder_point"] == round(rop, 3)
+        assert row["order_now"] == (product["quantity"] <= rop)
+    untouched = by_name["untouched"]
+    assert untouched["economic_order_quantity"] is None and untouched["days_until_reorder"] is None
+
+
+def test_reorder_plan_endpoint_is_cached_until_stock_moves():
+    server.products_store.clear()
+    with TestClient(server.app) as client:
+        client.post("/voice-command", json={"command": "add 20 kg rice at 50 rupees"})
+        client.post("/sync", json={"operations": [
+            {"client_op_id": "reorder-1", "type": "transaction", "product_name": "rice",
+             "transaction_type": "remove", "quantity_change": 15},
+        ]})
+        executions = server.reorder_flights.stats["executions"]
+        first = client.get("/analytics/reorder-plan")
+        plan = first.json()["plan"]
+        assert plan["products"][0]["product_name"].lower() == "rice" and plan["order_now_count"] == 1
+        assert client.get("/analytics/reorder-plan", headers={"If-None-Match": first.headers["etag"]}).status_code == 304
+        client.get("/analytics/reorder-plan")
+        assert server.reorder_flights.stats["executions"] == executions + 1
+
+        client.post("/voice-command", json={"command": "add 30 kg rice at 50 rupees"})
+        assert client.get("/analytics/reorder-plan").json()["plan"]["order_now_count"] == 0
+        assert server.reorder_flights.stats["executions"] == executions + 2
@@ -0,0 +1,102 @@
+from datetime import date, datetime, timedelta, timezone
+
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+import forecasting
+import rollups
+
+
+def _history(days=40, seed=3):
+    import random
+    rng = random.Random(seed)
+    start = datetime(2024, 3, 1, 6, tzinfo=timezone.utc)
+    rows = []
+    for i in range(days * 3):
+        at = start + timedelta(hours=8 * i + rng.random())
+        name = rng.choice(["Rice", "rice", "Onion"])
+        kind = rng.choice(["add", "remove", "remove"])
+        rows.append({"user_id": "u1", "product_name": name, "transaction_type": kind,
+                     "quantity_change": round(rng.uniform(0.5, 5), 3),
+                     "price_per_kg": round(rng.uniform(20, 60), 2) if kind == "add" else None,
+                     "created_at": at.isoformat()})
+    return rows
+
+
+def _raw_analytics(rows, product):
+    """The pre-rollup get_product_analytics computation."""
+    df = pd.DataFrame([r for r in rows if r["product_name"].lower() == product])
+    df["created_at"] = pd.to_datetime(df["created_at"])
+    added = df[df["transaction_type"] == "add"]["quantity_change"].sum()
+    removed = df[df["transaction_type"] == "remove"]["quantity_change"].sum()
+    days_span = (df["created_at"].max() - df["created_at"].min()).days
+    prices = df[df["price_per_kg"].notna()]["price_per_kg"]
+    return {"current_stock": added - removed, "total_added": added, "total_consumed": removed,
+            "consumption_rate_per_day": removed / days_span if len(df) > 1 and days_span > 0 else 0,
+            "average_price": prices.mean() if not prices.empty else 0, "transaction_count": len(df),
+            "first_transaction": df["created_at"].min().isoformat(),
+            "last_transaction": df["created_at"].max().isoformat()}
+
+
+@pytest.mark.parametrize("product", ["rice", "onion"])
+def test_rollup_summary_matches_raw_transactions(product):
+    rows = _history()
+    store = rollups.MemoryRollupStore()
+    for row in rows:
+        store.apply("u1", row)
+
+    expected = _raw_analytics(rows, product)
+    from_store = rollups.summarize(store.buckets("u1", product), product)
+    from_backfill = rollups.summarize([b for b in rollups.aggregate(rows) if b["product_name"] == product], product)
+    for summary in (from_store, from_backfill):
+        for field, value in expected.items():
+            assert summary[field] == (value if isinstance(value, str) else pytest.approx(value)), field
+    assert len(store.buckets("u1", product)) <= 40
+
+
+def test_backfill_aggregate_matches_incremental_buckets():
+    rows = _history()
+    store = rollups.MemoryRollupStore()
+    store.rebuild("u1", rows)
+    incremental = store.buckets("u1")
+    batch = rollups.aggregate(rows)
+    assert [(b["product_name"], b["day"]) for b in rollups.fold(rows)] == [(b["product_name"], b["day"]) for b in batch]
+    assert [(b["product_name"], b["day"]) for b in batch] == [(b["product_name"], b["day"]) for b in incremental]
+    for a, b in zip(batch, incremental):
+        for field in rollups.BUCKET_FIELDS:
+            assert a[field] == pytest.approx(b[field])
+        record = rollups.to_record(a)
+        assert record["day"] == a["day"].isoformat()
+
+
+def test_forecast_from_rollups_matches_raw_rows():
+    rows = _history()
+    now = datetime(2024, 4, 10)
+    products = [{"name": "Rice", "quantity": 30, "minimum_stock": 1}, {"name": "Onion", "quantity": 12}]
+    buckets = rollups.aggregate(rows)
+    assert forecasting.forecast_products(products, rollups.as_forecast_rows(buckets), now=now) == \
+        forecasting.forecast_products(products, rows, now=now)
+
+
+def test_summary_without_history():
+    assert rollups.summarize([], "rice") == {"message": "No transaction history found"}
+    assert rollups.MemoryRollupStore().buckets("u1", "rice", since=date(2024, 1, 1)) == []
+
+
+def test_in_memory_server_serves_product_analytics_from_rollups():
+    import server
+
+    server.products_store.clear()
+    server.rollup_store.rebuild(server.INVENTORY_OWNER, [])
+    client = TestClient(server.app)
+    client.post("/sync", json={"operations": [
+        {"client_op_id": "rollup-1", "type": "transaction", "product_name": "rice",
+         "transaction_type": "add", "quantity_change": 10, "price_per_kg": 40},
+        {"client_op_id": "rollup-2", "type": "transaction", "product_name": "rice",
+         "transaction_type": "remove", "quantity_change": 4},
+    ]})
+    analytics = client.get("/analytics/product/Rice").json()["analytics"]
+    assert analytics["current_stock"] == 6
+    assert analytics["transaction_count"] == 2
+    assert analytics["average_price"] == 40
@@ -0,0 +1,58 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+import lots
+import rollups
+import server
+
+
+def _stock(name, quantity, price=30.0):
+    server.products_store.clear()
+    asyncio.run(server.save_product(server.Product(name=name, quantity=quantity, price_per_kg=price)))
+
+
+def test_ten_thousand_parallel_sales_never_oversell(monkeypatch):
+    monkeypatch.setattr(server, "rollup_store", rollups.MemoryRollupStore())
+    monkeypatch.setattr(server, "lot_ledger", lots.LotLedger())
+    _stock("Onion", 5000)
+    server.lot_ledger.record(server.INVENTORY_OWNER, {"product_name": "Onion", "transaction_type": "add",
+                                                      "quantity_change": 5000, "price_per_kg": 30})
+
+    async def rush():
+        sale = {"action": "sell", "product_name": "onion", "quantity": 1.0}
+        return await asyncio.gather(*(server.execute_voice_action(dict(sale)) for _ in range(10_000)))
+
+    results = asyncio.run(rush())
+    assert sum(r["success"] for r in results) == 5000
+    assert all(r["available"] == 0 for r in results if not r["success"])
+    assert server.products_store[0]["quantity"] == 0
+    assert sum(b["removed"] for b in server.rollup_store.buckets(server.INVENTORY_OWNER, "onion")) == 5000
+    valuation = server.lot_ledger.valuations(server.INVENTORY_OWNER)[0]
+    assert valuation["cogs_fifo"] == 5000 * 30 and valuation["unmatched"] == 0
+
+
+def test_voice_sale_decrements_and_the_dashboard_sees_it():
+    _stock("Tomato", 10, price=40)
+    with TestClient(server.app) as client:
+        first = client.get("/analytics/dashboard")
+        body = client.post("/voice-command", json={"command": "sold 2 kg tomato"}).json()
+        assert body["success"] and body["product"]["quantity"] == 8
+
+        dashboard = client.get("/analytics/dashboard", headers={"If-None-Match": first.headers["etag"]})
+        assert dashboard.status_code == 200
+        assert dashboard.json()["dashboard"]["summary"]["total_inventory_value"] == 8 * 40
+
+        refused = client.post("/voice-command", json={"command": "sold 20 kg tomato"}).json()
+        assert not refused["success"] and refused["available"] == 8
+        assert client.post("/voice-command", json={"command": "sold tomato"}).json()["success"] is False
+
+
+def test_offline_sales_clamp_at_zero():
+    _stock("Rice", 3)
+    client = TestClient(server.app)
+    client.post("/sync", json={"operations": [
+        {"client_op_id": "sale-1", "type": "transaction", "product_name": "rice",
+         "transaction_type": "remove", "quantity_change": 5},
+    ]})
+    assert server.products_store[0]["quantity"] == 0
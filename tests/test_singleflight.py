@@ -0,0 +1,101 @@
+import asyncio
+
+import httpx
+import pytest
+
+import conditional
+import server
+import singleflight
+
+
+def _counting(delay=0.01, fail=False):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        if fail:
+            raise RuntimeError("query failed")
+        return {"value": len(calls)}
+    return compute, calls
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    flights = singleflight.SingleFlight("test")
+    compute, calls = _counting()
+
+    async def scenario():
+        return await asyncio.gather(*[flights.do(("u", "dash"), compute) for _ in range(20)],
+                                    flights.do(("u", "alerts"), compute))
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 2
+    assert all(r is results[0] for r in results[:20])
+    assert flights.stats["shared"] == 19
+
+
+def test_errors_reach_every_waiter_and_are_not_cached():
+    flights = singleflight.SingleFlight("test", cache_ttl=60)
+    compute, calls = _counting(fail=True)
+
+    async def scenario():
+        return await asyncio.gather(*[flights.do("k", compute) for _ in range(3)], return_exceptions=True)
+
+    assert all(isinstance(r, RuntimeError) for r in asyncio.run(scenario()))
+    with pytest.raises(RuntimeError):
+        asyncio.run(flights.do("k", compute))
+    assert len(calls) == 2
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    flights = singleflight.SingleFlight("test")
+    compute, calls = _counting(delay=0.05)
+
+    async def scenario():
+        leader = asyncio.ensure_future(flights.do("k", compute))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flights.do("k", compute))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(scenario()) == {"value": 1}
+    assert len(calls) == 1
+
+
+def test_cache_is_keyed_by_inventory_version():
+    flights = singleflight.SingleFlight("test", cache_ttl=60)
+    compute, calls = _counting(delay=0)
+
+    async def scenario():
+        await flights.do(singleflight.analytics_key("shop-9", "alerts"), compute)
+        await flights.do(singleflight.analytics_key("shop-9", "alerts"), compute)
+        conditional.bump_inventory_version("shop-9")
+        await flights.do(singleflight.analytics_key("shop-9", "alerts"), compute)
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
+    assert flights.stats["cache_hits"] == 1
+
+
+def test_dashboard_requests_coalesce(monkeypatch):
+    reads = []
+
+    async def slow_products():
+        reads.append(1)
+        await asyncio.sleep(0.05)
+        return []
+    monkeypatch.setattr(server, "get_all_products", slow_products)
+
+    async def alerts_ready(user_id):
+        pass  # without the startup event no alert loop runs, and ensure() would recompute (another read)
+    monkeypatch.setattr(server.alert_scheduler, "ensure", alerts_ready)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*[client.get("/analytics/dashboard") for _ in range(3)])
+
+    responses = asyncio.run(scenario())
+    assert all(r.status_code == 200 for r in responses)
+    assert len(reads) == 1
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+import server
+import stockout
+
+NOW = datetime(2025, 3, 10, 12)
+
+
+def _removals(name, daily):
+    start = NOW - timedelta(days=len(daily) - 1)
+    return [{"product_name": name, "transaction_type": "remove", "quantity_change": q,
+             "created_at": (start + timedelta(days=i)).isoformat()} for i, q in enumerate(daily) if q]
+
+
+def _by_name(risk):
+    return {row["product_name"]: row for row in risk["products"]}
+
+
+def test_steady_demand_runs_out_on_a_known_day():
+    products = [{"name": "rice", "quantity": 10}, {"name": "dal", "quantity": 100},
+                {"name": "salt", "quantity": 0}, {"name": "jaggery", "quantity": 5}]
+    risk = stockout.stockout_risk(products, _removals("rice", [2] * 30) + _removals("dal", [2] * 30),
+                                  horizon=14, now=NOW, paths=500, history_days=30, seed=1)
+    rows = _by_name(risk)
+
+    assert rows["rice"]["stockout_probability"] == 1.0
+    assert rows["rice"]["stockout_day"] == {"p10": 5, "p50": 5, "p90": 5}
+    assert rows["dal"]["stockout_probability"] == 0.0 and rows["dal"]["stockout_day"]["p50"] is None
+    assert rows["salt"]["stockout_probability"] == 1.0 and rows["salt"]["stockout_day"]["p10"] == 1
+    assert rows["jaggery"]["stockout_probability"] == 0.0
+    assert risk["at_risk_count"] == 2 and risk["paths"] == 500
+    assert [row["product_name"] for row in risk["products"][:2]] == ["rice", "salt"]
+
+
+def test_bootstrap_probability_matches_the_exact_value():
+    # Days of 0 or 4 with equal weight: 6 kg lasts 2 days unless both draws are 4 (p = 1/4)
+    # and 3 days unless at least two of three are 4 (p = 1/2).
+    products = [{"name": "onion", "quantity": 6}]
+    transactions = _removals("onion", [4, 0] * 20)
+    for horizon, exact in ((2, 0.25), (3, 0.5)):
+        risk = stockout.stockout_risk(products, transactions, horizon=horizon, now=NOW, paths=40_000,
+                                      history_days=40, seed=7)
+        row = risk["products"][0]
+        assert abs(row["stockout_probability"] - exact) < 4 * row["standard_error"]
+
+
+def test_batches_stop_at_the_runtime_budget():
+    demand = np.tile([1.0, 3.0], (50, 10))
+    counts, done = stockout.simulate_stockouts(demand, np.zeros(50, dtype=np.int64), np.full(50, 20.0),
+                                               horizon=10, paths=10_000, budget_ms=0, batch_cells=1_000,
+                                               rng=np.random.default_rng(0))
+    assert done == 20  # one batch of 1000 product-paths for 50 products
+    assert (counts.sum(axis=1) == done).all()
+
+
+def test_stockout_endpoint_is_cached_per_horizon_and_version():
+    server.products_store.clear()
+    with TestClient(server.app) as client:
+        client.post("/voice-command", json={"command": "add 20 kg sugar at 45 rupees"})
+        client.post("/sync", json={"operations": [
+            {"client_op_id": "stockout-1", "type": "transaction", "product_name": "sugar",
+             "transaction_type": "remove", "quantity_change": 12},
+        ]})
+        executions = server.stockout_flights.stats["executions"]
+        first = client.get("/analytics/stockout-risk", params={"days": 7})
+        risk = first.json()["risk"]
+        assert risk["horizon_days"] == 7 and risk["products"][0]["stockout_probability"] > 0
+        assert client.get("/analytics/stockout-risk", params={"days": 7},
+                          headers={"If-None-Match": first.headers["etag"]}).status_code == 304
+        client.get("/analytics/stockout-risk", params={"days": 7})
+        assert server.stockout_flights.stats["executions"] == executions + 1
+        client.get("/analytics/stockout-risk", params={"days": 30})
+        assert server.stockout_flights.stats["executions"] == executions + 2
+        assert client.get("/analytics/stockout-risk", params={"days": 0}).status_code == 400
@@ -0,0 +1,137 @@
+import asyncio
+
+import write_behind
+
+
+class FakeDatabase:
+    """apply_stock_deltas in memory: skips batch ids it has already applied."""
+
+    def __init__(self, quantities, fail_after_commit=False):
+        self.quantities = dict(quantities)
+        self.applied = set()
+        self.transactions = []
+        self.calls = 0
+        self.fail_after_commit = fail_after_commit
+
+    async def apply(self, batch_id, user_id, items, transactions):
+        self.calls += 1
+        await asyncio.sleep(0)
+        if batch_id not in self.applied:
+            self.applied.add(batch_id)
+            for item in items:
+                self.quantities[item["id"]] = max(0.0, self.quantities[item["id"]] + item["delta"])
+            self.transactions.extend(transactions)
+        if self.fail_after_commit:
+            raise ConnectionError("response lost")
+
+    async def fetch(self):
+        rows = [{"id": pid, "quantity": quantity} for pid, quantity in sorted(self.quantities.items())]
+        for _ in range(3):  # the response is still on its way while a batch commits
+            await asyncio.sleep(0)
+        return rows
+
+
+def _sale(buffer, product_id, quantity):
+    buffer.add("shop", product_id, product_id, -quantity, {"transaction_type": "remove", "quantity_change": quantity})
+
+
+def test_changes_to_hot_products_are_merged_into_one_call():
+    db = FakeDatabase({"onion": 500.0, "tomato": 500.0, "milk": 500.0})
+    buffer = write_behind.WriteBehindBuffer(db.apply, max_ops=10_000)
+    for i in range(900):
+        _sale(buffer, ("onion", "tomato", "milk")[i % 3], 0.5)
+    buffer.add("shop", "milk", "milk", 20, {"transaction_type": "add", "quantity_change": 20}, price_per_kg=55)
+
+    assert buffer.pending_delta("shop", "onion") == -150
+    assert asyncio.run(buffer.flush()) == 1
+    assert db.calls == 1 and len(db.transactions) == 901
+    assert db.quantities == {"onion": 350.0, "tomato": 350.0, "milk": 370.0}
+    assert buffer.pending == 0 and buffer.pending_delta("shop", "onion") == 0
+
+
+def test_reads_are_exact_while_batches_are_written():
+    db = FakeDatabase({"onion": 100.0})
+    buffer = write_behind.WriteBehindBuffer(db.apply, max_ops=10_000)
+
+    async def scenario():
+        seen = []
+        for round_ in range(50):
+            _sale(buffer, "onion", 1)
+            flushing = asyncio.create_task(buffer.flush()) if round_ % 7 == 0 else None
+            rows = await buffer.read("shop", db.fetch)
+            seen.append(rows[0]["quantity"])
+            if flushing:
+                await flushing
+        return seen
+
+    assert asyncio.run(scenario()) == [99.0 - i for i in range(50)]
+
+
+def test_journal_replay_writes_every_change_exactly_once(tmp_path):
+    path = str(tmp_path / "stock.journal")
+    db = FakeDatabase({"onion": 100.0, "rice": 50.0}, fail_after_commit=True)
+    crashed = write_behind.WriteBehindBuffer(db.apply, write_behind.DeltaJournal(path))
+    for _ in range(10):
+        _sale(crashed, "onion", 2)
+    asyncio.run(crashed.flush())  # written, but the response was lost before the commit record
+    _sale(crashed, "rice", 5)  # never flushed
+    crashed.journal.close()
+    with open(crashed.journal.path, "a") as f:
+        f.write('{"op": {"seq": 99, "user_')  # torn append at the moment of the crash
+
+    db.fail_after_commit = False
+    restarted = write_behind.WriteBehindBuffer(db.apply, write_behind.DeltaJournal(path))
+    assert restarted.replay() == 11
+    assert restarted.pending_delta("shop", "onion") == -20
+    asyncio.run(restarted.flush())
+
+    assert db.quantities == {"onion": 80.0, "rice": 45.0}
+    assert len(db.transactions) == 11
+    assert restarted.pending == 0 and restarted.journal.read() == []
+
+
+def test_workers_replay_only_journals_no_live_worker_holds(tmp_path):
+    path = str(tmp_path / "stock.journal")
+    db = FakeDatabase({"onion": 100.0, "rice": 50.0, "milk": 10.0})
+    live, gone, also_gone = (write_behind.WriteBehindBuffer(db.apply, write_behind.DeltaJournal(path)) for _ in range(3))
+    _sale(live, "onion", 1)
+    _sale(gone, "rice", 2)
+    _sale(also_gone, "milk", 3)
+    assert len({live.journal.path, gone.journal.path, also_gone.journal.path}) == 3
+    gone.journal.close()  # both workers died with a change unwritten
+    also_gone.journal.close()
+
+    restarted = write_behind.WriteBehindBuffer(db.apply, write_behind.DeltaJournal(path))
+    assert restarted.replay() == 2
+    assert restarted.pending_delta("shop", "onion") == 0
+    asyncio.run(restarted.flush())
+    asyncio.run(live.flush())
+
+    assert db.quantities == {"onion": 99.0, "rice": 48.0, "milk": 7.0}
+    assert len(db.transactions) == 3
+    assert write_behind.WriteBehindBuffer(db.apply, write_behind.DeltaJournal(path)).replay() == 0
+
+
+def test_journal_holds_only_pending_changes_under_steady_sales(tmp_path):
+    db = FakeDatabase({"onion": 1000.0})
+    buffer = write_behind.WriteBehindBuffer(db.apply, write_behind.DeltaJournal(str(tmp_path / "stock.journal")))
+    for _ in range(20):
+        for _ in range(10):
+            _sale(buffer, "onion", 1)
+        asyncio.run(buffer.flush())
+        _sale(buffer, "onion", 1)  # always something pending
+    assert len(buffer.journal.read()) == 1
+    assert db.quantities["onion"] == 781.0 and buffer.pending == 1
+
+
+def test_reaching_max_ops_flushes_early():
+    db = FakeDatabase({"milk": 10.0})
+    buffer = write_behind.WriteBehindBuffer(db.apply, max_ops=5, flush_ms=60_000)
+
+    async def scenario():
+        for _ in range(5):
+            _sale(buffer, "milk", 1)
+        await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+    assert db.quantities["milk"] == 5.0 and buffer.pending == 0